@@ -1,27 +1,26 @@
-from fastapi import APIRouter, HTTPException
+from datetime import datetime, timedelta
+from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional, List
+from app.db import get_db
+from app.core.responses import trusted_json
+from app.services.experiment_service import experiment_router, feedback_outcome
+from app.services.annotation_queue import annotation_queue
+from app.services.feedback_service import feedback_store, feedback_to_response, parse_timestamp, MAX_PAGE_SIZE
+from app.services.drift_service import parse_window
+from app.services.training_service import retrain_runner, add_training_examples
 
 router = APIRouter()
 
-# In-memory simulation for feedback and retraining processes
-feedback_db = {}
-retraining_status = {
-    "v1.4": {"status": "in_progress", "progress": 50, "expected_completion_time": "2023-09-25T10:00:00Z"}
-}
-
 # Endpoint 1: Collect User Feedback
 @router.post("/feedback", response_model=dict)
-async def collect_feedback(session_id: str, customer_id: str, feedback: dict, ai_response: dict):
+async def collect_feedback(session_id: str, customer_id: str, feedback: dict, ai_response: dict, db = Depends(get_db)):
     """
     Collects real-time feedback from users about the AI’s responses.
+    Records whose ai_response carries the "query" and its "intent" are used for retraining.
     """
-    feedback_id = f"feedback_{len(feedback_db) + 1}"
-    feedback_db[feedback_id] = {
-        "session_id": session_id,
-        "customer_id": customer_id,
-        "feedback": feedback,
-        "ai_response": ai_response
-    }
+    feedback_id = feedback_store.add(db, session_id, customer_id, feedback, ai_response)
+    # Attributed to the customer's arm of the running experiment, if any
+    experiment_router.record_feedback(customer_id or session_id, feedback_outcome(feedback))
     return {
         "status": "feedback_received",
         "feedback_id": feedback_id
@@ -29,51 +28,65 @@ async def collect_feedback(session_id: str, customer_id: str, feedback: dict, ai
 
 # Endpoint 2: Human Annotation of Feedback
 @router.post("/human-annotation", response_model=dict)
-async def annotate_feedback(feedback_id: str, annotator_id: str, original_response: str, corrected_response: str):
+async def annotate_feedback(feedback_id: str, annotator_id: str, original_response: str, corrected_response: str, db = Depends(get_db)):
     """
     Allows human annotators to review and correct AI responses.
+    Annotations are stored as append-only events; the latest one for a feedback record is current.
     """
-    if feedback_id not in feedback_db:
+    annotation_id = feedback_store.annotate(db, feedback_id, annotator_id, original_response, corrected_response)
+    if annotation_id is None:
         raise HTTPException(status_code=404, detail="Feedback not found")
-    
-    # Simulate annotation
-    feedback_db[feedback_id]["annotation"] = {
-        "annotator_id": annotator_id,
-        "original_response": original_response,
-        "corrected_response": corrected_response
-    }
     return {
         "status": "annotation_completed",
-        "feedback_id": feedback_id
+        "feedback_id": feedback_id,
+        "annotation_id": annotation_id
     }
 
 # Endpoint 3: Feedback Collection Over Time
 @router.get("/feedback-collection", response_model=dict)
-async def collect_feedback_over_time(start_time: str, end_time: str):
+async def collect_feedback_over_time(start_time: str, end_time: str, cursor: Optional[str] = None, limit: int = 100, db = Depends(get_db)):
     """
-    Retrieves feedback data collected over a specified time period.
+    Retrieves feedback data collected over a specified time period (ISO 8601, end exclusive), oldest first.
+    Pass the returned `next_cursor` back as `cursor` to fetch the next page.
     """
-    # Simulated feedback collection (filtered by time range)
-    collected_feedback = [feedback for feedback in feedback_db.values()]
-    return {
-        "feedback_collected": collected_feedback
-    }
+    try:
+        start, end = parse_timestamp(start_time), parse_timestamp(end_time)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_time and end_time must be ISO 8601 timestamps")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    try:
+        documents, next_cursor = feedback_store.page(db, start, end, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return trusted_json({
+        "feedback_collected": [feedback_to_response(document) for document in documents],
+        "next_cursor": next_cursor
+    })
 
 # Endpoint 4: Trigger Model Retraining
 @router.post("/model-retrain", response_model=dict)
 async def trigger_model_retrain(training_data: str, model_version: str, retraining_reason: str, expected_completion_time: str):
     """
     Triggers the retraining process for the AI model based on newly collected feedback or annotations.
+    `training_data` is the window of feedback and curated examples to train on, e.g. "30d" or "last_7_days".
     """
-    new_model_version = f"v{int(model_version.split('v')[-1]) + 1}"
-    retraining_status[new_model_version] = {
-        "status": "in_progress",
-        "progress": 0,
-        "expected_completion_time": expected_completion_time
-    }
+    try:
+        window_seconds = parse_window(training_data)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="training_data must be a window such as '24h', '30d' or 'last_7_days'")
+    end = datetime.utcnow()
+    try:
+        job = retrain_runner.start(model_version, end - timedelta(seconds=window_seconds), end, retraining_reason,
+                                   requested_completion_time=expected_completion_time)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Model version not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     return {
         "status": "retraining_started",
-        "new_model_version": new_model_version,
+        "new_model_version": job["model_version"],
         "expected_completion_time": expected_completion_time
     }
 
@@ -81,21 +94,56 @@ async def trigger_model_retrain(training_data: str, model_version: str, retraini
 @router.get("/retrain-status", response_model=dict)
 async def retrain_status(model_version: str):
     """
-    Retrieves the current status of the retraining process.
+    Retrieves the current status of the retraining process, with progress (%) and an ETA from the examples processed so far.
     """
-    if model_version not in retraining_status:
+    status = retrain_runner.status(model_version)
+    if status is None:
         raise HTTPException(status_code=404, detail="Model version not found")
-    
-    return retraining_status[model_version]
+
+    return status
 
 # Endpoint 6: Add New Training Data
 @router.post("/add-training-data", response_model=dict)
-async def add_training_data(training_data_source: str, annotations: List[dict]):
+async def add_training_data(training_data_source: str, annotations: List[dict], db = Depends(get_db)):
     """
     Adds newly annotated or curated data for future model retraining cycles.
+    Each annotation is a {"text": ..., "intent": ...} example; others are skipped.
     """
-    # Simulate adding new training data to a storage system
+    stored, skipped = add_training_examples(db, training_data_source, annotations)
     return {
         "status": "training_data_added",
-        "data_source": training_data_source
+        "data_source": training_data_source,
+        "stored": stored,
+        "skipped": skipped
     }
+
+# Endpoint 7: Get Annotation Queue
+@router.get("/annotation-queue", response_model=dict)
+async def get_annotation_queue(limit: int = 20):
+    """
+    Shows the interactions most worth annotating (lowest confidence, arm disagreement, diverse texts) without claiming them.
+    """
+    return trusted_json({
+        "items": await annotation_queue.peek(max(1, min(limit, MAX_PAGE_SIZE))),
+        "stats": await annotation_queue.stats()
+    })
+
+# Endpoint 8: Pull Items For Annotation
+@router.post("/annotation-queue/pull", response_model=dict)
+async def pull_annotation_queue(annotator_id: str, limit: int = 10, db = Depends(get_db)):
+    """
+    Claims the top items of the annotation queue. Each is stored as a feedback record so it can be
+    labelled through /human-annotation with the returned feedback_id.
+    """
+    items = await annotation_queue.pull(max(1, min(limit, MAX_PAGE_SIZE)))
+    for item in items:
+        item["feedback_id"] = feedback_store.add(
+            db, item.get("session_id") or "", item.get("customer_id") or "",
+            {"source": "annotation_queue", "assigned_to": annotator_id, "priority": item["priority"]},
+            {"query": item["text"], "intent": item["intent"], "confidence": item["confidence"],
+             "model_version": item["model_version"], "source": item["source"]}
+        )
+    return trusted_json({
+        "annotator_id": annotator_id,
+        "items": items
+    })
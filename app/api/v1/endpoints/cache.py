@@ -1,21 +1,30 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from typing import Optional, List
-import redis
 import json
+from app.core.resources import get_cache_client
+from app.services.cache_service import tiered_cache
+from app.utils import serialization
 
-# Set up Redis client (for local testing)
-cache_client = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+
+def decode_value(raw: bytes):
+    """
+    Decodes a stored value; entries written as plain strings before serialization was added are returned as text.
+    """
+    try:
+        return serialization.loads(raw)
+    except ValueError:
+        return raw.decode(errors="replace")
 
 router = APIRouter()
 
 # Endpoint 1: Store Data in Cache
 @router.post("/store", response_model=dict)
-async def store_cache(key: str, value: str, ttl: Optional[int] = None):
+async def store_cache(key: str, value: str, ttl: Optional[int] = None, cache_client=Depends(get_cache_client)):
     """
     Stores data or responses in the cache with an optional TTL (Time-to-Live).
     """
     try:
-        cache_client.set(key, value)
+        cache_client.set(key, serialization.dumps(value))
         if ttl:
             cache_client.expire(key, ttl)
         return {
@@ -28,7 +37,7 @@ async def store_cache(key: str, value: str, ttl: Optional[int] = None):
 
 # Endpoint 2: Retrieve Data from Cache
 @router.get("/retrieve", response_model=dict)
-async def retrieve_cache(key: str):
+async def retrieve_cache(key: str, cache_client=Depends(get_cache_client)):
     """
     Retrieves data from the cache using a specific key.
     """
@@ -37,7 +46,7 @@ async def retrieve_cache(key: str):
         if value:
             return {
                 "key": key,
-                "value": value
+                "value": decode_value(value)
             }
         else:
             raise HTTPException(status_code=404, detail="Cache entry not found")
@@ -46,12 +55,14 @@ async def retrieve_cache(key: str):
 
 # Endpoint 3: Invalidate Cache Entry
 @router.post("/invalidate", response_model=dict)
-async def invalidate_cache(key: str):
+async def invalidate_cache(key: str, cache_client=Depends(get_cache_client)):
     """
     Invalidates or removes a specific cache entry.
     """
     try:
         result = cache_client.delete(key)
+        # Other workers may still hold the key in their in-process L1
+        await tiered_cache.publish_invalidation(key)
         if result:
             return {
                 "status": "cache_invalidated",
@@ -64,14 +75,15 @@ async def invalidate_cache(key: str):
 
 # Endpoint 4: Refresh Cache Entry
 @router.post("/refresh", response_model=dict)
-async def refresh_cache(key: str, new_value: str, ttl: Optional[int] = None):
+async def refresh_cache(key: str, new_value: str, ttl: Optional[int] = None, cache_client=Depends(get_cache_client)):
     """
     Refreshes a cache entry with updated data and an optional TTL.
     """
     try:
-        cache_client.set(key, new_value)
+        cache_client.set(key, serialization.dumps(new_value))
         if ttl:
             cache_client.expire(key, ttl)
+        await tiered_cache.publish_invalidation(key)
         return {
             "status": "cache_refreshed",
             "key": key,
@@ -82,7 +94,7 @@ async def refresh_cache(key: str, new_value: str, ttl: Optional[int] = None):
 
 # Endpoint 5: Get Cache Status
 @router.get("/status", response_model=dict)
-async def cache_status(key: str):
+async def cache_status(key: str, cache_client=Depends(get_cache_client)):
     """
     Retrieves the current status of a cached item, including TTL and value.
     """
@@ -92,7 +104,7 @@ async def cache_status(key: str):
         if value is not None:
             return {
                 "key": key,
-                "value": value,
+                "value": decode_value(value),
                 "ttl": ttl
             }
         else:
@@ -102,14 +114,25 @@ async def cache_status(key: str):
 
 # Endpoint 6: Retrieve All Cached Keys
 @router.get("/all-keys", response_model=dict)
-async def get_all_keys():
+async def get_all_keys(cache_client=Depends(get_cache_client)):
     """
     Retrieves a list of all keys currently stored in the cache.
     """
     try:
         keys = cache_client.keys("*")
         return {
-            "cached_keys": keys
+            "cached_keys": [key.decode() for key in keys]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve cached keys: {str(e)}")
+
+# Endpoint 7: Get Cache Hit-Ratio Metrics
+@router.get("/metrics", response_model=dict)
+async def get_cache_metrics():
+    """
+    Retrieves hit/miss counters and hit ratios of the two-tier cache for this worker, per namespace.
+    """
+    return {
+        "l1_entries": len(tiered_cache.local),
+        "namespaces": tiered_cache.metrics()
+    }
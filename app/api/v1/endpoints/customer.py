@@ -2,25 +2,44 @@ from fastapi import APIRouter, HTTPException, Depends
 from bson import ObjectId
 from datetime import datetime
 from typing import List
-from app.schemas.customer import CustomerCreate, CustomerUpdate, CustomerResponse
+from app.schemas.customer import CUSTOMER_PII_FIELDS, CustomerCreate, CustomerUpdate, CustomerResponse
 from app.db import get_db
+from app.core.resources import get_cipher
+from app.core.responses import trusted_json
 
 router = APIRouter()
 
+# Response fields (by alias) and their defaults, used to project trusted documents without revalidation
+CUSTOMER_RESPONSE_FIELDS = {
+    field.alias: (field.default if not field.required else None)
+    for field in CustomerResponse.__fields__.values()
+}
+CUSTOMER_RESPONSE_FIELDS.pop("_id")
+
+def customer_to_response(document: dict) -> dict:
+    """
+    Projects a customer document read from our own collection onto the CustomerResponse shape.
+    """
+    response = {"_id": str(document["_id"])}
+    for field, default in CUSTOMER_RESPONSE_FIELDS.items():
+        response[field] = document.get(field, default)
+    return response
+
 # Create a new customer
 @router.post("/", response_model=CustomerResponse)
-async def create_customer(customer: CustomerCreate, db = Depends(get_db)):
-    customer_data = customer.dict()
+async def create_customer(customer: CustomerCreate, db = Depends(get_db), cipher = Depends(get_cipher)):
+    # PII is encrypted before it reaches MongoDB
+    customer_data = cipher.encrypt_record(customer.dict(), CUSTOMER_PII_FIELDS)
     customer_data['created_at'] = datetime.utcnow()  # Set created_at timestamp
     result = db["customers"].insert_one(customer_data)
     created_customer = db["customers"].find_one({"_id": result.inserted_id})
     if created_customer is None:
         raise HTTPException(status_code=400, detail="Customer creation failed")
-    return created_customer
+    return cipher.decrypt_record(created_customer, CUSTOMER_PII_FIELDS)
 
 # Get a customer by ID
 @router.get("/{customer_id}", response_model=CustomerResponse)
-async def get_customer(customer_id: str, db = Depends(get_db)):
+async def get_customer(customer_id: str, db = Depends(get_db), cipher = Depends(get_cipher)):
     if not ObjectId.is_valid(customer_id):
         raise HTTPException(status_code=400, detail="Invalid ObjectId")
     
@@ -28,15 +47,17 @@ async def get_customer(customer_id: str, db = Depends(get_db)):
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    return customer
+    return cipher.decrypt_record(customer, CUSTOMER_PII_FIELDS)
 
 # Update a customer by ID
 @router.put("/{customer_id}", response_model=CustomerResponse)
-async def update_customer(customer_id: str, customer_update: CustomerUpdate, db = Depends(get_db)):
+async def update_customer(customer_id: str, customer_update: CustomerUpdate, db = Depends(get_db),
+                          cipher = Depends(get_cipher)):
     if not ObjectId.is_valid(customer_id):
         raise HTTPException(status_code=400, detail="Invalid ObjectId")
     
     update_data = {k: v for k, v in customer_update.dict().items() if v is not None}
+    update_data = cipher.encrypt_record(update_data, CUSTOMER_PII_FIELDS)
     
     result = db["customers"].update_one({"_id": ObjectId(customer_id)}, {"$set": update_data})
 
@@ -47,7 +68,7 @@ async def update_customer(customer_id: str, customer_update: CustomerUpdate, db
     if not updated_customer:
         raise HTTPException(status_code=404, detail="Customer not found after update")
     
-    return updated_customer
+    return cipher.decrypt_record(updated_customer, CUSTOMER_PII_FIELDS)
 
 # Delete a customer by ID
 @router.delete("/{customer_id}", response_model=dict)
@@ -64,9 +85,11 @@ async def delete_customer(customer_id: str, db = Depends(get_db)):
 
 # Get all customers (optional)
 @router.get("/", response_model=List[CustomerResponse])
-async def get_all_customers(skip: int = 0, limit: int = 10, db = Depends(get_db)):
+async def get_all_customers(skip: int = 0, limit: int = 10, db = Depends(get_db), cipher = Depends(get_cipher)):
     customers = db["customers"].find().skip(skip).limit(limit)
-    return list(customers)
+    # Documents come straight from our collection, so skip per-item response-model validation
+    return trusted_json([customer_to_response(cipher.decrypt_record(customer, CUSTOMER_PII_FIELDS))
+                         for customer in customers])
 
 
 """
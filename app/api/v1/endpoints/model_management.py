@@ -1,36 +1,61 @@
 from fastapi import APIRouter, HTTPException
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List
 
-router = APIRouter()
+from app.services.drift_service import drift_monitor
+from app.services.experiment_service import experiment_router
+from app.services.model_registry import model_registry
 
-# In-memory simulation for model registry and deployments
-model_registry = {
-    "v1.2": {"status": "deployed", "metrics": {"accuracy": 0.93}},
-    "v1.3": {"status": "deployed", "metrics": {"accuracy": 0.95}}
-}
-active_model = "v1.3"
-deployment_history = []
+router = APIRouter()
 
 # Endpoint 1: Deploy Model
 @router.post("/deploy", response_model=dict)
 async def deploy_model(model_version: str, deployment_strategy: str, canary_traffic_percentage: Optional[int] = 100):
     """
     Deploys a new model version with a given deployment strategy (e.g., canary, blue-green).
+    The version is loaded and warmed before it takes traffic; in-flight requests finish on the previous one.
+    A canary below 100% routes that share of customers to the new version; deploying it at 100% promotes it.
     """
     if model_version not in model_registry:
         raise HTTPException(status_code=404, detail="Model version not found in registry")
+    if canary_traffic_percentage is None or not 0 <= canary_traffic_percentage <= 100:
+        raise HTTPException(status_code=400, detail="canary_traffic_percentage must be between 0 and 100")
 
-    # Simulate deployment
-    deployment_history.append({
-        "model_version": model_version,
-        "strategy": deployment_strategy,
-        "canary_traffic_percentage": canary_traffic_percentage
-    })
+    if deployment_strategy == "canary" and canary_traffic_percentage < 100:
+        stable_version = model_registry.active_version
+        try:
+            experiment = await run_in_threadpool(
+                experiment_router.start, f"canary-{model_version}",
+                {"stable": stable_version, "canary": model_version},
+                {"stable": 100 - canary_traffic_percentage, "canary": canary_traffic_percentage},
+                "canary"
+            )
+        except (ValueError, OSError) as e:
+            raise HTTPException(status_code=422, detail=f"Model artifact could not be loaded: {e}")
+        return {
+            "status": "canary_started",
+            "model_version": model_version,
+            "stable_version": stable_version,
+            "deployment_strategy": deployment_strategy,
+            "canary_traffic_percentage": canary_traffic_percentage,
+            "experiment_name": experiment.name
+        }
+
+    try:
+        swap = await run_in_threadpool(model_registry.activate, model_version, deployment_strategy, canary_traffic_percentage)
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=422, detail=f"Model artifact could not be loaded: {e}")
+    running = experiment_router.running
+    if running is not None and running.kind == "canary":
+        experiment_router.stop(running.name, status="promoted" if model_version in running.versions else "completed")
     return {
-        "status": "deployment_started",
+        "status": "deployed",
         "model_version": model_version,
+        "previous_version": swap["previous_version"],
         "deployment_strategy": deployment_strategy,
-        "canary_traffic_percentage": canary_traffic_percentage
+        "canary_traffic_percentage": canary_traffic_percentage,
+        "load_seconds": swap["load_seconds"],
+        "swap_seconds": swap["swap_seconds"]
     }
 
 # Endpoint 2: Rollback Model
@@ -39,15 +64,20 @@ async def rollback_model(model_version: str):
     """
     Rolls back to a previous model version in case of performance issues or unexpected behavior.
     """
-    global active_model
     if model_version not in model_registry:
         raise HTTPException(status_code=404, detail="Model version not found in registry")
-    
-    # Simulate rollback
-    active_model = model_version
+
+    try:
+        swap = await run_in_threadpool(model_registry.activate, model_version, "rollback")
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=422, detail=f"Model artifact could not be loaded: {e}")
+    running = experiment_router.running
+    if running is not None and running.kind == "canary":
+        experiment_router.stop(running.name, status="rolled_back")
     return {
-        "status": "rollback_started",
+        "status": "rolled_back",
         "model_version": model_version,
+        "previous_version": swap["previous_version"],
         "message": f"Model successfully rolled back to version {model_version}."
     }
 
@@ -57,23 +87,31 @@ async def get_active_model():
     """
     Retrieves the currently deployed model version and its deployment strategy.
     """
+    active_version = model_registry.active_version
+    deployments = [d for d in model_registry.history if d["model_version"] == active_version]
     return {
-        "active_model_version": active_model,
-        "deployment_strategy": "canary",
-        "deployed_at": "2023-09-21T10:00:00Z"
+        "active_model_version": active_version,
+        "deployment_strategy": deployments[-1]["strategy"] if deployments else None,
+        "deployed_at": deployments[-1]["deployed_at"] if deployments else None,
+        "loaded_versions": model_registry.loaded_versions()
     }
 
 # Endpoint 4: Register Model Version
 @router.post("/versioning", response_model=dict)
-async def register_model_version(model_version: str, training_data: str, metrics: dict, trained_by: str):
+async def register_model_version(model_version: str, training_data: str, metrics: dict, trained_by: str,
+                                 artifact_path: Optional[str] = None):
     """
     Adds a new model version to the registry with appropriate metadata.
-    """
-    model_registry[model_version] = {
-        "training_data": training_data,
-        "metrics": metrics,
-        "trained_by": trained_by
-    }
+    `artifact_path` is the directory of a saved intent model; without it the version serves the keyword rules.
+    """
+    try:
+        model_registry.register(model_version, {
+            "training_data": training_data,
+            "metrics": metrics,
+            "trained_by": trained_by
+        }, artifact_path=artifact_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "status": "model_version_registered",
         "model_version": model_version,
@@ -84,12 +122,21 @@ async def register_model_version(model_version: str, training_data: str, metrics
 @router.post("/ab-test/start", response_model=dict)
 async def start_ab_test(experiment_name: str, model_a_version: str, model_b_version: str, traffic_split: dict, metrics: List[str]):
     """
-    Initiates an A/B test between two model versions with a given traffic split.
+    Initiates an A/B test between two model versions with a given traffic split,
+    e.g. {"model_a": 50, "model_b": 50}. Customers are assigned to arms deterministically.
     """
     if model_a_version not in model_registry or model_b_version not in model_registry:
         raise HTTPException(status_code=404, detail="One or both model versions not found in registry")
-    
-    # Simulate starting an A/B test
+
+    try:
+        await run_in_threadpool(
+            experiment_router.start, experiment_name,
+            {"model_a": model_a_version, "model_b": model_b_version}, traffic_split, "ab_test", metrics
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        raise HTTPException(status_code=422, detail=f"Model artifact could not be loaded: {e}")
     return {
         "status": "ab_test_started",
         "experiment_name": experiment_name,
@@ -101,36 +148,35 @@ async def start_ab_test(experiment_name: str, model_a_version: str, model_b_vers
 @router.get("/ab-test/status", response_model=dict)
 async def get_ab_test_status(experiment_name: str):
     """
-    Retrieves the status of an ongoing A/B test, including traffic splits and performance metrics.
+    Retrieves the status of an ongoing A/B test, including traffic splits and live per-arm metrics
+    (request share, latency percentiles, mean confidence and feedback rate with 95% confidence intervals).
     """
-    # Simulate ongoing A/B test
-    return {
-        "experiment_name": experiment_name,
-        "traffic_split": {
-            "model_a": 50,
-            "model_b": 50
-        },
-        "metrics": {
-            "model_a": {"accuracy": 0.94, "response_time": "1.2s"},
-            "model_b": {"accuracy": 0.95, "response_time": "1.3s"}
-        },
-        "status": "ongoing"
-    }
+    status = experiment_router.status(experiment_name)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    return status
 
 # Endpoint 7: Trigger Drift Detection
 @router.post("/drift-detection", response_model=dict)
 async def trigger_drift_detection(model_version: str, drift_detection_window: str, metrics: List[str]):
     """
-    Triggers drift detection for the specified model version over a given window.
+    Triggers drift detection for the specified model version over a given window (e.g. "24h", "last_7_days").
+    The last window of live traffic becomes the baseline that later traffic is compared against.
     """
     if model_version not in model_registry:
         raise HTTPException(status_code=404, detail="Model version not found in registry")
-    
-    # Simulate drift detection initiation
+
+    try:
+        model = await run_in_threadpool(model_registry.load, model_version)
+        baseline = await run_in_threadpool(drift_monitor.capture_baseline, model, drift_detection_window, metrics)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "status": "drift_detection_started",
         "model_version": model_version,
-        "drift_detection_window": drift_detection_window
+        "drift_detection_window": drift_detection_window,
+        "baseline_captured_at": baseline["captured_at"],
+        "baseline_samples": baseline["baseline_samples"]
     }
 
 # Endpoint 8: Get Drift Detection Status
@@ -138,17 +184,24 @@ async def trigger_drift_detection(model_version: str, drift_detection_window: st
 async def get_drift_detection_status(model_version: str):
     """
     Retrieves the status of ongoing drift detection and performance comparison.
+    Compares confidence, intent and token distributions since the baseline using PSI and KS statistics.
     """
     if model_version not in model_registry:
         raise HTTPException(status_code=404, detail="Model version not found in registry")
-    
-    # Simulate drift detection result
-    return {
-        "model_version": model_version,
-        "drift_detected": True,
-        "metrics_comparison": {
-            "expected_accuracy": 0.95,
-            "current_accuracy": 0.90
-        },
-        "recommendation": "Consider retraining the model."
-    }
+
+    model = await run_in_threadpool(model_registry.load, model_version)
+    result = await run_in_threadpool(drift_monitor.compare, model)
+    if result is None:
+        return {
+            "model_version": model_version,
+            "status": "not_started",
+            "drift_detected": None,
+            "recommendation": "Trigger drift detection to capture a baseline."
+        }
+    if result["drift_detected"]:
+        result["recommendation"] = "Consider retraining the model."
+    elif result["drift_detected"] is None:
+        result["recommendation"] = "Not enough traffic since the baseline to compare yet."
+    else:
+        result["recommendation"] = "No action needed."
+    return result
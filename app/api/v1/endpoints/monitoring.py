@@ -1,31 +1,55 @@
-from fastapi import APIRouter, HTTPException
+import os
+import shutil
+import time
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
 from typing import List, Optional
 from datetime import datetime
+from app.core.config import settings
+from app.db import get_db
+from app.services.feedback_service import parse_timestamp
+from app.services.model_registry import model_registry
+from app.services.error_service import MAX_PAGE_SIZE, error_buffer, error_store, group_to_response, parse_report
+from app.services.alert_service import AlertRule, add_rule, alert_notifier, new_rule_id, read_state
+from app.services import metrics_service as m
+from app.services.timeseries_service import metrics_recorder, model_series, timeseries_store
+from app.services.tracing_service import trace_to_dict, tracing
+from app.services.profiling_service import ProfilerBusy, ProfileSession, profiler
 
 router = APIRouter()
 
-# In-memory storage for error logs, system metrics, and alerts
-error_logs = []
-active_alerts = []
+def _ai_metrics(collected: dict, model_version: Optional[str] = None) -> dict:
+    where = (lambda labels: labels["model_version"] == model_version) if model_version else None
+    latency = m.histogram_summary(m.intent_inference_duration, collected[m.intent_inference_duration.name], where)
+    confidence = m.histogram_summary(m.intent_confidence, collected[m.intent_confidence.name], where)
+    errors = sum(float(value[0]) for key, value in collected[m.intent_inference_errors.name].items()
+                 if model_version is None or key[0] == model_version)
+    return {
+        "predictions": confidence["count"],
+        "avg_confidence_score": round(confidence["avg"], 4) if confidence["avg"] is not None else None,
+        "inference_time": latency,
+        "inference_errors": int(errors)
+    }
 
 # Endpoint 1: Get System Metrics (e.g., CPU, memory, response times)
 @router.get("/system-metrics", response_model=dict)
 async def get_system_metrics():
     """
     Retrieves key system performance metrics such as CPU usage, memory usage, and response times.
+    Process figures are summed over the live workers; response times (seconds) cover all requests served.
     """
-    # Simulated system metrics
-    system_metrics = {
-        "cpu_usage": "60%",
-        "memory_usage": "2.5 GB",
-        "response_time": {
-            "avg_response_time": "1.2s",
-            "max_response_time": "3.5s",
-            "min_response_time": "0.5s"
-        },
-        "uptime": "99.98%"
+    collected = await run_in_threadpool(m.metrics.collect)
+    started = m.gauge_value(collected, m.process_start_time)
+    return {
+        "cpu_usage_percent": m.gauge_value(collected, m.process_cpu_percent),
+        "memory_usage_bytes": m.gauge_value(collected, m.process_resident_memory),
+        "open_file_descriptors": m.gauge_value(collected, m.process_open_fds),
+        "requests_in_flight": m.gauge_value(collected, m.http_requests_in_flight),
+        "event_loop_lag_max_seconds": m.gauge_value(collected, m.event_loop_lag_max),
+        "response_time": m.histogram_summary(m.http_request_duration, collected[m.http_request_duration.name]),
+        "uptime_seconds": round(time.time() - started, 1) if started else None
     }
-    return system_metrics
 
 # Endpoint 2: Get AI Model Metrics
 @router.get("/ai-metrics", response_model=dict)
@@ -33,97 +57,135 @@ async def get_ai_metrics():
     """
     Retrieves performance metrics specific to the AI model, such as accuracy, confidence scores, and latency.
     """
-    # Simulated AI model metrics
-    ai_metrics = {
-        "avg_response_time": "1.1s",
-        "max_response_time": "2.8s",
-        "min_response_time": "0.7s",
-        "avg_confidence_score": 0.87,
-        "accuracy": 0.92,
-        "inference_errors": 5
+    collected = await run_in_threadpool(m.metrics.collect)
+    active_version = model_registry.active_version
+    entry = model_registry.get(active_version) or {}
+    return {
+        "model_version": active_version,
+        "accuracy": entry.get("metrics", {}).get("accuracy"),
+        **_ai_metrics(collected),
+        "by_model_version": {key[0]: _ai_metrics(collected, key[0]) for key in collected[m.intent_confidence.name]}
     }
-    return ai_metrics
+
+def _parse_range(start_time: str, end_time: str):
+    try:
+        start, end = parse_timestamp(start_time), parse_timestamp(end_time)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_time and end_time must be ISO 8601 timestamps")
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end_time must be after start_time")
+    epoch = datetime(1970, 1, 1)
+    return (start - epoch).total_seconds(), (end - epoch).total_seconds()
+
+def _iso(timestamp: float) -> str:
+    return datetime.utcfromtimestamp(timestamp).isoformat() + "Z"
 
 # Endpoint 3: Get Historical Model Performance
 @router.get("/model-performance", response_model=dict)
-async def get_model_performance(start_time: str, end_time: str):
+async def get_model_performance(start_time: str, end_time: str, model_version: Optional[str] = None):
     """
     Retrieves historical performance data of the AI model, including accuracy, confidence scores, and response time.
+    Points come from the finest rollup tier (raw, 1m, 1h) that covers the window; response times are in seconds.
     """
-    # Simulated model performance metrics for the given time window
-    historical_metrics = {
-        "model_version": "v1.4",
-        "metrics": [
-            {
-                "timestamp": "2023-09-21T12:00:00Z",
-                "accuracy": 0.93,
-                "confidence_score": 0.88,
-                "response_time": "1.0s"
-            },
-            {
-                "timestamp": "2023-09-21T13:00:00Z",
-                "accuracy": 0.91,
-                "confidence_score": 0.86,
-                "response_time": "1.1s"
-            }
-        ]
+    start, end = _parse_range(start_time, end_time)
+    model_version = model_version or model_registry.active_version
+    accuracy = (model_registry.get(model_version) or {}).get("metrics", {}).get("accuracy")
+    _, confidence, latency = model_series(model_version)
+    confidence_points = await run_in_threadpool(timeseries_store.query, confidence, start, end)
+    latency_points = await run_in_threadpool(timeseries_store.query, latency, start, end)
+    latency_by_time = {point["timestamp"]: point for point in latency_points["points"]}
+    points = []
+    for point in confidence_points["points"]:
+        timing = latency_by_time.get(point["timestamp"], {})
+        points.append({
+            "timestamp": _iso(point["timestamp"]),
+            "accuracy": accuracy,
+            "predictions": int(point["count"]),
+            "confidence_score": point["avg"],
+            "confidence_p95": point["p95"],
+            "response_time": timing.get("avg"),
+            "response_time_p95": timing.get("p95")
+        })
+    return {
+        "model_version": model_version,
+        "resolution_seconds": confidence_points["resolution_seconds"],
+        "metrics": points
     }
-    return historical_metrics
 
 # Endpoint 4: Report an Error
 @router.post("/error/report", response_model=dict)
 async def report_error(error_type: str, session_id: str, component: str, error_message: str):
     """
     Reports an error from any component of the system, including details about what went wrong.
+    Reports with the same type, component and message (ignoring numbers, ids and quoted values) share an error_id.
     """
-    error_id = f"error_{len(error_logs) + 1}"
-    timestamp = datetime.utcnow().isoformat()
-    error_entry = {
-        "error_id": error_id,
-        "error_type": error_type,
-        "session_id": session_id,
-        "component": component,
-        "error_message": error_message,
-        "timestamp": timestamp
-    }
-    error_logs.append(error_entry)
+    event = parse_report({"error_type": error_type, "session_id": session_id, "component": component,
+                          "error_message": error_message})
+    # Flushes to MongoDB inline when the buffer is full: off the event loop
+    [error_id] = await run_in_threadpool(error_buffer.add, [event])
     return {
         "status": "error_reported",
         "error_id": error_id,
-        "timestamp": timestamp
+        "timestamp": event["timestamp"].isoformat()
     }
 
 # Endpoint 5: Get Error Logs
 @router.get("/error/logs", response_model=dict)
-async def get_error_logs(start_time: Optional[str] = None, end_time: Optional[str] = None, error_type: Optional[str] = None):
+async def get_error_logs(start_time: Optional[str] = None, end_time: Optional[str] = None, error_type: Optional[str] = None,
+                         component: Optional[str] = None, cursor: Optional[str] = None, limit: int = 100,
+                         db = Depends(get_db)):
     """
     Retrieves error logs filtered by time period, error type, or component.
+    Errors are grouped by error_id, most recently seen first, with their occurrence counts in the window (resolved
+    to whole hours). Pages hold up to 1000 groups; pass next_cursor as `cursor` to get the next one.
     """
-    # Filter error logs by time range and error type
-    filtered_logs = [log for log in error_logs]
+    try:
+        start = parse_timestamp(start_time) if start_time else None
+        end = parse_timestamp(end_time) if end_time else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_time and end_time must be ISO 8601 timestamps")
+    if start and end and end <= start:
+        raise HTTPException(status_code=400, detail="end_time must be after start_time")
+    # This worker's own buffered reports first, so a report is visible to the reporter right away
+    await run_in_threadpool(error_buffer.flush)
+    try:
+        groups, next_cursor = await run_in_threadpool(error_store.page, db, start, end, error_type, component,
+                                                      cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
-        "error_logs": filtered_logs
+        "error_logs": [group_to_response(group) for group in groups],
+        "next_cursor": next_cursor,
+        "max_page_size": MAX_PAGE_SIZE
     }
 
 # Endpoint 6: Create an Alert
 @router.post("/error/alert", response_model=dict)
-async def create_alert(alert_name: str, metric: str, threshold: float, notification_method: str, email: Optional[str] = None):
+async def create_alert(alert_name: str, metric: str, threshold: float, notification_method: str, email: Optional[str] = None,
+                       webhook_url: Optional[str] = None, comparison: str = "above", for_seconds: float = 0.0,
+                       clear_threshold: Optional[float] = None):
     """
     Creates an alert when certain thresholds (e.g., high CPU usage) are exceeded.
+    The alert fires once `metric` has been beyond `threshold` for `for_seconds` and resolves when it gets back to
+    `clear_threshold` (default: the threshold). Notifications go by email or to a webhook, batched per recipient;
+    webhook URLs must use an allowed scheme and host (ALERT_WEBHOOK_SCHEMES, ALERT_WEBHOOK_ALLOWED_HOSTS).
     """
-    alert_id = f"alert_{len(active_alerts) + 1}"
-    alert_entry = {
-        "alert_id": alert_id,
-        "alert_name": alert_name,
-        "metric": metric,
-        "threshold": threshold,
-        "notification_method": notification_method,
-        "email": email
-    }
-    active_alerts.append(alert_entry)
+    known = metrics_recorder.metric_names()
+    if metric not in known and not metric.startswith("model."):
+        raise HTTPException(status_code=400, detail=f"Unknown metric; alertable metrics are: {', '.join(sorted(known))}")
+    if notification_method == "webhook" and webhook_url and not alert_notifier.webhook_allowed(webhook_url):
+        raise HTTPException(status_code=400, detail="webhook_url must use an allowed scheme and host")
+    try:
+        rule = AlertRule(new_rule_id(), alert_name, metric, threshold, comparison=comparison,
+                         clear_threshold=clear_threshold, for_seconds=for_seconds,
+                         notification_method=notification_method,
+                         target=email if notification_method == "email" else webhook_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await run_in_threadpool(add_rule, settings.ALERT_DIR, rule)
     return {
         "status": "alert_created",
-        "alert_id": alert_id
+        "alert_id": rule.alert_id
     }
 
 # Endpoint 7: Get Active Alerts
@@ -131,9 +193,17 @@ async def create_alert(alert_name: str, metric: str, threshold: float, notificat
 async def get_active_alerts():
     """
     Retrieves a list of active alerts, including performance metrics or errors that have crossed predefined thresholds.
+    Firing alerts are listed under `active_alerts`; alerts still waiting out their for-duration under `pending_alerts`.
     """
+    state = await run_in_threadpool(read_state, settings.ALERT_DIR)
+    alerts = sorted(state["alerts"], key=lambda alert: alert["since"])
+    for alert in alerts:
+        alert["since"] = _iso(alert["since"])
+        alert.pop("due_at", None)
     return {
-        "active_alerts": active_alerts
+        "active_alerts": [alert for alert in alerts if alert["state"] == "firing"],
+        "pending_alerts": [alert for alert in alerts if alert["state"] == "pending"],
+        "evaluated_at": _iso(state["evaluated_at"]) if state["evaluated_at"] else None
     }
 
 # Endpoint 8: Get Resource Usage (e.g., disk space, network bandwidth)
@@ -141,11 +211,127 @@ async def get_active_alerts():
 async def get_resource_usage():
     """
     Tracks resource usage such as disk space, network bandwidth, and database query rates.
+    Database and Redis figures are command counts and latencies (seconds) since the workers started.
+    """
+    collected = await run_in_threadpool(m.metrics.collect)
+    disk = shutil.disk_usage(settings.METRICS_DIR if os.path.isdir(settings.METRICS_DIR) else ".")
+    return {
+        "disk_space_used_bytes": disk.used,
+        "disk_space_free_bytes": disk.free,
+        "network_bytes": m.read_network_bytes(),
+        "database_commands": m.histogram_summary(m.mongo_command_duration, collected[m.mongo_command_duration.name]),
+        "database_errors": int(sum(float(v[0]) for v in collected[m.mongo_command_errors.name].values())),
+        "redis_commands": m.histogram_summary(m.redis_command_duration, collected[m.redis_command_duration.name]),
+        "redis_errors": int(sum(float(v[0]) for v in collected[m.redis_command_errors.name].values()))
+    }
+
+# Endpoint 9: Get Metric History
+@router.get("/history", response_model=dict)
+async def get_metric_history(series: str, start_time: str, end_time: str):
+    """
+    Retrieves the history of one recorded series (count, avg, min, max, p95 per point) over a time window.
+    """
+    start, end = _parse_range(start_time, end_time)
+    specs = metrics_recorder.specs()
+    if series not in specs:
+        raise HTTPException(status_code=404, detail=f"Unknown series; recorded series are: {', '.join(sorted(specs))}")
+    result = await run_in_threadpool(timeseries_store.query, specs[series], start, end)
+    for point in result["points"]:
+        point["timestamp"] = _iso(point["timestamp"])
+    return result
+
+# Endpoint 10: Report a Batch of Errors
+@router.post("/error/report/batch", response_model=dict)
+async def report_errors(errors: List[dict]):
+    """
+    Reports many errors at once, each with error_type, component, error_message and optionally session_id and an
+    ISO 8601 timestamp (for errors collected while offline).
     """
-    # Simulated resource usage
-    resource_usage = {
-        "disk_space_used": "120 GB",
-        "network_bandwidth": "450 Mbps",
-        "database_query_rate": "50 queries/sec"
+    events = []
+    for i, report in enumerate(errors):
+        try:
+            events.append(parse_report(report))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"errors[{i}]: {e}")
+    error_ids = await run_in_threadpool(error_buffer.add, events)
+    return {
+        "status": "errors_reported",
+        "received": len(events),
+        "error_ids": error_ids
     }
-    return resource_usage
+
+def _require_tracing():
+    if not tracing.enabled:
+        raise HTTPException(status_code=404, detail="Tracing is disabled (set TRACING_ENABLED=true)")
+
+# Endpoint 11: Get Recent Traces
+@router.get("/traces", response_model=dict)
+async def get_recent_traces(limit: int = 20):
+    """
+    Lists the most recent traced requests and Celery tasks of this worker, newest first.
+    """
+    _require_tracing()
+    roots = tracing.recent.roots(max(1, min(limit, 200)))
+    return {
+        "traces": [{
+            "trace_id": format(span.context.trace_id, "032x"),
+            "name": span.name,
+            "started_at": _iso(span.start_time / 1e9),
+            "duration_ms": round((span.end_time - span.start_time) / 1e6, 3),
+            "status": span.status.status_code.name
+        } for span in roots]
+    }
+
+# Endpoint 12: Get a Trace
+@router.get("/traces/{trace_id}", response_model=dict)
+async def get_trace(trace_id: str):
+    """
+    Retrieves the spans of one trace (trace id from the X-Trace-ID response header) and the time spent per kind of
+    work: MongoDB, Redis, TTS, intent classification, Celery publishes and the request's own code.
+    """
+    _require_tracing()
+    try:
+        spans = tracing.recent.trace(trace_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="trace_id must be hexadecimal")
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have aged out of this worker's buffer)")
+    return trace_to_dict(spans)
+
+def _profile_response(session: ProfileSession, format: str, title: str) -> Response:
+    if format == "folded":
+        return Response(session.folded(), media_type="text/plain")
+    return Response(session.flamegraph(title), media_type="image/svg+xml")
+
+def _check_profile_format(format: str):
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set PROFILING_ENABLED=true)")
+    if format not in ("svg", "folded"):
+        raise HTTPException(status_code=400, detail="format must be svg or folded")
+
+# Endpoint 13: Profile a Time Window
+@router.post("/profile")
+async def profile_window(seconds: float = 10, format: str = "svg"):
+    """
+    Samples this worker's stacks for `seconds` and returns a flame graph (svg) or folded stacks.
+    """
+    _check_profile_format(format)
+    if not 0 < seconds <= settings.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {settings.PROFILE_MAX_SECONDS:g}")
+    try:
+        session = await profiler.profile_window(seconds)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _profile_response(session, format, f"{seconds:g}s window")
+
+# Endpoint 14: Get the Profile of a Request
+@router.get("/profile/{request_id}")
+async def get_request_profile(request_id: str, format: str = "svg"):
+    """
+    Retrieves the flame graph of a request sent with an `X-Profile: 1` header, by its X-Request-ID.
+    """
+    _check_profile_format(format)
+    session = profiler.results.get(request_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profile for this request id in this worker")
+    return _profile_response(session, format, f"Request {request_id}")
@@ -1,12 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional, List
 from datetime import datetime
+from app.services.session_service import session_store
+from app.services.annotation_queue import annotation_queue
 
 router = APIRouter()
 
-# In-memory storage for conversation context and session tracking
-conversation_log = {}
-
 # Endpoint 1: Context-Aware Response
 @router.post("/context-aware-response", response_model=dict)
 async def context_aware_response(session_id: str, customer_id: str, input_text: str, context: dict):
@@ -28,12 +27,14 @@ async def context_aware_response(session_id: str, customer_id: str, input_text:
         updated_task = current_task
     
     # Save the conversation context
-    conversation_log[session_id] = {
+    await session_store.save(session_id, {
         "context": context,
         "response_text": response_text,
         "confidence_score": confidence_score
-    }
+    })
 
+    annotation_queue.offer(input_text, updated_task, confidence_score, "orchestration",
+                           session_id=session_id, customer_id=customer_id, response_text=response_text)
     requires_handoff = confidence_score < 0.7
     
     return {
@@ -63,10 +64,10 @@ async def task_oriented_dialog(session_id: str, customer_id: str, task: str, cur
         task_completion = 0.3
 
     # Update the conversation log
-    conversation_log[session_id] = {
+    await session_store.save(session_id, {
         "task": task,
         "task_completion": task_completion
-    }
+    })
 
     return {
         "response_text": response_text,
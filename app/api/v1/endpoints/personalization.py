@@ -1,65 +1,79 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List
 from datetime import datetime
+from app.db import get_db
+from app.services.cache_service import cached
+from app.services.recommendation_service import recommendation_engine
+from app.services.offer_service import offer_store, load_customer_data, purchased_product_ids, RECOMMENDATIONS_LIMIT
+from app.services.targeting_service import targeting_engine, customer_facts
 
 router = APIRouter()
 
-# Simulated Databases for Personalization (to be replaced by CRM and Order Management Systems)
-fake_customer_db = {
-    "user123": {
-        "preferences": {
-            "preferred_language": "English",
-            "preferred_category": "electronics",
-            "device": "smartphone"
-        },
-        "recent_orders": [
-            {
-                "order_id": "12345",
-                "product": "Smartphone",
-                "price": "$799.99",
-                "order_date": "2023-09-20"
-            }
-        ]
-    }
-}
+SUGGESTIONS_LIMIT = 3
+
+# Customer profiles and orders live in the CRM/order collections:
+#   customer_profiles: {customer_id, preferences, updated_at}
+#   orders:            {customer_id, order_id, product_id, product, price, order_date, created_at}
+# Request handlers read the per-customer materialized offers (app/services/offer_service.py).
 
 # In-memory storage for personalized recommendations and dynamic content
 personalization_log = {}
 
 
+def get_customer_data(db, customer_id: str) -> dict:
+    """
+    Loads a customer's preferences and most recent orders, raising 404 for unknown customers.
+    """
+    customer_data = load_customer_data(db, [customer_id]).get(customer_id)
+    if not customer_data:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return customer_data
+
+
+@cached("offers", ttl=60, key_builder=lambda db, customer_id: customer_id)
+async def get_offers(db, customer_id: str) -> dict:
+    """
+    Single key lookup of the customer's materialized offers, raising 404 for unknown customers.
+    """
+    # A customer without offers yet has them computed here, from several queries: off the event loop
+    offers = await run_in_threadpool(offer_store.get, db, customer_id)
+    if offers is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return offers
+
+
+async def refresh_offers(db, customer_id: str):
+    """
+    Recomputes one customer's offers and drops the cached copy in every worker.
+    """
+    # pymongo blocks: off the event loop, which keeps serving requests meanwhile
+    await run_in_threadpool(offer_store.refresh_customers, db, [customer_id])
+    await get_offers.invalidate(db, customer_id)
+
+
 # Endpoint 1: Personalized Recommendations
 @router.post("/recommendations", response_model=dict)
-async def personalized_recommendations(customer_id: str, context: dict):
+async def personalized_recommendations(customer_id: str, context: dict, db = Depends(get_db)):
     """
     Provides personalized product or service recommendations based on the user's history, preferences, and interactions.
     """
-    customer_data = fake_customer_db.get(customer_id)
-
-    if not customer_data:
-        raise HTTPException(status_code=404, detail="Customer not found")
+    offers = await get_offers(db, customer_id)
 
-    preferences = context.get("preferences", {})
+    preferred_category = context.get("preferences", {}).get("preferred_category")
     recent_interactions = context.get("recent_interactions", [])
 
-    # Example recommendation logic (this would typically use a recommendation engine)
-    if preferences.get("preferred_category") == "electronics":
-        recommendations = [
-            {
-                "product_id": "987",
-                "product_name": "Wireless Earbuds",
-                "category": "accessories",
-                "price": "$99.99"
-            },
-            {
-                "product_id": "1234",
-                "product_name": "Phone Case",
-                "category": "accessories",
-                "price": "$19.99"
-            }
-        ]
-        response_text = "Since you've bought a smartphone recently, we recommend these accessories."
+    if preferred_category and preferred_category != offers["preferred_category"]:
+        # Ad-hoc preference override: rank live instead of using the materialized list
+        recommendations = recommendation_engine.recommend(
+            purchased_product_ids(offers), k=RECOMMENDATIONS_LIMIT, preferred_category=preferred_category
+        )
+    else:
+        recommendations = offers["recommendations"]
+
+    if recommendations:
+        response_text = "Based on your order history, we recommend these items."
     else:
-        recommendations = []
         response_text = "We couldn't find any recommendations for your preferences."
 
     return {
@@ -70,19 +84,22 @@ async def personalized_recommendations(customer_id: str, context: dict):
 
 # Endpoint 2: Fetch or Update Customer Profile
 @router.post("/customer-profile", response_model=dict)
-async def manage_customer_profile(customer_id: str, update: Optional[bool] = False, profile_update: Optional[dict] = None):
+async def manage_customer_profile(background_tasks: BackgroundTasks, customer_id: str, update: Optional[bool] = False, profile_update: Optional[dict] = None, db = Depends(get_db)):
     """
     Fetches or updates the customer's profile.
     If `update` is True, it updates the customer's preferences; otherwise, it fetches the profile.
     """
-    customer_data = fake_customer_db.get(customer_id)
-
-    if not customer_data:
-        raise HTTPException(status_code=404, detail="Customer not found")
+    customer_data = get_customer_data(db, customer_id)
 
     if update and profile_update:
         # Update profile
+        db["customer_profiles"].update_one(
+            {"customer_id": customer_id},
+            {"$set": {**{f"preferences.{k}": v for k, v in profile_update.items()}, "updated_at": datetime.utcnow()}}
+        )
         customer_data["preferences"].update(profile_update)
+        # Targeted recomputation of this customer's materialized offers
+        background_tasks.add_task(refresh_offers, db, customer_id)
         return {
             "status": "profile_updated",
             "updated_profile": customer_data
@@ -98,35 +115,17 @@ async def manage_customer_profile(customer_id: str, update: Optional[bool] = Fal
 
 # Endpoint 3: Deliver Personalized Dynamic Content
 @router.post("/dynamic-content", response_model=dict)
-async def dynamic_content(customer_id: str, interaction_context: dict):
+async def dynamic_content(customer_id: str, interaction_context: dict, db = Depends(get_db)):
     """
     Delivers personalized dynamic content such as banners, offers, and discounts based on the user's preferences and behavior.
     """
-    customer_data = fake_customer_db.get(customer_id)
+    offers = await get_offers(db, customer_id)
 
-    if not customer_data:
-        raise HTTPException(status_code=404, detail="Customer not found")
-
-    # Simulate personalized dynamic content
-    if interaction_context.get("last_clicked_item") == "Smartphone":
-        dynamic_content = {
-            "banner": "Get 10% off on Smartphone Accessories!",
-            "offers": [
-                {
-                    "product_id": "987",
-                    "offer": "10% off Wireless Earbuds"
-                },
-                {
-                    "product_id": "1234",
-                    "offer": "Buy 1 Get 1 Free on Phone Cases"
-                }
-            ]
-        }
-    else:
-        dynamic_content = {
-            "banner": "Check out our latest offers!",
-            "offers": []
-        }
+    # Highest-priority targeting rule matching the profile, recent orders and interaction context
+    dynamic_content = targeting_engine.select(customer_facts(offers, interaction_context)) or {
+        "banner": "Check out our latest offers!",
+        "offers": []
+    }
 
     return {
         "dynamic_content": dynamic_content
@@ -135,14 +134,11 @@ async def dynamic_content(customer_id: str, interaction_context: dict):
 
 # Endpoint 4: Retrieve Order History
 @router.get("/order-history", response_model=dict)
-async def order_history(customer_id: str):
+async def order_history(customer_id: str, db = Depends(get_db)):
     """
     Retrieves the customer's order history.
     """
-    customer_data = fake_customer_db.get(customer_id)
-
-    if not customer_data:
-        raise HTTPException(status_code=404, detail="Customer not found")
+    customer_data = get_customer_data(db, customer_id)
 
     return {
         "customer_id": customer_id,
@@ -152,38 +148,52 @@ async def order_history(customer_id: str):
 
 # Endpoint 5: Contextual Response Based on User Data
 @router.post("/contextual-response", response_model=dict)
-async def contextual_response(session_id: str, customer_id: str, input_text: str, context: dict):
+async def contextual_response(session_id: str, customer_id: str, input_text: str, context: dict, db = Depends(get_db)):
     """
     Generates a personalized response during a conversation based on the user’s profile, preferences, and interaction history.
     """
-    customer_data = fake_customer_db.get(customer_id)
-
-    if not customer_data:
-        raise HTTPException(status_code=404, detail="Customer not found")
+    offers = await get_offers(db, customer_id)
 
     preferences = context.get("preferences", {})
     recent_interactions = context.get("recent_interactions", [])
 
-    # Simulate response generation based on context
-    if "smartphone" in input_text.lower():
-        suggested_items = [
-            {
-                "product_id": "987",
-                "product_name": "Wireless Earbuds",
-                "price": "$99.99"
-            },
-            {
-                "product_id": "1234",
-                "product_name": "Phone Case",
-                "price": "$19.99"
-            }
-        ]
-        response_text = "Based on your recent smartphone purchase, I recommend checking out wireless earbuds or phone accessories."
+    # Suggest the top items bought together with the customer's purchases
+    suggested_items = offers["recommendations"][:SUGGESTIONS_LIMIT]
+    if suggested_items:
+        names = [item["product_name"] for item in suggested_items]
+        listed = names[0] if len(names) == 1 else f"{', '.join(names[:-1])} or {names[-1]}"
+        response_text = f"Based on your recent purchases, I recommend checking out {listed}."
     else:
-        suggested_items = []
         response_text = "I don't have specific recommendations for that request."
 
     return {
         "response_text": response_text,
         "suggested_items": suggested_items
     }
+
+
+# Endpoint 6: Replace Dynamic Content Targeting Rules
+@router.post("/targeting-rules", response_model=dict)
+async def set_targeting_rules(rules: List[dict]):
+    """
+    Replaces the dynamic content targeting rules. Rules are compiled before they are stored, and other workers pick them up within seconds.
+    """
+    try:
+        rule_count = targeting_engine.replace_rules(rules)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "status": "targeting_rules_updated",
+        "rule_count": rule_count
+    }
+
+
+# Endpoint 7: List Dynamic Content Targeting Rules
+@router.get("/targeting-rules", response_model=dict)
+async def get_targeting_rules():
+    """
+    Retrieves the active targeting rules in evaluation (priority) order.
+    """
+    return {
+        "rules": targeting_engine.compiled.rules
+    }
@@ -1,18 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
 import base64
 from typing import List, Optional
 from datetime import datetime
-from cryptography.fernet import Fernet
+from app.core.resources import get_cipher
+from app.services.encryption_service import DecryptionError
+from app.services.firewall_service import firewall_engine
+from app.services.metrics_service import firewall_rule_hits, metrics
+from app.services.rbac_service import access_control
 
 router = APIRouter()
 
-# Generate encryption key for AES-256-like encryption simulation
-encryption_key = Fernet.generate_key()
-cipher_suite = Fernet(encryption_key)
-
-# In-memory storage for access logs, firewall rules, and GDPR/CCPA requests
+# In-memory storage for access logs and GDPR/CCPA requests
 access_logs = []
-firewall_rules = []
 gdpr_requests = []
 ccpa_requests = []
 active_threats = [
@@ -20,43 +20,50 @@ active_threats = [
     {"threat_id": "threat_002", "threat_type": "SQL Injection", "severity": "medium", "timestamp": "2023-09-21T14:45:00Z"}
 ]
 
+# Methods accepted by the encryption endpoints; both name AES-256-GCM
+ENCRYPTION_METHODS = ("AES-256", "AES-256-GCM")
+
 # Endpoint 1: Encrypt Data
 @router.post("/encrypt-data", response_model=dict)
-async def encrypt_data(data: dict, encryption_method: str):
+async def encrypt_data(data: dict, encryption_method: str, fields: Optional[List[str]] = Query(None),
+                       cipher = Depends(get_cipher)):
     """
-    Encrypts sensitive data (e.g., user PII) using specified encryption methods like AES-256.
+    Encrypts sensitive fields of a record (default: all of them) with AES-256-GCM, each on its own.
     """
-    if encryption_method == "AES-256":
-        encrypted_data = cipher_suite.encrypt(str(data).encode())
-        return {
-            "status": "data_encrypted",
-            "encrypted_data": encrypted_data.decode()
-        }
-    else:
+    if encryption_method not in ENCRYPTION_METHODS:
         raise HTTPException(status_code=400, detail="Unsupported encryption method")
+    return {
+        "status": "data_encrypted",
+        "key_id": cipher.active_key_id,
+        "encrypted_data": cipher.encrypt_record(data, fields)
+    }
 
 # Endpoint 2: Decrypt Data
 @router.post("/decrypt-data", response_model=dict)
-async def decrypt_data(encrypted_data: str):
+async def decrypt_data(encrypted_data: dict, fields: Optional[List[str]] = Query(None), cipher = Depends(get_cipher)):
     """
-    Decrypts sensitive data that was encrypted with AES-256.
+    Decrypts the fields of a record that were encrypted by /encrypt-data; other fields are returned as they are.
     """
     try:
-        decrypted_data = cipher_suite.decrypt(encrypted_data.encode()).decode()
         return {
             "status": "data_decrypted",
-            "decrypted_data": decrypted_data
+            "decrypted_data": cipher.decrypt_record(encrypted_data, fields)
         }
-    except Exception as e:
+    except DecryptionError as e:
         raise HTTPException(status_code=400, detail=f"Decryption failed: {str(e)}")
 
 # Endpoint 3: Role-Based Access Control (RBAC)
 @router.post("/access-control", response_model=dict)
 async def set_access_control(user_id: str, role: str, permissions: List[str]):
     """
-    Implements role-based access control (RBAC) to manage user permissions.
+    Gives `role` exactly `permissions` and assigns it to `user_id`. Takes effect on the next request of every
+    user holding the role: their cached permissions are dropped here, other workers reload within seconds.
     """
-    # Simulate RBAC settings (can be stored in a database for real implementation)
+    try:
+        # Rewrites the whole policy, which takes a while with thousands of roles
+        effective = await run_in_threadpool(access_control.set_access_control, user_id, role, permissions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     access_logs.append({
         "user_id": user_id,
         "role": role,
@@ -66,7 +73,8 @@ async def set_access_control(user_id: str, role: str, permissions: List[str]):
     return {
         "status": "access_granted",
         "user_id": user_id,
-        "role": role
+        "role": role,
+        "effective_permissions": effective
     }
 
 # Endpoint 4: Retrieve Access Logs
@@ -83,13 +91,20 @@ async def get_access_logs(start_time: Optional[str] = None, end_time: Optional[s
 @router.post("/set-firewall-rules", response_model=dict)
 async def set_firewall_rules(rule_name: str, action: str, pattern: str):
     """
-    Configures firewall rules to block malicious traffic such as SQL injections or DDoS attacks.
+    Configures firewall rules to block malicious traffic such as SQL injections. `pattern` is a case-insensitive
+    regex matched against request paths, query strings and bodies; `action` is "block" (403) or "log".
+    A rule with the same name is replaced. Other workers pick the change up within seconds.
     """
     firewall_rule = {"rule_name": rule_name, "action": action, "pattern": pattern}
-    firewall_rules.append(firewall_rule)
+    try:
+        # Recompiles the whole rule set, which takes a while for thousands of rules
+        rule_count = await run_in_threadpool(firewall_engine.set_rule, firewall_rule)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "status": "firewall_rule_set",
-        "rule_name": rule_name
+        "rule_name": rule_name,
+        "rule_count": rule_count
     }
 
 # Endpoint 6: Handle GDPR Data Deletion Request
@@ -136,3 +151,99 @@ async def get_active_threats():
     Retrieves active threats or security anomalies detected by the system.
     """
     return {"active_threats": active_threats}
+
+# Endpoint 10: Encrypt Many Records
+@router.post("/encrypt-data/batch", response_model=dict)
+async def encrypt_data_batch(records: List[dict] = Body(..., embed=True), encryption_method: str = "AES-256-GCM",
+                             fields: Optional[List[str]] = Query(None), cipher = Depends(get_cipher)):
+    """
+    Encrypts the fields of many records at once, in chunks spread over the encryption thread pool.
+    """
+    if encryption_method not in ENCRYPTION_METHODS:
+        raise HTTPException(status_code=400, detail="Unsupported encryption method")
+    encrypted = await cipher.encrypt_records(records, fields)
+    return {
+        "status": "data_encrypted",
+        "key_id": cipher.active_key_id,
+        "count": len(encrypted),
+        "encrypted_records": encrypted
+    }
+
+# Endpoint 11: Decrypt Many Records
+@router.post("/decrypt-data/batch", response_model=dict)
+async def decrypt_data_batch(records: List[dict] = Body(..., embed=True), fields: Optional[List[str]] = Query(None),
+                             cipher = Depends(get_cipher)):
+    """
+    Decrypts many records at once; fails as a whole if any field doesn't decrypt.
+    """
+    try:
+        decrypted = await cipher.decrypt_records(records, fields)
+    except DecryptionError as e:
+        raise HTTPException(status_code=400, detail=f"Decryption failed: {str(e)}")
+    return {
+        "status": "data_decrypted",
+        "count": len(decrypted),
+        "decrypted_records": decrypted
+    }
+
+# Endpoint 12: List Firewall Rules
+@router.get("/firewall-rules", response_model=dict)
+async def get_firewall_rules():
+    """
+    Lists the firewall rules with the number of requests each has matched, over all workers.
+    """
+    collected = await run_in_threadpool(metrics.collect)
+    hits = {}
+    for (rule_name, _), value in collected[firewall_rule_hits.name].items():
+        hits[rule_name] = hits.get(rule_name, 0) + int(value[0])
+    return {
+        "firewall_rules": [dict(rule, hits=hits.get(rule["rule_name"], 0))
+                           for rule in firewall_engine.compiled.rules]
+    }
+
+# Endpoint 13: Remove Firewall Rule
+@router.delete("/firewall-rules/{rule_name}", response_model=dict)
+async def delete_firewall_rule(rule_name: str):
+    """
+    Removes a firewall rule.
+    """
+    if not await run_in_threadpool(firewall_engine.remove_rule, rule_name):
+        raise HTTPException(status_code=404, detail="Firewall rule not found")
+    return {
+        "status": "firewall_rule_removed",
+        "rule_name": rule_name
+    }
+
+# Endpoint 14: Retrieve a User's Roles and Permissions
+@router.get("/access-control/{user_id}", response_model=dict)
+async def get_access_control(user_id: str):
+    """
+    Returns the roles assigned to a user and the permissions they add up to.
+    """
+    policy = access_control.policy
+    return {
+        "user_id": user_id,
+        "roles": policy.assignments.get(user_id, []),
+        "effective_permissions": policy.permissions_of(user_id)
+    }
+
+# Endpoint 15: Revoke a Role
+@router.delete("/access-control/{user_id}/{role}", response_model=dict)
+async def revoke_access_control(user_id: str, role: str):
+    """
+    Takes a role away from a user, effective on their next request.
+    """
+    if not await run_in_threadpool(access_control.revoke, user_id, role):
+        raise HTTPException(status_code=404, detail="Role not assigned to user")
+    access_logs.append({
+        "user_id": user_id,
+        "role": role,
+        "permissions": [],
+        "revoked": True,
+        "timestamp": datetime.utcnow().isoformat()
+    })
+    return {
+        "status": "access_revoked",
+        "user_id": user_id,
+        "role": role
+    }
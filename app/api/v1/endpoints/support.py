@@ -1,10 +1,49 @@
+import time
+from typing import Optional
 from fastapi import APIRouter
-from app.services.nlp_service import analyze_intent
+from app.services.annotation_queue import annotation_queue
+from app.services.drift_service import drift_monitor
+from app.services.experiment_service import experiment_router
+from app.services.model_registry import model_registry
+from app.services.cache_service import cached
+from app.services.metrics_service import intent_confidence, intent_inference_duration, intent_inference_errors
 from app.schemas.support import SupportQuery, SupportResponse
 
 router = APIRouter()
 
+# Keyed by model version so a deploy never serves intents cached from the previous model
+@cached("intent", ttl=300, key_builder=lambda text, model, inference=None: f"{model.version}:{text.strip().lower()}")
+async def classify_query(text: str, model, inference: Optional[dict] = None):
+    """
+    Only runs on a cache miss; then leaves the model's inference time in `inference["seconds"]`.
+    """
+    started = time.perf_counter()
+    try:
+        intent, confidence = model.predict(text)
+    except Exception:
+        intent_inference_errors.labels(model.version).inc()
+        raise
+    elapsed = time.perf_counter() - started
+    intent_inference_duration.labels(model.version).observe(elapsed)
+    if inference is not None:
+        inference["seconds"] = elapsed
+    return {"intent": intent, "confidence": confidence}
+
 @router.post("/query", response_model=SupportResponse)
 async def query_support(query: SupportQuery):
-    intent, confidence = analyze_intent(query.query)
-    return {"intent": intent, "confidence": confidence}
+    assignment = experiment_router.route(query.customer_id or query.session_id)
+    model = model_registry.active() if assignment is None else model_registry.load(assignment.version)
+    inference = {}
+    result = await classify_query(query.query, model, inference=inference)
+    intent_confidence.labels(model.version).observe(result["confidence"])
+    drift_monitor.observe(model, query.query, result["intent"], result["confidence"])
+    alternatives = None
+    if assignment is not None:
+        # Inference time on a miss only: timing cache hits would compare the arms' hit rates, not their models
+        experiment_router.record_prediction(assignment, inference.get("seconds"), result["confidence"])
+        other_versions = [v for v in assignment.experiment.versions if v != assignment.version]
+        alternatives = lambda: [model_registry.load(v).predict(query.query)[0] for v in other_versions]
+    annotation_queue.offer(query.query, result["intent"], result["confidence"], "support",
+                           model_version=model.version, alternatives=alternatives,
+                           customer_id=query.customer_id, session_id=query.session_id)
+    return result
@@ -1,14 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import FileResponse
-from app.services.tts_service import TTSService
+from app.core.resources import get_tts_service
 
 router = APIRouter()
 
-# Initialize the TTS Service
-tts_service = TTSService(language="en", slow=False)
-
 @router.post("/tts/", response_class=FileResponse)
-async def get_tts(text: str, output_format: str = "mp3"):
+async def get_tts(text: str, output_format: str = "mp3", tts_service=Depends(get_tts_service)):
     """
     Convert the input text to speech and return the audio file.
     :param text: The text to convert into speech
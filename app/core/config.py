@@ -11,5 +11,112 @@ class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "supersecretkey")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # Two-tier cache (in-process L1 in front of Redis L2)
+    CACHE_L1_MAX_ENTRIES: int = int(os.getenv("CACHE_L1_MAX_ENTRIES", "10000"))
+    CACHE_DEFAULT_TTL: int = int(os.getenv("CACHE_DEFAULT_TTL", "60"))
+    CACHE_STALE_TTL: int = int(os.getenv("CACHE_STALE_TTL", "30"))
+    # Binary serialization for Redis values and Celery payloads
+    SERIALIZER_CODEC: str = os.getenv("SERIALIZER_CODEC", "msgpack")
+    SERIALIZER_COMPRESSION: str = os.getenv("SERIALIZER_COMPRESSION", "zstd")
+    SERIALIZER_COMPRESS_THRESHOLD: int = int(os.getenv("SERIALIZER_COMPRESS_THRESHOLD", "1024"))
+    SESSION_TTL: int = int(os.getenv("SESSION_TTL", "86400"))
+    # Offline-built item similarity index (see app/services/recommendation_service.py)
+    RECOMMENDATION_INDEX_DIR: str = os.getenv("RECOMMENDATION_INDEX_DIR", "data/recommendations")
+    # Seconds between incremental refreshes of materialized customer offers
+    OFFER_REFRESH_INTERVAL: int = int(os.getenv("OFFER_REFRESH_INTERVAL", "300"))
+    # Dynamic content targeting rules (see app/services/targeting_service.py): changes go to the first,
+    # the second is the read-only seed served until then
+    TARGETING_RULES_PATH: str = os.getenv("TARGETING_RULES_PATH", "data/targeting/rules.json")
+    TARGETING_SEED_RULES_PATH: str = os.getenv("TARGETING_SEED_RULES_PATH", "app/core/targeting_rules.json")
+    # Intent model artifacts and registry (see app/services/model_registry.py)
+    MODEL_ARTIFACT_DIR: str = os.getenv("MODEL_ARTIFACT_DIR", "data/models")
+    MODEL_MEMORY_BUDGET_MB: int = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "512"))
+    # Canary / A/B experiment definitions and per-worker arm counters
+    EXPERIMENT_DIR: str = os.getenv("EXPERIMENT_DIR", "data/experiments")
+    # Streaming drift sketches: per-worker ring of time slots per model version
+    DRIFT_DIR: str = os.getenv("DRIFT_DIR", "data/drift")
+    DRIFT_SLOT_SECONDS: int = int(os.getenv("DRIFT_SLOT_SECONDS", "600"))
+    DRIFT_RETENTION_SLOTS: int = int(os.getenv("DRIFT_RETENTION_SLOTS", "1008"))
+    DRIFT_TOKEN_BUCKETS: int = int(os.getenv("DRIFT_TOKEN_BUCKETS", "512"))
+    DRIFT_PSI_THRESHOLD: float = float(os.getenv("DRIFT_PSI_THRESHOLD", "0.2"))
+    # Interactions kept in Redis for human annotation, highest uncertainty first, shared by all workers
+    ANNOTATION_QUEUE_CAPACITY: int = int(os.getenv("ANNOTATION_QUEUE_CAPACITY", "10000"))
+    # Background retraining jobs (see app/services/training_service.py)
+    RETRAIN_DIR: str = os.getenv("RETRAIN_DIR", "data/retraining")
+    RETRAIN_PROCESSES: int = int(os.getenv("RETRAIN_PROCESSES", "2"))
+    RETRAIN_EPOCHS: int = int(os.getenv("RETRAIN_EPOCHS", "2"))
+    RETRAIN_CHUNK_SIZE: int = int(os.getenv("RETRAIN_CHUNK_SIZE", "1000"))
+    RETRAIN_LEARNING_RATE: float = float(os.getenv("RETRAIN_LEARNING_RATE", "0.1"))
+    RETRAIN_N_FEATURES: int = int(os.getenv("RETRAIN_N_FEATURES", "262144"))
+    # Per-worker metric files scraped at /metrics (see app/services/metrics_service.py)
+    METRICS_DIR: str = os.getenv("METRICS_DIR", "data/metrics")
+    METRICS_MAX_SLOTS: int = int(os.getenv("METRICS_MAX_SLOTS", "65536"))
+    METRICS_SAMPLE_INTERVAL: float = float(os.getenv("METRICS_SAMPLE_INTERVAL", "5"))
+    # Metrics history: raw samples every TIMESERIES_INTERVAL seconds plus 1m and 1h rollups
+    TIMESERIES_DIR: str = os.getenv("TIMESERIES_DIR", "data/timeseries")
+    TIMESERIES_INTERVAL: int = int(os.getenv("TIMESERIES_INTERVAL", "10"))
+    TIMESERIES_RAW_RETENTION_HOURS: int = int(os.getenv("TIMESERIES_RAW_RETENTION_HOURS", "24"))
+    TIMESERIES_MINUTE_RETENTION_DAYS: int = int(os.getenv("TIMESERIES_MINUTE_RETENTION_DAYS", "14"))
+    TIMESERIES_HOUR_RETENTION_DAYS: int = int(os.getenv("TIMESERIES_HOUR_RETENTION_DAYS", "400"))
+    # Threshold alerts, evaluated on every metrics history sample; notifications are batched per recipient
+    ALERT_DIR: str = os.getenv("ALERT_DIR", "data/alerts")
+    ALERT_NOTIFY_INTERVAL: float = float(os.getenv("ALERT_NOTIFY_INTERVAL", "30"))
+    ALERT_WEBHOOK_TIMEOUT: float = float(os.getenv("ALERT_WEBHOOK_TIMEOUT", "5"))
+    # Webhooks only go to these hosts (comma-separated, ".example.com" for its subdomains; none by default) and schemes
+    ALERT_WEBHOOK_ALLOWED_HOSTS: str = os.getenv("ALERT_WEBHOOK_ALLOWED_HOSTS", "")
+    ALERT_WEBHOOK_SCHEMES: str = os.getenv("ALERT_WEBHOOK_SCHEMES", "https")
+    # Error reports are merged per worker and flushed to MongoDB in bulk (see app/services/error_service.py)
+    ERROR_FLUSH_INTERVAL: float = float(os.getenv("ERROR_FLUSH_INTERVAL", "1"))
+    ERROR_BUFFER_MAX_GROUPS: int = int(os.getenv("ERROR_BUFFER_MAX_GROUPS", "10000"))
+    # JSON logs written by a background thread (see app/utils/logging.py); LOG_FILE="" logs to stderr only
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FILE: str = os.getenv("LOG_FILE", "logs/app.log")
+    LOG_MAX_BYTES: int = int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+    LOG_BACKUP_COUNT: int = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    LOG_BATCH_SIZE: int = int(os.getenv("LOG_BATCH_SIZE", "512"))
+    LOG_QUEUE_MAX: int = int(os.getenv("LOG_QUEUE_MAX", "100000"))
+    LOG_DEBUG_SAMPLE_RATE: float = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+    # Request tracing (see app/services/tracing_service.py); TRACE_FILE="" keeps spans in memory only
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+    TRACE_MEMORY_SPANS: int = int(os.getenv("TRACE_MEMORY_SPANS", "10000"))
+    TRACE_FILE: str = os.getenv("TRACE_FILE", "")
+    # On-demand sampling profiler (see app/services/profiling_service.py)
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILE_INTERVAL: float = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+    PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+    PROFILE_KEEP: int = int(os.getenv("PROFILE_KEEP", "20"))
+    # Production server (gunicorn.conf.py); WEB_CONCURRENCY=0 runs one worker per available core
+    SERVER_BIND: str = os.getenv("SERVER_BIND", "0.0.0.0:8000")
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "0"))
+    SERVER_PRELOAD: bool = os.getenv("SERVER_PRELOAD", "true").lower() == "true"
+    SERVER_MAX_REQUESTS: int = int(os.getenv("SERVER_MAX_REQUESTS", "20000"))
+    SERVER_MAX_REQUESTS_JITTER: int = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", "2000"))
+    SERVER_TIMEOUT: int = int(os.getenv("SERVER_TIMEOUT", "60"))
+    SERVER_GRACEFUL_TIMEOUT: int = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+    SERVER_KEEPALIVE: int = int(os.getenv("SERVER_KEEPALIVE", "75"))
+    SERVER_BACKLOG: int = int(os.getenv("SERVER_BACKLOG", "2048"))
+    # Worker resources (see app/core/resources.py): health probes, how long a worker stays up but not ready
+    # after SIGTERM (app/core/server.py) and the drain on shutdown; grace and drain must finish within
+    # SERVER_GRACEFUL_TIMEOUT
+    HEALTH_CHECK_TIMEOUT: float = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+    HEALTH_CACHE_SECONDS: float = float(os.getenv("HEALTH_CACHE_SECONDS", "1"))
+    SHUTDOWN_GRACE_SECONDS: float = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "5"))
+    SHUTDOWN_DRAIN_TIMEOUT: float = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))
+    # Field-level PII encryption (see app/services/encryption_service.py); 0 threads means one per core
+    ENCRYPTION_KEYRING_PATH: str = os.getenv("ENCRYPTION_KEYRING_PATH", "data/keys/keyring.json")
+    ENCRYPTION_KEYRING_RELOAD_SECONDS: float = float(os.getenv("ENCRYPTION_KEYRING_RELOAD_SECONDS", "5"))
+    ENCRYPTION_THREADS: int = int(os.getenv("ENCRYPTION_THREADS", "0"))
+    ENCRYPTION_CHUNK_SIZE: int = int(os.getenv("ENCRYPTION_CHUNK_SIZE", "500"))
+    # Request firewall (see app/services/firewall_service.py): rules file and how much of each body is inspected
+    FIREWALL_RULES_PATH: str = os.getenv("FIREWALL_RULES_PATH", "data/firewall/rules.json")
+    FIREWALL_BODY_PREFIX: int = int(os.getenv("FIREWALL_BODY_PREFIX", "4096"))
+    # Role-based access control (see app/services/rbac_service.py); superusers are comma-separated token subjects
+    # holding every permission, none by default: set it to bootstrap the first administrator
+    RBAC_PATH: str = os.getenv("RBAC_PATH", "data/rbac/roles.json")
+    RBAC_RELOAD_SECONDS: float = float(os.getenv("RBAC_RELOAD_SECONDS", "2"))
+    RBAC_SUPERUSERS: str = os.getenv("RBAC_SUPERUSERS", "")
+    RBAC_TOKEN_CACHE_SIZE: int = int(os.getenv("RBAC_TOKEN_CACHE_SIZE", "10000"))
 
 settings = Settings()
@@ -2,8 +2,28 @@ from fastapi import Request, HTTPException
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
+import asyncio
+import logging
+import re
 import time
+import uuid
+from collections import deque
+from urllib.parse import unquote_plus
 import jwt
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from app.core.config import settings
+from app.core.resources import resources
+from app.core.responses import FastJSONResponse
+from app.services.firewall_service import firewall_engine
+from app.services.metrics_service import http_request_duration, http_requests_in_flight
+from app.services.rbac_service import access_control
+from app.services.profiling_service import ProfilerBusy, profiler
+from app.services.tracing_service import extract_context, tracing
+from app.utils.logging import request_id_var
+
+logger = logging.getLogger("app_logger")
+
+REQUEST_ID_PATTERN = re.compile(rb"[A-Za-z0-9._:-]+")
 
 JWT_SECRET = "your-secret-key"  # You should load this from environment or secret management service
 
@@ -46,6 +66,251 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 
         return await call_next(request)
 
+class MetricsMiddleware:
+    """
+    Records request latency by method, route template and status, and the number of requests in flight.
+    Plain ASGI (not BaseHTTPMiddleware) so it adds only a couple of microseconds per request.
+    """
+    def __init__(self, app):
+        self.app = app
+        self._templates = {}
+        self._series = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            key = (scope["method"], scope.get("endpoint"), status)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = http_request_duration.labels(scope["method"], self._template(scope), status)
+            series.observe(elapsed)
+
+    def _template(self, scope) -> str:
+        return route_template(scope, self._templates)
+
+def route_template(scope, templates: dict) -> str:
+    # The router leaves the matched endpoint in the scope; label by its path template, not the raw path
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    if endpoint not in templates:
+        for route in getattr(scope.get("app"), "routes", []):
+            if getattr(route, "endpoint", None) is not None:
+                templates[route.endpoint] = route.path
+    return templates.get(endpoint, "unmatched")
+
+class InFlightMiddleware:
+    """
+    Counts the requests being served, background tasks included, so shutdown can wait for them to finish.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        resources.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            resources.request_finished()
+
+# Methods whose body the firewall inspects
+BODY_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Rule management itself is not inspected, or a rule could block requests that change rules
+FIREWALL_EXEMPT_PATHS = ("/api/v1/security/set-firewall-rules", "/api/v1/security/firewall-rules")
+
+class FirewallMiddleware:
+    """
+    Matches the request's path, query string and body prefix (URL-decoded like the query string when
+    it is a form) against the compiled firewall rules in one pass and answers 403 when a blocking
+    rule matches. The inspected body is buffered and
+    replayed to the app. Costs a single attribute check while there are no rules.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        compiled = firewall_engine.compiled
+        if not compiled.rules or scope["path"].startswith(FIREWALL_EXEMPT_PATHS):
+            return await self.app(scope, receive, send)
+        parts = [scope["path"], unquote_plus(scope["query_string"].decode("latin-1"))]
+        buffered = []
+        if scope["method"] in BODY_METHODS:
+            chunks, size = [], 0
+            while size < settings.FIREWALL_BODY_PREFIX:
+                message = await receive()
+                buffered.append(message)
+                if message["type"] != "http.request":
+                    break
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+                if not message.get("more_body", False):
+                    break
+            body = b"".join(chunks)[:settings.FIREWALL_BODY_PREFIX].decode("utf-8", "replace")
+            # Form fields are percent-encoded like the query string, so they're matched decoded too
+            content_type = next((value for name, value in scope["headers"] if name == b"content-type"), b"")
+            if content_type.split(b";")[0].strip().lower() == b"application/x-www-form-urlencoded":
+                body = unquote_plus(body)
+            parts.append(body)
+        matched = compiled.match("\n".join(parts))
+        if matched and firewall_engine.record(compiled, matched) is not None:
+            response = FastJSONResponse({"detail": "Request blocked"}, status_code=403)
+            return await response(scope, receive, send)
+        if buffered:
+            receive = replay(buffered, receive)
+        await self.app(scope, receive, send)
+
+class RBACMiddleware:
+    """
+    Authorizes requests to the routes listed in rbac_service.ROUTE_PERMISSIONS: 401 without a valid
+    bearer token, 403 when its subject's cached permission mask lacks the route's bit. Leaves the
+    subject in `request.state.user`. Other routes pass through after one dict lookup.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        required = access_control.required_mask(scope["method"], scope["path"])
+        if required is None:
+            return await self.app(scope, receive, send)
+        subject = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and token:
+                    subject = access_control.authenticate(token.strip())
+                break
+        if subject is None:
+            response = FastJSONResponse({"detail": "Not authenticated"}, status_code=401,
+                                        headers={"WWW-Authenticate": "Bearer"})
+            return await response(scope, receive, send)
+        if not access_control.allows(subject, required):
+            logger.warning(f"{subject} denied {scope['method']} {scope['path']}")
+            response = FastJSONResponse({"detail": "Permission denied"}, status_code=403)
+            return await response(scope, receive, send)
+        scope.setdefault("state", {})["user"] = subject
+        await self.app(scope, receive, send)
+
+def replay(messages, receive):
+    """
+    A receive callable returning `messages` before reading on from `receive`.
+    """
+    pending = deque(messages)
+
+    async def replayed():
+        if pending:
+            return pending.popleft()
+        return await receive()
+
+    return replayed
+
+class RequestIdMiddleware:
+    """
+    Gives every request an id (the client's X-Request-ID if it sent a sane one, else a new one), makes it
+    available to log records through `request_id_var` and echoes it in the X-Request-ID response header.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                if 0 < len(value) <= 128 and REQUEST_ID_PATTERN.fullmatch(value):
+                    request_id = value.decode()
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+        header = (b"x-request-id", request_id.encode())
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [header]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
+
+class TracingMiddleware:
+    """
+    Starts a server span per request, continuing the caller's trace if it sent a `traceparent` header, and
+    returns the trace id of recorded requests in X-Trace-ID. Only installed when tracing is enabled.
+    """
+    def __init__(self, app):
+        self.app = app
+        self._templates = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        carrier = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]
+                   if name in (b"traceparent", b"tracestate")}
+        attributes = {"http.method": scope["method"], "http.target": scope["path"], "request.id": request_id_var.get()}
+        with tracing.tracer.start_as_current_span(f"{scope['method']} {scope['path']}", context=extract_context(carrier),
+                                                  kind=SpanKind.SERVER, attributes=attributes) as span:
+            if not span.is_recording():
+                return await self.app(scope, receive, send)
+            header = (b"x-trace-id", format(span.get_span_context().trace_id, "032x").encode())
+
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [header]
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
+            template = route_template(scope, self._templates)
+            span.update_name(f"{scope['method']} {template}")
+            span.set_attribute("http.route", template)
+
+class ProfileMiddleware:
+    """
+    Profiles requests sent with an `X-Profile: 1` header; the flame graph is then served by
+    /monitoring/profile/{request_id}. Only installed when profiling is enabled.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (b"x-profile", b"1") not in scope["headers"]:
+            return await self.app(scope, receive, send)
+        try:
+            session = profiler.start(task=asyncio.current_task())
+        except ProfilerBusy as e:
+            logger.info(f"Request not profiled: {e}")
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.finish(session, request_id_var.get())
+
 # CORS Middleware
 def add_cors_middleware(app):
     app.add_middleware(
@@ -0,0 +1,262 @@
+"""
+The worker's shared clients and services, opened and closed by the app's lifespan (app/main.py).
+
+`resources.open()` creates every pool concurrently and checks the external ones (MongoDB, Redis)
+with a ping; a store that is down at startup is logged and shows in readiness, but doesn't keep the
+worker from starting, since the app degrades without Redis and recovers once MongoDB is back.
+Endpoints get the clients through the `get_*` dependencies below. Readiness starts failing as soon as
+the worker is told to stop (app/core/server.py), while it still accepts; uvicorn then closes its
+listener and waits for open connections before the lifespan shutdown, where `drain()` waits for any
+request still in flight (including its background tasks) before `close()` shuts the pools.
+
+Readiness (`/health/ready`) reports each store's last ping, probed at most once per
+HEALTH_CACHE_SECONDS however often it is polled; the worker is ready when the required stores
+answer and it isn't draining. Liveness (`/health/live`) only says the event loop is serving.
+
+Clients are never created at import: gunicorn forks the workers from a master that imported the
+app, and the clients must not be shared across a fork.
+"""
+import asyncio
+import logging
+import sys
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+import pymongo
+from pymongo import MongoClient
+from pymongo.database import Database
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.annotation_queue import annotation_queue
+from app.services.cache_service import tiered_cache
+from app.services.metrics_service import TimedRedis, mongo_command_metrics
+from app.services.session_service import session_store
+from app.services.tracing_service import TracedRedis, mongo_command_tracing
+
+if TYPE_CHECKING:
+    from app.services.encryption_service import FieldEncryptor
+
+logger = logging.getLogger("app_logger")
+
+# The tracing listener is only registered when tracing is on, so it costs nothing otherwise
+mongo_listeners = [mongo_command_metrics] + ([mongo_command_tracing] if settings.TRACING_ENABLED else [])
+
+# Readiness fails when one of these doesn't answer; without Redis the caches degrade to in-process
+REQUIRED_CHECKS = ("mongodb",)
+
+
+class Resources:
+    def __init__(self):
+        self.mongo_client: Optional[MongoClient] = None
+        self.db: Optional[Database] = None
+        # redis.asyncio pool shared by the two-tier cache, the session store and the annotation queue
+        self.redis: Optional[TimedRedis] = None
+        # Synchronous client of the cache router
+        self.cache_client: Optional[TracedRedis] = None
+        self.cipher: Optional["FieldEncryptor"] = None
+        self.tts = None
+        self.started_at: Optional[float] = None
+        self.draining = False
+        self.in_flight = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._checks: Dict[str, dict] = {}
+        self._checked_at = 0.0
+        self._probe: Optional[asyncio.Task] = None
+
+    # Opening and closing
+
+    def mongo_database(self) -> Database:
+        """
+        The MongoDB database, connecting on first use in processes without the lifespan (Celery workers, scripts).
+        """
+        if self.db is None:
+            self.mongo_client = MongoClient(settings.MONGODB_URL, event_listeners=mongo_listeners)
+            self.db = self.mongo_client[settings.MONGODB_DB_NAME]
+        return self.db
+
+    async def _open_mongo(self):
+        self.mongo_database()
+
+    async def _open_redis(self):
+        self.redis = TimedRedis.from_url(settings.REDIS_URL)
+        tiered_cache.redis = self.redis
+        session_store.redis = self.redis
+        annotation_queue.redis = self.redis
+        self.cache_client = TracedRedis.from_url(settings.REDIS_URL)
+
+    def cipher_suite(self) -> "FieldEncryptor":
+        if self.cipher is None:
+            from app.services.encryption_service import field_encryptor
+
+            # Keys come from the keyring every worker shares, so any worker decrypts what another encrypted
+            self.cipher = field_encryptor()
+        return self.cipher
+
+    def tts_service(self):
+        if self.tts is None:
+            from app.services.tts_service import TTSService
+
+            self.tts = TTSService(language="en", slow=False)
+        return self.tts
+
+    async def _open_cipher(self):
+        self.cipher_suite()
+
+    async def _open_tts(self):
+        self.tts_service()
+
+    async def open(self):
+        self.started_at = time.time()
+        self.draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+        await asyncio.gather(self._open_mongo(), self._open_redis(), self._open_cipher(), self._open_tts())
+        # Checked in the background: a store that is down must not hold up the worker's start
+        self._probe = asyncio.ensure_future(self._probe_all(log_failures=True))
+
+    async def drain(self, timeout: float):
+        """
+        Stops reporting ready and waits up to `timeout` seconds for in-flight requests to finish.
+
+        Normally uvicorn has already waited for them and this returns at once; it still waits when
+        uvicorn stopped waiting early (a second signal, or its own graceful shutdown timeout), or when
+        the app runs under another server, so the pools don't close under a running request.
+        """
+        self.draining = True
+        if self.in_flight and self._idle is not None:
+            logger.info(f"Draining {self.in_flight} in-flight request(s)")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"{self.in_flight} request(s) still running after {timeout:g}s, closing anyway")
+
+    async def _close_redis(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+        if self.cache_client is not None:
+            await run_in_threadpool(self.cache_client.close)
+        self.redis = self.cache_client = tiered_cache.redis = session_store.redis = annotation_queue.redis = None
+
+    async def _close_mongo(self):
+        if self.mongo_client is not None:
+            await run_in_threadpool(self.mongo_client.close)
+        self.mongo_client = self.db = None
+
+    async def _close_celery(self):
+        # Only if a request published a task: importing Celery here just to close it would be wasted
+        tasks = sys.modules.get("app.core.tasks")
+        if tasks is not None:
+            await run_in_threadpool(tasks.celery_app.close)
+
+    async def close(self):
+        if self._probe is not None:
+            self._probe.cancel()
+        results = await asyncio.gather(self._close_redis(), self._close_mongo(), self._close_celery(),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Closing a connection pool failed: {result}")
+        if self.cipher is not None:
+            self.cipher.close()
+        self.cipher = self.tts = None
+        logger.info("Connection pools closed")
+
+    # In-flight requests (counted by InFlightMiddleware)
+
+    def request_started(self):
+        self.in_flight += 1
+        if self._idle is not None:
+            self._idle.clear()
+
+    def request_finished(self):
+        self.in_flight -= 1
+        if self.in_flight == 0 and self._idle is not None:
+            self._idle.set()
+
+    # Health
+
+    def _ping_mongo_sync(self):
+        # Bounds server selection too, which otherwise waits 30s for an unreachable server
+        with pymongo.timeout(settings.HEALTH_CHECK_TIMEOUT):
+            self.mongo_client.admin.command("ping")
+
+    async def _ping_mongo(self) -> None:
+        await run_in_threadpool(self._ping_mongo_sync)
+
+    async def _ping_redis(self) -> None:
+        await self.redis.ping()
+
+    @staticmethod
+    async def _check(ping) -> dict:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(ping(), settings.HEALTH_CHECK_TIMEOUT)
+            return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 3)}
+        except Exception as e:
+            return {"ok": False, "error": str(e) or type(e).__name__}
+
+    async def _probe_all(self, log_failures: bool = False) -> Dict[str, dict]:
+        names, pings = [], []
+        if self.mongo_client is not None:
+            names.append("mongodb")
+            pings.append(self._check(self._ping_mongo))
+        if self.redis is not None:
+            names.append("redis")
+            pings.append(self._check(self._ping_redis))
+        self._checks = dict(zip(names, await asyncio.gather(*pings)))
+        self._checked_at = time.monotonic()
+        if log_failures:
+            for name, check in self._checks.items():
+                if not check["ok"]:
+                    logger.error(f"{name} is not reachable at startup: {check['error']}")
+        return self._checks
+
+    async def check_health(self, force: bool = False) -> Dict[str, dict]:
+        """
+        Result of the last ping of each store, refreshed when older than HEALTH_CACHE_SECONDS.
+        Concurrent callers share one probe.
+        """
+        if not force and time.monotonic() - self._checked_at < settings.HEALTH_CACHE_SECONDS:
+            return self._checks
+        if self._probe is None or self._probe.done():
+            self._probe = asyncio.ensure_future(self._probe_all())
+        return await asyncio.shield(self._probe)
+
+    async def readiness(self) -> dict:
+        checks = await self.check_health()
+        ready = (self.started_at is not None and not self.draining
+                 and all(checks.get(name, {}).get("ok") for name in REQUIRED_CHECKS))
+        return {"ready": ready, "draining": self.draining, "in_flight": self.in_flight, "checks": checks}
+
+    def liveness(self) -> dict:
+        return {
+            "alive": True,
+            "uptime_seconds": round(time.time() - self.started_at, 3) if self.started_at is not None else 0.0,
+            "draining": self.draining,
+        }
+
+
+resources = Resources()
+
+
+# Dependencies
+
+def get_db() -> Database:
+    return resources.mongo_database()
+
+
+def get_redis() -> Optional[TimedRedis]:
+    return resources.redis
+
+
+def get_cache_client() -> Optional[TracedRedis]:
+    return resources.cache_client
+
+
+def get_cipher() -> "FieldEncryptor":
+    return resources.cipher_suite()
+
+
+def get_tts_service():
+    return resources.tts_service()
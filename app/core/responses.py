@@ -0,0 +1,52 @@
+"""
+App-wide JSON response class backed by orjson.
+
+`FastJSONResponse` is the default response class (see app/main.py). It serializes ObjectId,
+datetime, UUID and Decimal natively, so schemas don't need per-field `json_encoders`.
+
+Routes that already build their payload from trusted internal data can return `trusted_json(...)`:
+FastAPI passes Response objects through untouched, which skips the response_model revalidation
+and the `jsonable_encoder` walk while keeping the response_model for the OpenAPI docs.
+"""
+import json
+from decimal import Decimal
+from typing import Any
+
+from bson import ObjectId
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _default(obj: Any):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.dict(by_alias=True)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if orjson is None and hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def trusted_json(content: Any, status_code: int = 200) -> FastJSONResponse:
+    """
+    Wraps a payload built from trusted internal data so it skips response-model validation.
+    """
+    return FastJSONResponse(content, status_code=status_code)
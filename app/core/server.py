@@ -0,0 +1,88 @@
+"""
+Production server pieces used by gunicorn.conf.py: the uvicorn worker class and the data loaded
+once in the gunicorn master before it forks the workers.
+"""
+import gc
+import logging
+import sys
+import time
+from types import FrameType
+from typing import Optional
+
+from gunicorn.arbiter import Arbiter
+from uvicorn import Config, Server
+from uvicorn.workers import UvicornWorker
+
+from app.core.config import settings
+from app.core.resources import resources
+
+logger = logging.getLogger("app_logger")
+
+
+class DrainingServer(Server):
+    """
+    Uvicorn server that keeps accepting for SHUTDOWN_GRACE_SECONDS after the first SIGTERM or
+    SIGINT, with readiness already failing, so load balancers polling /health/ready stop sending
+    it traffic before it closes its listener. A second signal stops it at once.
+    """
+
+    def __init__(self, config: Config):
+        super().__init__(config)
+        self._stop_signal: Optional[int] = None
+        self._stop_at = 0.0
+
+    def handle_exit(self, sig: int, frame: Optional[FrameType]) -> None:
+        if self._stop_signal is not None or self.should_exit:
+            super().handle_exit(sig, frame)
+            return
+        resources.draining = True
+        self._stop_signal = sig
+        self._stop_at = time.monotonic() + settings.SHUTDOWN_GRACE_SECONDS
+        logger.info(f"Not ready; stopping in {settings.SHUTDOWN_GRACE_SECONDS:g}s")
+
+    async def on_tick(self, counter: int) -> bool:
+        if self._stop_signal is not None and not self.should_exit and time.monotonic() >= self._stop_at:
+            super().handle_exit(self._stop_signal, None)
+        return await super().on_tick(counter)
+
+
+class UvloopWorker(UvicornWorker):
+    """
+    Uvicorn worker on uvloop with the httptools parser (fails at start if either is missing,
+    rather than silently falling back to the slower pure-Python ones), serving with DrainingServer.
+    """
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+    async def _serve(self) -> None:
+        # UvicornWorker._serve with DrainingServer in place of uvicorn's Server
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+
+def warm_shared_data():
+    """
+    Loads the read-only data every worker serves from (the active intent model, the
+    recommendation index, the targeting and firewall rules, the RBAC policy), then moves everything allocated so far out of the
+    garbage collector's reach. Called in the master with the app preloaded: the forked workers
+    then share these pages copy-on-write instead of each loading, and gc touching, their own copy.
+    """
+    from app.services.firewall_service import firewall_engine
+    from app.services.model_registry import model_registry
+    from app.services.rbac_service import access_control
+    from app.services.recommendation_service import recommendation_engine
+    from app.services.targeting_service import targeting_engine
+
+    model = model_registry.active()
+    index = recommendation_engine.index
+    rules = targeting_engine.compiled
+    firewall_engine.reload_if_changed()
+    access_control.reload_if_changed()
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Preloaded model {model.version}, recommendation index "
+                f"{index.version if index is not None else 'none'}, {len(rules)} targeting rules, "
+                f"{len(firewall_engine.compiled)} firewall rules and {len(access_control.policy.roles)} roles")
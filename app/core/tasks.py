@@ -1,4 +1,20 @@
+import logging
+import time
 from celery import Celery
+from celery.signals import after_task_publish, before_task_publish, task_postrun, task_prerun
+from typing import List, Optional
+from app.core.config import settings
+from opentelemetry import context as trace_context, trace
+from app.services.metrics_service import celery_publish_duration, celery_task_duration, celery_tasks
+from app.services.tracing_service import SpanKind, extract_context, inject_context, tracing
+from app.utils.logging import setup_logging
+from app.utils.serialization import register_celery_serializer
+
+register_celery_serializer("acx")
+# Worker processes log and trace through the same pipelines as the API
+setup_logging()
+tracing.setup()
+logger = logging.getLogger("app_logger")
 
 # Celery configuration
 celery_app = Celery(
@@ -8,9 +24,79 @@ celery_app = Celery(
 )
 
 celery_app.conf.task_routes = {'send_email': 'emails'}
+celery_app.conf.update(
+    task_serializer='acx',
+    result_serializer='acx',
+    accept_content=['acx', 'json'],
+    beat_schedule={
+        'refresh-customer-offers': {
+            'task': 'refresh_customer_offers',
+            'schedule': settings.OFFER_REFRESH_INTERVAL,
+        },
+    },
+)
+
+# Task timings for /metrics: publish latency in the API workers, run time in the Celery workers
+_publish_started = {}
+_task_started = {}
+# Spans of traced publishes and runs; the publishing request's trace context travels in the message headers
+_publish_spans = {}
+_task_spans = {}
+
+@before_task_publish.connect
+def _before_publish(sender=None, headers=None, **kwargs):
+    _publish_started[(headers or {}).get("id")] = time.perf_counter()
+    if tracing.enabled and headers is not None and trace.get_current_span().is_recording():
+        span = tracing.tracer.start_span(f"celery.publish {sender}", kind=SpanKind.PRODUCER,
+                                         attributes={"messaging.system": "celery", "celery.task_id": headers.get("id")})
+        inject_context(headers, span)
+        _publish_spans[headers.get("id")] = span
+
+@after_task_publish.connect
+def _after_publish(sender=None, headers=None, **kwargs):
+    started = _publish_started.pop((headers or {}).get("id"), None)
+    if started is not None:
+        celery_publish_duration.labels(sender).observe(time.perf_counter() - started)
+    span = _publish_spans.pop((headers or {}).get("id"), None)
+    if span is not None:
+        span.end()
+
+@task_prerun.connect
+def _task_prerun(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    if tracing.enabled:
+        span = tracing.tracer.start_span(f"celery.run {task.name}", context=extract_context(task.request, from_attributes=True),
+                                         kind=SpanKind.CONSUMER, attributes={"celery.task_id": task_id})
+        _task_spans[task_id] = (span, trace_context.attach(trace.set_span_in_context(span)))
+
+@task_postrun.connect
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        celery_task_duration.labels(task.name).observe(time.perf_counter() - started)
+    celery_tasks.labels(task.name, state or "UNKNOWN").inc()
+    traced_run = _task_spans.pop(task_id, None)
+    if traced_run is not None:
+        span, token = traced_run
+        span.set_attribute("celery.state", state or "UNKNOWN")
+        trace_context.detach(token)
+        span.end()
 
 @celery_app.task(name="send_email")
 def send_email(email: str, subject: str, body: str):
     # Mock implementation of email sending
-    print(f"Sending email to {email}: {subject}\n{body}")
+    logger.info(f"Sending email to {email}: {subject}", extra={"body": body})
     return "Email sent successfully"
+
+
+@celery_app.task(name="refresh_customer_offers")
+def refresh_customer_offers(customer_ids: Optional[List[str]] = None):
+    """
+    Refreshes materialized customer offers: the given customers, or everyone changed since the last run.
+    """
+    from app.db import get_db
+    from app.services.offer_service import offer_store
+
+    if customer_ids:
+        return {"mode": "targeted", "customers_refreshed": offer_store.refresh_customers(get_db(), customer_ids)}
+    return offer_store.refresh_changed(get_db())
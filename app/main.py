@@ -1,21 +1,82 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api.v1.endpoints import customer, auth, support, channels, orchestration, personalization, model_management, active_learning, cache, monitoring, security_compliance, tts  # Added security and compliance
-from app.db import connect_to_mongo, close_mongo_connection
+from app.core.resources import resources
+from app.services.cache_service import tiered_cache
+from app.services.model_registry import model_registry
+from starlette.concurrency import run_in_threadpool
+from app.core.responses import FastJSONResponse
+from app.core.config import settings
+from app.core.middleware import FirewallMiddleware, InFlightMiddleware, MetricsMiddleware, ProfileMiddleware, RBACMiddleware, RequestIdMiddleware, TracingMiddleware
+from app.utils.logging import setup_logging
+from app.services.tracing_service import tracing
+from app.services.metrics_service import CONTENT_TYPE, metrics, process_sampler
+from app.services.timeseries_service import metrics_recorder
+from app.services.alert_service import alert_evaluator, alert_notifier
+from app.services.error_service import error_buffer
+from app.services.annotation_queue import annotation_queue
+from app.services.firewall_service import firewall_engine
+from app.services.rbac_service import access_control
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+
+setup_logging()
+tracing.setup()
+
+# Runs in each worker (after gunicorn forks it), so clients and background tasks are never shared
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pools open while the active model loads and warms and the firewall rules and RBAC policy compile,
+    # all before the first request
+    await asyncio.gather(resources.open(), run_in_threadpool(model_registry.active),
+                         run_in_threadpool(firewall_engine.reload_if_changed),
+                         run_in_threadpool(access_control.reload_if_changed))
+    await tiered_cache.start()
+    await process_sampler.start()
+    # Alerts are evaluated on every metrics history sample
+    metrics_recorder.listeners.append(alert_evaluator.on_sample)
+    await alert_notifier.start()
+    await error_buffer.start()
+    await annotation_queue.start()
+    await metrics_recorder.start()
+    try:
+        yield
+    finally:
+        # Readiness has failed since the stop signal; requests still in flight finish before anything closes
+        await resources.drain(settings.SHUTDOWN_DRAIN_TIMEOUT)
+        await metrics_recorder.stop()
+        metrics_recorder.listeners.remove(alert_evaluator.on_sample)
+        await alert_notifier.stop()
+        # Flushes buffered error reports, so before MongoDB closes
+        await error_buffer.stop()
+        # Hands buffered offers to Redis, so before it closes
+        await annotation_queue.stop()
+        await process_sampler.stop()
+        await tiered_cache.stop()
+        await resources.close()
+        tracing.shutdown()
 
 app = FastAPI(
     title="AI Customer Care API",
     version="1.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan,
 )
 
-# MongoDB connection lifecycle events
-@app.on_event("startup")
-async def startup_db_client():
-    await connect_to_mongo()
+# Innermost, so blocked and unauthorized requests still show in metrics and carry a request id;
+# the firewall turns attacks away before any token is checked
+app.add_middleware(RBACMiddleware)
+app.add_middleware(FirewallMiddleware)
+app.add_middleware(InFlightMiddleware)
+app.add_middleware(MetricsMiddleware)
+# Only installed when turned on, so they cost nothing otherwise
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfileMiddleware)
+if tracing.enabled:
+    app.add_middleware(TracingMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    await close_mongo_connection()
 
 # API Routers
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Auth"])
@@ -34,4 +95,20 @@ app.include_router(tts.router, prefix="/api/v1", tags=["TTS"])
 # Root endpoint for health check
 @app.get("/")
 async def root():
-    return {"message": "API is running"}
\ No newline at end of file
+    return {"message": "API is running"}
+
+# Liveness probe: the event loop is serving requests
+@app.get("/health/live", include_in_schema=False)
+async def liveness():
+    return resources.liveness()
+
+# Readiness probe: 503 while a required store is unreachable or the worker is draining for shutdown
+@app.get("/health/ready", include_in_schema=False)
+async def readiness():
+    result = await resources.readiness()
+    return JSONResponse(result, status_code=200 if result["ready"] else 503)
+
+# Prometheus scrape endpoint (all workers combined)
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(await run_in_threadpool(metrics.exposition), media_type=CONTENT_TYPE)
@@ -29,12 +29,14 @@ class CustomerBase(BaseModel):
     country: Optional[str] = None
 
     class Config:
-        json_encoders = {ObjectId: str}  # Ensure ObjectId is encoded as a string
         allow_population_by_field_name = True
 
 class CustomerCreate(CustomerBase):
     pass
 
+# Stored encrypted (see app/services/encryption_service.py) and decrypted when read back
+CUSTOMER_PII_FIELDS = ("first_name", "last_name", "email", "phone_number", "address")
+
 class CustomerUpdate(BaseModel):
     first_name: Optional[str] = None
     last_name: Optional[str] = None
@@ -44,9 +46,6 @@ class CustomerUpdate(BaseModel):
     country: Optional[str] = None
     is_active: Optional[bool] = None
 
-    class Config:
-        json_encoders = {ObjectId: str}
-
 class CustomerResponse(CustomerBase):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")  # Use PyObjectId for MongoDB ObjectId
     created_at: datetime
@@ -54,5 +53,4 @@ class CustomerResponse(CustomerBase):
 
     class Config:
         allow_population_by_field_name = True  # Allow _id to be returned as id
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}  # Ensure ObjectId is encoded as a string
+        arbitrary_types_allowed = True  # ObjectId/datetime are encoded by FastJSONResponse
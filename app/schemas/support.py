@@ -1,7 +1,11 @@
+from typing import Optional
 from pydantic import BaseModel
 
 class SupportQuery(BaseModel):
     query: str
+    # Used to keep a customer on the same model arm during canaries and A/B tests
+    customer_id: Optional[str] = None
+    session_id: Optional[str] = None
 
 class SupportResponse(BaseModel):
     intent: str
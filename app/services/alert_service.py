@@ -0,0 +1,432 @@
+"""
+Threshold alerts on the live metrics, as sampled by the metrics recorder
+(see app/services/timeseries_service.py).
+
+A rule fires once its metric has stayed above (or below) the threshold for `for_seconds`, and
+resolves only when the value crosses back past `clear_threshold` (hysteresis; defaults to the
+threshold itself). Metric values are those the recorder samples every TIMESERIES_INTERVAL seconds:
+gauges and rates by series name, histograms as "<series>.avg" and "<series>.p95".
+
+Rules are indexed per metric in lists sorted by threshold and by clear threshold; "below" rules
+are kept negated so both directions share the same comparisons. A tick only visits the metrics
+whose value changed, and for each only the rules whose threshold lies between the previous and the
+new value, so it costs O(changed metrics * log rules + transitions) however many rules there are.
+Pending rules wait in a heap ordered by when their for-duration runs out.
+
+A rule notifies once when it fires and once when it resolves. Notifications are queued and sent
+every ALERT_NOTIFY_INTERVAL seconds, batched per recipient: one email (through the send_email
+Celery task) or one webhook POST carrying all of that recipient's events. Webhooks are only sent
+to the hosts and schemes allowed by ALERT_WEBHOOK_ALLOWED_HOSTS and ALERT_WEBHOOK_SCHEMES, so an
+alert can't make the server call arbitrary (internal) addresses.
+
+Rules are shared by the workers through <ALERT_DIR>/rules.json. They are evaluated by the worker
+that records metrics history, which publishes the pending and firing alerts to
+<ALERT_DIR>/state.json.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import math
+import os
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from bson import ObjectId
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("app_logger")
+
+COMPARISONS = {"above": 1.0, "below": -1.0}
+NOTIFICATION_METHODS = ("email", "webhook")
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.utcfromtimestamp(timestamp).isoformat() + "Z"
+
+
+class AlertRule:
+    __slots__ = ("alert_id", "alert_name", "metric", "threshold", "comparison", "clear_threshold",
+                 "for_seconds", "notification_method", "target", "created_at")
+
+    def __init__(self, alert_id: str, alert_name: str, metric: str, threshold: float, comparison: str = "above",
+                 clear_threshold: Optional[float] = None, for_seconds: float = 0.0,
+                 notification_method: str = "email", target: Optional[str] = None,
+                 created_at: Optional[float] = None):
+        """
+        Raises ValueError for an invalid rule.
+
+        :param clear_threshold: Value the metric must get back to (inclusive) before a firing rule
+            resolves; on the healthy side of `threshold`
+        :param target: Email address or webhook URL, depending on `notification_method`
+        """
+        if comparison not in COMPARISONS:
+            raise ValueError(f"comparison must be one of {', '.join(COMPARISONS)}")
+        if notification_method not in NOTIFICATION_METHODS:
+            raise ValueError(f"notification_method must be one of {', '.join(NOTIFICATION_METHODS)}")
+        if not target:
+            raise ValueError("email is required for email alerts" if notification_method == "email"
+                             else "webhook_url is required for webhook alerts")
+        if notification_method == "webhook" and not target.startswith(("http://", "https://")):
+            raise ValueError("webhook_url must be an http(s) URL")
+        clear_threshold = threshold if clear_threshold is None else clear_threshold
+        sign = COMPARISONS[comparison]
+        if not (math.isfinite(threshold) and math.isfinite(clear_threshold)) or clear_threshold * sign > threshold * sign:
+            raise ValueError(f"clear_threshold must not be {comparison} the threshold")
+        if for_seconds < 0:
+            raise ValueError("for_seconds must not be negative")
+        self.alert_id = alert_id
+        self.alert_name = alert_name
+        self.metric = metric
+        self.threshold = float(threshold)
+        self.comparison = comparison
+        self.clear_threshold = float(clear_threshold)
+        self.for_seconds = float(for_seconds)
+        self.notification_method = notification_method
+        self.target = target
+        self.created_at = created_at if created_at is not None else time.time()
+
+    def breached(self, value: float) -> bool:
+        sign = COMPARISONS[self.comparison]
+        return value * sign > self.threshold * sign
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Frame:
+    """
+    Rules of one comparison on one metric, with thresholds multiplied by `sign` so that a rule is
+    breached when sign * value > threshold and resolves when sign * value <= clear threshold.
+    """
+    __slots__ = ("sign", "thresholds", "by_threshold", "clears", "by_clear")
+
+    def __init__(self, sign: float, rules: List[AlertRule]):
+        self.sign = sign
+        self.by_threshold = sorted(rules, key=lambda rule: rule.threshold * sign)
+        self.thresholds = [rule.threshold * sign for rule in self.by_threshold]
+        self.by_clear = sorted(rules, key=lambda rule: rule.clear_threshold * sign)
+        self.clears = [rule.clear_threshold * sign for rule in self.by_clear]
+
+
+class AlertEvaluator:
+    def __init__(self, directory: str, notifier: Optional["AlertNotifier"] = None):
+        self.directory = directory
+        self.rules_path = os.path.join(directory, "rules.json")
+        self.state_path = os.path.join(directory, "state.json")
+        self.notifier = notifier
+        self.rules: Dict[str, AlertRule] = {}
+        self._frames: Dict[str, List[_Frame]] = {}
+        self._values: Dict[str, float] = {}
+        # Pending and firing alerts by rule id; rules not in here are ok
+        self._active: Dict[str, dict] = {}
+        self._pending: List[Tuple[float, str, float]] = []
+        self._mtime: Optional[float] = None
+        self._restored = False
+
+    # Rules
+
+    def set_rules(self, rules: List[AlertRule], now: Optional[float] = None):
+        """
+        Swaps in a new rule set. Alerts of rules that are kept carry over; new rules are checked
+        against the latest value of their metric.
+        """
+        now = now if now is not None else time.time()
+        added = [rule for rule in rules if rule.alert_id not in self.rules]
+        self.rules = {rule.alert_id: rule for rule in rules}
+        by_metric: Dict[str, Dict[str, List[AlertRule]]] = {}
+        for rule in rules:
+            by_metric.setdefault(rule.metric, {}).setdefault(rule.comparison, []).append(rule)
+        self._frames = {metric: [_Frame(COMPARISONS[comparison], group) for comparison, group in groups.items()]
+                        for metric, groups in by_metric.items()}
+        for alert_id in [alert_id for alert_id in self._active if alert_id not in self.rules]:
+            del self._active[alert_id]
+        events: List[dict] = []
+        for rule in added:
+            value = self._values.get(rule.metric)
+            if value is not None and rule.breached(value):
+                self._breached(rule, value, now, events)
+        self._publish(now, events)
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = os.stat(self.rules_path).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            rules = read_rules(self.directory)
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            logger.error(f"Alert rules in {self.rules_path} not loaded: {e}")
+            self._mtime = mtime
+            return False
+        self._mtime = mtime
+        if not self._restored:
+            self._restore()
+        self.set_rules(rules)
+        return True
+
+    def _restore(self):
+        # Alerts published by the previous evaluator, so a restart doesn't notify them again
+        self._restored = True
+        for alert in read_state(self.directory)["alerts"]:
+            self._active[alert["alert_id"]] = alert
+            if alert["state"] == "pending":
+                heapq.heappush(self._pending, (alert["due_at"], alert["alert_id"], alert["since"]))
+
+    # Evaluation
+
+    def evaluate(self, now: float, values: Dict[str, float]) -> List[dict]:
+        """
+        Applies one sample of metric values; returns the notifications it raised.
+        """
+        self.reload_if_changed()
+        events: List[dict] = []
+        changed = False
+        for metric, value in values.items():
+            if value is None or math.isnan(value):
+                continue
+            previous = self._values.get(metric)
+            if previous == value:
+                continue
+            self._values[metric] = value
+            for frame in self._frames.get(metric, ()):
+                changed |= self._cross(frame, previous, value, now, events)
+        while self._pending and self._pending[0][0] <= now:
+            _, alert_id, since = heapq.heappop(self._pending)
+            alert = self._active.get(alert_id)
+            # Entries of alerts that recovered (or were re-armed) since are stale
+            if alert is not None and alert["state"] == "pending" and alert["since"] == since:
+                self._fire(self.rules[alert_id], alert["value"], now, events)
+                changed = True
+        if changed:
+            self._publish(now, events)
+        return events
+
+    def _cross(self, frame: _Frame, previous: Optional[float], value: float, now: float, events: List[dict]) -> bool:
+        new = value * frame.sign
+        if previous is None:
+            # First value seen: everything below it is breached, and alerts restored from a
+            # previous evaluator above it have recovered
+            return (self._rising(frame, -math.inf, new, value, now, events)
+                    | self._falling(frame, math.inf, new, now, events))
+        old = previous * frame.sign
+        if new > old:
+            return self._rising(frame, old, new, value, now, events)
+        return self._falling(frame, old, new, now, events)
+
+    def _rising(self, frame: _Frame, old: float, new: float, value: float, now: float, events: List[dict]) -> bool:
+        # Newly breached: old <= threshold < new
+        low, high = bisect_left(frame.thresholds, old), bisect_left(frame.thresholds, new)
+        for rule in frame.by_threshold[low:high]:
+            self._breached(rule, value, now, events)
+        return high > low
+
+    def _falling(self, frame: _Frame, old: float, new: float, now: float, events: List[dict]) -> bool:
+        # No longer breached (new <= threshold < old): pending alerts are dropped
+        low, high = bisect_left(frame.thresholds, new), bisect_left(frame.thresholds, old)
+        for rule in frame.by_threshold[low:high]:
+            alert = self._active.get(rule.alert_id)
+            if alert is not None and alert["state"] == "pending":
+                del self._active[rule.alert_id]
+        # Back past the clear threshold (new <= clear < old): firing alerts resolve
+        clear_low, clear_high = bisect_left(frame.clears, new), bisect_left(frame.clears, old)
+        for rule in frame.by_clear[clear_low:clear_high]:
+            alert = self._active.get(rule.alert_id)
+            if alert is not None and alert["state"] == "firing":
+                del self._active[rule.alert_id]
+                events.append(self._event(rule, "resolved", new * frame.sign, now))
+        return high > low or clear_high > clear_low
+
+    def _breached(self, rule: AlertRule, value: float, now: float, events: List[dict]):
+        if rule.alert_id in self._active:
+            return
+        if rule.for_seconds <= 0:
+            self._fire(rule, value, now, events)
+            return
+        self._active[rule.alert_id] = {**self._alert(rule, value), "state": "pending", "since": now,
+                                       "due_at": now + rule.for_seconds}
+        heapq.heappush(self._pending, (now + rule.for_seconds, rule.alert_id, now))
+
+    def _fire(self, rule: AlertRule, value: float, now: float, events: List[dict]):
+        self._active[rule.alert_id] = {**self._alert(rule, value), "state": "firing", "since": now}
+        events.append(self._event(rule, "firing", self._values.get(rule.metric, value), now))
+
+    @staticmethod
+    def _alert(rule: AlertRule, value: float) -> dict:
+        return {"alert_id": rule.alert_id, "alert_name": rule.alert_name, "metric": rule.metric,
+                "comparison": rule.comparison, "threshold": rule.threshold, "value": value}
+
+    def _event(self, rule: AlertRule, state: str, value: float, now: float) -> dict:
+        return {**self._alert(rule, value), "state": state, "timestamp": _iso(now),
+                "notification_method": rule.notification_method, "target": rule.target}
+
+    def _publish(self, now: float, events: List[dict]):
+        if self.notifier is not None:
+            for event in events:
+                self.notifier.enqueue(event)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.state_path + ".tmp", "w") as f:
+            # dumps, unlike dump, runs the C encoder
+            f.write(json.dumps({"evaluated_at": now, "alerts": list(self._active.values())}))
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def on_sample(self, now: float, values: Dict[str, float]):
+        """
+        Metrics recorder listener.
+        """
+        self.evaluate(now, values)
+
+
+class AlertNotifier:
+    """
+    Queues alert events and sends them in batches, one message per recipient and interval.
+    """
+    def __init__(self, interval: float, webhook_timeout: float, webhook_hosts: Iterable[str] = (),
+                 webhook_schemes: Iterable[str] = ("https",)):
+        """
+        :param webhook_hosts: Hosts webhooks may be sent to; ".example.com" allows its subdomains
+        :param webhook_schemes: URL schemes webhooks may use
+        """
+        self.interval = interval
+        self.webhook_timeout = webhook_timeout
+        self.webhook_hosts = frozenset(host.lower() for host in webhook_hosts)
+        self.webhook_schemes = frozenset(scheme.lower() for scheme in webhook_schemes)
+        # Appended from the recorder's executor thread, drained on the event loop
+        self._queue: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._client = None
+
+    def enqueue(self, event: dict):
+        self._queue.append(event)
+
+    def batches(self) -> Dict[Tuple[str, str], List[dict]]:
+        """
+        Drains the queue, grouping events by (notification method, target).
+        """
+        batches: Dict[Tuple[str, str], List[dict]] = {}
+        while self._queue:
+            event = self._queue.popleft()
+            batches.setdefault((event["notification_method"], event["target"]), []).append(event)
+        return batches
+
+    @staticmethod
+    def email_message(events: List[dict]) -> Tuple[str, str]:
+        firing = sum(event["state"] == "firing" for event in events)
+        subject = f"{firing} alert(s) firing, {len(events) - firing} resolved"
+        lines = [f"[{event['state'].upper()}] {event['alert_name']}: {event['metric']} = {event['value']:.6g} "
+                 f"({event['comparison']} {event['threshold']:g}) at {event['timestamp']}" for event in events]
+        return subject, "\n".join(lines)
+
+    def webhook_allowed(self, url: str) -> bool:
+        try:
+            parts = urlsplit(url)
+            host = (parts.hostname or "").lower()
+        except ValueError:
+            return False
+        if parts.scheme.lower() not in self.webhook_schemes or not host:
+            return False
+        return host in self.webhook_hosts or any(allowed.startswith(".") and host.endswith(allowed)
+                                                 for allowed in self.webhook_hosts)
+
+    def _webhook_client(self):
+        # httpx is imported on the first webhook, not when the app starts
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(timeout=self.webhook_timeout)
+        return self._client
+
+    async def flush(self):
+        loop = asyncio.get_running_loop()
+        for (method, target), events in self.batches().items():
+            try:
+                if method == "email":
+                    from app.services.email_service import EmailService
+                    subject, message = self.email_message(events)
+                    await loop.run_in_executor(None, EmailService.send_alert_email, target, subject, message)
+                elif not self.webhook_allowed(target):
+                    # A rule stored before the host was taken off the allowlist
+                    logger.error(f"Dropped {len(events)} alert notification(s) to {target}: host not allowed")
+                else:
+                    response = await self._webhook_client().post(target, json={"alerts": events})
+                    response.raise_for_status()
+            except Exception as e:
+                logger.error(f"Sending {len(events)} alert notification(s) by {method} to {target} failed: {e}")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def read_rules(directory: str) -> List[AlertRule]:
+    try:
+        with open(os.path.join(directory, "rules.json")) as f:
+            return [AlertRule(**rule) for rule in json.load(f)]
+    except FileNotFoundError:
+        return []
+
+
+def add_rule(directory: str, rule: AlertRule) -> int:
+    """
+    Appends a rule to the shared rule file; returns the number of rules.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "rules.json")
+    with open(os.path.join(directory, "rules.lock"), "w") as lock:
+        # Workers adding rules at the same time would otherwise drop each other's
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        rules = [r.to_dict() for r in read_rules(directory)] + [rule.to_dict()]
+        with open(path + ".tmp", "w") as f:
+            json.dump(rules, f)
+        os.replace(path + ".tmp", path)
+    return len(rules)
+
+
+def new_rule_id() -> str:
+    return f"alert_{ObjectId()}"
+
+
+def read_state(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, "state.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"evaluated_at": None, "alerts": []}
+
+
+alert_notifier = AlertNotifier(
+    settings.ALERT_NOTIFY_INTERVAL,
+    settings.ALERT_WEBHOOK_TIMEOUT,
+    webhook_hosts=[host.strip() for host in settings.ALERT_WEBHOOK_ALLOWED_HOSTS.split(",") if host.strip()],
+    webhook_schemes=[scheme.strip() for scheme in settings.ALERT_WEBHOOK_SCHEMES.split(",") if scheme.strip()],
+)
+alert_evaluator = AlertEvaluator(settings.ALERT_DIR, alert_notifier)
@@ -0,0 +1,306 @@
+"""
+Uncertainty-sampling queue of interactions awaiting human annotation.
+
+Every support and orchestration prediction is offered to the queue with priority
+
+    (1 - confidence) * (1 + DISAGREEMENT_WEIGHT * arms_disagree) / sqrt(1 + queued in its cluster)
+
+so uncertain predictions rank first, predictions the arms of a running A/B test disagree on get a
+boost, and near-duplicate texts are spread out instead of flooding the queue. Texts are
+clustered by a one-hash MinHash of their tokens, so two texts share a cluster with probability
+equal to their token Jaccard similarity.
+
+The queue lives in Redis, so every worker offers to and annotators pull from the same global
+top `capacity`, and it survives worker restarts:
+
+    <prefix>queue     sorted set, item id -> priority (ZADD NX; ZPOPMAX for annotators, ZPOPMIN to evict)
+    <prefix>items     hash, item id -> serialized item (HSETNX)
+    <prefix>clusters  hash, MinHash cluster -> items queued in it
+
+An item's id is a hash of its normalized text, so `ZADD NX` both queues it and rejects the same
+text from any worker, in the same MULTI as its other entries: there is no separate claim a crash
+could leave behind. Requests don't wait on Redis: `offer()` only buffers the interaction, and a
+background task hands each worker's buffer to Redis every FLUSH_INTERVAL seconds in two round
+trips (reading the candidates' state, then one MULTI queueing the admitted ones). Each worker
+remembers the lowest queued priority from its last flush for THRESHOLD_TTL seconds, so offers that
+can't beat it (most confident traffic once the queue is full) are rejected before being buffered.
+Without Redis, offers are dropped and the queue reads as empty until it is back.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+import zlib
+from collections import deque
+from typing import Callable, List, Optional
+
+from redis.exceptions import RedisError
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.metrics_service import annotation_queue_events, metrics
+from app.services.nlp_service import TOKEN_PATTERN
+from app.utils import serialization
+
+logger = logging.getLogger("app_logger")
+
+DISAGREEMENT_WEIGHT = 1.0
+# How long a worker trusts the admission threshold from its last flush
+THRESHOLD_TTL = 1.0
+# How long Redis is bypassed after an error
+REDIS_RETRY_INTERVAL = 5.0
+# Seconds between flushes of a worker's buffered offers, and how many it buffers before dropping them
+FLUSH_INTERVAL = 0.1
+MAX_PENDING = 10_000
+
+
+def minhash_cluster(tokens: List[str]) -> int:
+    """
+    Smallest token hash; texts collide with probability equal to their token Jaccard similarity.
+    """
+    return min((zlib.crc32(token.encode()) for token in tokens), default=0)
+
+
+class AnnotationQueue:
+    def __init__(self, capacity: int, redis_client=None, prefix: str = "annotation:"):
+        """
+        :param capacity: Maximum number of queued items; the lowest priority is evicted beyond it
+        :param redis_client: `redis.asyncio` client holding the queue, or None until the worker connects
+        :param prefix: Redis key prefix
+        """
+        self.capacity = capacity
+        self.redis = redis_client
+        self.queue_key = prefix + "queue"
+        self.items_key = prefix + "items"
+        self.clusters_key = prefix + "clusters"
+        self._pending: deque = deque()
+        self._threshold = 0.0
+        self._threshold_at = -math.inf
+        self._redis_down_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.time() >= self._redis_down_until
+
+    def _redis_failed(self, e: Exception):
+        self._redis_down_until = time.time() + REDIS_RETRY_INTERVAL
+        logger.error(f"Annotation queue unavailable: {e}")
+
+    def _note_threshold(self, lowest: float, queued: int):
+        self._threshold = lowest if queued >= self.capacity else 0.0
+        self._threshold_at = time.monotonic()
+
+    def offer(self, text: str, intent: Optional[str], confidence: float, source: str,
+              model_version: Optional[str] = None, alternatives: Optional[Callable[[], List[str]]] = None,
+              **context) -> bool:
+        """
+        Buffers an interaction for the next flush, which queues it if it ranks among the top
+        `capacity`; False if it was rejected already.
+
+        :param alternatives: Called at the flush, only for candidates that could be queued; returns
+            the intents the other arms of a running experiment predict for the same text
+        """
+        annotation_queue_events.labels("offered").inc()
+        uncertainty = min(max(1.0 - confidence, 0.0), 1.0)
+        # Upper bound (disagreement, empty cluster) first: most confident traffic stops here
+        bound = uncertainty * (1 + DISAGREEMENT_WEIGHT if alternatives is not None else 1)
+        threshold = self._threshold if time.monotonic() - self._threshold_at < THRESHOLD_TTL else 0.0
+        if uncertainty <= 0 or bound <= threshold or not self._redis_available() or len(self._pending) >= MAX_PENDING:
+            self._reject()
+            return False
+        self._pending.append((text, intent, confidence, source, model_version, alternatives, context, time.time()))
+        return True
+
+    def _reject(self, count: int = 1):
+        annotation_queue_events.labels("rejected").inc(count)
+
+    async def flush(self) -> int:
+        """
+        Queues the buffered offers that rank among the top `capacity`; returns how many were queued.
+        """
+        offers = [self._pending.popleft() for _ in range(len(self._pending))]
+        if not offers:
+            return 0
+        if not self._redis_available():
+            self._reject(len(offers))
+            return 0
+        try:
+            return await self._flush(offers)
+        except (RedisError, OSError) as e:
+            self._redis_failed(e)
+            self._reject(len(offers))
+            return 0
+
+    async def _flush(self, offers: list) -> int:
+        candidates = {}
+        for offer in offers:
+            tokens = TOKEN_PATTERN.findall(offer[0].lower())
+            text_key = " ".join(tokens)
+            item_id = hashlib.blake2b(text_key.encode(), digest_size=12).hexdigest()
+            # The same text twice in one batch is a duplicate like any other
+            candidates.setdefault(item_id, (offer, minhash_cluster(tokens)))
+        pipe = self.redis.pipeline(transaction=False)
+        for item_id, (_, cluster) in candidates.items():
+            pipe.zscore(self.queue_key, item_id)
+            pipe.hget(self.clusters_key, cluster)
+        pipe.zrange(self.queue_key, 0, 0, withscores=True)
+        pipe.zcard(self.queue_key)
+        *states, lowest, queued = await pipe.execute()
+        lowest_priority = lowest[0][1] if lowest else 0.0
+        self._note_threshold(lowest_priority, queued)
+
+        admitted, added_to_cluster = [], {}
+        for (item_id, (offer, cluster)), score, cluster_size in zip(candidates.items(), states[::2], states[1::2]):
+            if score is not None:
+                continue
+            text, intent, confidence, source, model_version, alternatives, context, offered_at = offer
+            disagree = alternatives is not None and any(other != intent for other in alternatives())
+            in_cluster = max(int(cluster_size or 0), 0) + added_to_cluster.get(cluster, 0)
+            uncertainty = min(max(1.0 - confidence, 0.0), 1.0)
+            priority = uncertainty * (1 + DISAGREEMENT_WEIGHT * disagree) / (1 + in_cluster) ** 0.5
+            if queued >= self.capacity and priority <= lowest_priority:
+                continue
+            added_to_cluster[cluster] = added_to_cluster.get(cluster, 0) + 1
+            item = dict(context, item_id=item_id, text=text, intent=intent, confidence=confidence, source=source,
+                        model_version=model_version, arms_disagree=disagree, priority=round(priority, 6),
+                        queued_at=offered_at)
+            admitted.append((item_id, priority, cluster, {"item": item, "cluster": cluster}))
+        self._reject(len(offers) - len(admitted))
+        if not admitted:
+            return 0
+
+        # All or nothing: an item is never in the queue without its entry, or the reverse
+        pipe = self.redis.pipeline(transaction=True)
+        for item_id, priority, cluster, record in admitted:
+            pipe.zadd(self.queue_key, {item_id: priority}, nx=True)
+            pipe.hsetnx(self.items_key, item_id, serialization.dumps(record))
+            pipe.hincrby(self.clusters_key, cluster, 1)
+        pipe.zcard(self.queue_key)
+        *results, queued = await pipe.execute()
+        # Another worker queued the same text since it was read: NX kept its entry and record, and only the
+        # extra cluster count needs undoing
+        raced = [cluster for (_, _, cluster, _), added in zip(admitted, results[::3]) if not added]
+        if raced:
+            pipe = self.redis.pipeline(transaction=False)
+            for cluster in raced:
+                pipe.hincrby(self.clusters_key, cluster, -1)
+            await pipe.execute()
+            self._reject(len(raced))
+        annotation_queue_events.labels("queued").inc(len(admitted) - len(raced))
+        if queued > self.capacity:
+            # ZPOPMIN hands each evicted item to exactly one worker, which then clears its entries
+            evicted = await self.redis.zpopmin(self.queue_key, queued - self.capacity)
+            await self._discard([member for member, _ in evicted])
+            annotation_queue_events.labels("evicted").inc(len(evicted))
+            if evicted:
+                self._note_threshold(evicted[-1][1], self.capacity)
+        return len(admitted) - len(raced)
+
+    async def _discard(self, item_ids: list) -> List[dict]:
+        """
+        Deletes items already popped from the queue with their cluster entries; returns them in order.
+        """
+        if not item_ids:
+            return []
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hmget(self.items_key, item_ids)
+        pipe.hdel(self.items_key, *item_ids)
+        blobs, _ = await pipe.execute()
+        records = [serialization.loads(blob) for blob in blobs if blob is not None]
+        if records:
+            pipe = self.redis.pipeline(transaction=False)
+            for record in records:
+                pipe.hincrby(self.clusters_key, record["cluster"], -1)
+            sizes = await pipe.execute()
+            # A cluster another worker adds to meanwhile may be dropped; its size only spreads priorities out
+            emptied = [record["cluster"] for record, size in zip(records, sizes) if size <= 0]
+            if emptied:
+                await self.redis.hdel(self.clusters_key, *emptied)
+        return [record["item"] for record in records]
+
+    async def pull(self, n: int) -> List[dict]:
+        """
+        Removes and returns the n highest-priority items.
+        """
+        if not self._redis_available():
+            return []
+        try:
+            popped = await self.redis.zpopmax(self.queue_key, n)
+            return await self._discard([member for member, _ in popped])
+        except (RedisError, OSError) as e:
+            self._redis_failed(e)
+            return []
+
+    async def peek(self, n: int) -> List[dict]:
+        """
+        The n highest-priority items, without removing them.
+        """
+        if not self._redis_available():
+            return []
+        try:
+            item_ids = await self.redis.zrevrange(self.queue_key, 0, n - 1)
+            blobs = await self.redis.hmget(self.items_key, item_ids) if item_ids else []
+        except (RedisError, OSError) as e:
+            self._redis_failed(e)
+            return []
+        return [serialization.loads(blob)["item"] for blob in blobs if blob is not None]
+
+    async def size(self) -> int:
+        if not self._redis_available():
+            return 0
+        try:
+            return await self.redis.zcard(self.queue_key)
+        except (RedisError, OSError) as e:
+            self._redis_failed(e)
+            return 0
+
+    async def stats(self) -> dict:
+        """
+        The shared queue's state, and offers, rejections and evictions over all workers.
+        """
+        queued, clusters, lowest = 0, 0, []
+        if self._redis_available():
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.zcard(self.queue_key)
+                pipe.hlen(self.clusters_key)
+                pipe.zrange(self.queue_key, 0, 0, withscores=True)
+                queued, clusters, lowest = await pipe.execute()
+            except (RedisError, OSError) as e:
+                self._redis_failed(e)
+        collected = await run_in_threadpool(metrics.collect)
+        events = {labels[0]: int(value[0]) for labels, value in collected[annotation_queue_events.name].items()}
+        return {
+            "queued": queued,
+            "capacity": self.capacity,
+            "clusters": clusters,
+            "admission_threshold": round(lowest[0][1], 6) if lowest and queued >= self.capacity else 0.0,
+            "offered": events.get("offered", 0),
+            "rejected": events.get("rejected", 0),
+            "evicted": events.get("evicted", 0),
+        }
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            if self._pending:
+                await self.flush()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# Connected to Redis by each worker at startup (app/core/resources.py)
+annotation_queue = AnnotationQueue(settings.ANNOTATION_QUEUE_CAPACITY)
@@ -0,0 +1,351 @@
+"""
+Two-tier read-through cache for expensive async work (personalization, intent results, lookups).
+
+L1 is a bounded in-process LRU with per-entry TTL, L2 is Redis shared by all workers.
+Concurrent misses for the same key are coalesced into a single computation, entries past
+their TTL are served stale while one background refresh runs, and invalidations are fanned
+out to every worker through Redis pub/sub.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.utils import serialization
+
+logger = logging.getLogger("app_logger")
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# How long L2 is bypassed after a Redis error, so a down Redis doesn't add latency to every call
+L2_RETRY_INTERVAL = 5.0
+
+
+class CacheEntry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class LocalCache:
+    """
+    Bounded LRU keyed by full cache key. Expired entries are dropped lazily on access.
+    """
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.stale_until <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NamespaceStats:
+    __slots__ = ("l1_hits", "l2_hits", "stale_hits", "misses", "coalesced", "errors")
+
+    def __init__(self):
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        hits = self.l1_hits + self.l2_hits + self.stale_hits
+        lookups = hits + self.misses
+        return {
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class TieredCache:
+    def __init__(self, redis_client=None, max_entries: int = 10000, default_ttl: int = 60, stale_ttl: int = 30):
+        """
+        :param redis_client: `redis.asyncio` client used as L2, or None for an L1-only cache
+        :param max_entries: Maximum number of entries kept in the in-process L1
+        :param default_ttl: Seconds an entry is served as fresh
+        :param stale_ttl: Extra seconds an expired entry may be served while it is refreshed
+        """
+        self.redis = redis_client
+        self.local = LocalCache(max_entries)
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self._stats: Dict[str, NamespaceStats] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._background: set = set()
+        self._listener: Optional[asyncio.Task] = None
+        self._l2_down_until = 0.0
+
+    def stats(self, namespace: str) -> NamespaceStats:
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = NamespaceStats()
+        return stats
+
+    def metrics(self) -> dict:
+        """
+        Returns hit/miss counters and the hit ratio for every namespace seen so far.
+        """
+        return {namespace: stats.as_dict() for namespace, stats in self._stats.items()}
+
+    async def get_or_compute(self, namespace: str, key: str, compute: Callable[[], Awaitable[Any]],
+                             ttl: Optional[int] = None, stale_ttl: Optional[int] = None) -> Any:
+        """
+        Returns the cached value for `namespace:key`, calling `compute` on a miss.
+        """
+        full_key = f"{namespace}:{key}"
+        stats = self.stats(namespace)
+        ttl = self.default_ttl if ttl is None else ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+
+        entry = self.local.get(full_key)
+        from_l2 = False
+        if entry is None:
+            entry = await self._l2_get(full_key, stats)
+            if entry is not None:
+                self.local.set(full_key, entry)
+                from_l2 = True
+
+        if entry is not None:
+            if time.time() < entry.fresh_until:
+                if from_l2:
+                    stats.l2_hits += 1
+                else:
+                    stats.l1_hits += 1
+                return entry.value
+            # Past its TTL but inside the stale window: serve it and refresh once in the background
+            stats.stale_hits += 1
+            self._refresh_in_background(full_key, stats, compute, ttl, stale_ttl)
+            return entry.value
+
+        if full_key not in self._inflight:
+            stats.misses += 1
+        return await self._single_flight(full_key, stats, compute, ttl, stale_ttl)
+
+    async def _single_flight(self, full_key: str, stats: NamespaceStats, compute, ttl: int, stale_ttl: int) -> Any:
+        pending = self._inflight.get(full_key)
+        if pending is not None:
+            stats.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            value = await compute()
+            now = time.time()
+            entry = CacheEntry(value, now + ttl, now + ttl + stale_ttl)
+            self.local.set(full_key, entry)
+            await self._l2_set(full_key, entry, ttl + stale_ttl, stats)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(full_key, None)
+
+    def _refresh_in_background(self, full_key: str, stats: NamespaceStats, compute, ttl: int, stale_ttl: int):
+        if full_key in self._inflight:
+            return
+        task = asyncio.ensure_future(self._single_flight(full_key, stats, compute, ttl, stale_ttl))
+        self._background.add(task)
+        task.add_done_callback(self._finish_background)
+
+    def _finish_background(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background cache refresh failed: {task.exception()}")
+
+    def _l2_available(self) -> bool:
+        return self.redis is not None and time.time() >= self._l2_down_until
+
+    def _l2_failed(self, stats: Optional[NamespaceStats], e: Exception):
+        if stats is not None:
+            stats.errors += 1
+        self._l2_down_until = time.time() + L2_RETRY_INTERVAL
+        logger.error(f"Redis L2 cache unavailable: {e}")
+
+    async def _l2_get(self, full_key: str, stats: NamespaceStats) -> Optional[CacheEntry]:
+        if not self._l2_available():
+            return None
+        try:
+            raw = await self.redis.get(full_key)
+        except (RedisError, OSError) as e:
+            self._l2_failed(stats, e)
+            return None
+        if raw is None:
+            return None
+        try:
+            payload = serialization.loads(raw)
+            return CacheEntry(payload["v"], payload["f"], payload["s"])
+        except (ValueError, KeyError, TypeError):
+            # Foreign value (e.g. written through /cache/store); treat as a miss
+            return None
+
+    async def _l2_set(self, full_key: str, entry: CacheEntry, expire: int, stats: NamespaceStats):
+        if not self._l2_available():
+            return
+        payload = serialization.dumps({"v": entry.value, "f": entry.fresh_until, "s": entry.stale_until})
+        try:
+            await self.redis.set(full_key, payload, ex=max(int(expire), 1))
+        except (RedisError, OSError) as e:
+            self._l2_failed(stats, e)
+
+    def evict_local(self, key: str):
+        """
+        Drops `key` from this worker's L1. A trailing `*` drops every key with that prefix.
+        """
+        if key.endswith("*"):
+            self.local.delete_prefix(key[:-1])
+        else:
+            self.local.delete(key)
+
+    async def invalidate(self, key: str):
+        """
+        Removes `key` (full `namespace:key`, or a `prefix*` pattern) from L1 and L2 and tells
+        every other worker to drop its L1 copy.
+        """
+        self.evict_local(key)
+        if self._l2_available() and not key.endswith("*"):
+            try:
+                await self.redis.delete(key)
+            except (RedisError, OSError) as e:
+                self._l2_failed(None, e)
+        await self.publish_invalidation(key)
+
+    async def publish_invalidation(self, key: str):
+        """
+        Evicts `key` locally and broadcasts the eviction to the other workers.
+        """
+        self.evict_local(key)
+        if not self._l2_available():
+            return
+        try:
+            await self.redis.publish(INVALIDATION_CHANNEL, key)
+        except (RedisError, OSError) as e:
+            self._l2_failed(None, e)
+
+    async def listen_for_invalidations(self):
+        """
+        Subscribes to the invalidation channel and evicts L1 entries published by any worker.
+        Reconnects after Redis errors until cancelled.
+        """
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = message["data"]
+                    self.evict_local(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError) as e:
+                logger.error(f"Cache invalidation listener disconnected: {e}")
+                await asyncio.sleep(L2_RETRY_INTERVAL)
+            finally:
+                try:
+                    await pubsub.close()
+                except (RedisError, OSError):
+                    pass
+
+    async def start(self):
+        if self.redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(self.listen_for_invalidations())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        for task in list(self._background):
+            task.cancel()
+
+
+def _default_key(args: tuple, kwargs: dict) -> str:
+    raw = json.dumps([args, kwargs], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+# L1-only until each worker connects Redis at startup (app/db.py)
+tiered_cache = TieredCache(
+    redis_client=None,
+    max_entries=settings.CACHE_L1_MAX_ENTRIES,
+    default_ttl=settings.CACHE_DEFAULT_TTL,
+    stale_ttl=settings.CACHE_STALE_TTL,
+)
+
+
+def cached(namespace: str, ttl: Optional[int] = None, stale_ttl: Optional[int] = None,
+           key_builder: Optional[Callable[..., str]] = None, cache: Optional[TieredCache] = None):
+    """
+    Decorator that read-through caches an async function under `namespace`.
+
+    :param key_builder: Builds the cache key from the call arguments (default: hash of all arguments)
+    :param cache: Cache instance to use (default: the shared `tiered_cache`)
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = key_builder(*args, **kwargs) if key_builder else _default_key(args, kwargs)
+            return await (cache or tiered_cache).get_or_compute(
+                namespace, key, lambda: func(*args, **kwargs), ttl=ttl, stale_ttl=stale_ttl
+            )
+
+        async def invalidate(*args, **kwargs):
+            key = key_builder(*args, **kwargs) if key_builder else _default_key(args, kwargs)
+            await (cache or tiered_cache).invalidate(f"{namespace}:{key}")
+
+        wrapper.invalidate = invalidate
+        return wrapper
+    return decorator
@@ -0,0 +1,293 @@
+"""
+Streaming drift detection over live intent predictions.
+
+Every prediction updates constant-size sketches for its model version: a histogram of
+confidence scores, a frequency table of predicted intents and a hashed frequency table of query
+tokens (a single count-min row). Sketches are kept per time slot (DRIFT_SLOT_SECONDS) in a ring
+of DRIFT_RETENTION_SLOTS rows, memory-mapped per worker so any worker can sum the traffic of all
+of them over an arbitrary window.
+
+`capture_baseline` freezes the last `window` of traffic as the reference; `compare` sums the
+traffic seen since, over the same window length, and scores it against the baseline with PSI
+(confidence, intents, tokens) and a two-sample KS test on the binned confidence distribution.
+"""
+import glob
+import json
+import logging
+import math
+import os
+import re
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.nlp_service import TOKEN_PATTERN
+
+logger = logging.getLogger("app_logger")
+
+CONFIDENCE_BINS = 20
+MIN_SAMPLES = 100
+KS_ALPHA = 0.01
+# Smoothing for empty bins in PSI so a category missing on one side doesn't divide by zero
+PSI_EPSILON = 1e-4
+
+WINDOW_PATTERN = re.compile(r"^(?:last[_ ])?(\d+)[_ ]?(s|secs?|seconds?|m|mins?|minutes?|h|hours?|d|days?|w|weeks?)$")
+UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_window(window: str) -> int:
+    """
+    Window length in seconds from "24h", "30m", "7d" or "last_7_days". Raises ValueError otherwise.
+    """
+    match = WINDOW_PATTERN.match(window.strip().lower())
+    if match is None:
+        raise ValueError(f"Unrecognised drift detection window: {window!r} (use e.g. '24h', '7d' or 'last_7_days')")
+    return int(match.group(1)) * UNIT_SECONDS[match.group(2)[0]]
+
+
+def psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    """
+    Population stability index between two count vectors.
+    """
+    p = expected / max(expected.sum(), 1) + PSI_EPSILON
+    q = actual / max(actual.sum(), 1) + PSI_EPSILON
+    p, q = p / p.sum(), q / q.sum()
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def ks_two_sample(expected: np.ndarray, actual: np.ndarray) -> Dict[str, float]:
+    """
+    KS statistic between two binned distributions (a lower bound of the unbinned statistic) and
+    its asymptotic p-value.
+    """
+    n, m = float(expected.sum()), float(actual.sum())
+    d = float(np.max(np.abs(np.cumsum(expected) / n - np.cumsum(actual) / m)))
+    en = math.sqrt(n * m / (n + m))
+    lam = (en + 0.12 + 0.11 / en) * d
+    if lam < 0.2:
+        p_value = 1.0
+    else:
+        k = np.arange(1, 101)
+        p_value = float(np.clip(2 * np.sum((-1.0) ** (k - 1) * np.exp(-2 * k ** 2 * lam ** 2)), 0.0, 1.0))
+    return {"statistic": round(d, 4), "p_value": round(p_value, 6)}
+
+
+class SketchLayout:
+    """
+    Column layout of one slot row: slot number, prediction count, confidence bins, intents, token buckets.
+    """
+    def __init__(self, labels: List[str], token_buckets: int):
+        self.labels = list(labels) + ["other"]
+        self.label_index = {label: i for i, label in enumerate(labels)}
+        self.token_buckets = token_buckets
+        self.confidence = 2
+        self.intents = self.confidence + CONFIDENCE_BINS
+        self.tokens = self.intents + len(self.labels)
+        self.width = self.tokens + token_buckets
+
+
+class VersionSketch:
+    def __init__(self, version: str, labels: List[str], directory: str, slot_seconds: int, slots: int,
+                 token_buckets: int):
+        self.version = version
+        self.layout = SketchLayout(labels, token_buckets)
+        self.directory = os.path.join(directory, version)
+        self.slot_seconds = slot_seconds
+        self.slots = slots
+        self._ring: Optional[np.ndarray] = None
+        self._cells: Optional[memoryview] = None
+
+    @property
+    def nbytes(self) -> int:
+        return self.slots * self.layout.width * 4
+
+    def ring(self) -> np.ndarray:
+        if self._ring is None:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{os.getpid()}.npy")
+            shape = (self.slots, self.layout.width)
+            ring = None
+            if os.path.exists(path):
+                ring = np.load(path, mmap_mode="r+")
+                if ring.shape != shape:
+                    ring = None
+            if ring is None:
+                ring = np.lib.format.open_memmap(path, mode="w+", dtype=np.int32, shape=shape)
+            self._ring = np.asarray(ring)
+            # Flat int32 view for updates: a memoryview item increment is ~3x cheaper than numpy scalar indexing
+            self._cells = memoryview(self._ring).cast("B").cast("i")
+        return self._ring
+
+    def observe(self, text: str, intent: str, confidence: float, now: Optional[float] = None):
+        layout = self.layout
+        slot = int((now if now is not None else time.time()) // self.slot_seconds)
+        ring = self.ring()
+        cells = self._cells
+        base = (slot % self.slots) * layout.width
+        if cells[base] != slot:
+            # Slot last used one retention period ago: recycle it
+            ring[slot % self.slots] = 0
+            cells[base] = slot
+        cells[base + 1] += 1
+        cells[base + layout.confidence + min(int(confidence * CONFIDENCE_BINS), CONFIDENCE_BINS - 1)] += 1
+        cells[base + layout.intents + layout.label_index.get(intent, len(layout.labels) - 1)] += 1
+        tokens, buckets = base + layout.tokens, layout.token_buckets
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            cells[tokens + zlib.crc32(token.encode()) % buckets] += 1
+
+    def totals(self, first_slot: int, last_slot: int) -> np.ndarray:
+        """
+        Counts summed over slots [first_slot, last_slot] and over every worker's ring.
+        """
+        total = np.zeros(self.layout.width - 1, dtype=np.int64)
+        for path in glob.glob(os.path.join(self.directory, "*.npy")):
+            try:
+                ring = np.load(path, mmap_mode="r")
+            except (ValueError, OSError):
+                continue
+            if ring.shape != (self.slots, self.layout.width):
+                continue
+            in_window = (ring[:, 0] >= first_slot) & (ring[:, 0] <= last_slot)
+            total += ring[in_window, 1:].sum(axis=0, dtype=np.int64)
+        return total
+
+    def split(self, totals: np.ndarray) -> Dict[str, np.ndarray]:
+        # totals omit the slot-number column
+        layout = self.layout
+        return {
+            "count": totals[0],
+            "confidence": totals[layout.confidence - 1:layout.intents - 1],
+            "intents": totals[layout.intents - 1:layout.tokens - 1],
+            "tokens": totals[layout.tokens - 1:],
+        }
+
+
+class DriftMonitor:
+    def __init__(self, directory: str, slot_seconds: int, slots: int, token_buckets: int, psi_threshold: float):
+        """
+        :param directory: Holds per-version rings (one file per worker) and baselines
+        :param slot_seconds: Time resolution of the sketches
+        :param slots: Slots kept; windows can be at most slot_seconds * slots long
+        :param token_buckets: Width of the hashed token frequency table
+        :param psi_threshold: PSI above which a distribution counts as drifted
+        """
+        self.directory = directory
+        self.slot_seconds = slot_seconds
+        self.slots = slots
+        self.token_buckets = token_buckets
+        self.psi_threshold = psi_threshold
+        self._sketches: Dict[str, VersionSketch] = {}
+
+    @property
+    def retention_seconds(self) -> int:
+        return self.slot_seconds * self.slots
+
+    def _window_slots(self, window_seconds: int) -> int:
+        return max(1, -(-window_seconds // self.slot_seconds))
+
+    def sketch(self, version: str, labels: List[str]) -> VersionSketch:
+        sketch = self._sketches.get(version)
+        if sketch is None:
+            sketch = VersionSketch(version, labels, self.directory, self.slot_seconds, self.slots, self.token_buckets)
+            self._sketches[version] = sketch
+        return sketch
+
+    def observe(self, model, text: str, intent: str, confidence: float, now: Optional[float] = None):
+        """
+        Records one prediction of `model` (a LoadedModel from the registry).
+        """
+        self.sketch(model.version, model.model.labels).observe(text, intent, confidence, now)
+
+    def _baseline_path(self, version: str) -> str:
+        return os.path.join(self.directory, version, "baseline.json")
+
+    def capture_baseline(self, model, window: str, metrics: Optional[List[str]] = None,
+                         now: Optional[float] = None) -> dict:
+        """
+        Stores the last `window` of traffic as the baseline for `model`. Raises ValueError for bad windows.
+        """
+        window_seconds = parse_window(window)
+        if window_seconds > self.retention_seconds:
+            raise ValueError(f"Window {window!r} exceeds the {self.retention_seconds // 3600}h of retained traffic")
+        now = now if now is not None else time.time()
+        sketch = self.sketch(model.version, model.model.labels)
+        last_slot = int(now // self.slot_seconds)
+        totals = sketch.totals(last_slot - self._window_slots(window_seconds) + 1, last_slot)
+        baseline = {
+            "model_version": model.version,
+            "window": window,
+            "window_seconds": window_seconds,
+            "metrics": metrics or [],
+            "labels": sketch.layout.labels,
+            "captured_at": datetime.utcfromtimestamp(now).isoformat(),
+            "captured_slot": last_slot,
+            "totals": totals.tolist(),
+        }
+        os.makedirs(sketch.directory, exist_ok=True)
+        path = self._baseline_path(model.version)
+        with open(path + ".tmp", "w") as f:
+            json.dump(baseline, f)
+        os.replace(path + ".tmp", path)
+        return {"model_version": model.version, "window": window, "captured_at": baseline["captured_at"],
+                "baseline_samples": int(totals[0])}
+
+    def compare(self, model, now: Optional[float] = None) -> Optional[dict]:
+        """
+        Scores traffic since the baseline (over the baseline's window length) against it.
+        Returns None when no baseline was captured.
+        """
+        try:
+            with open(self._baseline_path(model.version)) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            return None
+        now = now if now is not None else time.time()
+        sketch = self.sketch(model.version, model.model.labels)
+        if baseline["labels"] != sketch.layout.labels or len(baseline["totals"]) != sketch.layout.width - 1:
+            # Version re-registered with another label set or sketch size since the baseline
+            return None
+        last_slot = int(now // self.slot_seconds)
+        first_slot = max(last_slot - self._window_slots(baseline["window_seconds"]) + 1, baseline["captured_slot"] + 1)
+        reference = sketch.split(np.array(baseline["totals"], dtype=np.int64))
+        current = sketch.split(sketch.totals(first_slot, last_slot))
+        result = {
+            "model_version": model.version,
+            "drift_detection_window": baseline["window"],
+            "baseline_captured_at": baseline["captured_at"],
+            "samples": {"baseline": int(reference["count"]), "current": int(current["count"])},
+        }
+        if reference["count"] < MIN_SAMPLES or current["count"] < MIN_SAMPLES:
+            return dict(result, status="insufficient_data", drift_detected=None)
+
+        bin_centres = (np.arange(CONFIDENCE_BINS) + 0.5) / CONFIDENCE_BINS
+        ks = ks_two_sample(reference["confidence"], current["confidence"])
+        comparison = {
+            "confidence": {
+                "psi": round(psi(reference["confidence"], current["confidence"]), 4),
+                "ks_statistic": ks["statistic"],
+                "ks_p_value": ks["p_value"],
+                "baseline_mean": round(float(bin_centres @ reference["confidence"] / reference["count"]), 4),
+                "current_mean": round(float(bin_centres @ current["confidence"] / current["count"]), 4),
+            },
+            "intent": {
+                "psi": round(psi(reference["intents"], current["intents"]), 4),
+                "baseline_share": dict(zip(sketch.layout.labels, (reference["intents"] / reference["count"]).round(4).tolist())),
+                "current_share": dict(zip(sketch.layout.labels, (current["intents"] / current["count"]).round(4).tolist())),
+            },
+            "tokens": {"psi": round(psi(reference["tokens"], current["tokens"]), 4)},
+        }
+        drifted = [name for name, stats in comparison.items() if stats["psi"] > self.psi_threshold]
+        if ks["p_value"] < KS_ALPHA and "confidence" not in drifted:
+            drifted.append("confidence")
+        return dict(result, status="completed", drift_detected=bool(drifted), drifted=drifted,
+                    metrics_comparison=comparison)
+
+
+drift_monitor = DriftMonitor(
+    settings.DRIFT_DIR, settings.DRIFT_SLOT_SECONDS, settings.DRIFT_RETENTION_SLOTS,
+    settings.DRIFT_TOKEN_BUCKETS, settings.DRIFT_PSI_THRESHOLD,
+)
@@ -1,4 +1,4 @@
-from core.tasks import send_email
+from app.core.tasks import send_email
 
 class EmailService:
     @staticmethod
@@ -0,0 +1,341 @@
+"""
+Field-level encryption of PII with AES-256-GCM and a local keyring.
+
+Every field is encrypted on its own with a fresh 96-bit nonce and the field name as associated
+data, so a ciphertext can't be moved to another field, and stored as the string
+`enc:<key id>:<base64(nonce + ciphertext + tag)>`. Values without that prefix are returned as they
+are by decryption, so documents written before encryption was turned on keep reading.
+
+Keys live in a JSON keyring (ENCRYPTION_KEYRING_PATH, created with a first key if missing) that
+every worker and restart shares. Rotation adds a key, holding a lock file so concurrent rotations
+don't drop each other's, and makes it the one new values are encrypted with; older keys stay for
+decryption until `reencrypt-customers` has rewritten the records that use them. Workers pick up a
+rotated keyring within ENCRYPTION_KEYRING_RELOAD_SECONDS, or at once when they meet an unknown key
+id. One AESGCM context per key is built and cached.
+
+Batches are split into chunks encrypted on a dedicated thread pool, keeping the event loop free;
+`encrypt_stream` / `decrypt_stream` do the same for iterables too large to hold in memory.
+
+    python -m app.services.encryption_service rotate
+    python -m app.services.encryption_service reencrypt-customers
+"""
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import os
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("app_logger")
+
+PREFIX = "enc:"
+NONCE_SIZE = 12
+KEY_SIZE = 32
+# First byte of the plaintext: strings are stored as UTF-8, anything else as JSON
+TYPE_STR = b"s"
+TYPE_JSON = b"j"
+
+
+class DecryptionError(ValueError):
+    pass
+
+
+class Keyring:
+    def __init__(self, path: str):
+        self.path = path
+        self.active_id: str = ""
+        self.keys: Dict[str, bytes] = {}
+        self._stamp: Tuple[int, int] = (0, 0)
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    # Loading and rotation
+
+    def load(self) -> "Keyring":
+        """
+        Reads the keyring, creating it with a first key when it doesn't exist yet.
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self._stamp = self._file_stamp()
+        except FileNotFoundError:
+            data = self._create()
+        self.keys = {key_id: base64.b64decode(entry["key"]) for key_id, entry in data["keys"].items()}
+        self.active_id = data["active"]
+        self._checked_at = time.monotonic()
+        return self
+
+    def _create(self) -> dict:
+        data = self._new_key({"active": None, "keys": {}})
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        temp_path = self._write_temp(directory, data)
+        try:
+            # Linking fails when another worker created the keyring first; theirs wins
+            os.link(temp_path, self.path)
+        except FileExistsError:
+            with open(self.path) as f:
+                data = json.load(f)
+        else:
+            logger.info(f"Created encryption keyring {self.path} with key {data['active']}")
+        finally:
+            os.unlink(temp_path)
+        self._stamp = self._file_stamp()
+        return data
+
+    def _file_stamp(self) -> Tuple[int, int]:
+        # Rotation replaces the file, so its inode changes even within the mtime's resolution
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    @staticmethod
+    def _new_key(data: dict) -> dict:
+        # Creation time plus a random suffix: unique across keyrings and concurrent rotations, and sortable
+        key_id = ""
+        while not key_id or key_id in data["keys"]:
+            key_id = f"k{datetime.utcnow():%Y%m%d%H%M%S}-{secrets.token_hex(3)}"
+        data["keys"][key_id] = {"key": base64.b64encode(os.urandom(KEY_SIZE)).decode(),
+                                "created_at": datetime.utcnow().isoformat()}
+        data["active"] = key_id
+        return data
+
+    @staticmethod
+    def _write_temp(directory: str, data: dict) -> str:
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".keyring-")
+        # mkstemp already creates it readable by the owner only
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+        return temp_path
+
+    def rotate(self) -> str:
+        """
+        Adds a key and makes it the active one; returns its id.
+        """
+        with self._lock, open(self.path + ".lock", "w") as lock:
+            # Workers rotating at the same time would otherwise drop each other's keys
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(self.path) as f:
+                data = self._new_key(json.load(f))
+            os.replace(self._write_temp(os.path.dirname(self.path) or ".", data), self.path)
+            self.load()
+        logger.info(f"Encryption key rotated to {data['active']}")
+        return data["active"]
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Reloads the keyring when its file changed (checked at most every ENCRYPTION_KEYRING_RELOAD_SECONDS).
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < settings.ENCRYPTION_KEYRING_RELOAD_SECONDS:
+            return False
+        self._checked_at = now
+        try:
+            changed = self._file_stamp() != self._stamp
+        except FileNotFoundError:
+            return False
+        if changed:
+            with self._lock:
+                self.load()
+        return changed
+
+
+class FieldEncryptor:
+    def __init__(self, keyring: Keyring, threads: Optional[int] = None, chunk_size: Optional[int] = None):
+        self.keyring = keyring
+        self.threads = threads or settings.ENCRYPTION_THREADS or os.cpu_count() or 1
+        self.chunk_size = chunk_size or settings.ENCRYPTION_CHUNK_SIZE
+        self._contexts: Dict[str, Any] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _context(self, key_id: str):
+        context = self._contexts.get(key_id)
+        if context is None:
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+            key = self.keyring.keys.get(key_id)
+            if key is None and self.keyring.refresh(force=True):
+                key = self.keyring.keys.get(key_id)
+            if key is None:
+                raise DecryptionError(f"Unknown encryption key {key_id!r}")
+            context = self._contexts[key_id] = AESGCM(key)
+        return context
+
+    @property
+    def active_key_id(self) -> str:
+        return self.keyring.active_id
+
+    # Single values and records
+
+    def encrypt_value(self, value: Any, field: str, nonce: Optional[bytes] = None) -> Any:
+        if value is None:
+            return value
+        if isinstance(value, str):
+            plaintext = TYPE_STR + value.encode()
+        else:
+            plaintext = TYPE_JSON + json.dumps(value, separators=(",", ":")).encode()
+        key_id = self.keyring.active_id
+        nonce = nonce or os.urandom(NONCE_SIZE)
+        sealed = nonce + self._context(key_id).encrypt(nonce, plaintext, field.encode())
+        return f"{PREFIX}{key_id}:{binascii.b2a_base64(sealed, newline=False).decode()}"
+
+    def decrypt_value(self, value: Any, field: str) -> Any:
+        if not isinstance(value, str) or not value.startswith(PREFIX):
+            return value
+        key_id, _, encoded = value[len(PREFIX):].partition(":")
+        context = self._context(key_id)
+        # Catching broadly saves importing cryptography's InvalidTag (and its bindings) in the hot path
+        try:
+            sealed = binascii.a2b_base64(encoded)
+            plaintext = context.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], field.encode())
+            if plaintext[:1] == TYPE_STR:
+                return plaintext[1:].decode()
+            return json.loads(plaintext[1:])
+        except Exception:
+            raise DecryptionError(f"Field {field!r} could not be decrypted") from None
+
+    def encrypt_record(self, record: dict, fields: Optional[Iterable[str]] = None) -> dict:
+        """
+        A copy of `record` with `fields` (default: all of them) encrypted; missing fields are skipped.
+        """
+        self.keyring.refresh()
+        names = [name for name in (record if fields is None else fields) if record.get(name) is not None]
+        # One read of the system's randomness for all of the record's nonces
+        nonces = os.urandom(NONCE_SIZE * len(names))
+        encrypted = dict(record)
+        for i, name in enumerate(names):
+            encrypted[name] = self.encrypt_value(record[name], name, nonces[i * NONCE_SIZE:(i + 1) * NONCE_SIZE])
+        return encrypted
+
+    def decrypt_record(self, record: dict, fields: Optional[Iterable[str]] = None) -> dict:
+        decrypted = dict(record)
+        for name in (record if fields is None else fields):
+            if name in record:
+                decrypted[name] = self.decrypt_value(record[name], name)
+        return decrypted
+
+    def needs_reencryption(self, record: dict, fields: Iterable[str]) -> bool:
+        """
+        Whether any of the record's fields is plaintext or encrypted with a key other than the active one.
+        """
+        active = f"{PREFIX}{self.keyring.active_id}:"
+        return any(record.get(name) is not None and not str(record[name]).startswith(active) for name in fields)
+
+    # Batches
+
+    def _encrypt_chunk(self, records: Sequence[dict], fields: Optional[List[str]]) -> List[dict]:
+        return [self.encrypt_record(record, fields) for record in records]
+
+    def _decrypt_chunk(self, records: Sequence[dict], fields: Optional[List[str]]) -> List[dict]:
+        return [self.decrypt_record(record, fields) for record in records]
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="encryption")
+        return self._executor
+
+    def _chunks(self, records: Iterable[dict]) -> Iterator[List[dict]]:
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def _run_batch(self, work, records: List[dict], fields: Optional[List[str]]) -> List[dict]:
+        if len(records) <= self.chunk_size:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), work, records, fields)
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*(loop.run_in_executor(self._pool(), work, chunk, fields)
+                                        for chunk in self._chunks(records)))
+        return [record for chunk in chunks for record in chunk]
+
+    async def encrypt_records(self, records: List[dict], fields: Optional[List[str]] = None) -> List[dict]:
+        return await self._run_batch(self._encrypt_chunk, records, fields)
+
+    async def decrypt_records(self, records: List[dict], fields: Optional[List[str]] = None) -> List[dict]:
+        return await self._run_batch(self._decrypt_chunk, records, fields)
+
+    def _stream(self, work, records: Iterable[dict], fields: Optional[List[str]]) -> Iterator[dict]:
+        # At most two chunks per thread in flight, so memory stays bounded however long the input is
+        pending = deque()
+        for chunk in self._chunks(records):
+            pending.append(self._pool().submit(work, chunk, fields))
+            if len(pending) >= 2 * self.threads:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+    def encrypt_stream(self, records: Iterable[dict], fields: Optional[List[str]] = None) -> Iterator[dict]:
+        return self._stream(self._encrypt_chunk, records, fields)
+
+    def decrypt_stream(self, records: Iterable[dict], fields: Optional[List[str]] = None) -> Iterator[dict]:
+        return self._stream(self._decrypt_chunk, records, fields)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def field_encryptor(path: Optional[str] = None) -> FieldEncryptor:
+    return FieldEncryptor(Keyring(path or settings.ENCRYPTION_KEYRING_PATH).load())
+
+
+def reencrypt_customers(db, encryptor: FieldEncryptor, batch_size: int = 1000) -> int:
+    """
+    Rewrites the PII of customers still encrypted with an older key (or not at all) with the active key.
+    """
+    from pymongo import UpdateOne
+
+    from app.schemas.customer import CUSTOMER_PII_FIELDS
+
+    updated, operations = 0, []
+    projection = {name: 1 for name in CUSTOMER_PII_FIELDS}
+    for document in db["customers"].find({}, projection):
+        if not encryptor.needs_reencryption(document, CUSTOMER_PII_FIELDS):
+            continue
+        encrypted = encryptor.encrypt_record(encryptor.decrypt_record(document, CUSTOMER_PII_FIELDS),
+                                             CUSTOMER_PII_FIELDS)
+        encrypted.pop("_id")
+        operations.append(UpdateOne({"_id": document["_id"]}, {"$set": encrypted}))
+        if len(operations) == batch_size:
+            updated += db["customers"].bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += db["customers"].bulk_write(operations, ordered=False).modified_count
+    return updated
+
+
+if __name__ == "__main__":
+    from app.utils.logging import setup_logging
+
+    setup_logging(log_file="")
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "rotate":
+        logger.info(f"Active encryption key: {Keyring(settings.ENCRYPTION_KEYRING_PATH).load().rotate()}")
+    elif command == "reencrypt-customers":
+        from app.db import get_db
+
+        logger.info(f"Customers re-encrypted: {reencrypt_customers(get_db(), field_encryptor())}")
+    else:
+        sys.exit("usage: python -m app.services.encryption_service rotate|reencrypt-customers")
@@ -0,0 +1,309 @@
+"""
+Error event store behind /monitoring/error/*.
+
+Reports are grouped rather than stored one by one. Each report is fingerprinted from its type,
+component and message with the variable parts (numbers, ids, quoted values) masked, so "timeout
+after 5012 ms" and "timeout after 4875 ms" count as one error. Per fingerprint, two collections
+are kept:
+
+- `error_groups`, keyed by fingerprint: type, component, message template, a sample message,
+  first/last seen and the total occurrence count.
+- `error_counts`, one document per fingerprint and hour with that hour's count. Its `_id` is
+  "<YYYYMMDDHH>:<fingerprint>", so the primary key is time-ordered and a time window is a range
+  scan on it; type and component filters use (error_type, _id) and (component, _id) indexes.
+
+Storage therefore grows with distinct errors x active hours, not with events; time windows are
+resolved to whole hours.
+
+Workers don't write each report: `ErrorBuffer` merges reports in memory by (fingerprint, hour)
+and flushes them every ERROR_FLUSH_INTERVAL seconds (or once ERROR_BUFFER_MAX_GROUPS are pending)
+as one unordered bulk upsert, so a burst of identical errors costs a couple of writes.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from app.core.config import settings
+from app.db import get_db
+from app.services.feedback_service import parse_timestamp
+
+logger = logging.getLogger("app_logger")
+
+GROUPS_COLLECTION = "error_groups"
+COUNTS_COLLECTION = "error_counts"
+MAX_PAGE_SIZE = 1000
+MAX_MESSAGE_LENGTH = 2000
+REQUIRED_FIELDS = ("error_type", "component", "error_message")
+
+# Masked in this order: quoted values first, so numbers inside them don't leave a trace
+VARIABLE_PARTS = [
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "<str>"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I), "<uuid>"),
+    # Any word with a digit in it: counts, durations ("5012ms"), ids ("cust42", "0x7f3a"), hosts ("db-3")
+    (re.compile(r"\b\w*\d\w*\b"), "<n>"),
+]
+
+
+def message_template(message: str) -> str:
+    for pattern, placeholder in VARIABLE_PARTS:
+        message = pattern.sub(placeholder, message)
+    return message
+
+
+@lru_cache(maxsize=65536)
+def fingerprint(error_type: str, component: str, message: str) -> str:
+    key = "\x1f".join((error_type, component, message_template(message)))
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def hour_key(timestamp: datetime) -> int:
+    """
+    YYYYMMDDHH as a number (cheaper than strftime); in decimal it is the prefix of `error_counts` ids.
+    """
+    return ((timestamp.year * 100 + timestamp.month) * 100 + timestamp.day) * 100 + timestamp.hour
+
+
+def parse_report(report: dict, now: Optional[datetime] = None) -> dict:
+    """
+    Validates one report; `timestamp` (ISO 8601) is optional. Raises ValueError.
+    """
+    missing = [field for field in REQUIRED_FIELDS if not isinstance(report.get(field), str) or not report[field]]
+    if missing:
+        raise ValueError(f"Missing or empty field(s): {', '.join(missing)}")
+    timestamp = report.get("timestamp")
+    return {
+        "error_type": report["error_type"],
+        "component": report["component"],
+        "error_message": report["error_message"][:MAX_MESSAGE_LENGTH],
+        "session_id": report.get("session_id"),
+        "timestamp": parse_timestamp(timestamp) if timestamp else (now or datetime.utcnow()),
+    }
+
+
+class _Pending:
+    __slots__ = ("error_type", "component", "message", "session_id", "count", "first_seen", "last_seen")
+
+    def __init__(self, event: dict):
+        self.error_type = event["error_type"]
+        self.component = event["component"]
+        self.message = event["error_message"]
+        self.session_id = event["session_id"]
+        self.count = 0
+        self.first_seen = self.last_seen = event["timestamp"]
+
+    def add(self, event: dict):
+        self.count += 1
+        if event["timestamp"] < self.first_seen:
+            self.first_seen = event["timestamp"]
+        if event["timestamp"] >= self.last_seen:
+            self.last_seen = event["timestamp"]
+            self.message = event["error_message"]
+            self.session_id = event["session_id"] or self.session_id
+
+
+class ErrorStore:
+    def __init__(self):
+        self._indexed = set()
+
+    def ensure_indexes(self, db):
+        if id(db) in self._indexed:
+            return
+        counts, groups = db[COUNTS_COLLECTION], db[GROUPS_COLLECTION]
+        counts.create_index([("error_type", ASCENDING), ("_id", ASCENDING)])
+        counts.create_index([("component", ASCENDING), ("_id", ASCENDING)])
+        groups.create_index([("last_seen", DESCENDING), ("_id", DESCENDING)])
+        groups.create_index([("error_type", ASCENDING), ("last_seen", DESCENDING), ("_id", DESCENDING)])
+        groups.create_index([("component", ASCENDING), ("last_seen", DESCENDING), ("_id", DESCENDING)])
+        self._indexed.add(id(db))
+
+    @staticmethod
+    def aggregate(events: Iterable[dict], pending: Dict[Tuple[str, int], _Pending]) -> List[str]:
+        """
+        Merges parsed reports into `pending` by (fingerprint, hour); returns their fingerprints.
+        """
+        fingerprints = []
+        for event in events:
+            fp = fingerprint(event["error_type"], event["component"], event["error_message"])
+            fingerprints.append(fp)
+            key = (fp, hour_key(event["timestamp"]))
+            entry = pending.get(key)
+            if entry is None:
+                entry = pending[key] = _Pending(event)
+            entry.add(event)
+        return fingerprints
+
+    def write(self, db, pending: Dict[Tuple[str, int], _Pending]):
+        """
+        Upserts aggregated reports in one unordered bulk write.
+        """
+        if not pending:
+            return
+        self.ensure_indexes(db)
+        groups, counts = [], []
+        for (fp, hour), entry in pending.items():
+            groups.append(UpdateOne({"_id": fp}, {
+                "$setOnInsert": {"error_type": entry.error_type, "component": entry.component,
+                                 "message_template": message_template(entry.message)},
+                "$set": {"sample_message": entry.message, "last_session_id": entry.session_id},
+                "$inc": {"count": entry.count},
+                "$min": {"first_seen": entry.first_seen},
+                "$max": {"last_seen": entry.last_seen},
+            }, upsert=True))
+            counts.append(UpdateOne({"_id": f"{hour}:{fp}"}, {
+                "$setOnInsert": {"fingerprint": fp, "error_type": entry.error_type, "component": entry.component},
+                "$inc": {"count": entry.count},
+                "$max": {"last_seen": entry.last_seen},
+            }, upsert=True))
+        db[COUNTS_COLLECTION].bulk_write(counts, ordered=False)
+        db[GROUPS_COLLECTION].bulk_write(groups, ordered=False)
+
+    def record(self, db, events: Iterable[dict]) -> int:
+        """
+        Stores parsed reports straight away; returns the number of (fingerprint, hour) upserts.
+        """
+        pending = {}
+        self.aggregate(events, pending)
+        self.write(db, pending)
+        return len(pending)
+
+    @staticmethod
+    def _parse_cursor(cursor: str) -> Tuple[datetime, str]:
+        try:
+            last_seen, fp = cursor.rsplit("_", 1)
+            return parse_timestamp(last_seen), fp
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor!r}")
+
+    def page(self, db, start: Optional[datetime] = None, end: Optional[datetime] = None,
+             error_type: Optional[str] = None, component: Optional[str] = None, cursor: Optional[str] = None,
+             limit: int = 100) -> Tuple[List[dict], Optional[str]]:
+        """
+        One page of error groups, most recently seen first, and the cursor of the next page (None
+        on the last page). With a time window, occurrences are counted over the hours it touches.
+        Raises ValueError for a malformed cursor.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        after = None
+        if cursor:
+            last_seen, fp = self._parse_cursor(cursor)
+            after = {"$or": [{"last_seen": {"$lt": last_seen}}, {"last_seen": last_seen, "_id": {"$lt": fp}}]}
+        match = {key: value for key, value in (("error_type", error_type), ("component", component)) if value}
+
+        if start is None and end is None:
+            # Whole history: the group documents already hold the totals
+            query = {**match, **(after or {})}
+            groups = list(db[GROUPS_COLLECTION].find(query).sort([("last_seen", DESCENDING), ("_id", DESCENDING)])
+                          .limit(limit + 1))
+            for group in groups:
+                group["occurrences"] = group["count"]
+        else:
+            hours = {}
+            if start is not None:
+                hours["$gte"] = str(hour_key(start))
+            if end is not None:
+                hours["$lt"] = str(hour_key(end + timedelta(hours=1) if end.minute or end.second or end.microsecond
+                                            else end))
+            pipeline = [
+                {"$match": {"_id": hours, **match}},
+                {"$group": {"_id": "$fingerprint", "occurrences": {"$sum": "$count"},
+                            "last_seen": {"$max": "$last_seen"}}},
+                *([{"$match": after}] if after else []),
+                {"$sort": {"last_seen": DESCENDING, "_id": DESCENDING}},
+                {"$limit": limit + 1},
+            ]
+            counted = list(db[COUNTS_COLLECTION].aggregate(pipeline))
+            details = {group["_id"]: group for group in
+                       db[GROUPS_COLLECTION].find({"_id": {"$in": [row["_id"] for row in counted]}})}
+            groups = [{**details.get(row["_id"], {}), "_id": row["_id"], "occurrences": row["occurrences"],
+                       "window_last_seen": row["last_seen"]} for row in counted]
+
+        next_cursor = None
+        if len(groups) > limit:
+            last = groups[limit - 1]
+            next_cursor = f"{last.get('window_last_seen', last.get('last_seen')).isoformat()}_{last['_id']}"
+        return groups[:limit], next_cursor
+
+
+def group_to_response(group: dict) -> dict:
+    return {
+        "error_id": group["_id"],
+        "error_type": group.get("error_type"),
+        "component": group.get("component"),
+        "error_message": group.get("sample_message"),
+        "message_template": group.get("message_template"),
+        "occurrences": group["occurrences"],
+        "total_occurrences": group.get("count"),
+        "first_seen": group.get("first_seen"),
+        "last_seen": group.get("window_last_seen", group.get("last_seen")),
+        "last_session_id": group.get("last_session_id"),
+    }
+
+
+class ErrorBuffer:
+    """
+    Per-worker buffer of aggregated reports, flushed to the store in the background.
+    """
+    def __init__(self, store: ErrorStore, interval: float, max_groups: int, db_factory: Callable = get_db):
+        self.store = store
+        self.interval = interval
+        self.max_groups = max_groups
+        self.db_factory = db_factory
+        self._pending: Dict[Tuple[str, int], _Pending] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, events: List[dict]) -> List[str]:
+        """
+        Buffers parsed reports; returns their fingerprints. Flushes inline once the buffer is full.
+        """
+        with self._lock:
+            fingerprints = self.store.aggregate(events, self._pending)
+            full = len(self._pending) >= self.max_groups
+        if full:
+            self.flush()
+        return fingerprints
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            try:
+                self.store.write(self.db_factory(), pending)
+            except Exception as e:
+                logger.error(f"Writing {len(pending)} error group(s) failed, dropping them: {e}")
+        return len(pending)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._pending:
+                await loop.run_in_executor(None, self.flush)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+
+
+error_store = ErrorStore()
+error_buffer = ErrorBuffer(error_store, settings.ERROR_FLUSH_INTERVAL, settings.ERROR_BUFFER_MAX_GROUPS)
@@ -0,0 +1,332 @@
+"""
+Deterministic traffic splitting between model versions for canary deploys and A/B tests.
+
+A request is assigned to an arm by hashing "<experiment>:<unit id>" (customer id, else session
+id) into one of 10,000 buckets and bisecting the cumulative split, so a customer always sees the
+same arm and feedback can be attributed by recomputing the assignment. At most one experiment
+routes support traffic at a time; requests without a customer or session id go to the active model.
+
+Per-arm counters (requests, a histogram of model inference latency on cache misses, confidence
+moments, feedback outcomes) live in a memory-mapped .npy file per worker and experiment. Only the
+worker's event loop writes its file, so updates are plain array increments with no locks or I/O;
+`/ab-test/status` sums the files of all workers. Experiment definitions are persisted as JSON and re-checked every few seconds like
+the model registry.
+"""
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.model_registry import model_registry
+
+logger = logging.getLogger("app_logger")
+
+BUCKETS = 10_000
+# Upper bounds (ms) of the latency histogram buckets; the last one catches everything slower
+LATENCY_BOUNDS_MS = np.array([0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, np.inf])
+_LATENCY_BOUNDS_S = [bound / 1000 for bound in LATENCY_BOUNDS_MS.tolist()]
+REQUESTS, CONFIDENCE_SUM, CONFIDENCE_SQ_SUM, FEEDBACK_POSITIVE, FEEDBACK_NEGATIVE = range(5)
+LATENCY_OFFSET = 5
+N_FIELDS = LATENCY_OFFSET + len(LATENCY_BOUNDS_MS)
+Z_95 = 1.96
+
+
+def bucket_of(experiment_name: str, unit_id: str) -> int:
+    digest = hashlib.blake2b(f"{experiment_name}:{unit_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % BUCKETS
+
+
+def feedback_outcome(feedback: dict) -> Optional[bool]:
+    """
+    Reads a positive/negative outcome from a feedback payload ({"helpful": bool} or a 1-5 "rating").
+    """
+    if isinstance(feedback.get("helpful"), bool):
+        return feedback["helpful"]
+    rating = feedback.get("rating")
+    if isinstance(rating, (int, float)):
+        return rating >= 4
+    return None
+
+
+def wilson_interval(positive: float, total: float) -> Optional[List[float]]:
+    if total <= 0:
+        return None
+    p = positive / total
+    denominator = 1 + Z_95 ** 2 / total
+    centre = (p + Z_95 ** 2 / (2 * total)) / denominator
+    margin = Z_95 * math.sqrt(p * (1 - p) / total + Z_95 ** 2 / (4 * total ** 2)) / denominator
+    return [round(centre - margin, 4), round(centre + margin, 4)]
+
+
+def histogram_quantile(counts: np.ndarray, q: float) -> Optional[float]:
+    total = float(counts.sum())
+    if total <= 0:
+        return None
+    position = int(np.searchsorted(np.cumsum(counts), q * total))
+    bound = LATENCY_BOUNDS_MS[min(position, len(LATENCY_BOUNDS_MS) - 1)]
+    return float(bound) if np.isfinite(bound) else float(LATENCY_BOUNDS_MS[-2])
+
+
+class Experiment:
+    def __init__(self, name: str, arms: Dict[str, str], split: Dict[str, float], kind: str = "ab_test",
+                 metrics: Optional[List[str]] = None, started_at: Optional[str] = None, status: str = "ongoing"):
+        """
+        :param arms: arm name -> model version
+        :param split: arm name -> traffic percentage (must cover every arm and sum to 100)
+        """
+        if set(split) != set(arms):
+            raise ValueError(f"Traffic split must name exactly the arms {sorted(arms)}")
+        shares = list(split.values())
+        if any(not isinstance(share, (int, float)) or share < 0 for share in shares) or abs(sum(shares) - 100) > 1e-6:
+            raise ValueError("Traffic split percentages must be non-negative and sum to 100")
+        self.name = name
+        self.arms = arms
+        self.split = split
+        self.kind = kind
+        self.metrics = metrics or []
+        self.started_at = started_at or datetime.utcnow().isoformat()
+        self.status = status
+        self.arm_names = list(arms)
+        self.versions = [arms[arm] for arm in self.arm_names]
+        self.thresholds = list(np.cumsum([split[arm] * BUCKETS / 100 for arm in self.arm_names]).round().astype(int))
+        self._counters: Optional[np.ndarray] = None
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "arms": self.arms, "split": self.split, "kind": self.kind,
+                "metrics": self.metrics, "started_at": self.started_at, "status": self.status}
+
+    def assign(self, unit_id: str) -> int:
+        return min(bisect_right(self.thresholds, bucket_of(self.name, unit_id)), len(self.arm_names) - 1)
+
+    def counter_dir(self, directory: str) -> str:
+        # One directory per run, so restarting an experiment under the same name starts from zero
+        return os.path.join(directory, self.name, self.started_at.replace(":", "-"))
+
+    def counters(self, directory: str) -> np.ndarray:
+        """
+        This worker's counters, memory-mapped from <counter_dir>/<pid>.npy.
+        """
+        if self._counters is None:
+            path = os.path.join(self.counter_dir(directory), f"{os.getpid()}.npy")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shape = (len(self.arm_names), N_FIELDS)
+            counters = None
+            if os.path.exists(path):
+                counters = np.load(path, mmap_mode="r+")
+                if counters.shape != shape:
+                    counters = None
+            if counters is None:
+                counters = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=shape)
+            # Plain ndarray view of the mapping: element updates on the memmap subclass are several times slower
+            self._counters = np.asarray(counters)
+        return self._counters
+
+
+class Assignment:
+    __slots__ = ("experiment", "arm", "version")
+
+    def __init__(self, experiment: Experiment, arm: int):
+        self.experiment = experiment
+        self.arm = arm
+        self.version = experiment.versions[arm]
+
+
+class ExperimentRouter:
+    def __init__(self, directory: str, registry=model_registry, check_interval: float = 2.0):
+        """
+        :param directory: Holds experiments.json and the per-worker counter files
+        :param registry: ModelRegistry the arm versions are loaded from
+        :param check_interval: Seconds between checks of experiments.json for changes by other workers
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, "experiments.json")
+        self.registry = registry
+        self.check_interval = check_interval
+        self._experiments: Dict[str, Experiment] = {}
+        self._running: Optional[Experiment] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._read()
+
+    # Definitions
+
+    def get(self, name: str) -> Optional[Experiment]:
+        self._maybe_sync()
+        return self._experiments.get(name)
+
+    @property
+    def running(self) -> Optional[Experiment]:
+        self._maybe_sync()
+        return self._running
+
+    def start(self, name: str, arms: Dict[str, str], split: Dict[str, float], kind: str = "ab_test",
+              metrics: Optional[List[str]] = None) -> Experiment:
+        """
+        Starts routing support traffic through a new experiment, ending the one currently running.
+        Raises ValueError for an invalid split and KeyError for unknown versions.
+        """
+        for version in arms.values():
+            if version not in self.registry:
+                raise KeyError(version)
+        experiment = Experiment(name, arms, split, kind=kind, metrics=metrics)
+        # Load and warm every arm before it takes traffic
+        for version in experiment.versions:
+            self.registry.load(version)
+        if self._running is not None:
+            self._running.status = "completed"
+        self._experiments[name] = experiment
+        self._running = experiment
+        self.registry.pin(set(experiment.versions))
+        self._write()
+        return experiment
+
+    def stop(self, name: str, status: str = "completed"):
+        experiment = self._experiments.get(name)
+        if experiment is None:
+            return
+        experiment.status = status
+        if self._running is experiment:
+            self._running = None
+            self.registry.pin(set())
+        self._write()
+
+    # Request path
+
+    def route(self, unit_id: Optional[str]) -> Optional[Assignment]:
+        experiment = self.running
+        if experiment is None or not unit_id:
+            return None
+        return Assignment(experiment, experiment.assign(unit_id))
+
+    def record_prediction(self, assignment: Assignment, latency_seconds: Optional[float], confidence: float):
+        """
+        :param latency_seconds: The model's inference time, None when the prediction came from the cache
+        """
+        row = assignment.experiment.counters(self.directory)[assignment.arm]
+        row[REQUESTS] += 1
+        row[CONFIDENCE_SUM] += confidence
+        row[CONFIDENCE_SQ_SUM] += confidence * confidence
+        if latency_seconds is not None:
+            row[LATENCY_OFFSET + bisect_right(_LATENCY_BOUNDS_S, latency_seconds)] += 1
+
+    def record_feedback(self, unit_id: Optional[str], outcome: Optional[bool]):
+        assignment = self.route(unit_id)
+        if assignment is None or outcome is None:
+            return
+        row = assignment.experiment.counters(self.directory)[assignment.arm]
+        row[FEEDBACK_POSITIVE if outcome else FEEDBACK_NEGATIVE] += 1
+
+    # Reporting
+
+    def aggregate(self, experiment: Experiment) -> np.ndarray:
+        """
+        Sums the counters of every worker that served the experiment.
+        """
+        total = np.zeros((len(experiment.arm_names), N_FIELDS))
+        for path in glob.glob(os.path.join(experiment.counter_dir(self.directory), "*.npy")):
+            try:
+                counters = np.load(path, mmap_mode="r")
+            except (ValueError, OSError):
+                continue
+            if counters.shape == total.shape:
+                total += counters
+        return total
+
+    def status(self, name: str) -> Optional[dict]:
+        experiment = self.get(name)
+        if experiment is None:
+            return None
+        totals = self.aggregate(experiment)
+        all_requests = float(totals[:, REQUESTS].sum())
+        metrics = {}
+        for position, arm in enumerate(experiment.arm_names):
+            row = totals[position].tolist()
+            requests = row[REQUESTS]
+            feedback = row[FEEDBACK_POSITIVE] + row[FEEDBACK_NEGATIVE]
+            confidence = None
+            if requests > 0:
+                mean = row[CONFIDENCE_SUM] / requests
+                variance = max(row[CONFIDENCE_SQ_SUM] / requests - mean * mean, 0.0)
+                margin = Z_95 * math.sqrt(variance / requests)
+                confidence = {"mean": round(mean, 4), "ci_95": [round(mean - margin, 4), round(mean + margin, 4)]}
+            latencies = totals[position, LATENCY_OFFSET:]
+            metrics[arm] = {
+                "model_version": experiment.arms[arm],
+                "requests": int(requests),
+                "observed_traffic_share": round(100 * requests / all_requests, 2) if all_requests else None,
+                "confidence": confidence,
+                "latency_ms": {"p50": histogram_quantile(latencies, 0.5), "p95": histogram_quantile(latencies, 0.95),
+                               "p99": histogram_quantile(latencies, 0.99)},
+                "feedback": {"responses": int(feedback),
+                             "positive_rate": round(row[FEEDBACK_POSITIVE] / feedback, 4) if feedback else None,
+                             "ci_95": wilson_interval(row[FEEDBACK_POSITIVE], feedback)},
+            }
+        return {"experiment_name": name, "kind": experiment.kind, "status": experiment.status,
+                "started_at": experiment.started_at, "traffic_split": experiment.split, "metrics": metrics}
+
+    # Persistence and cross-worker sync
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        state = {"experiments": [e.to_dict() for e in self._experiments.values()],
+                 "running": self._running.name if self._running else None}
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(self.path + ".tmp", self.path)
+        self._mtime = os.stat(self.path).st_mtime
+
+    def _read(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            experiments = {e["name"]: Experiment(**e) for e in state["experiments"]}
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            logger.error(f"Experiments in {self.path} not loaded: {e}")
+            self._mtime = mtime
+            return False
+        # Keep the open counter files of experiments that didn't change
+        for name, experiment in experiments.items():
+            current = self._experiments.get(name)
+            if current is not None and current.started_at == experiment.started_at and current.arms == experiment.arms:
+                experiment._counters = current._counters
+        self._experiments = experiments
+        self._running = experiments.get(state.get("running"))
+        self._mtime = mtime
+        if self._running is not None:
+            versions = set(self._running.versions)
+            self.registry.pin(versions)
+            # Warm the arms off the request path
+            threading.Thread(target=self._warm, args=(versions,), daemon=True).start()
+        return True
+
+    def _warm(self, versions):
+        for version in versions:
+            try:
+                self.registry.load(version)
+            except Exception as e:
+                logger.error(f"Experiment arm {version} failed to load: {e}")
+
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._read()
+
+
+experiment_router = ExperimentRouter(settings.EXPERIMENT_DIR)
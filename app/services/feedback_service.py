@@ -0,0 +1,155 @@
+"""
+Persistent feedback store for active learning.
+
+Feedback documents live in the `feedback` collection with an ObjectId `_id`. ObjectIds start
+with their creation second and increase within a process, so the primary key is time-ordered:
+it doubles as the timestamp index for range scans, and the last `_id` of a page is a stable
+pagination cursor (no skip/offset, constant cost per page however deep). `created_at` keeps the
+exact timestamp and has its own index for filtering at sub-second precision.
+
+Human annotations are append-only events in `feedback_annotations`; feedback documents are
+never modified, so a history of corrections is kept and concurrent annotators can't overwrite
+each other.
+"""
+import logging
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING
+
+logger = logging.getLogger("app_logger")
+
+FEEDBACK_COLLECTION = "feedback"
+ANNOTATIONS_COLLECTION = "feedback_annotations"
+MAX_PAGE_SIZE = 1000
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parses an ISO 8601 timestamp into naive UTC. Raises ValueError for anything else.
+    """
+    parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def to_object_id(value: str) -> Optional[ObjectId]:
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def object_id_at(created_at: datetime) -> ObjectId:
+    """
+    A unique ObjectId whose timestamp is `created_at` (naive UTC), so ids and timestamps agree even for backfills.
+    """
+    seconds = int(created_at.replace(tzinfo=timezone.utc).timestamp())
+    return ObjectId(struct.pack(">I", seconds) + ObjectId().binary[4:])
+
+
+def id_range(start: datetime, end: datetime) -> dict:
+    """
+    `_id` bounds covering [start, end); ObjectIds only hold whole seconds, so `end` is rounded up.
+    """
+    upper = end.replace(microsecond=0) + (timedelta(seconds=1) if end.microsecond else timedelta(0))
+    return {"$gte": ObjectId.from_datetime(start.replace(microsecond=0).replace(tzinfo=timezone.utc)),
+            "$lt": ObjectId.from_datetime(upper.replace(tzinfo=timezone.utc))}
+
+
+class FeedbackStore:
+    def __init__(self):
+        self._indexed = set()
+
+    def ensure_indexes(self, db):
+        if id(db) in self._indexed:
+            return
+        db[FEEDBACK_COLLECTION].create_index([("created_at", ASCENDING)])
+        db[ANNOTATIONS_COLLECTION].create_index([("feedback_id", ASCENDING), ("_id", ASCENDING)])
+        self._indexed.add(id(db))
+
+    def add(self, db, session_id: str, customer_id: str, feedback: dict, ai_response: dict,
+            created_at: Optional[datetime] = None) -> str:
+        self.ensure_indexes(db)
+        created_at = created_at or datetime.utcnow()
+        document = {
+            "_id": object_id_at(created_at),
+            "session_id": session_id,
+            "customer_id": customer_id,
+            "feedback": feedback,
+            "ai_response": ai_response,
+            "created_at": created_at,
+        }
+        db[FEEDBACK_COLLECTION].insert_one(document)
+        return str(document["_id"])
+
+    def get(self, db, feedback_id: str) -> Optional[dict]:
+        object_id = to_object_id(feedback_id)
+        return db[FEEDBACK_COLLECTION].find_one({"_id": object_id}) if object_id else None
+
+    def annotate(self, db, feedback_id: str, annotator_id: str, original_response: str,
+                 corrected_response: str) -> Optional[str]:
+        """
+        Appends an annotation event; returns its id, or None if the feedback doesn't exist.
+        """
+        self.ensure_indexes(db)
+        if self.get(db, feedback_id) is None:
+            return None
+        event = {
+            "_id": ObjectId(),
+            "feedback_id": feedback_id,
+            "annotator_id": annotator_id,
+            "original_response": original_response,
+            "corrected_response": corrected_response,
+            "created_at": datetime.utcnow(),
+        }
+        db[ANNOTATIONS_COLLECTION].insert_one(event)
+        return str(event["_id"])
+
+    def annotations(self, db, feedback_id: str) -> List[dict]:
+        """
+        Annotation events for one feedback record, oldest first; the last one is current.
+        """
+        return list(db[ANNOTATIONS_COLLECTION].find({"feedback_id": feedback_id}).sort("_id", ASCENDING))
+
+    def _range_query(self, start: datetime, end: datetime, after: Optional[str]) -> dict:
+        bounds = id_range(start, end)
+        if after:
+            after_id = to_object_id(after)
+            if after_id is None:
+                raise ValueError(f"Invalid cursor: {after!r}")
+            bounds["$gt"] = after_id
+        return {"_id": bounds, "created_at": {"$gte": start, "$lt": end}}
+
+    def iter_range(self, db, start: datetime, end: datetime, after: Optional[str] = None,
+                   batch_size: int = 1000, collection: str = FEEDBACK_COLLECTION) -> Iterator[dict]:
+        """
+        Streams records created in [start, end) in id (time) order, starting after the `after` cursor.
+        """
+        cursor = db[collection].find(self._range_query(start, end, after)).sort("_id", ASCENDING)
+        return cursor.batch_size(batch_size)
+
+    def page(self, db, start: datetime, end: datetime, cursor: Optional[str] = None,
+             limit: int = 100) -> Tuple[List[dict], Optional[str]]:
+        """
+        One page of feedback in [start, end) and the cursor of the next page (None on the last page).
+        Raises ValueError for a malformed cursor.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        documents = list(db[FEEDBACK_COLLECTION].find(self._range_query(start, end, cursor))
+                         .sort("_id", ASCENDING).limit(limit + 1))
+        next_cursor = str(documents[limit - 1]["_id"]) if len(documents) > limit else None
+        return documents[:limit], next_cursor
+
+
+def feedback_to_response(document: dict) -> dict:
+    response = dict(document)
+    response["feedback_id"] = str(response.pop("_id"))
+    return response
+
+
+feedback_store = FeedbackStore()
@@ -0,0 +1,355 @@
+"""
+Request firewall: rules set through POST /security/set-firewall-rules are checked against every
+request's path, query string and the first FIREWALL_BODY_PREFIX bytes of its body
+(FirewallMiddleware in app/core/middleware.py).
+
+A rule is a dict like:
+
+    {"rule_name": "sqli_union", "action": "block", "pattern": "union\\s+(all\\s+)?select"}
+
+Patterns are case-insensitive regular expressions; "block" rules answer 403, "log" rules only
+log and count. Each match increments `firewall_rule_hits_total{rule, action}` (all workers, at /metrics).
+
+Rules are compiled into one set so the check is a single pass over the request whatever the
+number of rules: every pattern is reduced to literals one of which must occur in any text it
+matches ("union\\s+select" needs "select"), and all literals go into one multi-pattern automaton
+(Aho-Corasick through pyahocorasick when installed, else a trie-shaped regex). Only the rules
+whose literal was found are then confirmed with their own regex; the few patterns without a
+usable literal are OR-ed into one regex. Rules are persisted to FIREWALL_RULES_PATH, changed
+under a lock file so workers changing them at the same time don't drop each other's changes, and
+re-read when the file changes, compiled on a background thread and swapped in whole, so requests
+never wait for a recompile.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.core.config import settings
+from app.services.metrics_service import firewall_rule_hits
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover - older Pythons
+    import sre_parse
+
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - optional dependency
+    ahocorasick = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("app_logger")
+
+ACTIONS = ("block", "log")
+# Shorter literals occur in too much ordinary text to narrow anything down
+MIN_LITERAL = 3
+# Any part of a required literal is required too; this bounds the automaton's depth
+MAX_LITERAL = 64
+
+
+def validate_rule(rule: dict):
+    if not isinstance(rule, dict) or not rule.get("rule_name"):
+        raise ValueError("Every firewall rule needs a rule_name")
+    if rule.get("action") not in ACTIONS:
+        raise ValueError(f"Rule {rule['rule_name']}: action must be one of {', '.join(ACTIONS)}")
+    if not isinstance(rule.get("pattern"), str) or not rule["pattern"]:
+        raise ValueError(f"Rule {rule['rule_name']}: pattern must be a non-empty string")
+    try:
+        re.compile(rule["pattern"], re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Rule {rule['rule_name']}: invalid pattern: {e}")
+
+
+REPEATS = tuple(op for op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, "POSSESSIVE_REPEAT", None))
+                if op is not None)
+
+
+def _shortest(literals: Optional[List[str]]) -> int:
+    return min(map(len, literals)) if literals else 0
+
+
+def _required(items) -> Optional[List[str]]:
+    best: Optional[List[str]] = None
+
+    def consider(option: Optional[List[str]]):
+        nonlocal best
+        if _shortest(option) >= MIN_LITERAL and _shortest(option) > _shortest(best):
+            best = option
+
+    run: List[str] = []
+    for op, av in list(items) + [(None, None)]:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            consider(["".join(run)])
+            run = []
+        if op is sre_parse.BRANCH:
+            # Every branch has to contribute one
+            options = [_required(branch) for branch in av[1]]
+            if all(options):
+                consider([literal for option in options for literal in option])
+        elif op is sre_parse.SUBPATTERN:
+            consider(_required(av[-1]))
+        elif op in REPEATS and av[0] >= 1:
+            consider(_required(av[2]))
+    return best
+
+
+def required_literals(pattern: str) -> Optional[List[str]]:
+    """
+    Lowercased literals at least one of which occurs in any text `pattern` matches, or None when
+    none can be derived (then the pattern has to be run on every request).
+    """
+    literals = _required(sre_parse.parse(pattern, re.IGNORECASE))
+    return [literal.lower()[:MAX_LITERAL] for literal in literals] if literals else None
+
+
+def literal_text(pattern: str) -> Optional[str]:
+    """
+    The lowercased text a pattern without any regex syntax matches, or None.
+    """
+    items = list(sre_parse.parse(pattern, re.IGNORECASE))
+    if not all(op is sre_parse.LITERAL for op, _ in items):
+        return None
+    return "".join(chr(av) for _, av in items).lower()
+
+
+def trie_regex(literals: Iterable[str]) -> str:
+    """
+    One regex matching any of `literals`, shaped as a trie ("uni(?:on|te)"): at each position it
+    follows one path instead of trying every literal in turn, and prefers the longest literal.
+    """
+    root: dict = {}
+    for literal in literals:
+        node = root
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" not in node:
+            return body
+        return (body if len(branches) > 1 else "(?:" + body + ")") + "?"
+
+    return build(root)
+
+
+class _AhoCorasickScanner:
+    def __init__(self, literals: List[str]):
+        self.automaton = ahocorasick.Automaton()
+        for literal in literals:
+            self.automaton.add_word(literal, literal)
+        self.automaton.make_automaton()
+
+    def scan(self, text: str) -> Set[str]:
+        return {literal for _, literal in self.automaton.iter(text)}
+
+
+class _TrieRegexScanner:
+    def __init__(self, literals: List[str]):
+        self.pattern = re.compile(trie_regex(literals))
+        known = set(literals)
+        # The regex reports the longest literal starting at a position; shorter ones it contains as a prefix occur too
+        self.prefixes = {literal: [literal[:end] for end in range(1, len(literal) + 1) if literal[:end] in known]
+                         for literal in literals}
+
+    def scan(self, text: str) -> Set[str]:
+        found: Set[str] = set()
+        match = self.pattern.search(text)
+        while match is not None:
+            found.update(self.prefixes[match.group()])
+            match = self.pattern.search(text, match.start() + 1)
+        return found
+
+
+class CompiledFirewall:
+    def __init__(self, rules: List[dict], use_ahocorasick: bool = True):
+        for rule in rules:
+            validate_rule(rule)
+        self.rules = list(rules)
+        self.regexes = [re.compile(rule["pattern"], re.IGNORECASE) for rule in self.rules]
+        # literal -> rules it proves to match (literal patterns) / rules to confirm with their regex
+        self.exact: Dict[str, List[int]] = {}
+        self.candidates: Dict[str, List[int]] = {}
+        self.unanchored: List[int] = []
+        for position, rule in enumerate(self.rules):
+            pattern = rule["pattern"]
+            literal = literal_text(pattern)
+            if literal is not None and len(literal) <= MAX_LITERAL:
+                self.exact.setdefault(literal, []).append(position)
+                continue
+            literals = [literal[:MAX_LITERAL]] if literal is not None else required_literals(pattern)
+            if literals is None:
+                self.unanchored.append(position)
+            for literal in literals or ():
+                self.candidates.setdefault(literal, []).append(position)
+        literals = sorted(set(self.exact) | set(self.candidates))
+        self.scanner = None
+        if literals:
+            scanner_class = _AhoCorasickScanner if ahocorasick is not None and use_ahocorasick else _TrieRegexScanner
+            self.scanner = scanner_class(literals)
+        self.unanchored_regex = None
+        if self.unanchored:
+            try:
+                self.unanchored_regex = re.compile("|".join(f"(?:{self.rules[p]['pattern']})" for p in self.unanchored),
+                                                   re.IGNORECASE)
+            except re.error:
+                # e.g. inline global flags, which are only allowed at the start: check those rules one by one
+                self.unanchored_regex = None
+        self.blocking = any(rule["action"] == "block" for rule in self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, subject: str) -> List[int]:
+        """
+        Positions of the rules matching `subject`, in rule order.
+        """
+        matched: Set[int] = set()
+        if self.scanner is not None:
+            for literal in self.scanner.scan(subject.lower()):
+                matched.update(self.exact.get(literal, ()))
+                for position in self.candidates.get(literal, ()):
+                    if position not in matched and self.regexes[position].search(subject):
+                        matched.add(position)
+        if self.unanchored and (self.unanchored_regex is None or self.unanchored_regex.search(subject)):
+            matched.update(position for position in self.unanchored if self.regexes[position].search(subject))
+        return sorted(matched)
+
+
+class FirewallEngine:
+    def __init__(self, rules_path: str, check_interval: float = 2.0):
+        """
+        :param rules_path: JSON file holding the list of rules
+        :param check_interval: Seconds between checks of the file for changes
+        """
+        self.rules_path = rules_path
+        self.check_interval = check_interval
+        self._compiled = CompiledFirewall([])
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    @property
+    def compiled(self) -> CompiledFirewall:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._reload_in_background()
+        return self._compiled
+
+    def _changed_mtime(self) -> Optional[float]:
+        try:
+            mtime = os.stat(self.rules_path).st_mtime
+        except FileNotFoundError:
+            return None
+        return None if mtime == self._mtime else mtime
+
+    def _reload_in_background(self):
+        # Compiling thousands of rules takes a while; meanwhile requests keep the current set
+        if self._reloading or self._changed_mtime() is None:
+            return
+        self._reloading = True
+        threading.Thread(target=self.reload_if_changed, name="firewall-reload", daemon=True).start()
+
+    def reload_if_changed(self) -> bool:
+        try:
+            with self._lock:
+                mtime = self._changed_mtime()
+                if mtime is None:
+                    return False
+                try:
+                    with open(self.rules_path) as f:
+                        compiled = CompiledFirewall(json.load(f))
+                except (ValueError, OSError) as e:
+                    # Keep serving the previous rule set if the new file is broken
+                    logger.error(f"Firewall rules in {self.rules_path} not loaded: {e}")
+                    self._mtime = mtime
+                    return False
+                self._compiled, self._mtime = compiled, mtime
+            logger.info(f"Loaded {len(compiled)} firewall rules")
+            return True
+        finally:
+            self._reloading = False
+
+    def _locked(self):
+        # Held from reading the rules to writing them back, by every worker
+        directory = os.path.dirname(self.rules_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock = open(self.rules_path + ".lock", "w")
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def replace_rules(self, rules: List[dict]) -> int:
+        """
+        Validates and compiles `rules`, persists them and swaps them in. Raises ValueError for invalid rules.
+        """
+        compiled = CompiledFirewall(rules)
+        with self._locked():
+            self._write(rules, compiled)
+        return len(compiled)
+
+    def _write(self, rules: List[dict], compiled: CompiledFirewall):
+        with self._lock:
+            with open(self.rules_path + ".tmp", "w") as f:
+                json.dump(rules, f, indent=2)
+            os.replace(self.rules_path + ".tmp", self.rules_path)
+            self._compiled, self._mtime = compiled, os.stat(self.rules_path).st_mtime
+
+    def set_rule(self, rule: dict) -> int:
+        """
+        Adds `rule`, or replaces the rule with the same name; returns the number of rules.
+        """
+        validate_rule(rule)
+        with self._locked():
+            self.reload_if_changed()
+            rules = [existing for existing in self._compiled.rules if existing["rule_name"] != rule["rule_name"]]
+            rules.append(rule)
+            self._write(rules, CompiledFirewall(rules))
+        return len(rules)
+
+    def remove_rule(self, rule_name: str) -> bool:
+        with self._locked():
+            self.reload_if_changed()
+            rules = [rule for rule in self._compiled.rules if rule["rule_name"] != rule_name]
+            if len(rules) == len(self._compiled.rules):
+                return False
+            self._write(rules, CompiledFirewall(rules))
+        return True
+
+    @staticmethod
+    def record(compiled: CompiledFirewall, matched: List[int]) -> Optional[dict]:
+        """
+        Counts the matched rules' hits and logs them; returns the first blocking rule, or None.
+        """
+        blocking = None
+        for position in matched:
+            rule = compiled.rules[position]
+            firewall_rule_hits.labels(rule["rule_name"], rule["action"]).inc()
+            if rule["action"] == "block" and blocking is None:
+                blocking = rule
+        names = ", ".join(compiled.rules[position]["rule_name"] for position in matched)
+        if blocking is not None:
+            logger.warning(f"Request blocked by firewall rule(s) {names}")
+        else:
+            logger.info(f"Request matched firewall rule(s) {names}")
+        return blocking
+
+
+firewall_engine = FirewallEngine(settings.FIREWALL_RULES_PATH)
@@ -0,0 +1,599 @@
+"""
+Low-overhead metrics shared by all workers, exposed at /metrics in Prometheus text format.
+
+Each process keeps its values in a memory-mapped float64 array under METRICS_DIR (<pid>.npy),
+with the series it has allocated listed next to it (<pid>.json). Only the owning process writes
+its file, so updates are an element increment with no IPC, under a per-process lock since the
+event loop, the Mongo command listener and thread-pool work update the same series; a scrape sums the files
+of every live worker and the retired totals (retired.json). When a worker exits (gunicorn's
+child_exit hook), or a scrape finds a file whose process is gone, its counters and histograms are
+added to the retired totals and its files deleted, so totals never go backwards while the number
+of files stays at the number of live processes; a process reusing a dead one's pid retires its
+files before creating its own. Gauges only count live workers. Retiring takes an exclusive lock
+on metrics.lock, scrapes a shared one, so a scrape never sees a worker in both places or neither.
+
+Metrics are declared once in this module, so every process (API workers, Celery workers) can
+expose the series written by the others. Histograms store per-bucket counts and their sum; the
+cumulative `_bucket` and `_count` series are derived at scrape time.
+"""
+import asyncio
+import glob
+import json
+import logging
+import math
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import redis.asyncio as aioredis
+from pymongo import monitoring
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.services.tracing_service import SpanKind, tracing
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("app_logger")
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# Identities of the last retired worker files, so a retirement interrupted before the files were
+# deleted isn't counted twice
+RETIRED_IDENTITIES = 256
+
+
+class MetricsStore:
+    """
+    This process's values, memory-mapped from <directory>/<pid>.npy and allocated in slots.
+    """
+    def __init__(self, directory: str, max_slots: int):
+        self.directory = directory
+        self.max_slots = max_slots
+        self.values = None
+        self._series: List[list] = []
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        # Held around every update: `values[slot] += amount` is a read and a write another thread can come between
+        self.update_lock = threading.Lock()
+        self._pid = None
+        # A forked worker must not write into its parent's file
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reopen)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._pid = os.getpid()
+        # Files under this pid are a dead process's: counted in the totals before they are replaced
+        self.retire(self._pid)
+        path = os.path.join(self.directory, f"{self._pid}.npy")
+        values = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(self.max_slots,))
+        # Item access on a flat memoryview is several times faster than on the memmap
+        self.values = memoryview(np.asarray(values))
+        self._values_array = values
+
+    def _reopen(self):
+        if self.values is not None:
+            self._lock = threading.Lock()
+            self.update_lock = threading.Lock()
+            self._open()
+            self._write_index()
+
+    def _write_index(self):
+        path = os.path.join(self.directory, f"{self._pid}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"series": self._series}, f)
+        os.replace(path + ".tmp", path)
+
+    def allocate(self, name: str, label_values: Sequence[str], width: int) -> Optional[int]:
+        """
+        Reserves `width` slots for a series; returns the first one, or None once the store is full.
+        """
+        with self._lock:
+            if self.values is None:
+                self._open()
+            if self._next_slot + width > self.max_slots:
+                logger.warning(f"Metrics store full ({self.max_slots} slots); dropping series {name}{list(label_values)}")
+                return None
+            base = self._next_slot
+            self._next_slot += width
+            self._series.append([name, list(label_values), base, width])
+            self._write_index()
+            return base
+
+    def _locked(self, exclusive: bool):
+        os.makedirs(self.directory, exist_ok=True)
+        lock = open(os.path.join(self.directory, "metrics.lock"), "w")
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return lock
+
+    def _read_retired(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, "retired.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"series": [], "retired": []}
+
+    def retire(self, pid: int) -> bool:
+        """
+        Adds the values of the exited process `pid` to the retired totals and deletes its files;
+        False if it is still running (another process than this one) or left no files.
+        """
+        if pid != os.getpid() and _pid_alive(pid):
+            return False
+        values_path = os.path.join(self.directory, f"{pid}.npy")
+        index_path = os.path.join(self.directory, f"{pid}.json")
+        with self._locked(exclusive=True):
+            # Checked again now that no process can be creating its files
+            if pid != os.getpid() and _pid_alive(pid):
+                return False
+            try:
+                stat = os.stat(values_path)
+                with open(index_path) as f:
+                    series = json.load(f)["series"]
+                values = np.load(values_path, mmap_mode="r")
+            except (ValueError, OSError, KeyError):
+                series = None
+            if series is not None:
+                identity = f"{pid}:{stat.st_ino}:{stat.st_mtime_ns}"
+                retired = self._read_retired()
+                if identity not in retired["retired"]:
+                    totals = {(name, tuple(labels), len(total)): total for name, labels, total in retired["series"]}
+                    for name, label_values, base, width in series:
+                        if base + width > len(values):
+                            continue
+                        key = (name, tuple(label_values), width)
+                        current = totals.get(key, [0.0] * width)
+                        totals[key] = [a + float(b) for a, b in zip(current, values[base:base + width])]
+                    retired = {"series": [[name, list(labels), total] for (name, labels, _), total in totals.items()],
+                               "retired": (retired["retired"] + [identity])[-RETIRED_IDENTITIES:]}
+                    path = os.path.join(self.directory, "retired.json")
+                    with open(path + ".tmp", "w") as f:
+                        json.dump(retired, f)
+                    os.replace(path + ".tmp", path)
+                del values
+            for path in (values_path, index_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return series is not None
+
+    def snapshot(self) -> Tuple[list, List[Tuple[int, list, np.ndarray]]]:
+        """
+        The retired totals ([name, label values, values] each) and (pid, series, values) of every
+        process that has written metrics, read together.
+        """
+        with self._locked(exclusive=False):
+            retired = self._read_retired()["series"]
+            workers = []
+            for index_path in glob.glob(os.path.join(self.directory, "*.json")):
+                try:
+                    pid = int(os.path.basename(index_path)[:-5])
+                    with open(index_path) as f:
+                        series = json.load(f)["series"]
+                    values = np.load(index_path[:-5] + ".npy", mmap_mode="r")
+                except (ValueError, OSError, KeyError):
+                    continue
+                workers.append((pid, series, values))
+        return retired, workers
+
+
+class _Dropped:
+    """
+    Stand-in for series that didn't fit in the store.
+    """
+    def inc(self, amount: float = 1.0):
+        pass
+
+    dec = set = observe = inc
+
+
+class CounterSeries:
+    __slots__ = ("_store", "_slot")
+
+    def __init__(self, store: MetricsStore, slot: int):
+        self._store = store
+        self._slot = slot
+
+    def inc(self, amount: float = 1.0):
+        with self._store.update_lock:
+            self._store.values[self._slot] += amount
+
+
+class GaugeSeries(CounterSeries):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        with self._store.update_lock:
+            self._store.values[self._slot] -= amount
+
+    def set(self, value: float):
+        self._store.values[self._slot] = value
+
+
+class HistogramSeries:
+    __slots__ = ("_store", "_slot", "_bounds", "_sum_slot")
+
+    def __init__(self, store: MetricsStore, slot: int, bounds: Tuple[float, ...]):
+        self._store = store
+        self._slot = slot
+        self._bounds = bounds
+        self._sum_slot = slot + len(bounds) + 1
+
+    def observe(self, value: float):
+        bucket = self._slot + bisect_left(self._bounds, value)
+        store = self._store
+        with store.update_lock:
+            values = store.values
+            values[bucket] += 1
+            values[self._sum_slot] += value
+
+
+class Metric:
+    def __init__(self, registry: "MetricsRegistry", name: str, kind: str, documentation: str,
+                 labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS, mode: str = "sum"):
+        """
+        :param kind: "counter", "gauge" or "histogram"
+        :param mode: How gauges combine across workers: "sum", "min" or "max" (live workers only)
+        """
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(float(bound) for bound in buckets) if kind == "histogram" else ()
+        self.mode = mode
+        self.width = len(self.buckets) + 2 if kind == "histogram" else 1
+        self._series: Dict[tuple, object] = {}
+
+    def labels(self, *values) -> object:
+        """
+        The series for these label values (positional, in `labelnames` order), created on first use.
+        """
+        series = self._series.get(values)
+        if series is None:
+            series = self._create(values)
+        return series
+
+    def _create(self, values: tuple):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        slot = self.registry.store.allocate(self.name, [str(value) for value in values], self.width)
+        if slot is None:
+            series = _Dropped()
+        elif self.kind == "histogram":
+            series = HistogramSeries(self.registry.store, slot, self.buckets)
+        elif self.kind == "gauge":
+            series = GaugeSeries(self.registry.store, slot)
+        else:
+            series = CounterSeries(self.registry.store, slot)
+        return self._series.setdefault(values, series)
+
+    # Label-less shortcuts
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+
+
+class MetricsRegistry:
+    def __init__(self, directory: str, max_slots: int):
+        self.store = MetricsStore(directory, max_slots)
+        self.metrics: Dict[str, Metric] = {}
+
+    def _add(self, name: str, kind: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Metric:
+        metric = Metric(self, name, kind, documentation, labelnames, **kwargs)
+        self.metrics[name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._add(name, "counter", documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), mode: str = "sum") -> Metric:
+        return self._add(name, "gauge", documentation, labelnames, mode=mode)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Metric:
+        return self._add(name, "histogram", documentation, labelnames, buckets=buckets)
+
+    def collect(self) -> Dict[str, Dict[tuple, np.ndarray]]:
+        """
+        name -> {label values -> combined values} over all workers. Histograms give
+        [bucket counts..., +Inf count, sum]; counters and gauges a single value.
+        """
+        combined: Dict[str, Dict[tuple, np.ndarray]] = {name: {} for name in self.metrics}
+        retired, workers = self.store.snapshot()
+        sources = [(name, label_values, np.array(total, dtype=np.float64), False) for name, label_values, total in retired]
+        exited = []
+        for pid, series, values in workers:
+            alive = _pid_alive(pid)
+            if not alive:
+                exited.append(pid)
+            for name, label_values, base, width in series:
+                if base + width <= len(values):
+                    sources.append((name, label_values, np.array(values[base:base + width]), alive))
+        for name, label_values, value, alive in sources:
+            metric = self.metrics.get(name)
+            if metric is None or metric.width != len(value) or (metric.kind == "gauge" and not alive):
+                continue
+            key = tuple(label_values)
+            current = combined[name].get(key)
+            if current is None:
+                combined[name][key] = value
+            elif metric.kind == "gauge" and metric.mode == "max":
+                np.maximum(current, value, out=current)
+            elif metric.kind == "gauge" and metric.mode == "min":
+                np.minimum(current, value, out=current)
+            else:
+                current += value
+        # Counted from their files this time; from the retired totals from now on
+        for pid in exited:
+            self.store.retire(pid)
+        return combined
+
+    def exposition(self) -> str:
+        """
+        All metrics in the Prometheus text format (version 0.0.4).
+        """
+        lines = []
+        for name, series in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(series.items()):
+                labels = [f'{label}="{_escape(v)}"' for label, v in zip(metric.labelnames, key)]
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{{{','.join(labels)}}} {_format_value(float(value[0]))}" if labels
+                                 else f"{name} {_format_value(float(value[0]))}")
+                    continue
+                cumulative = np.cumsum(value[:-1])
+                for bound, count in zip(metric.buckets + (math.inf,), cumulative.tolist()):
+                    le = ",".join(labels + [f'le="{_format_value(bound)}"'])
+                    lines.append(f"{name}_bucket{{{le}}} {_format_value(count)}")
+                suffix = f"{{{','.join(labels)}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {_format_value(float(value[-1]))}")
+                lines.append(f"{name}_count{suffix} {_format_value(float(cumulative[-1]))}")
+        return "\n".join(lines) + "\n"
+
+
+def histogram_summary(metric: Metric, series: Dict[tuple, np.ndarray], where=None) -> dict:
+    """
+    Count, mean and interpolated p50/p95/p99 of the histogram series (matching `where`) merged.
+    """
+    buckets = np.zeros(len(metric.buckets) + 2)
+    for key, value in series.items():
+        if where is None or where(dict(zip(metric.labelnames, key))):
+            buckets += value
+    counts, total = buckets[:-1], float(buckets[:-1].sum())
+    summary = {"count": int(total), "avg": round(float(buckets[-1]) / total, 6) if total else None}
+    for q in (0.5, 0.95, 0.99):
+        summary[f"p{int(q * 100)}"] = bucket_quantile(metric.buckets, counts, q)
+    return summary
+
+
+def bucket_quantile(bounds: Tuple[float, ...], counts: np.ndarray, q: float) -> Optional[float]:
+    """
+    Quantile by linear interpolation inside the bucket that holds it (as Prometheus' histogram_quantile).
+    """
+    total = float(counts.sum())
+    if total <= 0:
+        return None
+    cumulative = np.cumsum(counts)
+    rank = q * total
+    position = int(np.searchsorted(cumulative, rank))
+    if position >= len(bounds):
+        return bounds[-1]
+    lower = bounds[position - 1] if position > 0 else 0.0
+    below = float(cumulative[position - 1]) if position > 0 else 0.0
+    in_bucket = float(counts[position])
+    fraction = (rank - below) / in_bucket if in_bucket else 1.0
+    return round(lower + (bounds[position] - lower) * fraction, 6)
+
+
+metrics = MetricsRegistry(settings.METRICS_DIR, settings.METRICS_MAX_SLOTS)
+
+# HTTP (see app/core/middleware.py)
+http_requests_in_flight = metrics.gauge("http_requests_in_flight", "Requests being served.")
+http_request_duration = metrics.histogram("http_request_duration_seconds", "Request latency by route template.",
+                                          ["method", "route", "status"])
+# Process, sampled by ProcessSampler
+process_cpu_seconds = metrics.gauge("process_cpu_seconds", "User and system CPU time of live workers.")
+process_cpu_percent = metrics.gauge("process_cpu_percent", "CPU use over the last sampling interval, summed over workers.")
+process_resident_memory = metrics.gauge("process_resident_memory_bytes", "Resident memory of live workers.")
+process_open_fds = metrics.gauge("process_open_fds", "Open file descriptors of live workers.")
+process_start_time = metrics.gauge("process_start_time_seconds", "Start time of the oldest live worker.", mode="min")
+event_loop_lag = metrics.histogram("event_loop_lag_seconds", "How late the event loop runs a scheduled wakeup.")
+event_loop_lag_max = metrics.gauge("event_loop_lag_max_seconds", "Worst event loop lag in the last sampling interval.",
+                                   mode="max")
+# Clients
+mongo_command_duration = metrics.histogram("mongo_command_duration_seconds", "MongoDB command latency.", ["command"])
+mongo_command_errors = metrics.counter("mongo_command_errors_total", "Failed MongoDB commands.", ["command"])
+redis_command_duration = metrics.histogram("redis_command_duration_seconds", "Redis command latency.", ["command"])
+redis_command_errors = metrics.counter("redis_command_errors_total", "Failed Redis commands.", ["command"])
+celery_task_duration = metrics.histogram("celery_task_duration_seconds", "Celery task run time.", ["task"])
+celery_tasks = metrics.counter("celery_tasks_total", "Finished Celery tasks.", ["task", "state"])
+celery_publish_duration = metrics.histogram("celery_publish_duration_seconds", "Time to send a task to the broker.",
+                                            ["task"])
+# Intent model (see app/api/v1/endpoints/support.py)
+intent_inference_duration = metrics.histogram("intent_inference_duration_seconds", "Intent classification latency.",
+                                              ["model_version"])
+intent_confidence = metrics.histogram("intent_confidence", "Confidence of served intents.", ["model_version"],
+                                      buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99))
+intent_inference_errors = metrics.counter("intent_inference_errors_total", "Failed intent classifications.",
+                                          ["model_version"])
+firewall_rule_hits = metrics.counter("firewall_rule_hits_total", "Requests matched by each firewall rule.",
+                                     ["rule", "action"])
+annotation_queue_events = metrics.counter("annotation_queue_events_total",
+                                          "Interactions offered to, rejected by, queued in and evicted from the annotation queue.",
+                                          ["event"])
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Times every MongoDB command; pass as `event_listeners=[mongo_command_metrics]` to the client.
+    """
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_duration.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        mongo_command_duration.labels(event.command_name).observe(event.duration_micros / 1e6)
+        mongo_command_errors.labels(event.command_name).inc()
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+class TimedRedis(aioredis.Redis):
+    """
+    `redis.asyncio` client that records the latency of every command, and traces it (create with `TimedRedis.from_url`).
+    """
+    async def execute_command(self, *args, **options):
+        command = args[0] if isinstance(args[0], str) else args[0].decode()
+        started = time.perf_counter()
+        try:
+            with tracing.span(f"redis {command}", SpanKind.CLIENT, {"db.system": "redis"}):
+                return await super().execute_command(*args, **options)
+        except (RedisError, OSError):
+            redis_command_errors.labels(command).inc()
+            raise
+        finally:
+            redis_command_duration.labels(command).observe(time.perf_counter() - started)
+
+
+def gauge_value(collected: Dict[str, Dict[tuple, np.ndarray]], metric: Metric) -> Optional[float]:
+    """
+    Value of a label-less counter or gauge in `MetricsRegistry.collect()` output, None if never set.
+    """
+    value = collected.get(metric.name, {}).get(())
+    return float(value[0]) if value is not None else None
+
+
+def read_process_stats() -> dict:
+    """
+    CPU seconds, resident memory and open file descriptors of this process (from /proc where available).
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    stats = {"cpu_seconds": usage.ru_utime + usage.ru_stime, "rss_bytes": usage.ru_maxrss * 1024, "open_fds": None}
+    try:
+        with open("/proc/self/statm") as f:
+            stats["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        stats["open_fds"] = len(os.listdir("/proc/self/fd"))
+    except (OSError, ValueError):
+        pass
+    return stats
+
+
+def read_network_bytes() -> Optional[dict]:
+    """
+    Bytes received and sent on all non-loopback interfaces since boot (Linux), None elsewhere.
+    """
+    try:
+        with open("/proc/net/dev") as f:
+            lines = f.read().splitlines()[2:]
+    except OSError:
+        return None
+    received = sent = 0
+    for line in lines:
+        interface, _, fields = line.partition(":")
+        if interface.strip() != "lo":
+            values = fields.split()
+            received += int(values[0])
+            sent += int(values[8])
+    return {"received": received, "sent": sent}
+
+
+class ProcessSampler:
+    """
+    Measures event loop lag continuously and samples process CPU, memory and descriptors.
+    """
+    def __init__(self, lag_interval: float = 0.25, sample_interval: float = 5.0):
+        self.lag_interval = lag_interval
+        self.sample_interval = sample_interval
+        self.started_at = time.time()
+        self._task: Optional[asyncio.Task] = None
+        self._last_cpu: Optional[Tuple[float, float]] = None
+
+    def sample(self):
+        stats = read_process_stats()
+        now = time.monotonic()
+        if self._last_cpu is not None and now > self._last_cpu[1]:
+            process_cpu_percent.set(100.0 * (stats["cpu_seconds"] - self._last_cpu[0]) / (now - self._last_cpu[1]))
+        self._last_cpu = (stats["cpu_seconds"], now)
+        process_cpu_seconds.set(stats["cpu_seconds"])
+        process_resident_memory.set(stats["rss_bytes"])
+        if stats["open_fds"] is not None:
+            process_open_fds.set(stats["open_fds"])
+        process_start_time.set(self.started_at)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        worst, next_sample = 0.0, loop.time()
+        while True:
+            scheduled = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(loop.time() - scheduled, 0.0)
+            event_loop_lag.observe(lag)
+            worst = max(worst, lag)
+            if loop.time() >= next_sample:
+                self.sample()
+                event_loop_lag_max.set(worst)
+                worst, next_sample = 0.0, loop.time() + self.sample_interval
+
+    async def start(self):
+        if self._task is None:
+            self.sample()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+process_sampler = ProcessSampler(sample_interval=settings.METRICS_SAMPLE_INTERVAL)
@@ -0,0 +1,294 @@
+"""
+Model registry and runtime for the support intent classifier.
+
+Registered versions point at artifact directories on local disk (see `LinearIntentModel` in
+app/services/nlp_service.py); versions without an artifact serve the built-in keyword rules.
+Artifacts are loaded on first use with their weights memory-mapped, and warmed (pages faulted
+in, sample queries run) before they can serve traffic.
+
+Deploy and rollback load and warm the target version first and then swap a single reference,
+so a request that already picked up the previous model finishes on it and nothing waits on the
+load. Loaded versions other than the active one are evicted least-recently-used first once
+their total size exceeds the memory budget.
+
+The registry (versions, active version, deployment history) is persisted as JSON next to the
+artifacts and re-checked every few seconds, so a deploy in one worker is picked up by the others.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.services.nlp_service import KeywordIntentModel, LinearIntentModel
+from app.services.tracing_service import tracing
+
+logger = logging.getLogger("app_logger")
+
+WARMUP_QUERIES = ["I need help with my order", "I want a refund for my purchase", "Where is my package?"]
+
+# Versions known before the registry was persisted; they serve the keyword rules
+DEFAULT_VERSIONS = {
+    "v1.2": {"status": "deployed", "metrics": {"accuracy": 0.93}, "artifact_path": None},
+    "v1.3": {"status": "deployed", "metrics": {"accuracy": 0.95}, "artifact_path": None},
+}
+DEFAULT_ACTIVE_VERSION = "v1.3"
+
+
+class LoadedModel:
+    __slots__ = ("version", "model", "size_bytes", "loaded_at")
+
+    def __init__(self, version: str, model, size_bytes: int):
+        self.version = version
+        self.model = model
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+
+    def predict(self, text: str):
+        with tracing.span("intent.predict", attributes={"model.version": self.version}):
+            return self.model.predict(text)
+
+
+def load_artifact(artifact_path: Optional[str]):
+    if artifact_path is None:
+        return KeywordIntentModel()
+    return LinearIntentModel.load(artifact_path, mmap=True)
+
+
+class ModelRegistry:
+    def __init__(self, artifact_dir: str, memory_budget_bytes: int, check_interval: float = 2.0):
+        """
+        :param artifact_dir: Directory holding version artifacts and registry.json
+        :param memory_budget_bytes: Total size of loaded versions kept before evicting unused ones
+        :param check_interval: Seconds between checks of registry.json for deploys by other workers
+        """
+        self.artifact_dir = artifact_dir
+        self.registry_path = os.path.join(artifact_dir, "registry.json")
+        self.memory_budget_bytes = memory_budget_bytes
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._versions: Dict[str, dict] = {version: dict(entry) for version, entry in DEFAULT_VERSIONS.items()}
+        self._active_version = DEFAULT_ACTIVE_VERSION
+        self._history: List[dict] = []
+        self._loaded: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._active: Optional[LoadedModel] = None
+        self._pinned: Set[str] = set()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._syncing = False
+        self._read_registry()
+
+    # Registry state
+
+    def __contains__(self, version: str) -> bool:
+        self._maybe_sync()
+        return version in self._versions
+
+    def get(self, version: str) -> Optional[dict]:
+        self._maybe_sync()
+        entry = self._versions.get(version)
+        return dict(entry) if entry is not None else None
+
+    @property
+    def active_version(self) -> str:
+        self._maybe_sync()
+        return self._active_version
+
+    @property
+    def history(self) -> List[dict]:
+        return list(self._history)
+
+    def register(self, version: str, metadata: dict, artifact_path: Optional[str] = None) -> dict:
+        """
+        Adds (or updates) a version. Raises ValueError if the artifact can't be found.
+        """
+        if artifact_path is not None and not os.path.isfile(os.path.join(artifact_path, "model.json")):
+            raise ValueError(f"No model artifact found at {artifact_path}")
+        with self._lock:
+            entry = dict(metadata, artifact_path=artifact_path, status="registered",
+                         registered_at=datetime.utcnow().isoformat())
+            self._versions[version] = entry
+            # A re-registered version must not keep serving its old artifact
+            self._loaded.pop(version, None)
+            self._write_registry()
+        return dict(entry)
+
+    def store_artifact(self, version: str, model: LinearIntentModel) -> str:
+        """
+        Saves `model` under the artifact directory and returns its path, ready for `register`.
+        """
+        path = os.path.join(self.artifact_dir, version)
+        model.save(path)
+        return path
+
+    # Loading and eviction
+
+    def load(self, version: str) -> LoadedModel:
+        """
+        Returns the loaded and warmed version, loading it on first use.
+        """
+        with self._lock:
+            loaded = self._loaded.get(version)
+            if loaded is not None:
+                self._loaded.move_to_end(version)
+                return loaded
+            if version not in self._versions:
+                raise KeyError(version)
+            load_lock = self._load_locks.setdefault(version, threading.Lock())
+        # Loads of different versions run concurrently; concurrent loads of one version share the work
+        with load_lock:
+            with self._lock:
+                loaded = self._loaded.get(version)
+                artifact_path = self._versions[version].get("artifact_path")
+            if loaded is not None:
+                return loaded
+            started = time.perf_counter()
+            model = load_artifact(artifact_path)
+            model.warm(WARMUP_QUERIES)
+            loaded = LoadedModel(version, model, model.size_bytes)
+            logger.info(f"Loaded model {version} ({loaded.size_bytes} bytes) in {time.perf_counter() - started:.3f}s")
+            with self._lock:
+                self._loaded[version] = loaded
+                self._evict()
+            return loaded
+
+    def _evict(self):
+        protected = self._pinned | {self._active_version}
+        if self._active is not None:
+            protected.add(self._active.version)
+        total = sum(loaded.size_bytes for loaded in self._loaded.values())
+        # The most recently used version is never evicted, even if it alone exceeds the budget
+        for version in list(self._loaded)[:-1]:
+            if total <= self.memory_budget_bytes:
+                break
+            if version in protected:
+                continue
+            total -= self._loaded.pop(version).size_bytes
+            logger.info(f"Evicted model {version} from memory")
+
+    def pin(self, versions: Set[str]):
+        """
+        Keeps `versions` (e.g. arms of a running experiment) loaded regardless of the memory budget.
+        """
+        with self._lock:
+            self._pinned = set(versions)
+
+    def loaded_versions(self) -> Dict[str, int]:
+        with self._lock:
+            return {version: loaded.size_bytes for version, loaded in self._loaded.items()}
+
+    # Serving and swapping
+
+    def active(self) -> LoadedModel:
+        """
+        The model serving traffic. Callers keep the returned reference for the whole request.
+        """
+        self._maybe_sync()
+        active = self._active
+        if active is None:
+            active = self.load(self._active_version)
+            with self._lock:
+                if self._active is None:
+                    self._active = active
+                active = self._active
+        return active
+
+    def activate(self, version: str, strategy: str = "full", canary_traffic_percentage: Optional[int] = None) -> dict:
+        """
+        Loads and warms `version`, then makes it the active model. Raises KeyError for unknown
+        versions and ValueError/OSError for broken artifacts; the previous model keeps serving.
+        """
+        started = time.perf_counter()
+        loaded = self.load(version)
+        ready = time.perf_counter()
+        with self._lock:
+            previous = self._active_version
+            self._active = loaded
+            self._active_version = version
+            for name, entry in self._versions.items():
+                if name == version:
+                    entry["status"] = "deployed"
+                elif entry.get("status") == "deployed":
+                    entry["status"] = "inactive"
+            self._history.append({
+                "model_version": version,
+                "previous_version": previous,
+                "strategy": strategy,
+                "canary_traffic_percentage": canary_traffic_percentage,
+                "deployed_at": datetime.utcnow().isoformat(),
+            })
+            self._write_registry()
+            self._evict()
+        swapped = time.perf_counter()
+        logger.info(f"Activated model {version} (was {previous})")
+        return {
+            "model_version": version,
+            "previous_version": previous,
+            "load_seconds": round(ready - started, 6),
+            "swap_seconds": round(swapped - ready, 6),
+        }
+
+    # Persistence and cross-worker sync
+
+    def _write_registry(self):
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        state = {"versions": self._versions, "active_version": self._active_version, "history": self._history}
+        with open(self.registry_path + ".tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(self.registry_path + ".tmp", self.registry_path)
+        self._mtime = os.stat(self.registry_path).st_mtime
+
+    def _read_registry(self) -> bool:
+        try:
+            mtime = os.stat(self.registry_path).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.registry_path) as f:
+                state = json.load(f)
+        except (ValueError, OSError) as e:
+            logger.error(f"Model registry {self.registry_path} not loaded: {e}")
+            self._mtime = mtime
+            return False
+        with self._lock:
+            self._versions = state["versions"]
+            self._active_version = state["active_version"]
+            self._history = state.get("history", [])
+            self._mtime = mtime
+        return True
+
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        self._read_registry()
+        with self._lock:
+            active = self._active
+            if active is None or active.version == self._active_version or self._syncing:
+                return
+            # Another worker deployed: warm the new version off the request path, keep serving the old one
+            self._syncing = True
+        threading.Thread(target=self._follow_deploy, args=(self._active_version,), daemon=True).start()
+
+    def _follow_deploy(self, version: str):
+        try:
+            loaded = self.load(version)
+            with self._lock:
+                if self._active_version == version:
+                    self._active = loaded
+                    self._evict()
+        except Exception as e:
+            logger.error(f"Model {version} deployed by another worker failed to load: {e}")
+        finally:
+            self._syncing = False
+
+
+model_registry = ModelRegistry(settings.MODEL_ARTIFACT_DIR, settings.MODEL_MEMORY_BUDGET_MB * 1024 * 1024)
@@ -1,3 +1,17 @@
+import json
+import os
+import re
+import zlib
+from typing import List, Tuple
+
+import numpy as np
+
+from app.services.tracing_service import traced
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+@traced("nlp.analyze_intent")
 def analyze_intent(query: str):
     # Simple NLP simulation
     if "help" in query.lower():
@@ -5,3 +19,82 @@ def analyze_intent(query: str):
     elif "refund" in query.lower():
         return "refund_request", 0.90
     return "unknown", 0.50
+
+
+class KeywordIntentModel:
+    """
+    Built-in rule model, served for registry versions that have no artifact.
+    """
+    labels = ["help_request", "refund_request", "unknown"]
+    size_bytes = 0
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        return analyze_intent(text)
+
+    def warm(self, queries: List[str]):
+        for query in queries:
+            self.predict(query)
+
+
+def hashed_features(text: str, n_features: int) -> np.ndarray:
+    """
+    Feature indices of the unigrams and bigrams in `text` (crc32 hashing, stable across processes).
+    """
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return np.fromiter((zlib.crc32(gram.encode()) % n_features for gram in grams), dtype=np.int64, count=len(grams))
+
+
+class LinearIntentModel:
+    """
+    Hashed bag-of-words linear intent classifier.
+
+    Stored as a directory with `model.json` (labels, n_features), `weights.npy`
+    (n_features x n_labels) and `bias.npy`; weights are memory-mapped on load.
+    """
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels: List[str]):
+        self.weights = weights
+        self.bias = bias
+        self.labels = labels
+        self.n_features = weights.shape[0]
+
+    @property
+    def size_bytes(self) -> int:
+        return int(self.weights.nbytes + self.bias.nbytes)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "LinearIntentModel":
+        with open(os.path.join(path, "model.json")) as f:
+            meta = json.load(f)
+        weights = np.load(os.path.join(path, "weights.npy"), mmap_mode="r" if mmap else None)
+        bias = np.load(os.path.join(path, "bias.npy"))
+        if weights.shape != (meta["n_features"], len(meta["labels"])):
+            raise ValueError(f"Artifact {path} has weights of shape {weights.shape}, expected "
+                             f"({meta['n_features']}, {len(meta['labels'])})")
+        return cls(weights, bias, meta["labels"])
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "weights.npy"), np.asarray(self.weights, dtype=np.float32))
+        np.save(os.path.join(path, "bias.npy"), np.asarray(self.bias, dtype=np.float32))
+        with open(os.path.join(path, "model.json"), "w") as f:
+            json.dump({"type": "linear_intent", "labels": self.labels, "n_features": self.n_features}, f)
+
+    def decision(self, text: str) -> np.ndarray:
+        indices = hashed_features(text, self.n_features)
+        return self.weights[indices].sum(axis=0) + self.bias
+
+    def warm(self, queries: List[str]):
+        """
+        Faults the memory-mapped weights into the page cache and runs `queries` through the model.
+        """
+        float(np.sum(self.weights, dtype=np.float64))
+        for query in queries:
+            self.predict(query)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        scores = self.decision(text)
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+        return self.labels[best], round(float(probabilities[best]), 4)
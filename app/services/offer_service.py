@@ -0,0 +1,139 @@
+"""
+Materialized per-customer "next best offers".
+
+Each customer has one document in `customer_offers` (keyed by customer_id) holding their
+preferences, recent orders and precomputed recommendations, so personalization requests need a
+single key lookup. A background job (`refresh_customer_offers` in app/core/tasks.py) recomputes
+only customers whose profile (`updated_at`) or orders (`created_at`) changed since its last run,
+and everything when a new recommendation index is deployed. Profile updates recompute their
+customer immediately.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReplaceOne
+
+from app.services.recommendation_service import recommendation_engine
+
+logger = logging.getLogger("app_logger")
+
+OFFERS_COLLECTION = "customer_offers"
+STATE_COLLECTION = "materialization_state"
+STATE_ID = "customer_offers"
+RECOMMENDATIONS_LIMIT = 10
+RECENT_ORDERS_LIMIT = 50
+
+
+def load_customer_data(db, customer_ids: List[str]) -> Dict[str, dict]:
+    """
+    Loads preferences and most recent orders for a batch of customers with two queries.
+    Customers without a profile are omitted.
+    """
+    profiles = db["customer_profiles"].find({"customer_id": {"$in": customer_ids}}, {"_id": 0})
+    customers = {
+        profile["customer_id"]: {"preferences": profile.get("preferences", {}), "recent_orders": []}
+        for profile in profiles
+    }
+    orders = db["orders"].find({"customer_id": {"$in": list(customers)}}, {"_id": 0}).sort("order_date", -1)
+    for order in orders:
+        recent_orders = customers[order["customer_id"]]["recent_orders"]
+        if len(recent_orders) < RECENT_ORDERS_LIMIT:
+            recent_orders.append(order)
+    return customers
+
+
+def purchased_product_ids(customer_data: dict) -> tuple:
+    return tuple(str(order["product_id"]) for order in customer_data["recent_orders"] if order.get("product_id"))
+
+
+class OfferStore:
+    def __init__(self, engine=recommendation_engine, batch_size: int = 1000):
+        """
+        :param engine: RecommendationEngine used to compute offers
+        :param batch_size: Customers loaded and written per round trip during refreshes
+        """
+        self.engine = engine
+        self.batch_size = batch_size
+
+    def _index_version(self) -> Optional[str]:
+        index = self.engine.index
+        return getattr(index, "version", None) if index is not None else None
+
+    def compute(self, customer_id: str, customer_data: dict, index_version: Optional[str] = None) -> dict:
+        preferred_category = customer_data["preferences"].get("preferred_category")
+        return {
+            "_id": customer_id,
+            "preferences": customer_data["preferences"],
+            "recent_orders": customer_data["recent_orders"],
+            "preferred_category": preferred_category,
+            "recommendations": self.engine.recommend(
+                purchased_product_ids(customer_data), k=RECOMMENDATIONS_LIMIT, preferred_category=preferred_category
+            ),
+            "index_version": index_version,
+            "computed_at": datetime.utcnow(),
+        }
+
+    def get(self, db, customer_id: str) -> Optional[dict]:
+        """
+        Returns the materialized offers for a customer, computing them on first access.
+        Returns None for unknown customers.
+        """
+        offers = db[OFFERS_COLLECTION].find_one({"_id": customer_id})
+        if offers is None and self.refresh_customers(db, [customer_id]):
+            offers = db[OFFERS_COLLECTION].find_one({"_id": customer_id})
+        return offers
+
+    def refresh_customers(self, db, customer_ids: Iterable[str]) -> int:
+        """
+        Recomputes and upserts offers for the given customers; returns how many were written.
+        """
+        customer_ids = list(dict.fromkeys(customer_ids))
+        index_version = self._index_version()
+        written = 0
+        for start in range(0, len(customer_ids), self.batch_size):
+            batch = customer_ids[start:start + self.batch_size]
+            customers = load_customer_data(db, batch)
+            operations = [
+                ReplaceOne({"_id": customer_id}, self.compute(customer_id, data, index_version), upsert=True)
+                for customer_id, data in customers.items()
+            ]
+            if operations:
+                db[OFFERS_COLLECTION].bulk_write(operations, ordered=False)
+                written += len(operations)
+            removed = [customer_id for customer_id in batch if customer_id not in customers]
+            if removed:
+                db[OFFERS_COLLECTION].delete_many({"_id": {"$in": removed}})
+        return written
+
+    def changed_customers(self, db, since: datetime) -> set:
+        # $gte: Mongo stores milliseconds, so a change in the same millisecond as the watermark must still count
+        changed = set(db["customer_profiles"].distinct("customer_id", {"updated_at": {"$gte": since}}))
+        changed.update(db["orders"].distinct("customer_id", {"created_at": {"$gte": since}}))
+        return changed
+
+    def refresh_changed(self, db) -> dict:
+        """
+        Incremental refresh: recomputes customers changed since the previous run, or every
+        customer on the first run and after the recommendation index changed.
+        """
+        started_at = datetime.utcnow()
+        self.engine.reload_if_changed()
+        state = db[STATE_COLLECTION].find_one({"_id": STATE_ID})
+        index_version = self._index_version()
+        if state is None or state.get("index_version") != index_version:
+            mode = "full"
+            customer_ids = [p["customer_id"] for p in db["customer_profiles"].find({}, {"_id": 0, "customer_id": 1})]
+        else:
+            mode = "incremental"
+            customer_ids = self.changed_customers(db, state["last_run"])
+        written = self.refresh_customers(db, customer_ids)
+        # Watermark is the start time, so changes made during the run are picked up next time
+        db[STATE_COLLECTION].replace_one(
+            {"_id": STATE_ID}, {"_id": STATE_ID, "last_run": started_at, "index_version": index_version}, upsert=True
+        )
+        logger.info(f"Customer offers refresh ({mode}): {written} customers recomputed")
+        return {"mode": mode, "customers_refreshed": written}
+
+
+offer_store = OfferStore()
@@ -0,0 +1,218 @@
+"""
+Opt-in sampling profiler producing flame graphs (PROFILING_ENABLED).
+
+A profile is taken by a background thread that reads the Python stack of every thread with
+`sys._current_frames()` every PROFILE_INTERVAL seconds and counts identical stacks; nothing is
+hooked into the code being profiled, so it runs at full speed between samples and costs nothing
+when no profile is being taken. Threads that are just waiting (idle executor workers, the event
+loop in `select`) are left out.
+
+Two ways to take one: a time window of the whole worker (POST /monitoring/profile), or a single
+request sent with an `X-Profile: 1` header (`ProfileMiddleware`), fetched afterwards by its request
+id. For a request, only the event loop (while that request's task is running) and the threadpool
+workers are sampled; threadpool samples are counted as they come, so on a busy worker they can
+include other requests. Results come as an SVG flame graph or as folded stacks (for flamegraph.pl or
+speedscope). One profile runs at a time per worker.
+"""
+import asyncio
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from html import escape
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+# Where a thread's innermost Python frame sits when it has nothing to do
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+# Threads that run request code besides the event loop: Starlette's threadpool and run_in_executor
+REQUEST_THREAD_PREFIXES = ("AnyIO worker thread", "asyncio_", "ThreadPoolExecutor")
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(code, labels: Dict) -> str:
+    label = labels.get(code)
+    if label is None:
+        path = code.co_filename.replace(os.sep, "/").split("/")
+        label = labels[code] = f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+    return label
+
+
+class ProfileSession:
+    """
+    Samples stacks until stopped; `stacks` counts samples per folded stack ("outer;...;inner").
+    """
+    def __init__(self, interval: float, max_seconds: float, loop: Optional[asyncio.AbstractEventLoop] = None,
+                 task: Optional[asyncio.Task] = None, loop_thread: Optional[int] = None):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.loop = loop
+        self.task = task
+        self.loop_thread = loop_thread
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = time.time()
+        self.duration = 0.0
+        self._labels: Dict = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> "ProfileSession":
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        return self
+
+    def _run(self):
+        started = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            self.sample()
+            if time.perf_counter() - started >= self.max_seconds:
+                break
+        self.duration = time.perf_counter() - started
+
+    def sample(self):
+        own = threading.get_ident()
+        self.samples += 1
+        names = {thread.ident: thread.name for thread in threading.enumerate()} if self.task is not None else None
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            if self.task is not None:
+                if thread_id == self.loop_thread:
+                    if asyncio.current_task(self.loop) is not self.task:
+                        continue
+                elif not names.get(thread_id, "").startswith(REQUEST_THREAD_PREFIXES):
+                    continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code, self._labels))
+                frame = frame.f_back
+            labels.reverse()
+            self.stacks[";".join(labels)] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def flamegraph(self, title: str = "Flame graph") -> str:
+        return render_flamegraph(self.stacks, f"{title} ({sum(self.stacks.values())} samples, "
+                                              f"{self.interval * 1000:g} ms interval)")
+
+
+class SamplingProfiler:
+    """
+    Runs one `ProfileSession` at a time and keeps the last `keep` per-request profiles.
+    """
+    def __init__(self, interval: float, max_seconds: float, keep: int):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.keep = keep
+        self.results: "OrderedDict[str, ProfileSession]" = OrderedDict()
+        self._active: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+
+    def start(self, seconds: Optional[float] = None, task: Optional[asyncio.Task] = None) -> ProfileSession:
+        """
+        Starts sampling; with `task`, event loop samples only count while that task runs. Call from the event loop.
+        """
+        loop = asyncio.get_running_loop() if task is not None else None
+        session = ProfileSession(self.interval, min(seconds or self.max_seconds, self.max_seconds), loop, task,
+                                 threading.get_ident() if task is not None else None)
+        with self._lock:
+            if self._active is not None:
+                raise ProfilerBusy("A profile is already being taken in this worker")
+            self._active = session
+        session.start()
+        return session
+
+    def finish(self, session: ProfileSession, request_id: Optional[str] = None) -> ProfileSession:
+        session.stop()
+        with self._lock:
+            if self._active is session:
+                self._active = None
+            if request_id is not None:
+                self.results[request_id] = session
+                while len(self.results) > self.keep:
+                    self.results.popitem(last=False)
+        return session
+
+    async def profile_window(self, seconds: float) -> ProfileSession:
+        session = self.start(seconds)
+        try:
+            await asyncio.sleep(session.max_seconds)
+        finally:
+            self.finish(session)
+        return session
+
+
+def _color(name: str) -> str:
+    digest = hashlib.md5(name.encode()).digest()
+    return f"rgb({205 + digest[0] % 50},{digest[1] % 190},{digest[2] % 55})"
+
+
+def render_flamegraph(stacks: Counter, title: str, width: int = 1200, row_height: int = 16) -> str:
+    """
+    Self-contained SVG flame graph of folded stacks; hover a frame for its sample count.
+    """
+    root = {"children": {}, "value": 0}
+    for stack, count in stacks.items():
+        node = root
+        node["value"] += count
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"children": {}, "value": 0})
+            node["value"] += count
+    total = root["value"] or 1
+
+    rects = []
+    depth_max = 0
+
+    def layout(node: dict, x: float, depth: int):
+        nonlocal depth_max
+        for name, child in sorted(node["children"].items()):
+            w = child["value"] / total * width
+            if w >= 0.5:
+                depth_max = max(depth_max, depth)
+                rects.append((name, child["value"], x, depth, w))
+                layout(child, x, depth + 1)
+            x += w
+
+    layout(root, 0.0, 0)
+    top = 24
+    height = top + (depth_max + 1) * row_height + 4
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+        f'<text x="4" y="16" font-size="13">{escape(title)}</text>',
+    ]
+    for name, value, x, depth, w in rects:
+        # Flame graph: the outermost frames at the bottom
+        y = height - (depth + 1) * row_height - 4
+        fits = int((w - 4) / 7)
+        label = name if len(name) <= fits else (name[:fits - 2] + ".." if fits > 3 else "")
+        parts.append(
+            f'<g><title>{escape(name)}: {value} samples ({value / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="{_color(name)}" rx="2"/>'
+            f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{escape(label)}</text></g>'
+        )
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+profiler = SamplingProfiler(settings.PROFILE_INTERVAL, settings.PROFILE_MAX_SECONDS, settings.PROFILE_KEEP)
@@ -0,0 +1,301 @@
+"""
+Role-based access control: roles and assignments set through POST /security/access-control are
+enforced on every request to a protected route (RBACMiddleware in app/core/middleware.py).
+
+The policy is persisted to RBAC_PATH as:
+
+    {"permissions": ["security:admin", "pii:decrypt", ...],
+     "roles": {"auditor": ["security:admin"], ...},
+     "assignments": {"alice": ["auditor", ...], ...}}
+
+Each permission owns one bit, in the order of "permissions" (only ever appended to, so bits are
+stable across reloads), and each role is compiled to the OR of its permissions' bits. A user's
+effective permissions are the OR of their roles' masks, computed on their first request and cached
+per token subject, as is the subject of each verified token; a request is then authorized with one
+`mask & required == required`, whatever the number of roles. Token subjects listed in
+RBAC_SUPERUSERS hold every permission. There are none by default, so until an operator names one
+in the environment (to grant the first roles) every protected route is refused.
+
+Changes are made under a lock file, so workers changing the policy at the same time don't drop each
+other's changes. Changing a role drops the cached masks of the users holding it in this worker;
+other workers see the file change within RBAC_RELOAD_SECONDS and drop all of theirs.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from jose import JWTError, jwt
+from starlette.routing import compile_path
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("app_logger")
+
+# Permission each protected route requires; routes not listed are open to anyone
+ROUTE_PERMISSIONS = [
+    ("POST", "/api/v1/security/access-control", "security:admin"),
+    ("GET", "/api/v1/security/access-control/{user_id}", "security:admin"),
+    ("DELETE", "/api/v1/security/access-control/{user_id}/{role}", "security:admin"),
+    ("GET", "/api/v1/security/access-logs", "security:admin"),
+    ("POST", "/api/v1/security/set-firewall-rules", "security:admin"),
+    ("GET", "/api/v1/security/firewall-rules", "security:admin"),
+    ("DELETE", "/api/v1/security/firewall-rules/{rule_name}", "security:admin"),
+    ("POST", "/api/v1/security/decrypt-data", "pii:decrypt"),
+    ("POST", "/api/v1/security/decrypt-data/batch", "pii:decrypt"),
+    ("POST", "/api/v1/model/deploy", "models:manage"),
+    ("POST", "/api/v1/model/rollback", "models:manage"),
+    ("POST", "/api/v1/model/versioning", "models:manage"),
+    ("POST", "/api/v1/model/ab-test/start", "models:manage"),
+    ("POST", "/api/v1/monitoring/error/alert", "alerts:manage"),
+    ("GET", "/api/v1/monitoring/monitoring/alerts", "alerts:manage"),
+]
+# Mask of a superuser: every bit set, so `mask & required == required` for any `required`
+ALL_PERMISSIONS = -1
+
+
+def validate_names(kind: str, names: Iterable[str]):
+    for name in names:
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError(f"Every {kind} needs a non-empty name")
+
+
+class RBACPolicy:
+    def __init__(self, roles: Dict[str, List[str]], assignments: Dict[str, List[str]],
+                 permissions: Iterable[str] = (), superusers: Iterable[str] = ()):
+        self.permissions: List[str] = []
+        self.bits: Dict[str, int] = {}
+        for permission in permissions:
+            self.bit(permission)
+        self.roles = {role: sorted(set(granted)) for role, granted in roles.items()}
+        self.role_masks = {role: self.mask(granted) for role, granted in self.roles.items()}
+        self.assignments = {user: sorted(set(held)) for user, held in assignments.items() if held}
+        self.superusers = frozenset(superusers)
+        # Route permissions get a bit even when no role grants them yet, so only superusers pass
+        self.static_routes: Dict[Tuple[str, str], int] = {}
+        self.templated_routes: List[Tuple[str, object, int]] = []
+        for method, path, permission in ROUTE_PERMISSIONS:
+            if "{" in path:
+                self.templated_routes.append((method, compile_path(path)[0], self.bit(permission)))
+            else:
+                self.static_routes[(method, path)] = self.bit(permission)
+
+    def bit(self, permission: str) -> int:
+        bit = self.bits.get(permission)
+        if bit is None:
+            bit = self.bits[permission] = 1 << len(self.permissions)
+            self.permissions.append(permission)
+        return bit
+
+    def mask(self, permissions: Iterable[str]) -> int:
+        mask = 0
+        for permission in permissions:
+            mask |= self.bit(permission)
+        return mask
+
+    def required_mask(self, method: str, path: str) -> Optional[int]:
+        """
+        The permission bit the route serving `method path` requires, or None if it is open.
+        """
+        # Starlette answers HEAD with the GET route's handler
+        if method == "HEAD":
+            method = "GET"
+        required = self.static_routes.get((method, path))
+        if required is None and self.templated_routes:
+            for route_method, regex, bit in self.templated_routes:
+                if route_method == method and regex.match(path):
+                    return bit
+        return required
+
+    def mask_of(self, user: str) -> int:
+        if user in self.superusers:
+            return ALL_PERMISSIONS
+        mask = 0
+        for role in self.assignments.get(user, ()):
+            mask |= self.role_masks.get(role, 0)
+        return mask
+
+    def permissions_of(self, user: str) -> List[str]:
+        mask = self.mask_of(user)
+        return [permission for permission in self.permissions if mask & self.bits[permission]]
+
+    def members(self, role: str) -> List[str]:
+        return [user for user, held in self.assignments.items() if role in held]
+
+    def to_dict(self) -> dict:
+        return {"permissions": self.permissions, "roles": self.roles, "assignments": self.assignments}
+
+
+class AccessControl:
+    def __init__(self, path: str, check_interval: float = 2.0, superusers: Iterable[str] = (),
+                 token_cache_size: int = 10000):
+        """
+        :param path: JSON file holding the roles, their permissions and the users' roles
+        :param check_interval: Seconds between checks of the file for changes
+        :param superusers: Token subjects holding every permission
+        :param token_cache_size: Verified tokens remembered, so each is decoded once
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self.superusers = frozenset(superusers)
+        self.token_cache_size = token_cache_size
+        # The policy and the masks computed from it are swapped together, so a mask computed
+        # from a policy being replaced lands in the discarded cache
+        self._state: Tuple[RBACPolicy, Dict[str, int]] = (RBACPolicy({}, {}, superusers=self.superusers), {})
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._stamp: Optional[tuple] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def policy(self) -> RBACPolicy:
+        return self._current()[0]
+
+    def _current(self) -> Tuple[RBACPolicy, Dict[str, int]]:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self.reload_if_changed()
+        return self._state
+
+    def _changed_stamp(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        return None if stamp == self._stamp else stamp
+
+    def reload_if_changed(self) -> bool:
+        with self._lock:
+            stamp = self._changed_stamp()
+            if stamp is None:
+                return False
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                policy = RBACPolicy(data.get("roles", {}), data.get("assignments", {}),
+                                    data.get("permissions", ()), self.superusers)
+            except (ValueError, TypeError, AttributeError, OSError) as e:
+                # Keep enforcing the previous policy if the new file is broken
+                logger.error(f"RBAC policy in {self.path} not loaded: {e}")
+                self._stamp = stamp
+                return False
+            # Which roles changed is unknown here: every cached mask goes
+            self._state, self._stamp = (policy, {}), stamp
+        logger.info(f"Loaded {len(policy.roles)} roles assigned to {len(policy.assignments)} users")
+        return True
+
+    def _locked(self):
+        # Held from reloading the policy to saving the changed one, by every worker
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock = open(self.path + ".lock", "w")
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _save(self, policy: RBACPolicy, invalidated: Iterable[str]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(policy.to_dict(), f, separators=(",", ":"))
+        os.replace(self.path + ".tmp", self.path)
+        stat = os.stat(self.path)
+        masks = dict(self._state[1])
+        for user in invalidated:
+            masks.pop(user, None)
+        self._state, self._stamp = (policy, masks), (stat.st_ino, stat.st_mtime_ns)
+
+    def set_access_control(self, user_id: str, role: str, permissions: List[str]) -> List[str]:
+        """
+        Gives `role` exactly `permissions`, assigns it to `user_id` and persists the policy; returns
+        the user's effective permissions. Raises ValueError for empty names.
+        """
+        validate_names("user", [user_id])
+        validate_names("role", [role])
+        validate_names("permission", permissions)
+        with self._locked():
+            self.reload_if_changed()
+            with self._lock:
+                current = self._state[0]
+                roles = dict(current.roles)
+                roles[role] = permissions
+                assignments = dict(current.assignments)
+                assignments[user_id] = sorted(set(assignments.get(user_id, ())) | {role})
+                policy = RBACPolicy(roles, assignments, current.permissions, self.superusers)
+                self._save(policy, policy.members(role))
+        return policy.permissions_of(user_id)
+
+    def revoke(self, user_id: str, role: str) -> bool:
+        """
+        Takes `role` away from `user_id`; False if they didn't hold it.
+        """
+        with self._locked():
+            self.reload_if_changed()
+            with self._lock:
+                current = self._state[0]
+                held = current.assignments.get(user_id, [])
+                if role not in held:
+                    return False
+                assignments = dict(current.assignments)
+                assignments[user_id] = [other for other in held if other != role]
+                policy = RBACPolicy(current.roles, assignments, current.permissions, self.superusers)
+                self._save(policy, [user_id])
+        return True
+
+    def authenticate(self, token: str) -> Optional[str]:
+        """
+        The subject of a valid, unexpired access token, or None.
+        """
+        cached = self._tokens.get(token)
+        if cached is not None:
+            if cached[1] > time.time():
+                return cached[0]
+            del self._tokens[token]
+            return None
+        try:
+            claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            return None
+        subject = claims.get("sub")
+        if not isinstance(subject, str):
+            return None
+        if len(self._tokens) >= self.token_cache_size:
+            # Oldest first
+            self._tokens.pop(next(iter(self._tokens)), None)
+        self._tokens[token] = (subject, claims.get("exp", float("inf")))
+        return subject
+
+    def required_mask(self, method: str, path: str) -> Optional[int]:
+        return self._current()[0].required_mask(method, path)
+
+    def subject_mask(self, subject: str) -> int:
+        policy, masks = self._current()
+        mask = masks.get(subject)
+        if mask is None:
+            mask = masks[subject] = policy.mask_of(subject)
+        return mask
+
+    def allows(self, subject: str, required: int) -> bool:
+        return self.subject_mask(subject) & required == required
+
+    def permissions_of(self, user_id: str) -> List[str]:
+        return self.policy.permissions_of(user_id)
+
+
+access_control = AccessControl(
+    settings.RBAC_PATH,
+    check_interval=settings.RBAC_RELOAD_SECONDS,
+    superusers=[user.strip() for user in settings.RBAC_SUPERUSERS.split(",") if user.strip()],
+    token_cache_size=settings.RBAC_TOKEN_CACHE_SIZE,
+)
@@ -0,0 +1,280 @@
+"""
+Item-to-item recommendation engine built from order history.
+
+The offline build turns (customer, product) purchase pairs into a cosine-normalised item-item
+co-occurrence matrix, keeps the strongest `neighbors` entries per item and writes it as CSR
+arrays (.npy) into a versioned directory. Workers memory-map those arrays, so the index is
+shared through the page cache and costs almost nothing to load. Scoring a customer sums the
+neighbour rows of everything they bought and takes the top-k with argpartition, skipping items
+they already purchased.
+
+Rebuild from the `orders` and `products` collections with:
+
+    python -m app.services.recommendation_service
+"""
+import json
+import logging
+import os
+import secrets
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    from scipy import sparse
+
+logger = logging.getLogger("app_logger")
+
+# Score multiplier for items in the customer's preferred category
+CATEGORY_BOOST = 1.25
+
+ARRAYS = ("data", "indices", "indptr", "popularity", "categories", "item_ids", "item_names", "item_prices")
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the k highest scores, best first, without sorting the whole array.
+    """
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class ItemSimilarityIndex:
+    def __init__(self, data, indices, indptr, popularity, categories, item_ids, item_names, item_prices,
+                 category_names: List[str]):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.popularity = popularity
+        self.categories = categories
+        self.item_ids = item_ids
+        self.item_names = item_names
+        self.item_prices = item_prices
+        self.category_names = category_names
+        self.item_index: Dict[str, int] = {item_id: i for i, item_id in enumerate(item_ids.tolist())}
+        self.category_index: Dict[str, int] = {name: i for i, name in enumerate(category_names)}
+        self.popular_order = np.argsort(-popularity, kind="stable")
+        self.version: Optional[str] = None
+
+    @property
+    def n_items(self) -> int:
+        return len(self.item_ids)
+
+    @classmethod
+    def build(cls, orders: Iterable[Tuple[str, str]], catalog: Dict[str, dict], neighbors: int = 50) -> "ItemSimilarityIndex":
+        """
+        :param orders: (customer_id, product_id) purchase pairs
+        :param catalog: product_id -> {"product_name", "category", "price"}
+        :param neighbors: Number of most similar items kept per item
+        """
+        # Only the offline build needs scipy; serving reads the saved arrays with numpy
+        from scipy import sparse
+
+        pairs = np.array(list(orders), dtype=str).reshape(-1, 2)
+        item_ids = np.union1d(np.array(list(catalog), dtype=str), pairs[:, 1])
+        item_codes = np.searchsorted(item_ids, pairs[:, 1])
+        _, customer_codes = np.unique(pairs[:, 0], return_inverse=True)
+        n_customers = int(customer_codes.max()) + 1 if len(pairs) else 0
+        n_items = len(item_ids)
+
+        # Binary customer x item purchase matrix
+        purchases = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.float32), (customer_codes, item_codes)), shape=(n_customers, n_items)
+        )
+        purchases.sum_duplicates()
+        purchases.data[:] = 1.0
+        popularity = np.asarray(purchases.sum(axis=0), dtype=np.float32).ravel()
+
+        co_occurrence = (purchases.T @ purchases).tocsr()
+        co_occurrence.setdiag(0)
+        co_occurrence.eliminate_zeros()
+        norm = sparse.diags(1.0 / np.sqrt(np.maximum(popularity, 1.0)))
+        similarity = (norm @ co_occurrence @ norm).tocsr()
+        similarity = cls._prune(similarity, neighbors)
+
+        category_names = sorted({(catalog.get(i) or {}).get("category", "") for i in item_ids.tolist()})
+        category_lookup = {name: code for code, name in enumerate(category_names)}
+        meta = [catalog.get(i) or {} for i in item_ids.tolist()]
+        return cls(
+            data=similarity.data.astype(np.float32),
+            indices=similarity.indices.astype(np.int32),
+            indptr=similarity.indptr.astype(np.int64),
+            popularity=popularity,
+            categories=np.array([category_lookup[m.get("category", "")] for m in meta], dtype=np.int32),
+            item_ids=item_ids,
+            item_names=np.array([m.get("product_name", "") for m in meta], dtype=str),
+            item_prices=np.array([str(m.get("price", "")) for m in meta], dtype=str),
+            category_names=category_names,
+        )
+
+    @staticmethod
+    def _prune(matrix: "sparse.csr_matrix", neighbors: int) -> "sparse.csr_matrix":
+        from scipy import sparse
+
+        lengths = np.diff(matrix.indptr)
+        if lengths.max(initial=0) <= neighbors:
+            matrix.sort_indices()
+            return matrix
+        keep = np.ones(len(matrix.data), dtype=bool)
+        for row in np.flatnonzero(lengths > neighbors):
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            weakest = np.argpartition(matrix.data[start:end], end - start - neighbors)[:end - start - neighbors]
+            keep[start + weakest] = False
+        rows = np.repeat(np.arange(matrix.shape[0]), lengths)
+        return sparse.csr_matrix((matrix.data[keep], (rows[keep], matrix.indices[keep])), shape=matrix.shape)
+
+    def save(self, index_dir: str) -> str:
+        """
+        Writes the index into a new version directory and atomically points CURRENT at it.
+        """
+        # Random suffix: two builds in the same second must not write into each other's (possibly live) arrays
+        version = time.strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}-{secrets.token_hex(4)}"
+        target = os.path.join(index_dir, version)
+        os.makedirs(target)
+        for name in ARRAYS:
+            np.save(os.path.join(target, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(target, "categories.json"), "w") as f:
+            json.dump(self.category_names, f)
+        pointer = os.path.join(index_dir, "CURRENT")
+        with open(f"{pointer}.{version}.tmp", "w") as f:
+            f.write(version)
+        os.replace(f"{pointer}.{version}.tmp", pointer)
+        return version
+
+    @classmethod
+    def load(cls, index_dir: str, version: Optional[str] = None) -> "ItemSimilarityIndex":
+        """
+        Memory-maps the CURRENT (or given) version of the index.
+        """
+        if version is None:
+            with open(os.path.join(index_dir, "CURRENT")) as f:
+                version = f.read().strip()
+        source = os.path.join(index_dir, version)
+        arrays = {name: np.load(os.path.join(source, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        with open(os.path.join(source, "categories.json")) as f:
+            category_names = json.load(f)
+        index = cls(category_names=category_names, **arrays)
+        index.version = version
+        return index
+
+    def recommend(self, purchased: Iterable[str], k: int = 10, preferred_category: Optional[str] = None) -> List[Tuple[int, float]]:
+        """
+        Returns up to k (item position, score) pairs for a customer who bought `purchased`.
+        Customers without known purchases get the most popular items.
+        """
+        seeds = np.array(sorted({self.item_index[i] for i in purchased if i in self.item_index}), dtype=np.int64)
+        if len(seeds):
+            starts, ends = self.indptr[seeds], self.indptr[seeds + 1]
+            lengths = ends - starts
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            candidates, inverse = np.unique(self.indices[offsets], return_inverse=True)
+            scores = np.bincount(inverse, weights=self.data[offsets]).astype(np.float32)
+            keep = ~np.isin(candidates, seeds, assume_unique=True)
+            candidates, scores = candidates[keep], scores[keep]
+        else:
+            candidates = np.empty(0, dtype=np.int64)
+            scores = np.empty(0, dtype=np.float32)
+
+        category = self.category_index.get(preferred_category) if preferred_category else None
+        if category is not None and len(candidates):
+            scores = np.where(self.categories[candidates] == category, scores * CATEGORY_BOOST, scores)
+
+        best = top_k(scores, k)
+        results = [(int(candidates[i]), float(scores[i])) for i in best]
+        if len(results) < k:
+            results.extend(self._popular(k - len(results), exclude=set(seeds.tolist()) | {i for i, _ in results}))
+        return results
+
+    def _popular(self, k: int, exclude: set) -> List[Tuple[int, float]]:
+        results = []
+        for position in self.popular_order:
+            if len(results) == k or self.popularity[position] <= 0:
+                break
+            if int(position) not in exclude:
+                results.append((int(position), 0.0))
+        return results
+
+    def describe(self, position: int, score: float) -> dict:
+        return {
+            "product_id": str(self.item_ids[position]),
+            "product_name": str(self.item_names[position]),
+            "category": self.category_names[self.categories[position]],
+            "price": str(self.item_prices[position]),
+            "score": round(score, 4),
+        }
+
+
+class RecommendationEngine:
+    """
+    Lazily loads the memory-mapped index on first use and serves recommendations from it.
+    """
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self._index: Optional[ItemSimilarityIndex] = None
+
+    @property
+    def index(self) -> Optional[ItemSimilarityIndex]:
+        if self._index is None and os.path.exists(os.path.join(self.index_dir, "CURRENT")):
+            self.reload()
+        return self._index
+
+    def reload(self):
+        """
+        Switches to the index version CURRENT points at.
+        """
+        self._index = ItemSimilarityIndex.load(self.index_dir)
+        logger.info(f"Loaded recommendation index {self._index.version} ({self._index.n_items} items)")
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reloads when an offline rebuild has pointed CURRENT at a new version.
+        """
+        try:
+            with open(os.path.join(self.index_dir, "CURRENT")) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return False
+        if self._index is not None and self._index.version == version:
+            return False
+        self.reload()
+        return True
+
+    def recommend(self, purchased: Iterable[str], k: int = 10, preferred_category: Optional[str] = None) -> List[dict]:
+        index = self.index
+        if index is None:
+            return []
+        return [index.describe(position, score) for position, score in index.recommend(purchased, k, preferred_category)]
+
+
+recommendation_engine = RecommendationEngine(settings.RECOMMENDATION_INDEX_DIR)
+
+
+def rebuild_from_db(db, index_dir: str = settings.RECOMMENDATION_INDEX_DIR, neighbors: int = 50) -> str:
+    """
+    Rebuilds the index from the `orders` and `products` collections.
+    """
+    catalog = {
+        str(product["product_id"]): product
+        for product in db["products"].find({}, {"_id": 0, "product_id": 1, "product_name": 1, "category": 1, "price": 1})
+    }
+    orders = (
+        (str(order["customer_id"]), str(order["product_id"]))
+        for order in db["orders"].find({"product_id": {"$exists": True}}, {"_id": 0, "customer_id": 1, "product_id": 1})
+    )
+    return ItemSimilarityIndex.build(orders, catalog, neighbors=neighbors).save(index_dir)
+
+
+if __name__ == "__main__":
+    from app.db import get_db
+    from app.utils.logging import setup_logging
+
+    setup_logging(log_file="")
+    logger.info(f"Recommendation index written: {rebuild_from_db(get_db())}")
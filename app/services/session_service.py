@@ -0,0 +1,78 @@
+"""
+Conversation/session payload storage.
+
+Payloads are kept in Redis as compact serialized blobs so every worker sees the same session.
+When Redis is unreachable the store degrades to an in-process dict for the affected calls.
+"""
+import logging
+import time
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.utils import serialization
+
+logger = logging.getLogger("app_logger")
+
+# How long Redis is bypassed after an error
+REDIS_RETRY_INTERVAL = 5.0
+
+
+class SessionStore:
+    def __init__(self, redis_client=None, ttl: int = 86400, prefix: str = "session:"):
+        """
+        :param redis_client: `redis.asyncio` client, or None to keep sessions in-process only
+        :param ttl: Seconds a session is kept after its last update
+        :param prefix: Redis key prefix for session payloads
+        """
+        self.redis = redis_client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._fallback = {}
+        self._redis_down_until = 0.0
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.time() >= self._redis_down_until
+
+    def _redis_failed(self, e: Exception):
+        self._redis_down_until = time.time() + REDIS_RETRY_INTERVAL
+        logger.error(f"Session store falling back to in-process storage: {e}")
+
+    async def save(self, session_id: str, payload: dict):
+        """
+        Replaces the stored payload for a session.
+        """
+        blob = serialization.dumps(payload)
+        if self._redis_available():
+            try:
+                await self.redis.set(self.prefix + session_id, blob, ex=self.ttl)
+                self._fallback.pop(session_id, None)
+                return
+            except (RedisError, OSError) as e:
+                self._redis_failed(e)
+        self._fallback[session_id] = blob
+
+    async def load(self, session_id: str) -> Optional[dict]:
+        """
+        Returns the stored payload for a session, or None if there is none.
+        """
+        blob = self._fallback.get(session_id)
+        if blob is None and self._redis_available():
+            try:
+                blob = await self.redis.get(self.prefix + session_id)
+            except (RedisError, OSError) as e:
+                self._redis_failed(e)
+        return serialization.loads(blob) if blob is not None else None
+
+    async def delete(self, session_id: str):
+        self._fallback.pop(session_id, None)
+        if self._redis_available():
+            try:
+                await self.redis.delete(self.prefix + session_id)
+            except (RedisError, OSError) as e:
+                self._redis_failed(e)
+
+
+# In-process only until each worker connects Redis at startup (app/db.py)
+session_store = SessionStore(redis_client=None, ttl=settings.SESSION_TTL)
@@ -0,0 +1,210 @@
+"""
+Rule-compiled targeting engine for dynamic content (banners and offers).
+
+A rule is a dict like:
+
+    {
+        "rule_id": "smartphone_accessories",
+        "priority": 100,
+        "conditions": {"interaction.last_clicked_item": "Smartphone",
+                       "preferences.preferred_category": ["electronics", "audio"]},
+        "content": {"banner": "...", "offers": [...]}
+    }
+
+All conditions must hold; a list means "any of these values". Facts use the same attribute names:
+`preferences.*` from the profile, `orders.product_id`/`orders.product` from recent orders and
+`interaction.*` from the request's interaction context.
+
+Rules are compiled into per-attribute postings (value -> bitset of rules requiring it) over
+rules sorted by priority, so evaluation is a few bitset intersections per attribute and the
+winning rule is the lowest set bit. Rules are read from a JSON file that is re-checked for
+changes every few seconds, so edits (or POST /personalization/targeting-rules in any worker)
+reach every worker without a restart. Until rules are first set, the seed rules shipped in
+app/core/targeting_rules.json are served; changes are only ever written to TARGETING_RULES_PATH,
+under a lock file shared by the workers.
+"""
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("app_logger")
+
+
+def _values(value) -> List[str]:
+    if isinstance(value, (list, tuple, set)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+def _bitset(positions: List[int], size: int) -> int:
+    # Built through a bytearray: OR-ing bits into a growing int is quadratic for large rule sets
+    bitmap = bytearray((size + 7) // 8)
+    for position in positions:
+        bitmap[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bitmap, "little")
+
+
+def validate_rule(rule: dict):
+    if not isinstance(rule, dict) or not rule.get("rule_id"):
+        raise ValueError("Every targeting rule needs a rule_id")
+    if not isinstance(rule.get("content"), dict):
+        raise ValueError(f"Rule {rule['rule_id']}: content must be an object")
+    if not isinstance(rule.get("conditions", {}), dict):
+        raise ValueError(f"Rule {rule['rule_id']}: conditions must be an object")
+    if not isinstance(rule.get("priority", 0), (int, float)):
+        raise ValueError(f"Rule {rule['rule_id']}: priority must be a number")
+
+
+class CompiledRules:
+    def __init__(self, rules: List[dict]):
+        for rule in rules:
+            validate_rule(rule)
+        # Highest priority first; ties keep definition order
+        self.rules = sorted(rules, key=lambda rule: -rule.get("priority", 0))
+        self.all_rules = (1 << len(self.rules)) - 1
+        constrained: Dict[str, List[int]] = {}
+        postings: Dict[str, Dict[str, List[int]]] = {}
+        for position, rule in enumerate(self.rules):
+            for attribute, expected in rule.get("conditions", {}).items():
+                constrained.setdefault(attribute, []).append(position)
+                for value in _values(expected):
+                    postings.setdefault(attribute, {}).setdefault(value, []).append(position)
+        size = len(self.rules)
+        self.constrained: Dict[str, int] = {attribute: _bitset(positions, size) for attribute, positions in constrained.items()}
+        self.postings: Dict[str, Dict[str, int]] = {
+            attribute: {value: _bitset(positions, size) for value, positions in values.items()}
+            for attribute, values in postings.items()
+        }
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, facts: Dict[str, Iterable[str]]) -> int:
+        """
+        Bitset of rules whose conditions all hold for `facts`.
+        """
+        candidates = self.all_rules
+        for attribute, constrained in self.constrained.items():
+            satisfied = 0
+            postings = self.postings[attribute]
+            for value in facts.get(attribute, ()):
+                satisfied |= postings.get(value, 0)
+            # Rules that don't constrain this attribute stay candidates
+            candidates &= satisfied | ~constrained
+            if not candidates:
+                break
+        return candidates
+
+    def evaluate(self, facts: Dict[str, Iterable[str]], limit: int = 1) -> List[dict]:
+        """
+        Matching rules, highest priority first.
+        """
+        candidates = self.match(facts)
+        matched = []
+        while candidates and len(matched) < limit:
+            lowest = candidates & -candidates
+            matched.append(self.rules[lowest.bit_length() - 1])
+            candidates ^= lowest
+        return matched
+
+
+def customer_facts(offers: dict, interaction_context: dict) -> Dict[str, List[str]]:
+    """
+    Flattens profile preferences, recent orders and the interaction context into targeting facts.
+    """
+    facts: Dict[str, List[str]] = {}
+    for key, value in (offers.get("preferences") or {}).items():
+        facts[f"preferences.{key}"] = _values(value)
+    for field in ("product_id", "product"):
+        values = [str(order[field]) for order in offers.get("recent_orders", []) if order.get(field) is not None]
+        if values:
+            facts[f"orders.{field}"] = values
+    for key, value in (interaction_context or {}).items():
+        if value is not None and not isinstance(value, dict):
+            facts[f"interaction.{key}"] = _values(value)
+    return facts
+
+
+class TargetingEngine:
+    def __init__(self, rules_path: str, check_interval: float = 2.0, seed_path: Optional[str] = None):
+        """
+        :param rules_path: JSON file holding the list of rule definitions
+        :param check_interval: Seconds between checks of the file for changes
+        :param seed_path: Read-only rules shipped with the code, served until `rules_path` first exists
+        """
+        self.rules_path = rules_path
+        self.check_interval = check_interval
+        self.seed_path = seed_path
+        self._compiled = CompiledRules([])
+        self._stamp: Optional[tuple] = None
+        self._checked_at = 0.0
+
+    @property
+    def compiled(self) -> CompiledRules:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self.reload_if_changed()
+        return self._compiled
+
+    def _source(self) -> str:
+        if self.seed_path and not os.path.exists(self.rules_path):
+            return self.seed_path
+        return self.rules_path
+
+    def reload_if_changed(self) -> bool:
+        path = self._source()
+        try:
+            stamp = (path, os.stat(path).st_mtime)
+        except FileNotFoundError:
+            return False
+        if stamp == self._stamp:
+            return False
+        try:
+            with open(path) as f:
+                compiled = CompiledRules(json.load(f))
+        except (ValueError, OSError) as e:
+            # Keep serving the previous rule set if the new file is broken
+            logger.error(f"Targeting rules in {path} not loaded: {e}")
+            self._stamp = stamp
+            return False
+        self._compiled, self._stamp = compiled, stamp
+        logger.info(f"Loaded {len(compiled)} targeting rules")
+        return True
+
+    def replace_rules(self, rules: List[dict]) -> int:
+        """
+        Validates and compiles `rules`, persists them and swaps them in. Raises ValueError for invalid rules.
+        """
+        compiled = CompiledRules(rules)
+        directory = os.path.dirname(self.rules_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.rules_path + ".lock", "w") as lock:
+            # Workers writing at the same time would otherwise share the temporary file and publish a torn one
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(self.rules_path + ".tmp", "w") as f:
+                json.dump(rules, f, indent=2)
+            os.replace(self.rules_path + ".tmp", self.rules_path)
+            self._compiled, self._stamp = compiled, (self.rules_path, os.stat(self.rules_path).st_mtime)
+        return len(compiled)
+
+    def select(self, facts: Dict[str, Iterable[str]]) -> Optional[dict]:
+        """
+        Content of the highest-priority matching rule, or None.
+        """
+        matched = self.compiled.evaluate(facts, limit=1)
+        return matched[0]["content"] if matched else None
+
+
+targeting_engine = TargetingEngine(settings.TARGETING_RULES_PATH, seed_path=settings.TARGETING_SEED_RULES_PATH)
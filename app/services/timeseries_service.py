@@ -0,0 +1,424 @@
+"""
+Embedded time-series history of the live metrics (see app/services/metrics_service.py).
+
+Every TIMESERIES_INTERVAL seconds one worker (whoever holds the writer lock) reads the combined
+metrics of all workers and records a sample per series: a gauge value (CPU, memory, ...), a rate
+derived from a counter, or the histogram of observations made since the previous sample
+(latencies, confidence).
+
+Each series has three tiers, all memory-mapped ring buffers of fixed-width float64 rows: raw
+samples, 1-minute and 1-hour rollups. A row is [bucket, count, sum, min, max, sketch...], where
+`bucket` is the time bucket number (so rows recycled from an older lap are recognised) and the
+sketch is a fixed-bucket histogram: the metric's own latency buckets for histogram series, log-
+spaced bounds for gauges and rates. Sketches merge by addition, so rollups keep min/max/avg and
+an approximate p95 without holding the samples. Rollup rows are merged in place as samples
+arrive, so a restart loses nothing but the sample in flight.
+
+Range queries pick the finest tier that still holds the start of the range and returns at most
+MAX_POINTS points, and read only the rows in the range.
+
+Each sample is also handed to the recorder's listeners (the alert evaluator) as one value per
+metric: gauges and rates by series name, histograms as "<series>.avg" and "<series>.p95" of the
+observations since the previous sample.
+"""
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services import metrics_service as m
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("app_logger")
+
+MAX_POINTS = 1500
+HISTOGRAM_STATISTICS = ("avg", "p95")
+HEADER = 5
+BUCKET, COUNT, SUM, MIN, MAX = range(HEADER)
+SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def log_bounds(low: float, high: float, n: int = 32) -> Tuple[float, ...]:
+    return tuple(np.geomspace(low, high, n).tolist())
+
+
+class SeriesSpec:
+    def __init__(self, name: str, kind: str, bounds: Tuple[float, ...], extract: Callable[[dict], object]):
+        """
+        :param kind: "gauge" (value as sampled), "rate" (per-second increase of a cumulative total)
+            or "histogram" (increase of cumulative [bucket counts..., sum] between samples)
+        :param bounds: Sketch bucket upper bounds; values above the last go to an overflow bucket
+        :param extract: Reads the current value from `MetricsRegistry.collect()` output (None if absent)
+        """
+        self.name = name
+        self.kind = kind
+        self.bounds = bounds
+        self.extract = extract
+        self.width = HEADER + len(bounds) + 1
+
+
+class Tier:
+    def __init__(self, name: str, resolution: int, retention: int):
+        self.name = name
+        self.resolution = resolution
+        self.slots = max(retention // resolution, 1)
+
+    @property
+    def retention(self) -> int:
+        return self.slots * self.resolution
+
+
+class SeriesRing:
+    """
+    One tier of one series, memory-mapped from <directory>/<series>/<tier>.npy.
+    """
+    def __init__(self, path: str, slots: int, width: int, writable: bool):
+        self.path = path
+        self.slots = slots
+        self.width = width
+        self.writable = writable
+        self._rows: Optional[np.ndarray] = None
+
+    def rows(self, create: bool = False) -> Optional[np.ndarray]:
+        if self._rows is None:
+            shape = (self.slots, self.width)
+            rows = None
+            if os.path.exists(self.path):
+                try:
+                    rows = np.load(self.path, mmap_mode="r+" if self.writable else "r")
+                except (ValueError, OSError):
+                    rows = None
+                if rows is not None and rows.shape != shape:
+                    rows = None
+            if rows is None:
+                if not (create and self.writable):
+                    return None
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                rows = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.float64, shape=shape)
+                rows[:, BUCKET] = -1
+            self._rows = rows
+        return self._rows
+
+    def merge(self, bucket: int, count: float, total: float, low: float, high: float, sketch: np.ndarray):
+        rows = self.rows(create=True)
+        row = rows[bucket % self.slots]
+        if row[BUCKET] != bucket:
+            row[COUNT:] = 0
+            row[MIN], row[MAX] = math.inf, -math.inf
+        row[COUNT] += count
+        row[SUM] += total
+        row[MIN] = min(row[MIN], low)
+        row[MAX] = max(row[MAX], high)
+        row[HEADER:] += sketch
+        # Written last, so a concurrent reader never takes a half-reset row for this bucket
+        row[BUCKET] = bucket
+
+    def read(self, first: int, last: int) -> np.ndarray:
+        """
+        Rows of buckets [first, last] still held, oldest first.
+        """
+        rows = self.rows()
+        if rows is None or last < first:
+            return np.empty((0, self.width))
+        first = max(first, last - self.slots + 1)
+        buckets = np.arange(first, last + 1)
+        selected = rows[buckets % self.slots]
+        return selected[selected[:, BUCKET] == buckets]
+
+
+class TimeSeriesStore:
+    def __init__(self, directory: str, tiers: List[Tier], writable: bool = True):
+        self.directory = directory
+        self.tiers = tiers
+        self.writable = writable
+        self._rings: Dict[Tuple[str, str], SeriesRing] = {}
+
+    def ring(self, spec: SeriesSpec, tier: Tier) -> SeriesRing:
+        key = (spec.name, tier.name)
+        ring = self._rings.get(key)
+        if ring is None:
+            path = os.path.join(self.directory, SAFE_NAME.sub("_", spec.name), f"{tier.name}.npy")
+            ring = self._rings[key] = SeriesRing(path, tier.slots, spec.width, self.writable)
+        return ring
+
+    def record(self, spec: SeriesSpec, timestamp: float, count: float, total: float, low: float, high: float,
+               sketch: np.ndarray):
+        """
+        Adds one sample (already reduced to count/sum/min/max and a sketch) to every tier.
+        """
+        for tier in self.tiers:
+            self.ring(spec, tier).merge(int(timestamp // tier.resolution), count, total, low, high, sketch)
+
+    def record_value(self, spec: SeriesSpec, timestamp: float, value: float):
+        sketch = np.zeros(len(spec.bounds) + 1)
+        sketch[bisect_left(spec.bounds, value)] = 1
+        self.record(spec, timestamp, 1, value, value, value, sketch)
+
+    def record_histogram(self, spec: SeriesSpec, timestamp: float, buckets: np.ndarray, total: float):
+        """
+        Adds observations given as per-bucket counts (over spec.bounds plus overflow) and their sum.
+        """
+        count = float(buckets.sum())
+        if count <= 0:
+            return
+        filled = np.flatnonzero(buckets)
+        # Histograms don't keep extremes: take the edges of the outermost non-empty buckets
+        low = spec.bounds[filled[0] - 1] if filled[0] > 0 else 0.0
+        high = spec.bounds[min(filled[-1], len(spec.bounds) - 1)]
+        self.record(spec, timestamp, count, total, low, high, buckets)
+
+    def choose_tier(self, start: float, end: float, now: float) -> Tier:
+        for tier in self.tiers:
+            if start >= now - tier.retention and (end - start) / tier.resolution <= MAX_POINTS:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, spec: SeriesSpec, start: float, end: float, now: Optional[float] = None) -> dict:
+        """
+        Points in [start, end) from the finest tier that covers the range.
+        """
+        now = now if now is not None else time.time()
+        tier = self.choose_tier(start, end, now)
+        # Nothing is recorded past the current bucket; don't let a far-future end push the ring window past it
+        end = min(end, (now // tier.resolution + 1) * tier.resolution)
+        rows = self.ring(spec, tier).read(int(start // tier.resolution), int(math.ceil(end / tier.resolution)) - 1)
+        counts = rows[:, COUNT]
+        has_data = counts > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            averages = np.round(rows[:, SUM] / counts, 6)
+        # Sketch buckets are coarse; the exact extremes bound the estimate
+        p95 = np.clip(sketch_quantiles(spec.bounds, rows[:, HEADER:], 0.95), rows[:, MIN], rows[:, MAX])
+        points = [
+            {"timestamp": bucket * tier.resolution, "count": count,
+             "avg": average if present else None, "min": low if present else None,
+             "max": high if present else None, "p95": quantile if present else None}
+            for bucket, count, average, low, high, quantile, present in zip(
+                rows[:, BUCKET].tolist(), counts.tolist(), averages.tolist(), rows[:, MIN].tolist(),
+                rows[:, MAX].tolist(), p95.tolist(), has_data.tolist())
+        ]
+        return {"series": spec.name, "tier": tier.name, "resolution_seconds": tier.resolution, "points": points}
+
+
+def sketch_quantiles(bounds: Tuple[float, ...], sketches: np.ndarray, q: float) -> np.ndarray:
+    """
+    Per-row quantile of sketches (rows of bucket counts), interpolated inside the bucket as
+    `metrics_service.bucket_quantile`; NaN for empty rows.
+    """
+    cumulative = np.cumsum(sketches, axis=1)
+    total = cumulative[:, -1] if len(cumulative) else np.empty(0)
+    rank = q * total
+    position = np.minimum((cumulative < rank[:, None]).sum(axis=1), len(bounds))
+    edges = np.asarray((0.0,) + tuple(bounds) + (bounds[-1],))
+    lower, upper = edges[position], edges[position + 1]
+    rows = np.arange(len(sketches))
+    below = np.where(position > 0, cumulative[rows, np.maximum(position - 1, 0)], 0.0)
+    in_bucket = sketches[rows, position]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = np.where(in_bucket > 0, (rank - below) / in_bucket, 1.0)
+        result = np.round(lower + (upper - lower) * fraction, 6)
+    return np.where(total > 0, result, np.nan)
+
+
+# Series recorded from the live metrics
+
+def _histogram(metric: m.Metric, where: Optional[Callable[[dict], bool]] = None):
+    def extract(collected: dict):
+        values = None
+        for key, value in collected.get(metric.name, {}).items():
+            if where is None or where(dict(zip(metric.labelnames, key))):
+                values = value.copy() if values is None else values + value
+        return values
+    return extract
+
+
+def _histogram_count(metric: m.Metric, where: Optional[Callable[[dict], bool]] = None):
+    histogram = _histogram(metric, where)
+
+    def extract(collected: dict):
+        values = histogram(collected)
+        return float(values[:-1].sum()) if values is not None else None
+    return extract
+
+
+def _gauge(metric: m.Metric):
+    return lambda collected: m.gauge_value(collected, metric)
+
+
+RATE_BOUNDS = log_bounds(0.01, 1e6)
+SYSTEM_SERIES = [
+    SeriesSpec("system.cpu_percent", "gauge", log_bounds(0.1, 10_000), _gauge(m.process_cpu_percent)),
+    SeriesSpec("system.memory_bytes", "gauge", log_bounds(1e6, 1e12), _gauge(m.process_resident_memory)),
+    SeriesSpec("system.open_fds", "gauge", log_bounds(1, 1e6), _gauge(m.process_open_fds)),
+    SeriesSpec("system.requests_in_flight", "gauge", log_bounds(1, 1e5), _gauge(m.http_requests_in_flight)),
+    SeriesSpec("system.event_loop_lag_seconds", "gauge", log_bounds(1e-5, 100), _gauge(m.event_loop_lag_max)),
+    SeriesSpec("http.request_rate", "rate", RATE_BOUNDS, _histogram_count(m.http_request_duration)),
+    SeriesSpec("http.server_error_rate", "rate", RATE_BOUNDS,
+               _histogram_count(m.http_request_duration, lambda labels: labels["status"].startswith("5"))),
+    SeriesSpec("http.latency_seconds", "histogram", m.http_request_duration.buckets,
+               _histogram(m.http_request_duration)),
+    SeriesSpec("mongo.command_rate", "rate", RATE_BOUNDS, _histogram_count(m.mongo_command_duration)),
+    SeriesSpec("mongo.latency_seconds", "histogram", m.mongo_command_duration.buckets,
+               _histogram(m.mongo_command_duration)),
+    SeriesSpec("redis.latency_seconds", "histogram", m.redis_command_duration.buckets,
+               _histogram(m.redis_command_duration)),
+]
+
+
+def model_series(version: str) -> List[SeriesSpec]:
+    """
+    Per model version: prediction rate, served confidence and inference latency.
+    """
+    by_version = lambda labels: labels["model_version"] == version
+    return [
+        SeriesSpec(f"model.{version}.prediction_rate", "rate", RATE_BOUNDS,
+                   _histogram_count(m.intent_confidence, by_version)),
+        SeriesSpec(f"model.{version}.confidence", "histogram", m.intent_confidence.buckets,
+                   _histogram(m.intent_confidence, by_version)),
+        SeriesSpec(f"model.{version}.inference_seconds", "histogram", m.intent_inference_duration.buckets,
+                   _histogram(m.intent_inference_duration, by_version)),
+    ]
+
+
+class MetricsRecorder:
+    """
+    Samples the live metrics into the store on a fixed tick, in the worker holding the writer lock.
+    """
+    def __init__(self, store: TimeSeriesStore, registry: m.MetricsRegistry, interval: float):
+        self.store = store
+        self.registry = registry
+        self.interval = interval
+        self._previous: Dict[str, object] = {}
+        self._previous_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock_file = None
+        # Called with (timestamp, {metric: value}) after every sample
+        self.listeners: List[Callable[[float, Dict[str, float]], None]] = []
+
+    def specs(self, collected: Optional[dict] = None) -> Dict[str, SeriesSpec]:
+        """
+        Every known series: the system ones and those of each model version that has served traffic.
+        """
+        specs = {spec.name: spec for spec in SYSTEM_SERIES}
+        if collected is not None:
+            versions = {key[0] for key in collected.get(m.intent_confidence.name, {})}
+        elif os.path.isdir(self.store.directory):
+            # "model.<version>.<series>" directories recorded so far
+            versions = {name[len("model."):].rsplit(".", 1)[0] for name in os.listdir(self.store.directory)
+                        if name.startswith("model.")}
+        else:
+            versions = set()
+        for version in versions:
+            specs.update({spec.name: spec for spec in model_series(version)})
+        return specs
+
+    def metric_names(self) -> List[str]:
+        """
+        Names of the values handed to listeners.
+        """
+        names = []
+        for spec in self.specs().values():
+            if spec.kind == "histogram":
+                names.extend(f"{spec.name}.{statistic}" for statistic in HISTOGRAM_STATISTICS)
+            else:
+                names.append(spec.name)
+        return names
+
+    def sample(self, now: Optional[float] = None):
+        now = now if now is not None else time.time()
+        collected = self.registry.collect()
+        elapsed = now - self._previous_at if self._previous_at is not None else None
+        values: Dict[str, float] = {}
+        for spec in self.specs(collected).values():
+            value = spec.extract(collected)
+            if value is None:
+                continue
+            if spec.kind == "gauge":
+                self.store.record_value(spec, now, value)
+                values[spec.name] = value
+                continue
+            previous = self._previous.get(spec.name)
+            self._previous[spec.name] = value
+            if not elapsed:
+                continue
+            if previous is None:
+                # First seen since the last sample (the first sample only primes the totals)
+                previous = value * 0
+            delta = value - previous
+            # A total that went down means workers restarted; count what is there now
+            if np.any(np.asarray(delta) < 0):
+                delta = value
+            if spec.kind == "rate":
+                self.store.record_value(spec, now, delta / elapsed)
+                values[spec.name] = delta / elapsed
+            else:
+                self.store.record_histogram(spec, now, delta[:-1], float(delta[-1]))
+                count = float(delta[:-1].sum())
+                if count > 0:
+                    values[f"{spec.name}.avg"] = float(delta[-1]) / count
+                    values[f"{spec.name}.p95"] = m.bucket_quantile(spec.bounds, delta[:-1], 0.95)
+        self._previous_at = now
+        for listener in self.listeners:
+            try:
+                listener(now, values)
+            except Exception as e:
+                logger.error(f"Metrics listener failed: {e}")
+
+    def _acquire_writer_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        os.makedirs(self.store.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.store.directory, "writer.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Workers without the lock keep trying, so another one takes over if the writer exits
+            if self._lock_file is not None or self._acquire_writer_lock():
+                try:
+                    await loop.run_in_executor(None, self.sample)
+                except Exception as e:
+                    logger.error(f"Recording metrics history failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+TIERS = [
+    Tier("raw", settings.TIMESERIES_INTERVAL, settings.TIMESERIES_RAW_RETENTION_HOURS * 3600),
+    Tier("1m", 60, settings.TIMESERIES_MINUTE_RETENTION_DAYS * 86400),
+    Tier("1h", 3600, settings.TIMESERIES_HOUR_RETENTION_DAYS * 86400),
+]
+timeseries_store = TimeSeriesStore(settings.TIMESERIES_DIR, TIERS)
+metrics_recorder = MetricsRecorder(timeseries_store, m.metrics, settings.TIMESERIES_INTERVAL)
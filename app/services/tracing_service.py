@@ -0,0 +1,277 @@
+"""
+Per-request tracing on the OpenTelemetry API, exported locally.
+
+When TRACING_ENABLED is set, `TracingMiddleware` starts a server span for TRACE_SAMPLE_RATE of the
+requests (or continues the caller's trace from a W3C `traceparent` header), and the hot paths add
+child spans: MongoDB commands (`mongo_command_tracing`, a pymongo listener), Redis commands, TTS,
+intent classification and Celery publishes. Celery tasks continue the trace of the request that
+queued them. Finished spans are kept in memory for /monitoring/traces (the last TRACE_MEMORY_SPANS)
+and, if TRACE_FILE is set, appended to it as OTLP-style JSON lines by a background thread.
+
+Child spans are only started inside a recorded trace: with tracing off, or for requests that were
+not sampled, `tracing.span()` and `@traced` cost one flag or context lookup and return a shared
+no-op, and the middleware isn't installed at all.
+"""
+import functools
+import inspect
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Sequence
+
+import redis
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from pymongo import monitoring
+
+from app.core.config import settings
+
+logger = logging.getLogger("app_logger")
+
+SERVICE_NAME = "ai-customer-care"
+
+# Entered when nothing is traced; `as span` gives a span whose methods do nothing
+_NO_SPAN = nullcontext(trace.INVALID_SPAN)
+
+
+class RecentSpans(SpanExporter):
+    """
+    The last `max_spans` finished spans of this process, for /monitoring/traces.
+    """
+    def __init__(self, max_spans: int):
+        self.spans: deque = deque(maxlen=max_spans)
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        self.spans.extend(spans)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+    def trace(self, trace_id: str) -> List[ReadableSpan]:
+        wanted = int(trace_id, 16)
+        return sorted((s for s in list(self.spans) if s.context.trace_id == wanted), key=lambda s: s.start_time)
+
+    def roots(self, limit: int) -> List[ReadableSpan]:
+        """
+        Most recent spans that started a trace in this process (requests and Celery tasks), newest first.
+        """
+        found = []
+        for span in reversed(list(self.spans)):
+            if span.parent is None or span.parent.is_remote:
+                found.append(span)
+                if len(found) == limit:
+                    break
+        return found
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """
+    Appends spans to `path`, one JSON object per line.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        text = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        try:
+            with self._lock:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(text)
+        except OSError as e:
+            logger.error(f"Could not write spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+class Tracing:
+    """
+    Holds this process's tracer; a no-op until `setup()` is called with tracing enabled.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.tracer: trace.Tracer = trace.NoOpTracer()
+        self.provider: Optional[TracerProvider] = None
+        self.recent: Optional[RecentSpans] = None
+
+    def setup(self, enabled: Optional[bool] = None, sample_rate: Optional[float] = None,
+              file_path: Optional[str] = None, memory_spans: Optional[int] = None):
+        """
+        Creates the tracer provider and exporters from settings (arguments override). Safe to call more than once.
+        """
+        enabled = settings.TRACING_ENABLED if enabled is None else enabled
+        if not enabled or self.provider is not None:
+            return
+        sample_rate = settings.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        file_path = settings.TRACE_FILE if file_path is None else file_path
+        provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}),
+                                  sampler=ParentBased(TraceIdRatioBased(sample_rate)))
+        self.recent = RecentSpans(settings.TRACE_MEMORY_SPANS if memory_spans is None else memory_spans)
+        provider.add_span_processor(SimpleSpanProcessor(self.recent))
+        if file_path:
+            provider.add_span_processor(BatchSpanProcessor(JsonLinesSpanExporter(file_path)))
+        self.provider = provider
+        self.tracer = provider.get_tracer("app")
+        self.enabled = True
+
+    def shutdown(self):
+        if self.provider is not None:
+            self.provider.shutdown()
+
+    def span(self, name: str, kind: SpanKind = SpanKind.INTERNAL, attributes: Optional[dict] = None):
+        """
+        Context manager for a child span of the current one. When there is no recorded span to
+        attach to, this is a shared no-op.
+        """
+        if not self.enabled or not trace.get_current_span().is_recording():
+            return _NO_SPAN
+        return self.tracer.start_as_current_span(name, kind=kind, attributes=attributes)
+
+
+tracing = Tracing()
+
+
+def traced(name: str):
+    """
+    Decorator running the function (sync or async) inside `tracing.span(name)`.
+    """
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not tracing.enabled:
+                    return await fn(*args, **kwargs)
+                with tracing.span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not tracing.enabled:
+                return fn(*args, **kwargs)
+            with tracing.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class MongoCommandTracing(monitoring.CommandListener):
+    """
+    A client span per MongoDB command; pass as `event_listeners=[mongo_command_tracing]` to the client.
+
+    pymongo calls the listener on the thread that runs the command, so spans attach to the request
+    being served there.
+    """
+    def __init__(self):
+        self._spans: Dict[int, trace.Span] = {}
+
+    def started(self, event):
+        if not tracing.enabled or not trace.get_current_span().is_recording():
+            return
+        collection = event.command.get(event.command_name)
+        attributes = {"db.system": "mongodb", "db.name": event.database_name, "db.operation": event.command_name}
+        if isinstance(collection, str):
+            attributes["db.mongodb.collection"] = collection
+        self._spans[event.request_id] = tracing.tracer.start_span(f"mongodb {event.command_name}",
+                                                                  kind=SpanKind.CLIENT, attributes=attributes)
+
+    def succeeded(self, event):
+        span = self._spans.pop(event.request_id, None)
+        if span is not None:
+            span.end()
+
+    def failed(self, event):
+        span = self._spans.pop(event.request_id, None)
+        if span is not None:
+            span.set_status(Status(StatusCode.ERROR, str(event.failure)))
+            span.end()
+
+
+mongo_command_tracing = MongoCommandTracing()
+
+
+class TracedRedis(redis.StrictRedis):
+    """
+    Synchronous Redis client with a client span per command.
+    """
+    def execute_command(self, *args, **options):
+        command = args[0] if isinstance(args[0], str) else args[0].decode()
+        with tracing.span(f"redis {command}", SpanKind.CLIENT, {"db.system": "redis"}):
+            return super().execute_command(*args, **options)
+
+
+def inject_context(carrier: dict, span: Optional[trace.Span] = None):
+    """
+    Writes the W3C trace context of `span` (default: the current one) into `carrier`.
+    """
+    context = trace.set_span_in_context(span) if span is not None else None
+    propagate.inject(carrier, context=context)
+
+
+class _AttributeGetter:
+    # Celery exposes custom message headers as attributes of `task.request`
+    def get(self, carrier, key: str):
+        value = getattr(carrier, key, None)
+        return [value] if isinstance(value, str) else None
+
+    def keys(self, carrier):
+        return []
+
+
+def extract_context(carrier, from_attributes: bool = False):
+    """
+    Trace context sent by the caller, from a header dict (or an object's attributes).
+    """
+    if from_attributes:
+        return propagate.extract(carrier, getter=_AttributeGetter())
+    return propagate.extract(carrier)
+
+
+def span_to_dict(span: ReadableSpan, origin_ns: int) -> dict:
+    return {
+        "name": span.name,
+        "span_id": format(span.context.span_id, "016x"),
+        "parent_id": format(span.parent.span_id, "016x") if span.parent is not None else None,
+        "kind": span.kind.name,
+        "start_ms": round((span.start_time - origin_ns) / 1e6, 3),
+        "duration_ms": round((span.end_time - span.start_time) / 1e6, 3),
+        "status": span.status.status_code.name,
+        "attributes": dict(span.attributes or {}),
+    }
+
+
+def trace_to_dict(spans: List[ReadableSpan]) -> dict:
+    """
+    Spans of one trace with offsets from its start, and where the time went: the self time of the
+    spans (minus their children) summed per kind of work, i.e. the span name up to the first space
+    or dot (mongodb, redis, tts, intent, GET, ...).
+    """
+    origin = min(span.start_time for span in spans)
+    children_ns: Dict[int, int] = {}
+    for span in spans:
+        if span.parent is not None:
+            children_ns[span.parent.span_id] = children_ns.get(span.parent.span_id, 0) + span.end_time - span.start_time
+    breakdown: Dict[str, float] = {}
+    for span in spans:
+        category = span.name.replace(".", " ").split(" ", 1)[0]
+        own_ns = max(span.end_time - span.start_time - children_ns.get(span.context.span_id, 0), 0)
+        breakdown[category] = breakdown.get(category, 0.0) + own_ns / 1e6
+    return {
+        "trace_id": format(spans[0].context.trace_id, "032x"),
+        "duration_ms": round((max(span.end_time for span in spans) - origin) / 1e6, 3),
+        "breakdown_ms": {category: round(ms, 3) for category, ms in sorted(breakdown.items(), key=lambda kv: -kv[1])},
+        "spans": [span_to_dict(span, origin) for span in spans],
+    }
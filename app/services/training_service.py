@@ -0,0 +1,482 @@
+"""
+Background retraining of the support intent classifier.
+
+Training data is streamed from MongoDB in chunks: feedback records whose `ai_response` carries the
+query, labelled by their latest human annotation (when it names an intent) or by the served intent
+when the customer rated the answer positively, plus curated examples added through
+/add-training-data. One example in HOLDOUT_MODULUS is held out for evaluation.
+
+A job trains the hashed linear model (`LinearIntentModel`) with mini-batch SGD on the softmax
+loss, starting from the weights of the version it retrains. The time window is split into shards
+that worker processes train in parallel, each from the same starting weights; their updates are
+averaged (weighted by examples) at the end of every epoch. Workers report examples read through a
+shared counter, which gives progress and ETA. The result is stored and registered in the model
+registry, ready to deploy.
+
+Job status is written to RETRAIN_DIR as JSON, so /retrain-status answers from any worker. One job
+runs at a time across all workers: it holds an flock on <RETRAIN_DIR>/job.lock until it ends, which
+the system also releases if its process dies.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.db import get_db
+from app.services.experiment_service import feedback_outcome
+from app.services.feedback_service import (ANNOTATIONS_COLLECTION, FEEDBACK_COLLECTION, feedback_store, id_range,
+                                           object_id_at)
+from app.services.model_registry import ModelRegistry, model_registry
+from app.services.nlp_service import LinearIntentModel, hashed_features
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("app_logger")
+
+TRAINING_DATA_COLLECTION = "training_data"
+HOLDOUT_MODULUS = 20
+BATCH_SIZE = 32
+SHARDS_PER_PROCESS = 4
+VERSION_PATTERN = re.compile(r"^(.*?)(\d+)$")
+
+# Set in each pool worker by `_init_worker`
+_worker_progress = None
+
+
+def next_version(version: str) -> str:
+    """
+    "v1.3" -> "v1.4", "v2" -> "v3". Raises ValueError if the version doesn't end in a number.
+    """
+    match = VERSION_PATTERN.match(version)
+    if match is None:
+        raise ValueError(f"Can't derive the next version of {version!r}")
+    return f"{match.group(1)}{int(match.group(2)) + 1}"
+
+
+def is_holdout(text: str) -> bool:
+    return zlib.crc32(text.encode()) % HOLDOUT_MODULUS == 0
+
+
+def add_training_examples(db, source: str, examples: List[dict]) -> Tuple[int, int]:
+    """
+    Stores curated {"text", "intent"} examples; returns (stored, skipped) counts.
+    """
+    created_at = datetime.utcnow()
+    documents = [{"_id": object_id_at(created_at), "source": source, "text": example["text"],
+                  "intent": example["intent"], "created_at": created_at}
+                 for example in examples
+                 if isinstance(example.get("text"), str) and example["text"].strip()
+                 and isinstance(example.get("intent"), str) and example["intent"]]
+    if documents:
+        db[TRAINING_DATA_COLLECTION].insert_many(documents)
+    return len(documents), len(examples) - len(documents)
+
+
+class FeedbackTrainingSource:
+    """
+    Labelled examples in MongoDB. Picklable: each worker process opens its own connection.
+    """
+    def __init__(self, db_factory: Callable = get_db):
+        self.db_factory = db_factory
+        self._db = None
+
+    def __getstate__(self):
+        return {"db_factory": self.db_factory, "_db": None}
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = self.db_factory()
+        return self._db
+
+    def count(self, start: datetime, end: datetime) -> int:
+        query = {"_id": id_range(start, end), "created_at": {"$gte": start, "$lt": end}}
+        return (self.db[FEEDBACK_COLLECTION].count_documents(query)
+                + self.db[TRAINING_DATA_COLLECTION].count_documents(query))
+
+    def labels(self, start: datetime, end: datetime) -> List[str]:
+        query = {"_id": id_range(start, end), "created_at": {"$gte": start, "$lt": end}}
+        return sorted(self.db[TRAINING_DATA_COLLECTION].distinct("intent", query))
+
+    def chunks(self, start: datetime, end: datetime, labels: List[str],
+               chunk_size: int) -> Iterator[Tuple[List[str], List[int], int]]:
+        """
+        Yields (texts, label indices, documents read) per chunk of documents created in [start, end).
+        """
+        label_index = {label: i for i, label in enumerate(labels)}
+        batch = []
+        for document in feedback_store.iter_range(self.db, start, end, batch_size=chunk_size):
+            batch.append(document)
+            if len(batch) == chunk_size:
+                yield self._label_feedback(batch, label_index)
+                batch = []
+        if batch:
+            yield self._label_feedback(batch, label_index)
+
+        texts, ys, read = [], [], 0
+        for document in feedback_store.iter_range(self.db, start, end, batch_size=chunk_size,
+                                                  collection=TRAINING_DATA_COLLECTION):
+            read += 1
+            if document["intent"] in label_index:
+                texts.append(document["text"])
+                ys.append(label_index[document["intent"]])
+            if read == chunk_size:
+                yield texts, ys, read
+                texts, ys, read = [], [], 0
+        if read:
+            yield texts, ys, read
+
+    def _label_feedback(self, documents: List[dict], label_index: Dict[str, int]) -> Tuple[List[str], List[int], int]:
+        ids = [str(document["_id"]) for document in documents]
+        corrections = {}
+        # Oldest first, so the latest annotation of each record wins
+        for event in self.db[ANNOTATIONS_COLLECTION].find({"feedback_id": {"$in": ids}}).sort("_id", 1):
+            corrections[event["feedback_id"]] = event["corrected_response"]
+        texts, ys = [], []
+        for feedback_id, document in zip(ids, documents):
+            response = document.get("ai_response") or {}
+            text = response.get("query")
+            if not isinstance(text, str) or not text:
+                continue
+            label = corrections.get(feedback_id)
+            if label is None and feedback_outcome(document.get("feedback") or {}):
+                label = response.get("intent")
+            if label in label_index:
+                texts.append(text)
+                ys.append(label_index[label])
+        return texts, ys, len(documents)
+
+
+class IntentTrainer:
+    """
+    Mini-batch SGD on the softmax loss of a `LinearIntentModel`'s weights, updated in place.
+    """
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, learning_rate: float):
+        self.weights = weights
+        self.bias = bias
+        self.learning_rate = learning_rate
+        self.n_features = weights.shape[0]
+
+    def scores(self, features: List[np.ndarray]) -> np.ndarray:
+        lengths = np.fromiter(map(len, features), dtype=np.int64, count=len(features))
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        return np.add.reduceat(self.weights[np.concatenate(features)], offsets, axis=0) + self.bias
+
+    def partial_fit(self, texts: List[str], ys: List[int]) -> int:
+        """
+        One pass over the examples; texts without any token are skipped. Returns examples used.
+        """
+        examples = [(features, y) for features, y in
+                    ((hashed_features(text, self.n_features), y) for text, y in zip(texts, ys)) if len(features)]
+        for i in range(0, len(examples), BATCH_SIZE):
+            features, y = zip(*examples[i:i + BATCH_SIZE])
+            scores = self.scores(features)
+            gradient = np.exp(scores - scores.max(axis=1, keepdims=True))
+            gradient /= gradient.sum(axis=1, keepdims=True)
+            gradient[np.arange(len(y)), y] -= 1
+            gradient *= self.learning_rate
+            rows = np.repeat(np.arange(len(features)), [len(f) for f in features])
+            np.subtract.at(self.weights, np.concatenate(features), gradient[rows])
+            self.bias -= gradient.sum(axis=0)
+        return len(examples)
+
+    def predict(self, texts: List[str]) -> np.ndarray:
+        features = [hashed_features(text, self.n_features) for text in texts]
+        present = np.fromiter(map(len, features), dtype=np.int64, count=len(features)) > 0
+        predictions = np.full(len(texts), int(self.bias.argmax()))
+        if present.any():
+            predictions[present] = self.scores([f for f in features if len(f)]).argmax(axis=1)
+        return predictions
+
+
+def _init_worker(progress):
+    global _worker_progress
+    _worker_progress = progress
+
+
+def _report(progress, read: int):
+    with progress.get_lock():
+        progress.value += read
+
+
+def train_shard(source: FeedbackTrainingSource, start: datetime, end: datetime, labels: List[str],
+                weights: np.ndarray, bias: np.ndarray, learning_rate: float, chunk_size: int,
+                progress=None) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Trains a copy of the weights on one shard; returns (weights delta, bias delta, examples used).
+    """
+    progress = progress or _worker_progress
+    trainer = IntentTrainer(weights.copy(), bias.copy(), learning_rate)
+    used = 0
+    for texts, ys, read in source.chunks(start, end, labels, chunk_size):
+        kept = [(text, y) for text, y in zip(texts, ys) if not is_holdout(text)]
+        if kept:
+            used += trainer.partial_fit(*zip(*kept))
+        _report(progress, read)
+    return trainer.weights - weights, trainer.bias - bias, used
+
+
+def evaluate_shard(source: FeedbackTrainingSource, start: datetime, end: datetime, labels: List[str],
+                   weights: np.ndarray, bias: np.ndarray, chunk_size: int, progress=None) -> Tuple[int, int]:
+    """
+    Returns (correct, total) over the held-out examples of one shard.
+    """
+    progress = progress or _worker_progress
+    trainer = IntentTrainer(weights, bias, 0.0)
+    correct = total = 0
+    for texts, ys, read in source.chunks(start, end, labels, chunk_size):
+        held_out = [(text, y) for text, y in zip(texts, ys) if is_holdout(text)]
+        if held_out:
+            held_texts, held_ys = zip(*held_out)
+            correct += int((trainer.predict(list(held_texts)) == np.asarray(held_ys)).sum())
+            total += len(held_out)
+        _report(progress, read)
+    return correct, total
+
+
+class RetrainRunner:
+    def __init__(self, directory: str, registry: ModelRegistry, processes: int, epochs: int, chunk_size: int,
+                 learning_rate: float, n_features: int):
+        """
+        :param directory: Where job status files are written
+        :param processes: Worker processes per job; 0 trains in the job's thread (no pool)
+        :param n_features: Hashed feature count for versions trained from the keyword rules
+        """
+        self.directory = directory
+        self.registry = registry
+        self.processes = processes
+        self.epochs = epochs
+        self.chunk_size = chunk_size
+        self.learning_rate = learning_rate
+        self.n_features = n_features
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, dict] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+
+    # Status
+
+    def _path(self, version: str) -> str:
+        return os.path.join(self.directory, f"{version}.json")
+
+    def _write_status(self, version: str):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(version)
+        with self._lock:
+            state = dict(self._jobs[version])
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def _update(self, version: str, **changes):
+        with self._lock:
+            self._jobs[version].update(changes)
+        self._write_status(version)
+
+    def status(self, version: str) -> Optional[dict]:
+        """
+        Status of the job training `version`, started by this or any other worker.
+        """
+        with self._lock:
+            if version in self._jobs:
+                return dict(self._jobs[version])
+        try:
+            with open(self._path(version)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _running_here(self) -> bool:
+        with self._lock:
+            return any(job["status"] in ("queued", "in_progress") for job in self._jobs.values())
+
+    def _claim(self):
+        """
+        The shared job lock, open and held; None if a job in this or another worker holds it.
+        """
+        if self._running_here():
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        claim = open(os.path.join(self.directory, "job.lock"), "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(claim, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                claim.close()
+                return None
+        return claim
+
+    def running(self) -> bool:
+        """
+        Whether a job is running in this or any other worker.
+        """
+        claim = self._claim()
+        if claim is None:
+            return True
+        claim.close()
+        return False
+
+    # Jobs
+
+    def start(self, base_version: str, start: datetime, end: datetime, reason: str,
+              requested_completion_time: Optional[str] = None,
+              source: Optional[FeedbackTrainingSource] = None) -> dict:
+        """
+        Starts retraining `base_version` on data created in [start, end) as the next free version.
+        Raises KeyError for unknown versions and ValueError if a job is already running.
+        """
+        if base_version not in self.registry:
+            raise KeyError(base_version)
+        claim = self._claim()
+        if claim is None:
+            raise ValueError("A retraining job is already running")
+        try:
+            return self._start(claim, base_version, start, end, reason, requested_completion_time, source)
+        except BaseException:
+            claim.close()
+            raise
+
+    def _start(self, claim, base_version: str, start: datetime, end: datetime, reason: str,
+               requested_completion_time: Optional[str], source: Optional[FeedbackTrainingSource]) -> dict:
+        # Holding the claim, so no other worker picks the same version
+        version = next_version(base_version)
+        while version in self.registry or self.status(version) is not None:
+            version = next_version(version)
+        job = {
+            "model_version": version,
+            "base_version": base_version,
+            "status": "queued",
+            "progress": 0.0,
+            "processed": 0,
+            "total": None,
+            "eta_seconds": None,
+            "expected_completion_time": None,
+            "requested_completion_time": requested_completion_time,
+            "retraining_reason": reason,
+            "window": [start.isoformat(), end.isoformat()],
+            "started_at": datetime.utcnow().isoformat(),
+        }
+        with self._lock:
+            self._jobs[version] = job
+        self._write_status(version)
+        thread = threading.Thread(target=self._run, args=(claim, version, base_version, start, end,
+                                                          source or FeedbackTrainingSource()), daemon=True)
+        self._threads[version] = thread
+        thread.start()
+        return dict(job)
+
+    def join(self, version: str, timeout: Optional[float] = None):
+        thread = self._threads.get(version)
+        if thread is not None:
+            thread.join(timeout)
+
+    def _initial_weights(self, base_version: str, labels: List[str]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        base = self.registry.load(base_version).model
+        labels = list(base.labels) + [label for label in labels if label not in base.labels]
+        if isinstance(base, LinearIntentModel):
+            weights = np.zeros((base.n_features, len(labels)), dtype=np.float32)
+            weights[:, :len(base.labels)] = base.weights
+            bias = np.zeros(len(labels), dtype=np.float32)
+            bias[:len(base.labels)] = base.bias
+        else:
+            weights = np.zeros((self.n_features, len(labels)), dtype=np.float32)
+            bias = np.zeros(len(labels), dtype=np.float32)
+        return weights, bias, labels
+
+    def _run(self, claim, version: str, base_version: str, start: datetime, end: datetime,
+             source: FeedbackTrainingSource):
+        context = multiprocessing.get_context("spawn")
+        progress = context.Value("q", 0)
+        executor = None
+        try:
+            total = source.count(start, end)
+            weights, bias, labels = self._initial_weights(base_version, source.labels(start, end))
+            passes = self.epochs + 1
+            self._update(version, status="in_progress", total=total * passes, labels=labels)
+            shards = self._shards(start, end)
+            if self.processes > 0:
+                executor = ProcessPoolExecutor(self.processes, mp_context=context,
+                                               initializer=_init_worker, initargs=(progress,))
+            began = time.monotonic()
+
+            used = 0
+            for epoch in range(self.epochs):
+                results = self._map(executor, version, progress, total * passes, began, train_shard,
+                                    [(source, a, b, labels, weights, bias, self.learning_rate, self.chunk_size)
+                                     for a, b in shards])
+                used = sum(n for _, _, n in results)
+                if not used:
+                    raise ValueError("No labelled training examples in the window")
+                # Iterative parameter mixing: average the shard updates, weighted by examples
+                weights = weights + sum(dw * (n / used) for dw, _, n in results).astype(np.float32)
+                bias = bias + sum(db * (n / used) for _, db, n in results).astype(np.float32)
+
+            results = self._map(executor, version, progress, total * passes, began, evaluate_shard,
+                                [(source, a, b, labels, weights, bias, self.chunk_size) for a, b in shards])
+            correct, held_out = map(sum, zip(*results))
+            accuracy = round(correct / held_out, 4) if held_out else None
+
+            path = self.registry.store_artifact(version, LinearIntentModel(weights, bias, labels))
+            metrics = {"accuracy": accuracy, "holdout_examples": held_out, "training_examples": used}
+            self.registry.register(version, {"metrics": metrics, "base_version": base_version,
+                                             "retraining_reason": self._jobs[version]["retraining_reason"]}, path)
+            self._update(version, status="completed", progress=100.0, processed=progress.value, eta_seconds=0,
+                         expected_completion_time=None, completed_at=datetime.utcnow().isoformat(),
+                         training_seconds=round(time.monotonic() - began, 3), metrics=metrics, artifact_path=path)
+            logger.info(f"Retrained {base_version} as {version}: {metrics}")
+        except Exception as e:
+            logger.error(f"Retraining {version} failed: {e}")
+            self._update(version, status="failed", error=str(e), eta_seconds=None, expected_completion_time=None)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            claim.close()
+
+    def _shards(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        count = max(self.processes, 1) * SHARDS_PER_PROCESS
+        step = (end - start) / count
+        bounds = [start + step * i for i in range(count)] + [end]
+        return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+    def _map(self, executor: Optional[ProcessPoolExecutor], version: str, progress, total: int, began: float,
+             fn: Callable, tasks: List[tuple]) -> list:
+        if executor is None:
+            results = []
+            for task in tasks:
+                results.append(fn(*task, progress=progress))
+                self._report_progress(version, progress.value, total, began)
+            return results
+        futures = [executor.submit(fn, *task) for task in tasks]
+        while True:
+            done, pending = wait(futures, timeout=0.5, return_when=FIRST_EXCEPTION)
+            self._report_progress(version, progress.value, total, began)
+            for future in done:
+                if future.exception() is not None:
+                    raise future.exception()
+            if not pending:
+                return [future.result() for future in futures]
+
+    def _report_progress(self, version: str, processed: int, total: int, began: float):
+        fraction = min(processed / total, 1.0) if total else 0.0
+        elapsed = time.monotonic() - began
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        self._update(version, processed=processed, progress=round(min(fraction * 100, 99.9), 1),
+                     eta_seconds=round(eta, 1) if eta is not None else None,
+                     expected_completion_time=(datetime.utcnow() + timedelta(seconds=eta)).isoformat() + "Z"
+                     if eta is not None else None)
+
+
+retrain_runner = RetrainRunner(settings.RETRAIN_DIR, model_registry, settings.RETRAIN_PROCESSES, settings.RETRAIN_EPOCHS,
+                               settings.RETRAIN_CHUNK_SIZE, settings.RETRAIN_LEARNING_RATE, settings.RETRAIN_N_FEATURES)
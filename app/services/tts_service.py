@@ -1,8 +1,10 @@
+import logging
 import os
-from gtts import gTTS
 from typing import Optional
-from pydub import AudioSegment
 import tempfile
+from app.services.tracing_service import traced
+
+logger = logging.getLogger("app_logger")
 
 # For advanced TTS (e.g., Google Cloud TTS, AWS Polly), you'd configure credentials here.
 # Example: os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = '/path/to/credentials.json'
@@ -18,6 +20,7 @@ class TTSService:
         self.language = language
         self.slow = slow
 
+    @traced("tts.text_to_speech")
     def text_to_speech(self, text: str, output_format: str = "mp3") -> Optional[str]:
         """
         Convert text to speech using gTTS and return the path to the saved audio file.
@@ -26,7 +29,8 @@ class TTSService:
         :return: The file path of the audio output or None if conversion fails
         """
         try:
-            # Use Google Text-to-Speech (gTTS)
+            # Use Google Text-to-Speech (gTTS); imported on first use, it is slow to import
+            from gtts import gTTS
             tts = gTTS(text=text, lang=self.language, slow=self.slow)
 
             # Use a temporary file to store the audio
@@ -40,9 +44,10 @@ class TTSService:
 
             return temp_audio_path
         except Exception as e:
-            print(f"Error during TTS conversion: {e}")
+            logger.error(f"Error during TTS conversion: {e}")
             return None
 
+    @traced("tts.convert_audio_format")
     def convert_audio_format(self, file_path: str, output_format: str) -> Optional[str]:
         """
         Convert an audio file from MP3 to another format (e.g., WAV).
@@ -51,6 +56,7 @@ class TTSService:
         :return: The new file path with the converted format or None if conversion fails
         """
         try:
+            from pydub import AudioSegment
             audio = AudioSegment.from_file(file_path, format="mp3")
 
             # Save the converted file as a new temp file
@@ -62,19 +68,22 @@ class TTSService:
 
             return converted_file_path
         except Exception as e:
-            print(f"Error during audio conversion: {e}")
+            logger.error(f"Error during audio conversion: {e}")
             return None
 
 
 # Example usage
 if __name__ == "__main__":
+    from app.utils.logging import setup_logging
+
+    setup_logging(log_file="")
     tts_service = TTSService(language="en", slow=False)
     audio_file_path = tts_service.text_to_speech("Hello, this is an example TTS service.", output_format="mp3")
 
     if audio_file_path:
-        print(f"TTS conversion successful. Audio file saved at {audio_file_path}")
+        logger.info(f"TTS conversion successful. Audio file saved at {audio_file_path}")
     else:
-        print("TTS conversion failed.")
+        logger.error("TTS conversion failed.")
 
 """
 Key Features:
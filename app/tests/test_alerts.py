@@ -0,0 +1,80 @@
+import pytest
+
+from app.services.alert_service import AlertEvaluator, AlertNotifier, AlertRule, add_rule, read_state
+
+NOW = 1_700_000_000
+
+def rule(alert_id, threshold, **kwargs):
+    kwargs.setdefault("target", "ops@example.com")
+    return AlertRule(alert_id, alert_id, kwargs.pop("metric", "system.cpu_percent"), threshold, **kwargs)
+
+@pytest.fixture
+def evaluator(tmp_path):
+    return AlertEvaluator(str(tmp_path), AlertNotifier(interval=1, webhook_timeout=1))
+
+def states(evaluator):
+    return {alert["alert_id"]: alert["state"] for alert in read_state(evaluator.directory)["alerts"]}
+
+def test_fires_once_and_resolves_with_hysteresis(evaluator):
+    evaluator.set_rules([rule("cpu", 80, clear_threshold=60)], now=NOW)
+    assert evaluator.evaluate(NOW, {"system.cpu_percent": 50}) == []
+    [fired] = evaluator.evaluate(NOW + 10, {"system.cpu_percent": 90})
+    assert fired["state"] == "firing" and fired["value"] == 90
+    # Flapping around the threshold neither resolves nor notifies again
+    assert evaluator.evaluate(NOW + 20, {"system.cpu_percent": 70}) == []
+    assert evaluator.evaluate(NOW + 30, {"system.cpu_percent": 95}) == []
+    assert states(evaluator) == {"cpu": "firing"}
+    [resolved] = evaluator.evaluate(NOW + 40, {"system.cpu_percent": 60})
+    assert resolved["state"] == "resolved"
+    assert states(evaluator) == {}
+
+def test_for_duration_and_below_rules(evaluator):
+    evaluator.set_rules([rule("slow", 1.0, metric="http.latency_seconds.p95", for_seconds=30),
+                         rule("idle", 0.5, metric="http.request_rate", comparison="below")], now=NOW)
+    assert evaluator.evaluate(NOW, {"http.latency_seconds.p95": 2.0, "http.request_rate": 10}) == []
+    assert states(evaluator) == {"slow": "pending"}
+    # Recovering before the for-duration runs out cancels it
+    evaluator.evaluate(NOW + 10, {"http.latency_seconds.p95": 0.5})
+    evaluator.evaluate(NOW + 20, {"http.latency_seconds.p95": 3.0})
+    assert evaluator.evaluate(NOW + 40, {"http.request_rate": 0.1})[0]["alert_id"] == "idle"
+    assert evaluator.evaluate(NOW + 49, {}) == []
+    assert [event["alert_id"] for event in evaluator.evaluate(NOW + 50, {})] == ["slow"]
+    assert states(evaluator) == {"slow": "firing", "idle": "firing"}
+
+def test_rules_added_later_see_the_current_value_and_restarts_dont_renotify(evaluator, tmp_path):
+    evaluator.evaluate(NOW, {"system.cpu_percent": 90})
+    add_rule(str(tmp_path), rule("cpu", 80))
+    assert evaluator.evaluate(NOW + 10, {"system.cpu_percent": 90}) == []
+    [[fired]] = evaluator.notifier.batches().values()
+    assert fired["alert_id"] == "cpu" and states(evaluator) == {"cpu": "firing"}
+
+    restarted = AlertEvaluator(str(tmp_path))
+    assert restarted.evaluate(NOW + 20, {"system.cpu_percent": 91}) == []
+    assert [event["state"] for event in restarted.evaluate(NOW + 30, {"system.cpu_percent": 10})] == ["resolved"]
+
+def test_notifications_are_batched_per_recipient(evaluator):
+    evaluator.set_rules([rule("a", 1), rule("b", 2), rule("c", 3, notification_method="webhook",
+                                                              target="http://hooks.example.com/x")], now=NOW)
+    evaluator.evaluate(NOW, {"system.cpu_percent": 5})
+    batches = evaluator.notifier.batches()
+    assert {key: len(events) for key, events in batches.items()} == {
+        ("email", "ops@example.com"): 2, ("webhook", "http://hooks.example.com/x"): 1}
+    subject, body = AlertNotifier.email_message(batches[("email", "ops@example.com")])
+    assert subject == "2 alert(s) firing, 0 resolved" and len(body.splitlines()) == 2
+
+def test_webhooks_only_go_to_allowed_hosts():
+    notifier = AlertNotifier(interval=1, webhook_timeout=1, webhook_hosts=["hooks.example.com", ".ops.example.com"])
+    assert notifier.webhook_allowed("https://hooks.example.com/x")
+    assert notifier.webhook_allowed("https://pager.ops.example.com/x")
+    assert not notifier.webhook_allowed("http://hooks.example.com/x")
+    assert not notifier.webhook_allowed("https://169.254.169.254/latest/meta-data")
+    assert not notifier.webhook_allowed("https://hooks.example.com@10.0.0.1/x")
+    assert not notifier.webhook_allowed("https://ops.example.com.evil.net/x")
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ValueError):
+        rule("x", 80, clear_threshold=90)
+    with pytest.raises(ValueError):
+        rule("x", 80, notification_method="webhook", target="ops@example.com")
+    with pytest.raises(ValueError):
+        rule("x", 80, notification_method="sms")
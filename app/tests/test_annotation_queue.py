@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app.services.annotation_queue import AnnotationQueue, minhash_cluster
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def run(test, workers=1, capacity=10):
+    # Queues of several workers sharing one Redis server
+    async def main():
+        server = fakeredis.FakeServer()
+        return await test(*[AnnotationQueue(capacity, fakeredis.FakeAsyncRedis(server=server)) for _ in range(workers)])
+    return asyncio.run(main())
+
+def test_pull_returns_most_uncertain_first_and_capacity_evicts_lowest():
+    async def test(queue):
+        for i, confidence in enumerate([0.9, 0.2, 0.6, 0.4, 0.95, 0.1]):
+            queue.offer(f"question number {i} about topic {i * 7}", "help_request", confidence, "support")
+            # One flush per offer, as when requests are spread out
+            await queue.flush()
+        assert await queue.size() == 3
+        assert [item["confidence"] for item in await queue.pull(2)] == [0.1, 0.2]
+        assert [item["confidence"] for item in await queue.pull(5)] == [0.4]
+        assert await queue.size() == 0
+    run(test, capacity=3)
+
+def test_offers_wait_for_the_flush():
+    async def test(queue):
+        assert queue.offer("where is my parcel", "unknown", 0.5, "support")
+        assert await queue.size() == 0
+        assert await queue.flush() == 1 and await queue.size() == 1
+    run(test)
+
+def test_confident_and_duplicate_offers_are_rejected():
+    async def test(queue):
+        before = (await queue.stats())["rejected"]
+        assert not queue.offer("I want a refund", "refund_request", 1.0, "support")
+        queue.offer("Where is my parcel?", "unknown", 0.5, "support")
+        queue.offer("where is my PARCEL", "unknown", 0.4, "support")
+        await queue.flush()
+        queue.offer("Where is my parcel", "unknown", 0.3, "support")
+        await queue.flush()
+        assert await queue.size() == 1
+        assert (await queue.stats())["rejected"] - before == 3
+    run(test)
+
+def test_near_duplicates_are_spread_out_and_disagreement_is_boosted():
+    async def test(queue):
+        queue.offer("my card payment failed at checkout today", "unknown", 0.5, "support")
+        queue.offer("my card payment failed at checkout yesterday", "unknown", 0.5, "support")
+        queue.offer("cannot log in to the mobile app", "unknown", 0.5, "support")
+        queue.offer("how do I change the delivery address", "help_request", 0.7, "support",
+                    alternatives=lambda: ["unknown"])
+        await queue.flush()
+        items = await queue.peek(4)
+        assert items[0]["arms_disagree"] is True
+        # The second card-payment question shares a cluster with the first and ranks below the login one
+        texts = [item["text"] for item in items]
+        assert texts.index("cannot log in to the mobile app") < texts.index("my card payment failed at checkout yesterday")
+    run(test)
+
+def test_workers_share_one_queue():
+    async def test(first, second):
+        first.offer("cannot log in to the mobile app", "unknown", 0.3, "support")
+        second.offer("where is my parcel", "unknown", 0.6, "support")
+        # Same text from another worker in the same flush interval is a duplicate
+        second.offer("Cannot log in to the mobile app!", "unknown", 0.2, "support")
+        await asyncio.gather(first.flush(), second.flush())
+        assert await first.size() == 2
+        assert [item["text"] for item in await second.pull(1)] == ["cannot log in to the mobile app"]
+        assert [item["text"] for item in await first.pull(5)] == ["where is my parcel"]
+        assert (await first.stats())["clusters"] == 0
+    run(test, workers=2)
+
+def test_offers_are_dropped_without_redis():
+    queue = AnnotationQueue(10)
+    assert not queue.offer("where is my parcel", "unknown", 0.5, "support")
+    assert asyncio.run(queue.pull(5)) == []
+
+def test_minhash_clusters_similar_texts():
+    assert minhash_cluster("my card payment failed at checkout today".split()) == \
+        minhash_cluster("my card payment failed at checkout yesterday".split())
+    assert minhash_cluster("my card payment failed".split()) != minhash_cluster("cannot log in".split())
@@ -0,0 +1,59 @@
+import asyncio
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.cache_service import TieredCache, cached
+
+client = TestClient(app)
+
+def test_concurrent_misses_are_coalesced():
+    cache = TieredCache(redis_client=None)
+    calls = []
+
+    @cached("test", cache=cache, key_builder=lambda x: str(x))
+    async def slow_square(x):
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        return x * x
+
+    async def run():
+        return await asyncio.gather(*[slow_square(3) for _ in range(20)])
+
+    assert asyncio.run(run()) == [9] * 20
+    assert calls == [3]
+    stats = cache.metrics()["test"]
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 19
+
+def test_stale_entry_served_while_refreshing():
+    cache = TieredCache(redis_client=None, default_ttl=0, stale_ttl=60)
+    counter = {"n": 0}
+
+    async def compute():
+        counter["n"] += 1
+        return counter["n"]
+
+    async def run():
+        first = await cache.get_or_compute("ns", "k", compute)
+        stale = await cache.get_or_compute("ns", "k", compute)
+        await asyncio.sleep(0)
+        return first, stale
+
+    assert asyncio.run(run()) == (1, 1)
+    assert counter["n"] == 2
+    assert cache.metrics()["ns"]["stale_hits"] == 1
+
+def test_lru_bound_and_prefix_eviction():
+    cache = TieredCache(redis_client=None, max_entries=2)
+
+    async def run():
+        for key in ("a", "b", "c"):
+            await cache.get_or_compute("ns", key, lambda: asyncio.sleep(0, result=key))
+        cache.evict_local("ns:*")
+
+    asyncio.run(run())
+    assert len(cache.local) == 0
+
+def test_cache_metrics_endpoint():
+    response = client.get("/api/v1/cache/metrics")
+    assert response.status_code == 200
+    assert "namespaces" in response.json()
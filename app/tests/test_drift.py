@@ -0,0 +1,62 @@
+import random
+import pytest
+from app.services.drift_service import DriftMonitor, parse_window, psi
+from app.services.model_registry import ModelRegistry
+
+HOUR = 3600
+# Aligned to the 600s slots so each hour of traffic fills exactly six slots
+START = 1_699_999_800
+
+def traffic(monitor, model, start, queries, confidences, n=600):
+    rng = random.Random(7)
+    for i in range(n):
+        text = rng.choice(queries)
+        intent, _ = model.predict(text)
+        monitor.observe(model, text, intent, rng.choice(confidences), now=start + i * HOUR / n)
+
+@pytest.fixture
+def setup(tmp_path):
+    registry = ModelRegistry(str(tmp_path / "models"), memory_budget_bytes=1 << 30)
+    monitor = DriftMonitor(str(tmp_path / "drift"), slot_seconds=600, slots=144, token_buckets=256, psi_threshold=0.2)
+    return monitor, registry.load("v1.3")
+
+def test_parse_window():
+    assert parse_window("24h") == 86400
+    assert parse_window("last_7_days") == 7 * 86400
+    assert parse_window("30 minutes") == 1800
+    with pytest.raises(ValueError):
+        parse_window("forever")
+
+def test_psi_is_zero_for_identical_distributions():
+    import numpy as np
+    counts = np.array([10, 20, 30])
+    assert psi(counts, counts * 3) == pytest.approx(0.0, abs=1e-9)
+    assert psi(counts, counts[::-1]) > 0.2
+
+def test_stable_traffic_does_not_drift(setup):
+    monitor, model = setup
+    queries = ["I need help with my order", "where is my refund", "help me reset my password"]
+    traffic(monitor, model, START, queries, [0.95, 0.9])
+    assert monitor.capture_baseline(model, "1h", now=START + HOUR - 1)["baseline_samples"] == 600
+    traffic(monitor, model, START + HOUR, queries, [0.95, 0.9])
+
+    result = monitor.compare(model, now=START + 2 * HOUR - 1)
+    assert result["samples"] == {"baseline": 600, "current": 600}
+    assert result["drift_detected"] is False
+
+def test_shifted_traffic_drifts(setup):
+    monitor, model = setup
+    traffic(monitor, model, START, ["I need help with my order", "help me log in"], [0.95])
+    monitor.capture_baseline(model, "1h", now=START + HOUR - 1)
+    traffic(monitor, model, START + HOUR, ["cancel my subscription today", "refund the duplicate charge"], [0.5, 0.9])
+
+    result = monitor.compare(model, now=START + 2 * HOUR - 1)
+    assert result["drift_detected"] is True
+    assert set(result["drifted"]) == {"confidence", "intent", "tokens"}
+    assert result["metrics_comparison"]["confidence"]["ks_p_value"] < 0.01
+
+def test_compare_without_baseline_or_traffic(setup):
+    monitor, model = setup
+    assert monitor.compare(model) is None
+    monitor.capture_baseline(model, "1h", now=START)
+    assert monitor.compare(model, now=START + 600)["status"] == "insufficient_data"
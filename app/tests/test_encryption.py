@@ -0,0 +1,84 @@
+import asyncio
+import os
+import re
+import threading
+
+import pytest
+
+from app.schemas.customer import CUSTOMER_PII_FIELDS
+from app.services.encryption_service import DecryptionError, FieldEncryptor, Keyring
+
+CUSTOMER = {"first_name": "Ada", "last_name": "Lovelace", "email": "ada@example.com", "phone_number": None,
+            "address": "12 St James's Square", "city": "London", "country": "UK"}
+
+KEY_ID = re.compile(r"k\d{14}-[0-9a-f]{6}")
+
+def encryptor(tmp_path, **kwargs) -> FieldEncryptor:
+    return FieldEncryptor(Keyring(os.path.join(tmp_path, "keys", "keyring.json")).load(), **kwargs)
+
+def test_pii_fields_round_trip(tmp_path):
+    cipher = encryptor(tmp_path)
+    encrypted = cipher.encrypt_record(CUSTOMER, CUSTOMER_PII_FIELDS)
+    assert KEY_ID.fullmatch(cipher.active_key_id)
+    assert encrypted["email"].startswith(f"enc:{cipher.active_key_id}:") and "ada" not in encrypted["email"]
+    # Fields outside the PII list, and missing values, are stored as they are
+    assert encrypted["city"] == "London" and encrypted["phone_number"] is None
+    # A fresh nonce per field: the same value never encrypts the same way twice
+    assert cipher.encrypt_record(CUSTOMER, CUSTOMER_PII_FIELDS)["email"] != encrypted["email"]
+    assert cipher.decrypt_record(encrypted, CUSTOMER_PII_FIELDS) == CUSTOMER
+    # Documents written before encryption read back unchanged
+    assert cipher.decrypt_record(CUSTOMER, CUSTOMER_PII_FIELDS) == CUSTOMER
+
+def test_non_string_values_keep_their_type(tmp_path):
+    cipher = encryptor(tmp_path)
+    record = {"age": 36, "tags": ["vip"], "active": True}
+    assert cipher.decrypt_record(cipher.encrypt_record(record)) == record
+
+def test_ciphertext_is_bound_to_its_field(tmp_path):
+    cipher = encryptor(tmp_path)
+    encrypted = cipher.encrypt_record(CUSTOMER, CUSTOMER_PII_FIELDS)
+    with pytest.raises(DecryptionError):
+        cipher.decrypt_value(encrypted["email"], "first_name")
+    with pytest.raises(DecryptionError):
+        cipher.decrypt_value(encrypted["email"][:-4] + "AAAA", "email")
+
+def test_keyring_is_shared_and_rotated(tmp_path):
+    cipher = encryptor(tmp_path)
+    old = cipher.encrypt_value("ada@example.com", "email")
+    # Another worker (or a restart) loads the same keys
+    other = encryptor(tmp_path)
+    assert other.decrypt_value(old, "email") == "ada@example.com"
+
+    first = cipher.active_key_id
+    rotated = other.keyring.rotate()
+    assert KEY_ID.fullmatch(rotated) and rotated != first and sorted(other.keyring.keys) == sorted([first, rotated])
+    new = other.encrypt_value("ada@example.com", "email")
+    assert new.startswith(f"enc:{rotated}:") and other.decrypt_value(old, "email") == "ada@example.com"
+    # The first worker hasn't reloaded yet, but meeting the unknown key id makes it
+    assert cipher.decrypt_value(new, "email") == "ada@example.com"
+    assert cipher.active_key_id == rotated
+    assert cipher.needs_reencryption({"email": old}, ["email"]) and not cipher.needs_reencryption({"email": new}, ["email"])
+
+def test_concurrent_rotations_keep_every_key(tmp_path):
+    workers = [encryptor(tmp_path).keyring for _ in range(8)]
+    rotated = []
+    threads = [threading.Thread(target=lambda keyring=keyring: rotated.append(keyring.rotate())) for keyring in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    keys = encryptor(tmp_path).keyring.keys
+    assert len(set(rotated)) == 8 and set(rotated) < set(keys) and len(keys) == 9
+
+def test_batches_are_encrypted_in_chunks(tmp_path):
+    cipher = encryptor(tmp_path, threads=2, chunk_size=3)
+    records = [dict(CUSTOMER, email=f"user{i}@example.com") for i in range(10)]
+
+    async def run():
+        encrypted = await cipher.encrypt_records(records, list(CUSTOMER_PII_FIELDS))
+        return encrypted, await cipher.decrypt_records(encrypted, list(CUSTOMER_PII_FIELDS))
+
+    encrypted, decrypted = asyncio.run(run())
+    assert decrypted == records and all(record["email"].startswith("enc:") for record in encrypted)
+    assert list(cipher.decrypt_stream(cipher.encrypt_stream(iter(records)))) == records
+    cipher.close()
@@ -0,0 +1,72 @@
+import pytest
+from datetime import datetime, timedelta
+from app.services.error_service import ErrorBuffer, ErrorStore, fingerprint, message_template, parse_report
+
+mongomock = pytest.importorskip("mongomock")
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["test"]
+
+def report(error_type, component, message, at, session_id=None):
+    return parse_report({"error_type": error_type, "component": component, "error_message": message,
+                         "session_id": session_id, "timestamp": at.isoformat()})
+
+def test_variable_parts_share_a_fingerprint():
+    assert message_template("timeout after 5012ms on 'orders-7' (cust42)") == "timeout after <n> on <str> (<n>)"
+    assert fingerprint("Timeout", "db", "timeout after 5012ms") == fingerprint("Timeout", "db", "timeout after 33ms")
+    assert fingerprint("Timeout", "db", "timeout after 5012ms") != fingerprint("Timeout", "cache", "timeout after 5012ms")
+
+def test_duplicates_are_grouped_with_counts(db):
+    store = ErrorStore()
+    events = [report("Timeout", "db", f"timeout after {i}ms", START + timedelta(minutes=i), f"s{i}") for i in range(90)]
+    events += [report("KeyError", "support", "KeyError: 'intent'", START + timedelta(minutes=5))]
+    assert store.record(db, events) == 3  # Timeout spans two hours
+    assert db.error_groups.count_documents({}) == 2
+    groups, cursor = store.page(db)
+    assert cursor is None
+    timeout = groups[0]
+    assert (timeout["error_type"], timeout["occurrences"], timeout["last_session_id"]) == ("Timeout", 90, "s89")
+    assert timeout["first_seen"] == START and timeout["sample_message"] == "timeout after 89ms"
+    assert groups[1]["occurrences"] == 1
+
+def test_filters_and_hourly_windows(db):
+    store = ErrorStore()
+    store.record(db, [report("Timeout", "db", "timeout", START + timedelta(minutes=i)) for i in range(120)])
+    store.record(db, [report("Timeout", "cache", "timeout", START + timedelta(minutes=30))])
+    groups, _ = store.page(db, START + timedelta(hours=1), START + timedelta(hours=2))
+    assert [(g["component"], g["occurrences"], g["count"]) for g in groups] == [("db", 60, 120)]
+    # Window edges round out to whole hours
+    groups, _ = store.page(db, START + timedelta(minutes=20), START + timedelta(minutes=40), component="cache")
+    assert [g["occurrences"] for g in groups] == [1]
+    assert store.page(db, error_type="KeyError") == ([], None)
+
+def test_pages_follow_the_cursor(db):
+    store = ErrorStore()
+    store.record(db, [report("E", f"c{i}", "boom", START + timedelta(seconds=i)) for i in range(25)])
+    for window in ({}, {"start": START, "end": START + timedelta(hours=1)}):
+        seen, cursor = [], None
+        while True:
+            page, cursor = store.page(db, cursor=cursor, limit=10, **window)
+            seen.extend(group["component"] for group in page)
+            if cursor is None:
+                break
+        assert seen == [f"c{i}" for i in reversed(range(25))]
+    with pytest.raises(ValueError):
+        store.page(db, cursor="nope")
+
+def test_buffer_merges_reports_until_flushed(db):
+    buffer = ErrorBuffer(ErrorStore(), interval=1, max_groups=100, db_factory=lambda: db)
+    ids = buffer.add([report("Timeout", "db", f"timeout after {i}ms", START) for i in range(1000)])
+    assert len(set(ids)) == 1 and len(buffer) == 1
+    assert db.error_groups.count_documents({}) == 0
+    assert buffer.flush() == 1
+    assert db.error_groups.find_one()["count"] == 1000
+
+def test_invalid_reports_are_rejected():
+    with pytest.raises(ValueError):
+        parse_report({"error_type": "E", "component": "db"})
+    with pytest.raises(ValueError):
+        parse_report({"error_type": "E", "component": "db", "error_message": "x", "timestamp": "yesterday"})
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from app.services.experiment_service import CONFIDENCE_SQ_SUM, CONFIDENCE_SUM, ExperimentRouter, N_FIELDS, REQUESTS
+from app.services.model_registry import ModelRegistry
+
+@pytest.fixture
+def router(tmp_path):
+    registry = ModelRegistry(str(tmp_path / "models"), memory_budget_bytes=1 << 30)
+    return ExperimentRouter(str(tmp_path / "experiments"), registry=registry)
+
+def test_assignment_is_deterministic_and_follows_the_split(router):
+    router.start("exp", {"model_a": "v1.2", "model_b": "v1.3"}, {"model_a": 80, "model_b": 20})
+    arms = [router.route(f"customer_{i}").arm for i in range(20000)]
+    assert arms == [router.route(f"customer_{i}").arm for i in range(20000)]
+    assert abs(np.mean(arms) - 0.20) < 0.02
+    assert router.route(None) is None
+
+def test_invalid_split_is_rejected(router):
+    with pytest.raises(ValueError):
+        router.start("exp", {"model_a": "v1.2", "model_b": "v1.3"}, {"model_a": 60, "model_b": 60})
+    with pytest.raises(KeyError):
+        router.start("exp", {"model_a": "v1.2", "model_b": "v9"}, {"model_a": 50, "model_b": 50})
+
+def test_status_aggregates_workers_with_confidence_intervals(router):
+    experiment = router.start("exp", {"model_a": "v1.2", "model_b": "v1.3"}, {"model_a": 50, "model_b": 50})
+    for i in range(200):
+        assignment = router.route(f"customer_{i}")
+        router.record_prediction(assignment, 0.002, 0.9 if assignment.arm == 0 else 0.6)
+        router.record_feedback(f"customer_{i}", assignment.arm == 0)
+    # Counters written by another worker process
+    other = np.lib.format.open_memmap(f"{experiment.counter_dir(router.directory)}/99999999.npy", mode="w+",
+                                      dtype=np.float64, shape=(2, N_FIELDS))
+    other[0, [REQUESTS, CONFIDENCE_SUM, CONFIDENCE_SQ_SUM]] = [100, 90, 81]
+    other.flush()
+
+    status = router.status("exp")
+    model_a, model_b = status["metrics"]["model_a"], status["metrics"]["model_b"]
+    assert model_a["requests"] + model_b["requests"] == 300
+    assert model_a["confidence"]["ci_95"][0] <= 0.9 <= model_a["confidence"]["ci_95"][1]
+    assert model_a["feedback"]["positive_rate"] == 1.0
+    assert model_b["feedback"]["positive_rate"] == 0.0
+    assert model_b["feedback"]["ci_95"][1] < model_a["feedback"]["ci_95"][0]
+    assert model_a["latency_ms"]["p50"] == 2.5
+
+def test_other_workers_pick_up_started_experiments(router, tmp_path):
+    router.start("exp", {"model_a": "v1.2", "model_b": "v1.3"}, {"model_a": 50, "model_b": 50})
+    other = ExperimentRouter(router.directory, registry=router.registry, check_interval=0)
+    assert other.route("customer_1").arm == router.route("customer_1").arm
+    router.stop("exp")
+    assert other.route("customer_1") is None
+    assert other.status("exp")["status"] == "completed"
+
+def test_cache_hits_count_without_latency(router):
+    router.start("exp", {"model_a": "v1.2", "model_b": "v1.3"}, {"model_a": 50, "model_b": 50})
+    assignment = router.route("customer_1")
+    router.record_prediction(assignment, 0.02, 0.8)
+    for _ in range(9):
+        router.record_prediction(assignment, None, 0.8)
+    arm = router.status("exp")["metrics"][assignment.experiment.arm_names[assignment.arm]]
+    assert arm["requests"] == 10 and arm["latency_ms"]["p99"] == 25
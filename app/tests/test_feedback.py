@@ -0,0 +1,53 @@
+import pytest
+from datetime import datetime, timedelta
+from app.services.feedback_service import FeedbackStore, parse_timestamp
+
+mongomock = pytest.importorskip("mongomock")
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["test"]
+
+@pytest.fixture
+def store(db):
+    store = FeedbackStore()
+    for i in range(50):
+        store.add(db, f"s{i}", f"c{i}", {"rating": i % 5 + 1}, {"intent": "help_request"},
+                  created_at=START + timedelta(minutes=i, milliseconds=500))
+    return store
+
+def test_range_query_pages_through_window_in_time_order(db, store):
+    start, end = START + timedelta(minutes=10), START + timedelta(minutes=35)
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.page(db, start, end, cursor=cursor, limit=7)
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert [doc["session_id"] for doc in seen] == [f"s{i}" for i in range(10, 35)]
+    assert all(start <= doc["created_at"] < end for doc in seen)
+
+def test_sub_second_bounds(db, store):
+    # s10 was created at 12:10:00.5; a window starting after it must exclude it
+    page, _ = store.page(db, START + timedelta(minutes=10, milliseconds=600), START + timedelta(minutes=11), limit=10)
+    assert page == []
+    page, _ = store.page(db, START + timedelta(minutes=10), START + timedelta(minutes=10, milliseconds=501), limit=10)
+    assert [doc["session_id"] for doc in page] == ["s10"]
+
+def test_annotations_are_append_only_events(db, store):
+    feedback_id = str(next(iter(store.iter_range(db, START, START + timedelta(hours=1))))["_id"])
+    store.annotate(db, feedback_id, "annotator_1", "Sorry", "Here is how to reset it")
+    store.annotate(db, feedback_id, "annotator_2", "Sorry", "Reset it from the settings page")
+    events = store.annotations(db, feedback_id)
+    assert [e["annotator_id"] for e in events] == ["annotator_1", "annotator_2"]
+    assert "annotation" not in store.get(db, feedback_id)
+    assert store.annotate(db, "000000000000000000000000", "a", "x", "y") is None
+    assert store.annotate(db, "feedback_1", "a", "x", "y") is None
+
+def test_parse_timestamp_normalises_to_utc():
+    assert parse_timestamp("2024-05-01T14:00:00+02:00") == datetime(2024, 5, 1, 12, 0)
+    assert parse_timestamp("2024-05-01T12:00:00Z") == datetime(2024, 5, 1, 12, 0)
+    with pytest.raises(ValueError):
+        parse_timestamp("yesterday")
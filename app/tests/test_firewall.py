@@ -0,0 +1,104 @@
+import asyncio
+import os
+import random
+import threading
+
+import pytest
+
+from app.core import middleware
+from app.services.firewall_service import CompiledFirewall, FirewallEngine, required_literals, trie_regex
+
+RULES = [
+    {"rule_name": "sqli_union", "action": "block", "pattern": r"union\s+(all\s+)?select"},
+    {"rule_name": "xss", "action": "log", "pattern": "<script"},
+    {"rule_name": "card_number", "action": "log", "pattern": r"\b\d{16}\b"},
+    {"rule_name": "traversal", "action": "block", "pattern": r"\.\./"},
+    {"rule_name": "drop", "action": "block", "pattern": r"drop\s+table|truncate\s+table"},
+]
+
+def test_required_literals():
+    assert required_literals(r"union\s+(all\s+)?select") == ["select"]
+    assert required_literals(r"drop\s+table|truncate\s+table") == ["table", "truncate"]
+    assert required_literals(r"(?:<script|javascript:)\s*\w+") == ["<script", "javascript:"]
+    # Nothing every match must contain: checked with the regex on every request
+    assert required_literals(r"\d{16}") is None
+
+@pytest.mark.parametrize("use_ahocorasick", [True, False])
+def test_rules_match_in_one_pass(use_ahocorasick):
+    compiled = CompiledFirewall(RULES, use_ahocorasick=use_ahocorasick)
+    assert compiled.match("/api/v1/support/query\nq=refund\n{}") == []
+    assert compiled.match("/search\nq=1 UNION ALL  Select password\n") == [0]
+    assert compiled.match("/x\n\n<SCRIPT>alert(1)</script> 4111111111111111") == [1, 2]
+    assert compiled.match("/static/../../etc/passwd\n\n") == [3]
+    assert compiled.match("/\n\nTRUNCATE table users") == [4]
+
+def test_both_matchers_agree_with_each_rule_regex():
+    rng = random.Random(7)
+    words = ["".join(rng.choice("abcdef") for _ in range(rng.randint(2, 6))) for _ in range(300)]
+    rules = [{"rule_name": f"r{i}", "action": "log", "pattern": word if i % 3 else rf"{word}\d+"}
+             for i, word in enumerate(words)]
+    with_automaton, with_regex = CompiledFirewall(rules), CompiledFirewall(rules, use_ahocorasick=False)
+    for _ in range(200):
+        text = "".join(rng.choice("abcdef0123 ") for _ in range(80))
+        expected = [position for position, regex in enumerate(with_regex.regexes) if regex.search(text)]
+        assert with_automaton.match(text) == expected and with_regex.match(text) == expected
+
+def test_trie_regex_prefers_the_longest_literal():
+    assert trie_regex(["uni", "union", "unite"]) == "uni(?:on|te)?"
+
+def test_rules_are_persisted_and_hot_swapped(tmp_path):
+    path = os.path.join(tmp_path, "firewall", "rules.json")
+    engine, other_worker = FirewallEngine(path), FirewallEngine(path)
+    assert engine.set_rule(RULES[0]) == 1
+    assert engine.set_rule(dict(RULES[0], action="log")) == 1
+    with pytest.raises(ValueError):
+        engine.set_rule({"rule_name": "broken", "action": "block", "pattern": "(unclosed"})
+    assert other_worker.reload_if_changed()
+    assert other_worker.compiled.rules == [dict(RULES[0], action="log")]
+    assert engine.remove_rule("sqli_union") and not engine.remove_rule("sqli_union")
+
+def test_concurrent_rule_changes_are_all_kept(tmp_path):
+    path = os.path.join(tmp_path, "firewall", "rules.json")
+    workers = [FirewallEngine(path) for _ in range(len(RULES))]
+    threads = [threading.Thread(target=worker.set_rule, args=(rule,)) for worker, rule in zip(workers, RULES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine = FirewallEngine(path)
+    engine.reload_if_changed()
+    assert sorted(rule["rule_name"] for rule in engine.compiled.rules) == sorted(rule["rule_name"] for rule in RULES)
+
+def test_middleware_blocks_and_replays_the_body(tmp_path, monkeypatch):
+    engine = FirewallEngine(os.path.join(tmp_path, "rules.json"))
+    engine.replace_rules(RULES)
+    monkeypatch.setattr(middleware, "firewall_engine", engine)
+    received = []
+
+    async def app(scope, receive, send):
+        received.append((await receive())["body"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    def request(body: bytes, content_type: bytes = b"application/json") -> int:
+        messages = []
+        scope = {"type": "http", "method": "POST", "path": "/api/v1/support/query", "query_string": b"",
+                 "headers": [(b"content-type", content_type)]}
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(middleware.FirewallMiddleware(app)(scope, receive, send))
+        return messages[0]["status"]
+
+    assert request(b'{"query": "where is my order"}') == 200
+    assert received == [b'{"query": "where is my order"}']
+    assert request(b'{"query": "1 union select card from payments"}') == 403
+    assert len(received) == 1
+    # Form bodies are decoded like the query string before matching
+    assert request(b"query=1+union%20select+card", b"application/x-www-form-urlencoded; charset=utf-8") == 403
+    assert request(b"query=where+is+my+order", b"application/x-www-form-urlencoded") == 200
+    assert received[-1] == b"query=where+is+my+order"
@@ -0,0 +1,92 @@
+import io
+import json
+import logging
+import queue
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.middleware import RequestIdMiddleware
+from app.utils.logging import (BatchWriter, BufferedQueueHandler, DebugSampler, JsonFormatter, RotatingFile,
+                               request_id_var)
+
+def pipeline(name, max_queued=1000, destinations=None):
+    log_queue = queue.SimpleQueue()
+    handler = BufferedQueueHandler(log_queue, max_queued)
+    stream = io.StringIO()
+    writer = BatchWriter(log_queue, destinations or [stream], JsonFormatter(), batch_size=64)
+    test_logger = logging.getLogger(name)
+    test_logger.handlers[:] = [handler]
+    test_logger.setLevel(logging.DEBUG)
+    test_logger.propagate = False
+    return test_logger, handler, writer, stream
+
+def lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_records_are_json_lines_with_request_id_and_extra_fields():
+    test_logger, _, writer, stream = pipeline("test_json")
+    token = request_id_var.set("req-1")
+    try:
+        test_logger.info("order %s shipped", 42, extra={"customer_id": "c7"})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            test_logger.exception("failed")
+    finally:
+        request_id_var.reset(token)
+    # Queued records are only written by the writer thread
+    assert stream.getvalue() == ""
+    writer.start()
+    writer.stop()
+    first, second = lines(stream)
+    assert first["message"] == "order 42 shipped" and first["request_id"] == "req-1"
+    assert first["customer_id"] == "c7" and first["level"] == "INFO"
+    assert second["level"] == "ERROR" and "ValueError: boom" in second["exc_info"]
+
+def test_debug_records_are_sampled_and_a_full_queue_drops():
+    test_logger, handler, writer, stream = pipeline("test_sampling", max_queued=5)
+    sampler = DebugSampler(test_logger, rate=0.0)
+    for i in range(100):
+        test_logger.debug("noisy %d", i)
+    assert sampler.sampled_out == 100 and handler.queue.qsize() == 0
+    for i in range(10):
+        test_logger.warning("loud %d", i)
+    assert handler.dropped == 5
+    writer.start()
+    writer.stop()
+    assert [line["message"] for line in lines(stream)] == [f"loud {i}" for i in range(5)]
+    # Sampled-in debug records point at the caller, not at the sampler
+    sampler.rate = 1.0
+    test_logger.debug("kept")
+    writer.start()
+    writer.stop()
+    assert lines(stream)[-1]["module"] == "test_logging"
+
+def test_log_file_directory_is_created_and_rotated(tmp_path):
+    log_file = RotatingFile(str(tmp_path / "logs" / "app.log"), max_bytes=1000, backup_count=2)
+    test_logger, _, writer, _ = pipeline("test_file", destinations=[log_file])
+    writer.start()
+    for i in range(100):
+        test_logger.info("line %03d padded to a reasonable length", i)
+    writer.stop()
+    log_file.close()
+    names = sorted(path.name for path in (tmp_path / "logs").iterdir())
+    assert names == ["app.log", "app.log.1", "app.log.2"]
+    assert all(path.stat().st_size <= 1000 for path in (tmp_path / "logs").iterdir())
+
+def test_request_id_is_propagated_and_echoed():
+    seen = []
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        seen.append(request_id_var.get())
+        return {}
+
+    client = TestClient(RequestIdMiddleware(app))
+    response = client.get("/ping", headers={"X-Request-ID": "abc-123"})
+    assert response.headers["x-request-id"] == "abc-123" and seen == ["abc-123"]
+    response = client.get("/ping", headers={"X-Request-ID": "bad id\\n"})
+    assert response.headers["x-request-id"] == seen[-1] and len(seen[-1]) == 32
+    assert request_id_var.get() is None
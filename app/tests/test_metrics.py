@@ -0,0 +1,109 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.core import middleware
+from app.core.middleware import MetricsMiddleware
+from app.services.metrics_service import MetricsRegistry, bucket_quantile, gauge_value
+
+@pytest.fixture
+def registry(tmp_path):
+    return MetricsRegistry(str(tmp_path), max_slots=256)
+
+def test_exposition_format(registry):
+    requests = registry.counter("requests_total", "Requests.", ["route"])
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    requests.labels('/a"b').inc()
+    requests.labels('/a"b').inc(2)
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+    text = registry.exposition()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/a\\"b"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_sum 5.55" in text
+    assert "latency_seconds_count 3" in text
+
+def test_workers_are_combined_and_dead_gauges_dropped(tmp_path):
+    first = MetricsRegistry(str(tmp_path), max_slots=64)
+    first.counter("jobs_total", "Jobs.").inc(5)
+    first.gauge("in_flight", "In flight.").set(2)
+    # Pretend the first registry's files belong to a worker that has exited
+    dead_pid = 2 ** 22 + 1
+    for ext in (".npy", ".json"):
+        shutil.move(str(tmp_path / f"{os.getpid()}{ext}"), str(tmp_path / f"{dead_pid}{ext}"))
+
+    second = MetricsRegistry(str(tmp_path), max_slots=64)
+    jobs = second.counter("jobs_total", "Jobs.")
+    in_flight = second.gauge("in_flight", "In flight.")
+    jobs.inc(1)
+    in_flight.set(3)
+    collected = second.collect()
+    assert gauge_value(collected, jobs) == 6
+    assert gauge_value(collected, in_flight) == 3
+
+def test_exited_workers_are_retired_into_totals(tmp_path):
+    first = MetricsRegistry(str(tmp_path), max_slots=64)
+    first.counter("jobs_total", "Jobs.").inc(5)
+    first.histogram("job_seconds", "Job time.", buckets=(1.0,)).observe(0.5)
+    first.gauge("in_flight", "In flight.").set(2)
+    dead_pid = 2 ** 22 + 1
+    for ext in (".npy", ".json"):
+        shutil.move(str(tmp_path / f"{os.getpid()}{ext}"), str(tmp_path / f"{dead_pid}{ext}"))
+
+    second = MetricsRegistry(str(tmp_path), max_slots=64)
+    jobs = second.counter("jobs_total", "Jobs.")
+    second.histogram("job_seconds", "Job time.", buckets=(1.0,))
+    in_flight = second.gauge("in_flight", "In flight.")
+    jobs.inc(1)
+    for _ in range(2):
+        collected = second.collect()
+        assert gauge_value(collected, jobs) == 6 and gauge_value(collected, in_flight) is None
+        assert collected["job_seconds"][()].tolist() == [1, 0, 0.5]
+    assert not os.path.exists(tmp_path / f"{dead_pid}.npy")
+    # A new process given the same pid as this one carries its values over instead of wiping them
+    third = MetricsRegistry(str(tmp_path), max_slots=64)
+    third.counter("jobs_total", "Jobs.").inc(1)
+    assert gauge_value(third.collect(), jobs) == 7
+
+def test_full_store_drops_new_series(registry):
+    histogram = registry.histogram("h", "H.", ["k"], buckets=tuple(range(1, 100)))
+    histogram.labels("a").observe(1)
+    histogram.labels("b").observe(1)
+    histogram.labels("c").observe(1)
+    assert set(registry.collect()["h"]) == {("a",), ("b",)}
+
+def test_bucket_quantile_interpolates():
+    assert bucket_quantile((1.0, 2.0, 4.0), np.array([0, 10, 10, 0]), 0.5) == 2.0
+    assert bucket_quantile((1.0, 2.0, 4.0), np.array([0, 10, 10, 0]), 0.75) == 3.0
+    assert bucket_quantile((1.0,), np.array([0, 0]), 0.5) is None
+
+def test_middleware_labels_by_route_template(registry, monkeypatch):
+    duration = registry.histogram("http_request_duration_seconds", "Latency.", ["method", "route", "status"])
+    in_flight = registry.gauge("http_requests_in_flight", "In flight.")
+    monkeypatch.setattr(middleware, "http_request_duration", duration)
+    monkeypatch.setattr(middleware, "http_requests_in_flight", in_flight)
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        if item_id == "missing":
+            raise HTTPException(status_code=404)
+        return {"item_id": item_id}
+
+    client = TestClient(app)
+    for item_id in ("1", "2", "missing"):
+        client.get(f"/items/{item_id}")
+    client.get("/nowhere")
+    series = registry.collect()["http_request_duration_seconds"]
+    counts = {key: int(value[:-1].sum()) for key, value in series.items()}
+    assert counts == {("GET", "/items/{item_id}", "200"): 2, ("GET", "/items/{item_id}", "404"): 1,
+                      ("GET", "unmatched", "404"): 1}
+    assert gauge_value(registry.collect(), in_flight) == 0
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from app.services.model_registry import ModelRegistry
+from app.services.nlp_service import LinearIntentModel, hashed_features
+
+LABELS = ["help_request", "refund_request", "unknown"]
+
+def make_model(n_features=1024, favourite=None):
+    weights = np.zeros((n_features, len(LABELS)), dtype=np.float32)
+    weights[hashed_features("refund", n_features), 1] = 3.0
+    weights[hashed_features("help", n_features), 0] = 3.0
+    bias = np.zeros(len(LABELS), dtype=np.float32)
+    if favourite is not None:
+        bias[LABELS.index(favourite)] = 10.0
+    return LinearIntentModel(weights, bias, LABELS)
+
+def test_artifact_round_trip_is_memory_mapped(tmp_path):
+    make_model().save(str(tmp_path / "v2"))
+    model = LinearIntentModel.load(str(tmp_path / "v2"))
+    assert isinstance(model.weights, np.memmap)
+    assert model.predict("I want a refund")[0] == "refund_request"
+    assert model.predict("please help me")[0] == "help_request"
+
+def test_activate_swaps_without_disturbing_in_flight_requests(tmp_path):
+    registry = ModelRegistry(str(tmp_path), memory_budget_bytes=1 << 30)
+    registry.register("v2", {"metrics": {}}, artifact_path=registry.store_artifact("v2", make_model(favourite="unknown")))
+    in_flight = registry.active()
+    assert in_flight.version == "v1.3"
+
+    swap = registry.activate("v2")
+    assert swap["previous_version"] == "v1.3"
+    assert registry.active().predict("I want a refund")[0] == "unknown"
+    # A request that picked up the old model before the swap still finishes on it
+    assert in_flight.predict("I want a refund") == ("refund_request", 0.90)
+
+    registry.activate("v1.3", strategy="rollback")
+    assert registry.active().version == "v1.3"
+
+def test_unused_versions_are_evicted_over_budget(tmp_path):
+    model_bytes = make_model().size_bytes
+    registry = ModelRegistry(str(tmp_path), memory_budget_bytes=int(model_bytes * 1.5))
+    for version in ("v2", "v3"):
+        registry.register(version, {}, artifact_path=registry.store_artifact(version, make_model()))
+    registry.activate("v2")
+    # Over budget, but v2 is active and v3 was just loaded
+    registry.load("v3")
+    assert {"v2", "v3"} <= set(registry.loaded_versions())
+    registry.activate("v3")
+    assert "v3" in registry.loaded_versions()
+    assert "v2" not in registry.loaded_versions()
+
+def test_deploys_are_shared_through_the_registry_file(tmp_path):
+    writer = ModelRegistry(str(tmp_path), memory_budget_bytes=1 << 30)
+    writer.register("v2", {}, artifact_path=writer.store_artifact("v2", make_model()))
+    writer.activate("v2")
+
+    reader = ModelRegistry(str(tmp_path), memory_budget_bytes=1 << 30, check_interval=0)
+    assert reader.active_version == "v2"
+    assert reader.active().version == "v2"
+    assert reader.history[-1]["previous_version"] == "v1.3"
+
+def test_register_rejects_missing_artifact(tmp_path):
+    registry = ModelRegistry(str(tmp_path), memory_budget_bytes=1 << 30)
+    with pytest.raises(ValueError):
+        registry.register("v9", {}, artifact_path=str(tmp_path / "missing"))
@@ -0,0 +1,43 @@
+import pytest
+from datetime import datetime, timedelta
+from app.services.offer_service import OfferStore
+from app.services.recommendation_service import ItemSimilarityIndex, RecommendationEngine
+
+mongomock = pytest.importorskip("mongomock")
+
+CATALOG = {
+    "phone": {"product_name": "Smartphone", "category": "electronics", "price": "$799.99"},
+    "case": {"product_name": "Phone Case", "category": "accessories", "price": "$19.99"},
+}
+
+@pytest.fixture
+def store(tmp_path):
+    ItemSimilarityIndex.build([("c1", "phone"), ("c1", "case"), ("c2", "phone")], CATALOG).save(str(tmp_path))
+    return OfferStore(engine=RecommendationEngine(str(tmp_path)))
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient()["test"]
+    past = datetime.utcnow() - timedelta(hours=1)
+    db["customer_profiles"].insert_many([
+        {"customer_id": "c1", "preferences": {}, "updated_at": past},
+        {"customer_id": "c2", "preferences": {}, "updated_at": past},
+    ])
+    db["orders"].insert_many([
+        {"customer_id": "c1", "product_id": "phone", "order_date": past, "created_at": past},
+        {"customer_id": "c2", "product_id": "phone", "order_date": past, "created_at": past},
+    ])
+    return db
+
+def test_incremental_refresh_only_recomputes_changed_customers(store, db):
+    assert store.refresh_changed(db) == {"mode": "full", "customers_refreshed": 2}
+    assert store.refresh_changed(db) == {"mode": "incremental", "customers_refreshed": 0}
+
+    db["orders"].insert_one({"customer_id": "c2", "product_id": "case", "order_date": datetime.utcnow(),
+                             "created_at": datetime.utcnow()})
+    assert store.refresh_changed(db) == {"mode": "incremental", "customers_refreshed": 1}
+
+def test_lookup_materializes_on_first_access(store, db):
+    offers = store.get(db, "c2")
+    assert [item["product_id"] for item in offers["recommendations"]] == ["case"]
+    assert store.get(db, "unknown") is None
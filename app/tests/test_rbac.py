@@ -0,0 +1,94 @@
+import os
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import security_compliance
+from app.core import middleware
+from app.main import app
+from app.services.rbac_service import ALL_PERMISSIONS, AccessControl
+from app.utils.token import create_access_token
+
+client = TestClient(app)
+
+def bearer(subject: str) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': subject})}"}
+
+@pytest.fixture
+def rbac(tmp_path, monkeypatch):
+    store = AccessControl(os.path.join(tmp_path, "rbac", "roles.json"), check_interval=0, superusers=["admin"])
+    monkeypatch.setattr(middleware, "access_control", store)
+    monkeypatch.setattr(security_compliance, "access_control", store)
+    return store
+
+def test_permissions_compile_to_a_cached_mask(rbac):
+    assert rbac.set_access_control("alice", "auditor", ["security:admin", "reports:read"]) == \
+        ["security:admin", "reports:read"]
+    required = rbac.required_mask("GET", "/api/v1/security/access-logs")
+    assert rbac.allows("alice", required)
+    assert not rbac.allows("bob", required)
+    assert rbac.subject_mask("admin") == ALL_PERMISSIONS
+    # Templated routes match whatever fills the parameters; unlisted routes are open
+    assert rbac.required_mask("DELETE", "/api/v1/security/firewall-rules/sqli") == required
+    assert rbac.required_mask("GET", "/api/v1/security/threat-detection") is None
+
+def test_changing_a_role_invalidates_its_holders(rbac):
+    rbac.set_access_control("alice", "operator", ["models:manage"])
+    rbac.set_access_control("carol", "viewer", ["reports:read"])
+    required = rbac.required_mask("POST", "/api/v1/model/deploy")
+    assert rbac.allows("alice", required) and not rbac.allows("carol", required)
+    # bob is given the role with fewer permissions: alice loses them with him
+    rbac.set_access_control("bob", "operator", ["reports:read"])
+    assert not rbac.allows("alice", required) and not rbac.allows("bob", required)
+    assert rbac.revoke("alice", "operator") and not rbac.revoke("alice", "operator")
+    assert rbac.permissions_of("alice") == []
+
+def test_policy_is_persisted_and_reloaded(rbac):
+    other_worker = AccessControl(rbac.path, check_interval=0)
+    rbac.set_access_control("alice", "operator", ["models:manage"])
+    required = other_worker.required_mask("POST", "/api/v1/model/rollback")
+    assert other_worker.allows("alice", required)
+    rbac.set_access_control("alice", "operator", [])
+    # The other worker's cached mask goes with the file change
+    assert not other_worker.allows("alice", required)
+    with pytest.raises(ValueError):
+        rbac.set_access_control("alice", "", ["models:manage"])
+
+def test_concurrent_changes_from_workers_are_all_kept(rbac):
+    workers = [AccessControl(rbac.path, check_interval=0) for _ in range(8)]
+    threads = [threading.Thread(target=worker.set_access_control, args=(f"user{i}", f"role{i}", ["reports:read"]))
+               for i, worker in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(rbac.policy.assignments) == sorted(f"user{i}" for i in range(8))
+
+def test_middleware_enforces_route_permissions(rbac):
+    assert client.get("/api/v1/security/access-logs").status_code == 401
+    assert client.get("/api/v1/security/access-logs", headers={"Authorization": "Bearer garbage"}).status_code == 401
+    assert client.get("/api/v1/security/access-logs", headers=bearer("alice")).status_code == 403
+    # HEAD runs the GET handler, so it needs the same permission
+    assert client.head("/api/v1/security/access-logs").status_code == 401
+    assert client.head("/api/v1/security/firewall-rules", headers=bearer("alice")).status_code == 403
+    assert client.head("/api/v1/security/access-control/alice", headers=bearer("alice")).status_code == 403
+
+    response = client.post("/api/v1/security/access-control", params={"user_id": "alice", "role": "auditor"},
+                           json=["security:admin"], headers=bearer("admin"))
+    assert response.status_code == 200
+    assert response.json()["effective_permissions"] == ["security:admin"]
+    assert client.get("/api/v1/security/access-logs", headers=bearer("alice")).status_code == 200
+    assert client.get("/api/v1/security/access-control/alice", headers=bearer("alice")).json()["roles"] == ["auditor"]
+
+    assert client.delete("/api/v1/security/access-control/alice/auditor", headers=bearer("admin")).status_code == 200
+    assert client.get("/api/v1/security/access-logs", headers=bearer("alice")).status_code == 403
+    # Alert rules make the server send webhooks, so only those allowed may create them
+    assert client.post("/api/v1/monitoring/error/alert", params={
+        "alert_name": "x", "metric": "system.cpu_percent", "threshold": 90, "notification_method": "webhook",
+        "webhook_url": "http://10.0.0.1/"}).status_code == 401
+    assert client.post("/api/v1/monitoring/error/alert", headers=bearer("admin"), params={
+        "alert_name": "x", "metric": "system.cpu_percent", "threshold": 90, "notification_method": "webhook",
+        "webhook_url": "http://10.0.0.1/"}).status_code == 400
+    # Open routes need no token
+    assert client.get("/api/v1/security/threat-detection").status_code == 200
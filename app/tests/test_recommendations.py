@@ -0,0 +1,40 @@
+from app.services.recommendation_service import ItemSimilarityIndex, RecommendationEngine, top_k
+import numpy as np
+
+CATALOG = {
+    "phone": {"product_name": "Smartphone", "category": "electronics", "price": "$799.99"},
+    "case": {"product_name": "Phone Case", "category": "accessories", "price": "$19.99"},
+    "buds": {"product_name": "Wireless Earbuds", "category": "accessories", "price": "$99.99"},
+    "kettle": {"product_name": "Kettle", "category": "kitchen", "price": "$29.99"},
+}
+
+ORDERS = [
+    ("c1", "phone"), ("c1", "case"), ("c1", "buds"),
+    ("c2", "phone"), ("c2", "case"),
+    ("c3", "phone"), ("c3", "buds"),
+    ("c4", "kettle"),
+]
+
+def test_top_k_returns_best_first():
+    assert top_k(np.array([0.1, 0.9, 0.5, 0.7]), 2).tolist() == [1, 3]
+
+def test_recommends_co_purchased_items_and_skips_purchased(tmp_path):
+    ItemSimilarityIndex.build(ORDERS, CATALOG).save(str(tmp_path))
+    engine = RecommendationEngine(str(tmp_path))
+
+    recommendations = engine.recommend(["phone"], k=2)
+    assert {item["product_id"] for item in recommendations} == {"case", "buds"}
+    assert all(item["product_id"] != "phone" for item in recommendations)
+    assert isinstance(engine.index.data, np.memmap)
+
+def test_rebuilds_never_overwrite_a_live_version(tmp_path):
+    index = ItemSimilarityIndex.build(ORDERS, CATALOG)
+    first, second = index.save(str(tmp_path)), index.save(str(tmp_path))
+    assert first != second
+    assert ItemSimilarityIndex.load(str(tmp_path)).version == second
+    assert ItemSimilarityIndex.load(str(tmp_path), first).version == first
+
+def test_cold_start_falls_back_to_popular_items(tmp_path):
+    ItemSimilarityIndex.build(ORDERS, CATALOG).save(str(tmp_path))
+    recommendations = RecommendationEngine(str(tmp_path)).recommend([], k=1)
+    assert recommendations[0]["product_id"] == "phone"
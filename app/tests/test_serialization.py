@@ -0,0 +1,24 @@
+import json
+import pytest
+from datetime import datetime
+from app.utils.serialization import Serializer, MAGIC, COMPRESSION_NONE, COMPRESSION_ZLIB
+
+def test_roundtrip_with_compression_above_threshold():
+    serializer = Serializer("msgpack", "zlib", compress_threshold=64)
+    small = {"intent": "help_request"}
+    large = {"turns": ["Where is my order?"] * 100}
+    assert serializer.dumps(small)[4] == COMPRESSION_NONE
+    assert serializer.dumps(large)[4] == COMPRESSION_ZLIB
+    assert serializer.loads(serializer.dumps(large)) == large
+
+def test_legacy_json_entries_still_decode():
+    legacy = json.dumps({"v": [1, 2], "f": 1.0, "s": 2.0}).encode()
+    assert Serializer("msgpack", "zstd").loads(legacy) == {"v": [1, 2], "f": 1.0, "s": 2.0}
+
+def test_codecs_decode_each_other():
+    blob = Serializer("json", "none").dumps({"created_at": datetime(2023, 9, 21, 12, 0)})
+    assert Serializer("msgpack", "zstd").loads(blob) == {"created_at": "2023-09-21T12:00:00"}
+
+def test_newer_format_version_is_rejected():
+    with pytest.raises(ValueError):
+        Serializer().loads(MAGIC + bytes((99, 1, 0)) + b"{}")
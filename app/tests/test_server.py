@@ -0,0 +1,108 @@
+import asyncio
+import json
+import os
+import runpy
+import signal
+import subprocess
+import sys
+
+from gunicorn.util import load_class
+from uvicorn import Config
+
+from app.core.config import settings
+from app.core.resources import Resources, resources
+from app.core.server import DrainingServer
+from app.services.cache_service import tiered_cache
+from app.services.session_service import session_store
+
+ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+CONFIG_PATH = os.path.join(ROOT, "gunicorn.conf.py")
+
+def test_no_clients_are_created_at_import():
+    # gunicorn forks the workers from a master that imported the app; clients are made per worker
+    check = ("import app.main\n"
+             "from app.core import resources as r\n"
+             "print(r.resources.mongo_client, r.resources.redis, r.resources.cache_client, r.tiered_cache.redis,\n"
+             "      r.session_store.redis)")
+    output = subprocess.run([sys.executable, "-c", check], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["None"] * 5
+
+def test_resources_are_opened_and_closed_per_worker(monkeypatch):
+    # Nothing listens there, so the startup ping fails fast
+    monkeypatch.setattr(settings, "MONGODB_URL", "mongodb://127.0.0.1:1")
+    monkeypatch.setattr(settings, "HEALTH_CHECK_TIMEOUT", 0.2)
+    resources = Resources()
+
+    async def run():
+        await resources.open()
+        assert tiered_cache.redis is resources.redis and session_store.redis is resources.redis
+        assert resources.db is not None and resources.cache_client is not None
+        readiness = await resources.readiness()
+        await resources.close()
+        return readiness
+
+    readiness = asyncio.run(run())
+    assert not readiness["ready"] and not readiness["checks"]["mongodb"]["ok"]
+    assert tiered_cache.redis is None and session_store.redis is None and resources.mongo_client is None
+
+def test_drain_waits_for_requests_in_flight(monkeypatch):
+    monkeypatch.setattr(settings, "MONGODB_URL", "mongodb://127.0.0.1:1")
+    monkeypatch.setattr(settings, "HEALTH_CHECK_TIMEOUT", 0.2)
+    resources = Resources()
+
+    async def run():
+        await resources.open()
+        resources.request_started()
+        asyncio.get_running_loop().call_later(0.05, resources.request_finished)
+        await resources.drain(timeout=5)
+        drained = resources.in_flight
+        readiness = await resources.readiness()
+        await resources.close()
+        return drained, readiness
+
+    drained, readiness = asyncio.run(run())
+    assert drained == 0
+    assert readiness["draining"] and not readiness["ready"]
+
+def test_stop_signal_fails_readiness_before_the_server_stops(monkeypatch):
+    monkeypatch.setattr(resources, "draining", False)
+    monkeypatch.setattr(settings, "SHUTDOWN_GRACE_SECONDS", 0.05)
+    server = DrainingServer(Config(app=None))
+    server.handle_exit(signal.SIGTERM, None)
+    # Still accepting, but load balancers polling readiness see it draining
+    assert resources.draining and not asyncio.run(server.on_tick(1))
+    asyncio.run(asyncio.sleep(0.06))
+    assert asyncio.run(server.on_tick(2)) and server.should_exit
+
+def test_second_stop_signal_stops_at_once(monkeypatch):
+    monkeypatch.setattr(resources, "draining", False)
+    monkeypatch.setattr(settings, "SHUTDOWN_GRACE_SECONDS", 60)
+    server = DrainingServer(Config(app=None))
+    server.handle_exit(signal.SIGTERM, None)
+    server.handle_exit(signal.SIGTERM, None)
+    assert server.should_exit
+
+def test_gunicorn_config():
+    config = runpy.run_path(CONFIG_PATH)
+    assert config["workers"] >= 1 and config["preload_app"]
+    assert config["max_requests_jitter"] > 0
+    worker = load_class(config["worker_class"])
+    assert worker.CONFIG_KWARGS == {"loop": "uvloop", "http": "httptools"}
+
+def test_load_test_runs_as_documented():
+    # From the repo root, as in its docstring; a short run still reports every latency percentile
+    result = subprocess.run([sys.executable, "-m", "benchmarks.bench_load", "--duration", "1", "--warmup", "0.2",
+                             "--concurrency", "2", "--customers", "20", "--products", "20"],
+                            cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    overall = json.loads(result.stdout)["overall"]
+    assert overall["requests"] > 0 and overall["errors"] == 0
+    assert overall["p50_ms"] <= overall["p95_ms"] <= overall["p99_ms"]
+
+def test_heavy_dependencies_are_imported_on_first_use():
+    # Each of these costs tens of milliseconds of cold start and is only needed by some requests
+    check = ("import sys\n"
+             "import app.main\n"
+             "print(*[m for m in ('httpx', 'scipy', 'gtts', 'pydub', 'celery') if m in sys.modules])")
+    output = subprocess.run([sys.executable, "-c", check], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert output.split() == []
@@ -0,0 +1,59 @@
+import json
+import threading
+from app.services.targeting_service import CompiledRules, TargetingEngine, customer_facts
+
+RULES = [
+    {"rule_id": "default", "priority": 0, "conditions": {}, "content": {"banner": "Latest offers"}},
+    {"rule_id": "phone", "priority": 100, "conditions": {"interaction.last_clicked_item": "Smartphone"},
+     "content": {"banner": "Phone accessories"}},
+    {"rule_id": "phone_vip", "priority": 200,
+     "conditions": {"interaction.last_clicked_item": "Smartphone", "preferences.tier": ["gold", "platinum"]},
+     "content": {"banner": "VIP phone deals"}},
+]
+
+def test_highest_priority_matching_rule_wins():
+    rules = CompiledRules(RULES)
+    facts = customer_facts({"preferences": {"tier": "gold"}}, {"last_clicked_item": "Smartphone"})
+    assert [rule["rule_id"] for rule in rules.evaluate(facts, limit=3)] == ["phone_vip", "phone", "default"]
+    assert rules.evaluate(customer_facts({}, {"last_clicked_item": "Kettle"}))[0]["rule_id"] == "default"
+
+def test_rules_hot_reload_from_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(RULES[:1]))
+    engine = TargetingEngine(str(path), check_interval=0)
+    assert engine.select({"interaction.last_clicked_item": ["Smartphone"]}) == {"banner": "Latest offers"}
+
+    other = TargetingEngine(str(path), check_interval=0)
+    other.replace_rules(RULES)
+    assert engine.select({"interaction.last_clicked_item": ["Smartphone"]}) == {"banner": "Phone accessories"}
+
+def test_concurrent_updates_publish_whole_files(tmp_path):
+    path = str(tmp_path / "rules.json")
+    rule_sets = [[dict(rule, rule_id=f"{rule['rule_id']}_{i}") for rule in RULES] * 50 for i in range(8)]
+    failures = []
+
+    def replace(rules):
+        try:
+            TargetingEngine(path).replace_rules(rules)
+        except OSError as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=replace, args=(rules,)) for rules in rule_sets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert failures == []
+    with open(path) as f:
+        assert json.load(f) in rule_sets
+
+def test_seed_rules_are_served_until_changed(tmp_path):
+    seed = tmp_path / "seed.json"
+    seed.write_text(json.dumps(RULES[:1]))
+    path = tmp_path / "targeting" / "rules.json"
+    engine = TargetingEngine(str(path), check_interval=0, seed_path=str(seed))
+    assert engine.select({}) == {"banner": "Latest offers"}
+    engine.replace_rules(RULES[1:2])
+    assert engine.select({"interaction.last_clicked_item": ["Smartphone"]}) == {"banner": "Phone accessories"}
+    # Changes never touch the seed
+    assert json.loads(seed.read_text()) == RULES[:1]
@@ -0,0 +1,68 @@
+import pytest
+
+from app.services import metrics_service as m
+from app.services.metrics_service import MetricsRegistry
+from app.services.timeseries_service import MetricsRecorder, SeriesSpec, Tier, TimeSeriesStore, log_bounds
+
+NOW = 1_700_000_000 - 1_700_000_000 % 3600
+TIERS = [Tier("raw", 10, 3600), Tier("1m", 60, 86400), Tier("1h", 3600, 90 * 86400)]
+CPU = SeriesSpec("system.cpu_percent", "gauge", log_bounds(0.1, 10_000), lambda collected: None)
+
+@pytest.fixture
+def store(tmp_path):
+    return TimeSeriesStore(str(tmp_path), TIERS)
+
+def test_rollups_keep_min_max_avg_and_p95(store):
+    for i in range(360):
+        store.record_value(CPU, NOW + i * 10, 10.0 if i % 20 else 90.0)
+    hour = store.query(CPU, NOW, NOW + 3600, now=NOW + 3600)
+    assert hour["tier"] == "raw" and len(hour["points"]) == 360
+
+    day = store.query(CPU, NOW - 86400 + 3600, NOW + 3600, now=NOW + 3600)
+    assert day["tier"] == "1m" and len(day["points"]) == 60
+    assert day["points"][0] == pytest.approx({"timestamp": NOW, "count": 6, "avg": (90 + 5 * 10) / 6, "min": 10.0,
+                                              "max": 90.0, "p95": day["points"][0]["p95"]})
+
+    quarter = store.query(CPU, NOW - 90 * 86400 + 3600, NOW + 3600, now=NOW + 3600)
+    assert quarter["tier"] == "1h"
+    [point] = quarter["points"]
+    assert point["count"] == 360 and point["min"] == 10.0 and point["max"] == 90.0
+    assert point["avg"] == pytest.approx(14.0)
+    # 5% of samples are 90: p95 sits at the top of the 10.0 sketch bucket, well below 90
+    assert 10.0 <= point["p95"] < 15.0
+
+def test_far_future_end_still_returns_recent_points(store):
+    store.record_value(CPU, NOW, 5.0)
+    points = store.query(CPU, NOW - 365 * 86400, NOW + 100 * 365 * 86400, now=NOW + 1)["points"]
+    assert [(p["timestamp"], p["avg"]) for p in points] == [(NOW, 5.0)]
+
+def test_ring_slots_from_an_older_lap_are_not_returned(store):
+    store.record_value(CPU, NOW, 1.0)
+    store.record_value(CPU, NOW + 3600, 2.0)  # same raw slot, one retention period later
+    assert store.query(CPU, NOW, NOW + 10, now=NOW + 10)["points"] == []
+    assert [p["avg"] for p in store.query(CPU, NOW + 3600, NOW + 3610, now=NOW + 3610)["points"]] == [2.0]
+
+def test_queries_of_unrecorded_series_create_nothing(tmp_path, store):
+    assert store.query(CPU, NOW, NOW + 60, now=NOW + 60)["points"] == []
+    assert list(tmp_path.iterdir()) == []
+
+def test_recorder_derives_rates_and_latency_histograms(tmp_path):
+    registry = MetricsRegistry(str(tmp_path / "metrics"), max_slots=1024)
+    duration = registry.histogram(m.http_request_duration.name, "Latency.", ["method", "route", "status"])
+    store = TimeSeriesStore(str(tmp_path / "ts"), TIERS)
+    recorder = MetricsRecorder(store, registry, interval=10)
+    duration.labels("GET", "/a", "200").observe(0.002)
+    recorder.sample(now=NOW)
+    for _ in range(50):
+        duration.labels("GET", "/a", "200").observe(0.02)
+    duration.labels("GET", "/a", "503").observe(0.02)
+    recorder.sample(now=NOW + 10)
+
+    specs = recorder.specs()
+    rate = store.query(specs["http.request_rate"], NOW, NOW + 20, now=NOW + 20)["points"]
+    assert [p["avg"] for p in rate] == [pytest.approx(5.1)]
+    errors = store.query(specs["http.server_error_rate"], NOW, NOW + 20, now=NOW + 20)["points"]
+    assert [p["avg"] for p in errors] == [pytest.approx(0.1)]
+    [latency] = store.query(specs["http.latency_seconds"], NOW, NOW + 20, now=NOW + 20)["points"]
+    assert latency["count"] == 51 and latency["avg"] == pytest.approx(0.02)
+    assert 0.01 < latency["p95"] <= 0.025
@@ -0,0 +1,103 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.middleware import RequestIdMiddleware, TracingMiddleware
+from app.services.nlp_service import analyze_intent
+from app.services.profiling_service import ProfileSession
+from app.services.tracing_service import (Tracing, extract_context, inject_context, mongo_command_tracing,
+                                          trace_to_dict, tracing)
+
+@pytest.fixture
+def traces(monkeypatch):
+    def enable(sample_rate=1.0):
+        fresh = Tracing()
+        fresh.setup(enabled=True, sample_rate=sample_rate, file_path="", memory_spans=100)
+        for name in ("enabled", "tracer", "provider", "recent"):
+            monkeypatch.setattr(tracing, name, getattr(fresh, name))
+        return fresh.recent
+    return enable
+
+def mongo_event(request_id, command_name="find", collection="customers"):
+    return SimpleNamespace(request_id=request_id, command_name=command_name, database_name="customer_database",
+                           command={command_name: collection}, failure=None)
+
+def test_nothing_is_recorded_when_disabled():
+    assert not tracing.enabled
+    with tracing.span("anything") as span:
+        assert not span.is_recording()
+    assert analyze_intent("I need help") == ("help_request", 0.95)
+
+def test_child_spans_attach_to_the_request(traces):
+    recent = traces()
+    # Outside a request nothing is started
+    analyze_intent("refund please")
+    assert len(recent.spans) == 0
+    with tracing.tracer.start_as_current_span("POST /api/v1/support/query"):
+        analyze_intent("refund please")
+        mongo_command_tracing.started(mongo_event(1))
+        time.sleep(0.002)
+        mongo_command_tracing.succeeded(mongo_event(1))
+    assert [span.name for span in recent.spans] == ["nlp.analyze_intent", "mongodb find", "POST /api/v1/support/query"]
+    root = recent.roots(10)[0]
+    assert recent.spans[1].attributes["db.mongodb.collection"] == "customers"
+    result = trace_to_dict(recent.trace(format(root.context.trace_id, "032x")))
+    assert list(result["breakdown_ms"])[0] == "mongodb" and result["breakdown_ms"]["mongodb"] >= 2
+    assert [span["parent_id"] for span in result["spans"]].count(result["spans"][0]["span_id"]) == 2
+
+def test_unsampled_requests_record_nothing(traces):
+    recent = traces(sample_rate=0.0)
+    with tracing.tracer.start_as_current_span("GET /"):
+        analyze_intent("help")
+        mongo_command_tracing.started(mongo_event(2))
+        mongo_command_tracing.succeeded(mongo_event(2))
+    assert len(recent.spans) == 0
+
+def test_trace_context_travels_in_headers(traces):
+    recent = traces()
+    headers = {}
+    with tracing.tracer.start_as_current_span("publish") as span:
+        inject_context(headers)
+    task_request = SimpleNamespace(**headers)
+    with tracing.tracer.start_as_current_span("run", context=extract_context(task_request, from_attributes=True)):
+        pass
+    assert recent.spans[-1].context.trace_id == span.get_span_context().trace_id
+    assert recent.roots(10)[0].name == "run"  # Continued from a remote parent
+
+def test_middleware_names_spans_by_route(traces):
+    recent = traces()
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    def item(item_id: str):
+        return {"intent": analyze_intent(item_id)[0]}
+
+    app.add_middleware(TracingMiddleware)
+    app.add_middleware(RequestIdMiddleware)
+    response = TestClient(app).get("/items/help", headers={"X-Request-ID": "req-9"})
+    trace_id = response.headers["x-trace-id"]
+    spans = recent.trace(trace_id)
+    assert [span.name for span in spans] == ["GET /items/{item_id}", "nlp.analyze_intent"]
+    assert spans[0].attributes["http.status_code"] == 200 and spans[0].attributes["request.id"] == "req-9"
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+def test_profiler_counts_stacks_of_busy_threads():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,))
+    worker.start()
+    session = ProfileSession(interval=0.001, max_seconds=5)
+    session.start()
+    time.sleep(0.2)
+    session.stop()
+    stop.set()
+    worker.join()
+    assert session.samples > 0
+    assert any(stack.rsplit(";", 1)[-1].startswith("busy_loop (tests/test_tracing.py:") for stack in session.stacks)
+    assert "busy_loop" in session.folded() and "busy_loop" in session.flamegraph()
@@ -0,0 +1,121 @@
+import random
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.services.feedback_service import FeedbackStore
+from app.services.model_registry import ModelRegistry
+from app.services.nlp_service import LinearIntentModel
+from app.services.training_service import (FeedbackTrainingSource, IntentTrainer, RetrainRunner, add_training_examples,
+                                           next_version)
+
+mongomock = pytest.importorskip("mongomock")
+
+START = datetime(2024, 5, 1)
+PHRASES = {
+    "help_request": ["can you assist me", "i am stuck with setup", "how do i use this"],
+    "refund_request": ["give my money back", "i was charged twice", "return this for cash"],
+    "shipping_question": ["where is my parcel", "when will it arrive", "track the delivery"],
+}
+
+def examples(n, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        intent = rng.choice(sorted(PHRASES))
+        yield f"{rng.choice(PHRASES[intent])} order {i}", intent
+
+def test_next_version():
+    assert next_version("v1.3") == "v1.4"
+    assert next_version("v9") == "v10"
+    with pytest.raises(ValueError):
+        next_version("latest")
+
+def test_trainer_learns_separable_intents():
+    labels = sorted(PHRASES)
+    trainer = IntentTrainer(np.zeros((4096, 3), dtype=np.float32), np.zeros(3, dtype=np.float32), 0.1)
+    data = list(examples(600))
+    texts, ys = zip(*data)
+    trainer.partial_fit(texts, [labels.index(y) for y in ys])
+    predicted = trainer.predict(["where is my parcel", "i was charged twice", "how do i use this", ""])
+    assert [labels[i] for i in predicted[:3]] == ["shipping_question", "refund_request", "help_request"]
+
+def test_source_labels_feedback_from_annotations_and_ratings():
+    db = mongomock.MongoClient()["test"]
+    store = FeedbackStore()
+    at = START + timedelta(hours=1)
+    store.add(db, "s1", "c1", {"rating": 5}, {"query": "refund me", "intent": "refund_request"}, created_at=at)
+    store.add(db, "s2", "c2", {"rating": 1}, {"query": "hello there", "intent": "help_request"}, created_at=at)
+    corrected = store.add(db, "s3", "c3", {"rating": 1}, {"query": "parcel lost", "intent": "help_request"}, created_at=at)
+    store.annotate(db, corrected, "a1", "help_request", "refund_request")
+    store.annotate(db, corrected, "a2", "help_request", "shipping_question")
+    store.add(db, "s4", "c4", {"rating": 5}, {"intent": "help_request"}, created_at=at)
+    stored, skipped = add_training_examples(db, "curated", [{"text": "track my box", "intent": "shipping_question"},
+                                                            {"text": "", "intent": "help_request"}])
+    assert (stored, skipped) == (1, 1)
+
+    source = FeedbackTrainingSource(lambda: db)
+    labels = ["help_request", "refund_request", "unknown", "shipping_question"]
+    chunks = list(source.chunks(START, START + timedelta(days=1), labels, chunk_size=2))
+    texts = [text for chunk in chunks for text in chunk[0]]
+    ys = [labels[y] for chunk in chunks for y in chunk[1]]
+    assert dict(zip(texts, ys)) == {"refund me": "refund_request", "parcel lost": "shipping_question"}
+    assert sum(chunk[2] for chunk in chunks) == 4
+
+def test_retrain_job_registers_a_better_model(tmp_path):
+    db = mongomock.MongoClient()["test"]
+    store = FeedbackStore()
+    for i, (text, intent) in enumerate(examples(2000, seed=1)):
+        store.add(db, f"s{i}", f"c{i}", {"rating": 5}, {"query": text, "intent": intent},
+                  created_at=START + timedelta(seconds=30 * i))
+    add_training_examples(db, "curated", [{"text": "where is my parcel", "intent": "shipping_question"}])
+    registry = ModelRegistry(str(tmp_path / "models"), memory_budget_bytes=1 << 30)
+    runner = RetrainRunner(str(tmp_path / "jobs"), registry, processes=0, epochs=2, chunk_size=256,
+                           learning_rate=0.1, n_features=4096)
+
+    job = runner.start("v1.3", START, datetime.utcnow() + timedelta(minutes=1), "weekly", source=FeedbackTrainingSource(lambda: db))
+    assert job["model_version"] == "v1.4"
+    runner.join("v1.4", timeout=60)
+
+    status = runner.status("v1.4")
+    assert status["status"] == "completed", status
+    assert status["progress"] == 100.0
+    assert status["metrics"]["accuracy"] > 0.9
+    assert "shipping_question" in status["labels"]
+    model = LinearIntentModel.load(registry.get("v1.4")["artifact_path"])
+    assert model.predict("where is my parcel")[0] == "shipping_question"
+    # Other workers read the status file
+    assert RetrainRunner(str(tmp_path / "jobs"), registry, 0, 1, 1, 0.1, 16).status("v1.4")["status"] == "completed"
+
+def test_retrain_job_fails_without_labelled_data(tmp_path):
+    db = mongomock.MongoClient()["test"]
+    registry = ModelRegistry(str(tmp_path / "models"), memory_budget_bytes=1 << 30)
+    runner = RetrainRunner(str(tmp_path / "jobs"), registry, 0, 1, 100, 0.1, 1024)
+    with pytest.raises(KeyError):
+        runner.start("v9.9", START, START + timedelta(days=1), "r", source=FeedbackTrainingSource(lambda: db))
+    job = runner.start("v1.3", START, START + timedelta(days=1), "r", source=FeedbackTrainingSource(lambda: db))
+    runner.join(job["model_version"], timeout=30)
+    assert runner.status(job["model_version"])["status"] == "failed"
+    assert job["model_version"] not in registry
+
+def test_one_retrain_job_runs_across_workers(tmp_path):
+    db = mongomock.MongoClient()["test"]
+    registry = ModelRegistry(str(tmp_path / "models"), memory_budget_bytes=1 << 30)
+    first = RetrainRunner(str(tmp_path / "jobs"), registry, 0, 1, 100, 0.1, 1024)
+    second = RetrainRunner(str(tmp_path / "jobs"), registry, 0, 1, 100, 0.1, 1024)
+    release = threading.Event()
+
+    def slow_db():
+        release.wait(30)
+        return db
+
+    job = first.start("v1.3", START, START + timedelta(days=1), "r", source=FeedbackTrainingSource(slow_db))
+    assert second.running()
+    with pytest.raises(ValueError):
+        second.start("v1.3", START, START + timedelta(days=1), "r", source=FeedbackTrainingSource(lambda: db))
+    release.set()
+    first.join(job["model_version"], timeout=30)
+    assert not second.running()
+    job = second.start("v1.3", START, START + timedelta(days=1), "r", source=FeedbackTrainingSource(lambda: db))
+    second.join(job["model_version"], timeout=30)
@@ -1,24 +1,286 @@
+"""
+Structured, non-blocking logging for `app_logger`.
+
+Log calls on the request path only build the record and put it on an in-memory queue
+(`logging.handlers.QueueHandler`). A background thread takes everything queued (up to
+LOG_BATCH_SIZE records), formats each record as one JSON line and writes the batch with a single
+write + flush per destination: stderr and, if LOG_FILE is set, a size-rotated file whose directory
+is created on demand. Records that arrive while a batch is being written make up the next one, so
+batches grow with load.
+
+Every record carries the id of the request it was logged from (`request_id_var`, set by
+`RequestIdMiddleware`), so all lines of one request can be correlated. Structured fields passed
+with `extra={...}` become top-level JSON keys. Debug calls are sampled at LOG_DEBUG_SAMPLE_RATE
+before a record is built, so verbose debug logging can stay on under load; if the writer falls
+LOG_QUEUE_MAX records behind, new records are dropped (and counted) rather than blocking requests.
+
+`setup_logging()` is idempotent and is called by app/main.py and the Celery worker; the writer
+thread is restarted in forked children.
+"""
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import random
+import sys
+import threading
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler
+from typing import List, Optional, TextIO
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
 
-# Configure logger
 logger = logging.getLogger("app_logger")
-logger.setLevel(logging.INFO)
 
-# Log format
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Id of the request being served, if any (see app/core/middleware.py)
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def _dumps(payload: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload, default=str).decode()
+    return json.dumps(payload, default=str)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRIBUTES:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+        if record.stack_info:
+            payload["stack_info"] = record.stack_info
+        return _dumps(payload)
+
+
+class RotatingFile:
+    """
+    Append-only text file rotated to path.1 ... path.<backup_count> once it exceeds max_bytes.
+    """
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file: Optional[TextIO] = None
+
+    def _open(self) -> TextIO:
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def write(self, text: str):
+        stream = self._open()
+        if not self.max_bytes or stream.tell() + len(text) <= self.max_bytes:
+            stream.write(text)
+            return
+        # The batch doesn't fit: rotate between the lines where it fills up
+        for line in text.splitlines(keepends=True):
+            if stream.tell() + len(line) > self.max_bytes and stream.tell() > 0:
+                self._rotate()
+                stream = self._open()
+            stream.write(line)
+
+    def _rotate(self):
+        self.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class DebugSampler:
+    """
+    Replaces `logger.debug` so that debug calls not sampled return before a LogRecord is even built.
+    """
+    def __init__(self, target: logging.Logger, rate: float):
+        self.logger = target
+        self.rate = rate
+        self.sampled_out = 0
+        target.debug = self
+
+    def __call__(self, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        if self.rate < 1.0 and random.random() >= self.rate:
+            self.sampled_out += 1
+            return
+        # Attribute the record to our caller, not to this wrapper
+        kwargs["stacklevel"] = kwargs.get("stacklevel", 1) + 1
+        self.logger._log(logging.DEBUG, msg, args, **kwargs)
+
+
+class BufferedQueueHandler(QueueHandler):
+    """
+    Stamps the request id and queues records without ever blocking.
+    """
+    def __init__(self, log_queue: queue.SimpleQueue, max_queued: int):
+        super().__init__(log_queue)
+        self.max_queued = max_queued
+        self.dropped = 0
+
+    def emit(self, record: logging.LogRecord):
+        if self.queue.qsize() >= self.max_queued:
+            self.dropped += 1
+            return
+        super().emit(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Captured here: the writer thread runs outside the request's context
+        record.request_id = request_id_var.get()
+        # Render args and exceptions now, while the objects they refer to are unchanged
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class BatchWriter:
+    """
+    Background thread writing queued records in batches of up to `batch_size`.
+    """
+    _STOP = object()
+
+    def __init__(self, log_queue: queue.SimpleQueue, destinations: List, formatter: logging.Formatter,
+                 batch_size: int):
+        self.queue = log_queue
+        self.destinations = destinations
+        self.formatter = formatter
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(self._STOP)
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            batch = [record]
+            # Whatever else is already queued goes in the same write; don't wait for more
+            while len(batch) < self.batch_size and record is not self._STOP:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(record)
+            stop = batch[-1] is self._STOP
+            self.write([r for r in batch if r is not self._STOP])
+            if stop:
+                return
+
+    def write(self, records: List[logging.LogRecord]):
+        if not records:
+            return
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception as e:
+                lines.append(_dumps({"level": "ERROR", "logger": "app_logger", "message": f"Unformattable log record: {e}"}))
+        text = "\n".join(lines) + "\n"
+        for destination in self.destinations:
+            try:
+                destination.write(text)
+                destination.flush()
+            except Exception:
+                pass
+
+
+_handler: Optional[BufferedQueueHandler] = None
+_writer: Optional[BatchWriter] = None
+
+
+def setup_logging(level: Optional[str] = None, log_file: Optional[str] = None,
+                  stream: Optional[TextIO] = None) -> BufferedQueueHandler:
+    """
+    Routes `app_logger` through the queue and the JSON batch writer. Safe to call more than once.
+    """
+    global _handler, _writer
+    if _handler is not None:
+        return _handler
+    log_file = settings.LOG_FILE if log_file is None else log_file
+    destinations = [stream or sys.stderr]
+    if log_file:
+        destinations.append(RotatingFile(log_file, settings.LOG_MAX_BYTES, settings.LOG_BACKUP_COUNT))
+    log_queue = queue.SimpleQueue()
+    _handler = BufferedQueueHandler(log_queue, settings.LOG_QUEUE_MAX)
+    _writer = BatchWriter(log_queue, destinations, JsonFormatter(), settings.LOG_BATCH_SIZE)
+    _writer.start()
+    logger.setLevel(level or settings.LOG_LEVEL)
+    DebugSampler(logger, settings.LOG_DEBUG_SAMPLE_RATE)
+    logger.addHandler(_handler)
+    logger.propagate = False
+    return _handler
+
+
+def shutdown_logging():
+    """
+    Writes out everything queued; log calls after this are queued but no longer written.
+    """
+    if _writer is not None:
+        _writer.stop()
+        for destination in _writer.destinations:
+            if isinstance(destination, RotatingFile):
+                destination.close()
+
+
+def _restart_writer():
+    # Threads don't survive fork, and the inherited queue's lock may be held by the parent's
+    # writer: give the child a fresh queue and its own writer
+    if _writer is not None:
+        _handler.queue = _writer.queue = queue.SimpleQueue()
+        _writer.start()
 
-# File handler (rotating logs after 5MB, keeping last 5 logs)
-file_handler = RotatingFileHandler("logs/app.log", maxBytes=5 * 1024 * 1024, backupCount=5)
-file_handler.setFormatter(formatter)
 
-# Stream handler (console logs)
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_writer)
 
-# Adding handlers to logger
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
 
 def log_info(message: str):
     logger.info(message)
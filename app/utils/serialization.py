@@ -0,0 +1,195 @@
+"""
+Pluggable binary serialization for values stored in Redis (cache, sessions) and Celery task payloads.
+
+Every payload starts with a 5-byte header: 2 magic bytes, the format version, the codec id and the
+compression id. Payloads without the magic bytes are entries written before this layer existed and
+are decoded as plain JSON, so old cache entries and queued tasks keep working.
+"""
+import json
+import logging
+import zlib
+from datetime import date, datetime
+from typing import Any
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - optional dependency
+    lz4_frame = None
+
+logger = logging.getLogger("app_logger")
+
+MAGIC = b"\xacX"
+VERSION = 1
+HEADER_SIZE = len(MAGIC) + 3
+
+CODEC_JSON = 1
+CODEC_MSGPACK = 2
+CODECS = {"json": CODEC_JSON, "msgpack": CODEC_MSGPACK}
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+COMPRESSION_LZ4 = 3
+COMPRESSIONS = {"none": COMPRESSION_NONE, "zlib": COMPRESSION_ZLIB, "zstd": COMPRESSION_ZSTD, "lz4": COMPRESSION_LZ4}
+
+
+def _default(obj: Any):
+    # ObjectId, Decimal, UUID, ... are stored as strings; dates as ISO-8601
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+
+def _json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _msgpack_dumps(obj: Any) -> bytes:
+    return msgpack.packb(obj, default=_default, use_bin_type=True, datetime=False)
+
+
+def _msgpack_loads(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _codec_available(codec: int) -> bool:
+    return codec == CODEC_JSON or (codec == CODEC_MSGPACK and msgpack is not None)
+
+
+def _compression_available(compression: int) -> bool:
+    if compression == COMPRESSION_ZSTD:
+        return zstandard is not None
+    if compression == COMPRESSION_LZ4:
+        return lz4_frame is not None
+    return compression in (COMPRESSION_NONE, COMPRESSION_ZLIB)
+
+
+class Serializer:
+    def __init__(self, codec: str = "msgpack", compression: str = "zstd", compress_threshold: int = 1024, level: int = 3):
+        """
+        :param codec: "msgpack" or "json" (orjson when installed)
+        :param compression: "zstd", "lz4", "zlib" or "none"
+        :param compress_threshold: Payloads smaller than this many bytes are stored uncompressed
+        :param level: Compression level passed to the compressor
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported codec: {codec}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression: {compression}")
+        self.codec = CODECS[codec]
+        self.compression = COMPRESSIONS[compression]
+        if not _codec_available(self.codec):
+            logger.warning(f"Serializer codec '{codec}' is not installed, falling back to JSON")
+            self.codec = CODEC_JSON
+        if not _compression_available(self.compression):
+            logger.warning(f"Serializer compression '{compression}' is not installed, storing uncompressed")
+            self.compression = COMPRESSION_NONE
+        self.compress_threshold = compress_threshold
+        self.level = level
+        self._zstd_compressor = zstandard.ZstdCompressor(level=level) if self.compression == COMPRESSION_ZSTD else None
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+    def dumps(self, obj: Any) -> bytes:
+        body = _msgpack_dumps(obj) if self.codec == CODEC_MSGPACK else _json_dumps(obj)
+        compression = COMPRESSION_NONE
+        if self.compression != COMPRESSION_NONE and len(body) >= self.compress_threshold:
+            body = self._compress(body)
+            compression = self.compression
+        return MAGIC + bytes((VERSION, self.codec, compression)) + body
+
+    def loads(self, data: Any) -> Any:
+        if isinstance(data, str):
+            data = data.encode()
+        if not data.startswith(MAGIC):
+            # Written before the versioned header existed
+            return _json_loads(data)
+        version, codec, compression = data[2], data[3], data[4]
+        if version > VERSION:
+            raise ValueError(f"Unsupported serialization version: {version}")
+        body = data[HEADER_SIZE:]
+        if compression != COMPRESSION_NONE:
+            try:
+                body = self._decompress(body, compression)
+            except ValueError:
+                raise
+            except Exception as e:  # zstandard.ZstdError, zlib.error, lz4 RuntimeError
+                raise ValueError(f"Corrupt compressed payload: {e}") from e
+        if codec == CODEC_MSGPACK:
+            if msgpack is None:
+                raise ValueError("Payload is msgpack-encoded but msgpack is not installed")
+            return _msgpack_loads(body)
+        if codec == CODEC_JSON:
+            return _json_loads(body)
+        raise ValueError(f"Unknown codec id: {codec}")
+
+    def _compress(self, body: bytes) -> bytes:
+        if self.compression == COMPRESSION_ZSTD:
+            return self._zstd_compressor.compress(body)
+        if self.compression == COMPRESSION_LZ4:
+            return lz4_frame.compress(body, compression_level=self.level)
+        return zlib.compress(body, self.level)
+
+    def _decompress(self, body: bytes, compression: int) -> bytes:
+        if compression == COMPRESSION_ZSTD:
+            if self._zstd_decompressor is None:
+                raise ValueError("Payload is zstd-compressed but zstandard is not installed")
+            return self._zstd_decompressor.decompress(body)
+        if compression == COMPRESSION_LZ4:
+            if lz4_frame is None:
+                raise ValueError("Payload is lz4-compressed but lz4 is not installed")
+            return lz4_frame.decompress(body)
+        if compression == COMPRESSION_ZLIB:
+            return zlib.decompress(body)
+        raise ValueError(f"Unknown compression id: {compression}")
+
+
+serializer = Serializer(
+    codec=settings.SERIALIZER_CODEC,
+    compression=settings.SERIALIZER_COMPRESSION,
+    compress_threshold=settings.SERIALIZER_COMPRESS_THRESHOLD,
+)
+
+
+def dumps(obj: Any) -> bytes:
+    return serializer.dumps(obj)
+
+
+def loads(data: Any) -> Any:
+    return serializer.loads(data)
+
+
+CELERY_CONTENT_TYPE = "application/x-acx"
+
+
+def register_celery_serializer(name: str = "acx"):
+    """
+    Registers the serializer with kombu so Celery tasks can use `task_serializer=name`.
+    """
+    from kombu.serialization import register
+
+    register(name, dumps, loads, content_type=CELERY_CONTENT_TYPE, content_encoding="binary")
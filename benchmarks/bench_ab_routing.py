@@ -0,0 +1,69 @@
+"""
+Overhead of experiment routing on the support query path: per-request cost of arm assignment
+and counter updates, and the /support/query handler with and without a running A/B test.
+
+    python -m benchmarks.bench_ab_routing
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+WORKDIR = tempfile.mkdtemp()
+os.environ.setdefault("MODEL_ARTIFACT_DIR", os.path.join(WORKDIR, "models"))
+os.environ.setdefault("EXPERIMENT_DIR", os.path.join(WORKDIR, "experiments"))
+
+from app.api.v1.endpoints.support import query_support  # noqa: E402
+from app.schemas.support import SupportQuery  # noqa: E402
+from app.services.experiment_service import experiment_router  # noqa: E402
+
+REQUESTS = 50_000
+CUSTOMERS = 5_000
+
+
+def per_call_us(fn, n: int = REQUESTS) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def handler_us(queries) -> float:
+    async def run():
+        for query in queries[:1000]:  # fill the intent cache
+            await query_support(query)
+        start = time.perf_counter()
+        for query in queries:
+            await query_support(query)
+        return (time.perf_counter() - start) / len(queries) * 1e6
+
+    return asyncio.run(run())
+
+
+def main():
+    queries = [SupportQuery(query=f"I need help with order {i % 200}", customer_id=f"customer_{i % CUSTOMERS}")
+               for i in range(REQUESTS)]
+    baseline = handler_us(queries)
+
+    experiment_router.start("micro", {"model_a": "v1.2", "model_b": "v1.3"}, {"model_a": 50, "model_b": 50})
+    route = per_call_us(lambda i: experiment_router.route(f"customer_{i % CUSTOMERS}"))
+    assignment = experiment_router.route("customer_1")
+    record = per_call_us(lambda i: experiment_router.record_prediction(assignment, 0.0004, 0.9))
+
+    experiment_router.start("bench", {"model_a": "v1.2", "model_b": "v1.3"}, {"model_a": 50, "model_b": 50})
+    with_experiment = handler_us(queries)
+
+    start = time.perf_counter()
+    status = experiment_router.status("bench")
+    status_ms = (time.perf_counter() - start) * 1e3
+    shares = {arm: m["observed_traffic_share"] for arm, m in status["metrics"].items()}
+
+    print(f"route (hash + bisect):      {route:6.2f} us")
+    print(f"record_prediction:          {record:6.2f} us")
+    print(f"support handler, no test:   {baseline:6.2f} us")
+    print(f"support handler, A/B test:  {with_experiment:6.2f} us  (+{with_experiment - baseline:.2f} us)")
+    print(f"status aggregation:         {status_ms:6.2f} ms  observed split {shares}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Alert evaluation cost with a large rule set: index build, the first tick (every rule is checked
+once), and steady ticks where every metric moves a little, against scanning all rules each tick.
+
+    python -m benchmarks.bench_alerts --rules 50000 --metrics 500
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from app.services.alert_service import AlertEvaluator, AlertNotifier, AlertRule
+
+NOW = 1_700_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=50_000)
+    parser.add_argument("--metrics", type=int, default=500)
+    parser.add_argument("--ticks", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    metrics = [f"model.v{i}.inference_seconds.p95" for i in range(args.metrics)]
+    rules = []
+    for i in range(args.rules):
+        # Metrics sit around 20-60; most thresholds guard the tails, some sit in the normal range
+        comparison = "above" if i % 4 else "below"
+        threshold = rng.uniform(40, 100) if comparison == "above" else rng.uniform(0, 40)
+        clear = threshold - 5 if comparison == "above" else threshold + 5
+        rules.append(AlertRule(f"alert_{i}", f"rule {i}", rng.choice(metrics), threshold, comparison=comparison,
+                               clear_threshold=clear, for_seconds=rng.choice((0, 30, 300)),
+                               notification_method="webhook", target=f"http://hooks.example.com/{i % 50}"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        notifier = AlertNotifier(interval=30, webhook_timeout=5)
+        evaluator = AlertEvaluator(directory, notifier)
+        publishing = []
+        publish = evaluator._publish
+
+        def timed_publish(*args):
+            start = time.perf_counter()
+            publish(*args)
+            publishing.append(time.perf_counter() - start)
+        evaluator._publish = timed_publish
+        start = time.perf_counter()
+        evaluator.set_rules(rules, now=NOW)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        values = {metric: rng.uniform(20, 60) for metric in metrics}
+        start = time.perf_counter()
+        evaluator.evaluate(NOW, values)
+        first_ms = (time.perf_counter() - start) * 1e3
+
+        timings, evaluation, events = [], [], 0
+        for tick in range(1, args.ticks + 1):
+            # A slow random walk: each metric crosses a handful of thresholds per tick
+            values = {metric: min(max(value + rng.gauss(0, 0.5), 0), 100) for metric, value in values.items()}
+            published = len(publishing)
+            start = time.perf_counter()
+            events += len(evaluator.evaluate(NOW + tick * 10, values))
+            timings.append(time.perf_counter() - start)
+            evaluation.append(timings[-1] - sum(publishing[published:]))
+            notifier.batches()
+        publish_ms = (sum(timings) - sum(evaluation)) / args.ticks * 1e3
+        evaluation.sort()
+        timings.sort()
+        active = len(evaluator._active)
+
+    # Reference: check every rule against its metric's value on every tick, no state handling at all
+    start = time.perf_counter()
+    for _ in range(10):
+        breached = sum(rule.breached(values[rule.metric]) for rule in rules)
+    scan_ms = (time.perf_counter() - start) / 10 * 1e3
+
+    print(f"rules:             {args.rules:,} on {args.metrics} metrics")
+    print(f"index build:       {build_ms:.1f} ms")
+    print(f"first tick:        {first_ms:.1f} ms (every rule checked once)")
+    print(f"steady tick:       p50 {timings[len(timings) // 2] * 1e3:.2f} ms, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e3:.2f} ms, all {args.metrics} metrics changed")
+    print(f"  evaluation:      p50 {evaluation[len(evaluation) // 2] * 1e3:.2f} ms, "
+          f"p99 {evaluation[int(len(evaluation) * 0.99)] * 1e3:.2f} ms")
+    print(f"  state publish:   {publish_ms:.2f} ms avg (written on ticks with transitions)")
+    print(f"notifications:     {events / args.ticks:.1f} per tick, {active:,} alerts pending or firing")
+    print(f"full scan:         {scan_ms:.2f} ms per tick ({breached:,} breached), comparisons only")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Annotation queue cost at production volume: offer throughput against the 5k interactions/sec
+target with the queue at capacity (buffering each offer, and flushing the buffer every
+FLUSH_INTERVAL's worth of offers at that rate), the time a request spends offering, and latency of
+an annotator peeking at and pulling the top 50.
+The queue lives in Redis: an in-memory stand-in (fakeredis) by default, which leaves out the
+network round trips, or a real server with --redis-url (its keys under "bench-annotation:" are
+deleted first).
+
+    python -m benchmarks.bench_annotation_queue [--redis-url redis://localhost:6379/15]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.core.config import settings
+from app.services.annotation_queue import FLUSH_INTERVAL, AnnotationQueue
+
+OFFERS = 50_000
+TARGET_PER_SECOND = 5000
+WORDS = ("help refund order package delivery cancel subscription charge password account login invoice "
+         "address broken damaged late missing card payment warranty return exchange").split()
+PREFIX = "bench-annotation:"
+
+
+async def run(redis_client, offers: int):
+    rng = random.Random(5)
+    stream = [(" ".join(rng.choices(WORDS, k=rng.randint(4, 12))), rng.betavariate(5, 1.5))
+              for _ in range(offers)]
+    capacity = settings.ANNOTATION_QUEUE_CAPACITY
+    queue = AnnotationQueue(capacity, redis_client, prefix=PREFIX)
+    await redis_client.delete(queue.queue_key, queue.items_key, queue.clusters_key)
+    disagree = lambda: ["refund_request"]
+    batch = max(1, int(TARGET_PER_SECOND * FLUSH_INTERVAL))
+
+    offering = 0.0
+    start = time.perf_counter()
+    for i, (text, confidence) in enumerate(stream):
+        started = time.perf_counter()
+        queue.offer(text, "help_request", confidence, "support", "v1.3",
+                    alternatives=disagree if i % 10 == 0 else None, session_id=f"s{i}")
+        offering += time.perf_counter() - started
+        if (i + 1) % batch == 0:
+            await queue.flush()
+    await queue.flush()
+    elapsed = time.perf_counter() - start
+    per_second = offers / elapsed
+
+    stats = await queue.stats()
+    start = time.perf_counter()
+    peeked = await queue.peek(50)
+    peek_ms = (time.perf_counter() - start) * 1e3
+    start = time.perf_counter()
+    pulled = await queue.pull(50)
+    pull_ms = (time.perf_counter() - start) * 1e3
+
+    print(f"offers:            {offers:,} at capacity {capacity:,}")
+    print(f"redis queue:       {per_second:,.0f} offers/s ({elapsed / offers * 1e6:.2f} us each, "
+          f"{per_second / TARGET_PER_SECOND:.1f}x the {TARGET_PER_SECOND:,}/s target)")
+    print(f"in the request:    {offering / offers * 1e6:.2f} us per offer (flushed {batch} at a time)")
+    print(f"queued {stats['queued']:,}, clusters {stats['clusters']:,}, rejected {stats['rejected']:,}, "
+          f"evicted {stats['evicted']:,}")
+    print(f"peek top 50:       {peek_ms:.2f} ms ({len(peeked)} items)")
+    print(f"pull top 50:       {pull_ms:.2f} ms ({len(pulled)} items)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", default=None)
+    parser.add_argument("--offers", type=int, default=OFFERS)
+    args = parser.parse_args()
+    if args.redis_url:
+        import redis.asyncio as aioredis
+
+        redis_client = aioredis.Redis.from_url(args.redis_url)
+    else:
+        import fakeredis
+
+        redis_client = fakeredis.FakeAsyncRedis()
+    asyncio.run(run(redis_client, args.offers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Drift monitoring cost: per-prediction sketch update, memory per monitored model version, and
+the time to capture a baseline and compare a day of traffic against it.
+
+    python -m benchmarks.bench_drift
+"""
+import random
+import tempfile
+import time
+
+from app.core.config import settings
+from app.services.drift_service import DriftMonitor
+from app.services.model_registry import ModelRegistry
+
+PREDICTIONS = 200_000
+WORDS = ("help refund order package delivery cancel subscription charge password account login invoice "
+         "address broken damaged late missing card payment warranty return exchange").split()
+
+
+def main():
+    rng = random.Random(3)
+    queries = [" ".join(rng.choices(WORDS, k=rng.randint(4, 12))) for _ in range(5000)]
+    with tempfile.TemporaryDirectory() as directory:
+        registry = ModelRegistry(f"{directory}/models", memory_budget_bytes=1 << 30)
+        model = registry.load("v1.3")
+        monitor = DriftMonitor(f"{directory}/drift", settings.DRIFT_SLOT_SECONDS, settings.DRIFT_RETENTION_SLOTS,
+                               settings.DRIFT_TOKEN_BUCKETS, settings.DRIFT_PSI_THRESHOLD)
+        predictions = [(text, *model.predict(text)) for text in queries]
+        day = 86400
+        start_time = 1_700_000_000
+
+        start = time.perf_counter()
+        for i in range(PREDICTIONS):
+            text, intent, confidence = predictions[i % len(predictions)]
+            monitor.observe(model, text, intent, confidence, now=start_time + i * day / PREDICTIONS)
+        observe_us = (time.perf_counter() - start) / PREDICTIONS * 1e6
+
+        start = time.perf_counter()
+        for i in range(PREDICTIONS):
+            predictions[i % len(predictions)][0].split()
+        baseline_us = (time.perf_counter() - start) / PREDICTIONS * 1e6
+
+        start = time.perf_counter()
+        monitor.capture_baseline(model, "12h", now=start_time + day / 2)
+        capture_ms = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        result = monitor.compare(model, now=start_time + day)
+        compare_ms = (time.perf_counter() - start) * 1e3
+
+        sketch = monitor.sketch(model.version, model.model.labels)
+        print(f"sketch update per prediction: {observe_us - baseline_us:.2f} us")
+        print(f"memory per model version:     {sketch.nbytes / 2**20:.2f} MB per worker "
+              f"({settings.DRIFT_RETENTION_SLOTS} x {settings.DRIFT_SLOT_SECONDS}s slots, "
+              f"{settings.DRIFT_TOKEN_BUCKETS} token buckets)")
+        print(f"capture 12h baseline:         {capture_ms:.2f} ms")
+        print(f"compare 12h window:           {compare_ms:.2f} ms  samples {result['samples']}, "
+              f"drift_detected={result['drift_detected']}")
+
+
+if __name__ == "__main__":
+    main()
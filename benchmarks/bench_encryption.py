@@ -0,0 +1,101 @@
+"""
+Records per second of field-level PII encryption (AES-256-GCM, app/services/encryption_service.py)
+over a stream of synthetic customers, by thread count: encrypting, decrypting, and both in a
+pipeline. Records are generated from their index and streamed in chunks, so a million of them
+never sit in memory at once. Two reference rows come first, single-threaded: building a new AESGCM
+context per field instead of the cached one, and the previous approach of Fernet over str(record).
+
+    python -m benchmarks.bench_encryption --records 1000000 --threads 1 2 4
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import time
+from typing import Iterator
+
+from app.schemas.customer import CUSTOMER_PII_FIELDS
+from app.services.encryption_service import FieldEncryptor, Keyring
+
+CITIES = ("London", "Paris", "Berlin", "Madrid", "Rome", "Lisbon", "Dublin", "Vienna")
+
+
+def customers(count: int) -> Iterator[dict]:
+    for i in range(count):
+        yield {
+            "first_name": f"First{i % 5000}",
+            "last_name": f"Last{i % 7919}",
+            "email": f"customer{i}@example.com",
+            "phone_number": f"+44 20 7{i % 1000000:06d}",
+            "address": f"{i % 300} High Street",
+            "city": CITIES[i % len(CITIES)],
+            "country": "EU",
+        }
+
+
+class UncachedEncryptor(FieldEncryptor):
+    """
+    Builds the AESGCM context for every field, as code that doesn't keep one per key would.
+    """
+    def _context(self, key_id: str):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        return AESGCM(self.keyring.keys[key_id])
+
+
+def timed(records: int, run) -> float:
+    started = time.perf_counter()
+    processed = sum(1 for _ in run())
+    if processed != records:
+        raise SystemExit(f"Processed {processed} of {records} records")
+    return time.perf_counter() - started
+
+
+def report(name: str, threads: int, records: int, seconds: float):
+    print(f"{name:<22} {threads:>7} {seconds:>9.2f} {records / seconds:>12,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+    fields = list(CUSTOMER_PII_FIELDS)
+
+    with tempfile.TemporaryDirectory() as directory:
+        keyring = Keyring(os.path.join(directory, "keyring.json")).load()
+        print(f"{args.records:,} customers, {len(fields)} PII fields each, {os.cpu_count()} CPUs")
+        print(f"{'':<22} {'threads':>7} {'seconds':>9} {'records/s':>12}")
+
+        # References on a tenth of the records, extrapolated
+        sample = max(1, args.records // 10)
+        uncached = UncachedEncryptor(keyring, threads=1, chunk_size=args.chunk_size)
+        seconds = timed(sample, lambda: (uncached.encrypt_record(r, fields) for r in customers(sample)))
+        report("encrypt, uncached ctx", 1, sample, seconds)
+
+        from cryptography.fernet import Fernet
+
+        fernet = Fernet(Fernet.generate_key())
+        seconds = timed(sample, lambda: (fernet.encrypt(str(r).encode()) for r in customers(sample)))
+        report("fernet(str(record))", 1, sample, seconds)
+
+        # Ciphertexts to decrypt, cycled over: a pool of distinct records rather than all of them in memory
+        cipher = FieldEncryptor(keyring, threads=1, chunk_size=args.chunk_size)
+        pool = [cipher.encrypt_record(r, fields) for r in customers(min(args.records, 20_000))]
+
+        for threads in args.threads:
+            cipher = FieldEncryptor(keyring, threads=threads, chunk_size=args.chunk_size)
+            seconds = timed(args.records, lambda: cipher.encrypt_stream(customers(args.records), fields))
+            report("encrypt", threads, args.records, seconds)
+            encrypted = itertools.islice(itertools.cycle(pool), args.records)
+            seconds = timed(args.records, lambda: cipher.decrypt_stream(encrypted, fields))
+            report("decrypt", threads, args.records, seconds)
+            seconds = timed(args.records, lambda: cipher.decrypt_stream(
+                cipher.encrypt_stream(customers(args.records), fields), fields))
+            report("encrypt + decrypt", threads, args.records, seconds)
+            cipher.close()
+
+
+if __name__ == "__main__":
+    main()
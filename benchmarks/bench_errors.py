@@ -0,0 +1,123 @@
+"""
+Error event store at scale: ingest rate (reports merged in a worker's buffer, and bulk upserts into
+MongoDB) and latency of filtered error-log pages once 50M events have been reported.
+
+Events follow a long tail: a few hundred distinct errors (by type, component and message
+template) spread over 30 days, where the top errors make up most of the volume. Needs a MongoDB
+server for the 50M-event run (seeding is the ingest measurement and is reused by later runs);
+--mongomock gives a quick in-memory smoke run at small sizes.
+
+    python -m benchmarks.bench_errors --events 50000000
+    python -m benchmarks.bench_errors --mongomock --events 5000 --kinds 50
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+from app.core.config import settings
+from app.services.error_service import GROUPS_COLLECTION, ErrorBuffer, ErrorStore
+
+SPAN = timedelta(days=30)
+BATCH = 100_000
+TYPES = ["Timeout", "ConnectionError", "KeyError", "ValueError", "HTTPException", "ValidationError"]
+COMPONENTS = ["db", "cache", "support", "tts", "orchestration", "auth", "celery", "personalization"]
+MESSAGES = ["timeout after {n}ms talking to {host}", "connection refused by {host}:{n}", "KeyError: '{key}'",
+            "invalid literal for int() with base 10: '{key}'", "status {n} from upstream {host}",
+            "field {key} failed validation for customer {n}"]
+
+
+def error_kinds(rng: random.Random, kinds: int):
+    # A letters-only tag per kind: digits would be masked out of the fingerprint
+    tags = set()
+    while len(tags) < kinds:
+        tags.add("".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=8)))
+    return [(rng.choice(TYPES), rng.choice(COMPONENTS), rng.choice(MESSAGES) + f" in {tag}") for tag in sorted(tags)]
+
+
+def events(rng: random.Random, kinds: list, count: int, start: datetime):
+    weights = [1 / (rank + 1) for rank in range(len(kinds))]
+    step = SPAN / count
+    chosen = rng.choices(kinds, weights=weights, k=count)
+    for i, (error_type, component, template) in enumerate(chosen):
+        yield {"error_type": error_type, "component": component, "session_id": f"s{i}",
+               "error_message": template.format(n=rng.randrange(100_000), host=f"node-{rng.randrange(40)}",
+                                                key=f"k{rng.randrange(1000)}"),
+               "timestamp": start + step * i}
+
+
+def timed_ms(fn, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=50_000_000)
+    parser.add_argument("--kinds", type=int, default=500, help="Distinct errors")
+    parser.add_argument("--mongodb-url", default=settings.MONGODB_URL)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = MongoClient(args.mongodb_url)
+    db = client["errors_bench"]
+    rng = random.Random(13)
+    kinds = error_kinds(rng, args.kinds)
+    end = datetime(2024, 6, 1)
+    store = ErrorStore()
+
+    # In-process: what a worker spends per report before anything reaches MongoDB
+    sample = list(events(rng, kinds, 200_000, end - SPAN))
+    buffer = ErrorBuffer(store, interval=1, max_groups=10 ** 9, db_factory=lambda: None)
+    started = time.perf_counter()
+    for i in range(0, len(sample), 100):
+        buffer.add(sample[i:i + 100])
+    elapsed = time.perf_counter() - started
+    print(f"buffer merge:      {len(sample) / elapsed:,.0f} events/s into {len(buffer):,} (error, hour) groups")
+
+    reported = sum(group["count"] for group in db[GROUPS_COLLECTION].find({}, {"count": 1}))
+    if reported != args.events:
+        db[GROUPS_COLLECTION].drop()
+        db["error_counts"].drop()
+        started, upserts = time.perf_counter(), 0
+        batch = []
+        for event in events(rng, kinds, args.events, end - SPAN):
+            batch.append(event)
+            if len(batch) == BATCH:
+                upserts += store.record(db, batch)
+                batch = []
+        if batch:
+            upserts += store.record(db, batch)
+        elapsed = time.perf_counter() - started
+        print(f"ingest:            {args.events:,} events in {elapsed:.1f}s ({args.events / elapsed:,.0f} events/s, "
+              f"{upserts:,} upserts)")
+    store.ensure_indexes(db)
+    print(f"stored:            {db[GROUPS_COLLECTION].estimated_document_count():,} groups, "
+          f"{db['error_counts'].estimated_document_count():,} hourly count documents")
+
+    print(f"\n{'first page of 100':<36} {'ms':>8}")
+    queries = [
+        ("all time", {}),
+        ("all time, error_type", {"error_type": "Timeout"}),
+        ("all time, component", {"component": "db"}),
+        ("1h window", {"start": end - timedelta(hours=1), "end": end}),
+        ("24h window", {"start": end - timedelta(days=1), "end": end}),
+        ("7d window", {"start": end - timedelta(days=7), "end": end}),
+        ("7d window, error_type", {"start": end - timedelta(days=7), "end": end, "error_type": "Timeout"}),
+        ("30d window, component", {"start": end - SPAN, "end": end, "component": "db"}),
+    ]
+    for label, query in queries:
+        ms = timed_ms(lambda: store.page(db, limit=100, **query))
+        print(f"{label:<36} {ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Feedback range queries at scale: latency of a 100-row page for 1h/24h/7d windows, deep
+pagination with the `_id` cursor vs skip/offset, and streaming throughput of a full window.
+
+Needs a MongoDB server for the 10M-row run (seeding takes a few minutes and is reused by later
+runs); --mongomock gives a quick in-memory smoke run at small sizes.
+
+    python -m benchmarks.bench_feedback --rows 10000000
+    python -m benchmarks.bench_feedback --mongomock --rows 20000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, MongoClient
+
+from app.core.config import settings
+from app.services.feedback_service import FEEDBACK_COLLECTION, FeedbackStore, object_id_at
+
+SPAN = timedelta(days=30)
+PAGE = 100
+
+
+def seed(db, rows: int, end: datetime):
+    collection = db[FEEDBACK_COLLECTION]
+    if collection.estimated_document_count() == rows:
+        return
+    collection.drop()
+    rng = random.Random(11)
+    step = SPAN / rows
+    start = end - SPAN
+    batch = []
+    for i in range(rows):
+        created_at = start + step * i
+        batch.append({"_id": object_id_at(created_at), "session_id": f"s{i}", "customer_id": f"c{rng.randrange(100_000)}",
+                      "feedback": {"rating": rng.randint(1, 5)}, "ai_response": {"intent": "help_request"},
+                      "created_at": created_at})
+        if len(batch) == 50_000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def timed_ms(fn, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--mongodb-url", default=settings.MONGODB_URL)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = MongoClient(args.mongodb_url)
+    db = client["feedback_bench"]
+    end = datetime(2024, 6, 1)
+    started = time.perf_counter()
+    seed(db, args.rows, end)
+    store = FeedbackStore()
+    store.ensure_indexes(db)
+    print(f"{args.rows:,} feedback rows ready in {time.perf_counter() - started:.1f}s")
+
+    print(f"{'first page of window':<28} {'ms':>8}")
+    for label, width in (("1h", timedelta(hours=1)), ("24h", timedelta(days=1)), ("7d", timedelta(days=7))):
+        window_start = end - SPAN / 2
+        ms = timed_ms(lambda: store.page(db, window_start, window_start + width, limit=PAGE))
+        print(f"{label:<28} {ms:>8.2f}")
+
+    window_start, window_end = end - timedelta(days=7), end
+    query = {"created_at": {"$gte": window_start, "$lt": window_end}}
+    print(f"\n{'7d window, page n':<18} {'cursor ms':>10} {'skip ms':>10}")
+    cursors, cursor = {}, None
+    for n in range(1, 1001):
+        if n in (1, 10, 100, 1000):
+            cursors[n] = cursor
+        _, cursor = store.page(db, window_start, window_end, cursor=cursor, limit=PAGE)
+        if cursor is None:
+            break
+    for n, page_cursor in cursors.items():
+        cursor_ms = timed_ms(lambda: store.page(db, window_start, window_end, cursor=page_cursor, limit=PAGE), repeat=5)
+        skip_ms = timed_ms(lambda: list(db[FEEDBACK_COLLECTION].find(query).sort("_id", ASCENDING)
+                                        .skip((n - 1) * PAGE).limit(PAGE)), repeat=5)
+        print(f"{n:<18} {cursor_ms:>10.2f} {skip_ms:>10.2f}")
+
+    window_start = end - timedelta(days=1)
+    started = time.perf_counter()
+    streamed = sum(1 for _ in store.iter_range(db, window_start, end))
+    elapsed = time.perf_counter() - started
+    print(f"\nstream 24h window: {streamed:,} rows in {elapsed:.2f}s ({streamed / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Load test of every router in app/main.py with a weighted, realistic request mix, reported as JSON
+(throughput and p50/p95/p99 latency overall and per endpoint) so runs can be compared.
+
+The app runs in-process and is driven over ASGI by `--concurrency` concurrent clients (httpx),
+with its external services replaced by local stand-ins: mongomock for MongoDB, fakeredis (behind
+the instrumented Redis client) for the cache and session stores, Celery tasks run eagerly, and a
+local speech stand-in for Google TTS (which needs the network). Customers, orders and the
+recommendation index are seeded first, so personalization requests hit real data paths.
+
+    python -m benchmarks.bench_load --duration 30 --concurrency 32 --output load.json
+    python -m benchmarks.bench_load --duration 30 --baseline load.json  # exit 1 on regressions
+
+With --baseline, an endpoint regresses when its p95 grows, or overall throughput drops, by more
+than --tolerance (default 15%).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+QUERIES = ["I need help with my order", "I want a refund for my purchase", "Where is my package?",
+           "Can I change my delivery address?", "help, my card was charged twice", "How do I reset my password?",
+           "refund for the broken headphones please", "What are your opening hours?"]
+CATEGORIES = ["electronics", "books", "clothing", "home", "sports", "toys", "beauty", "garden"]
+CHANNELS = ["web", "mobile", "voice", "sms", "email"]
+MIN_SAMPLES_TO_COMPARE = 30
+
+
+class Request(NamedTuple):
+    method: str
+    url: str
+    params: Optional[dict] = None
+    body: object = None
+
+
+class Scenario(NamedTuple):
+    name: str
+    weight: float
+    build: Callable[["Workload"], Request]
+
+
+class Workload:
+    """
+    Seeded request generator; remembers ids created during the run (customers, feedback, cache keys).
+    """
+    def __init__(self, rng: random.Random, customers: int):
+        self.rng = rng
+        self.customers = customers
+        self.customer_ids: List[str] = []
+        self.cache_keys: List[str] = []
+        self.session = 0
+
+    def customer(self) -> str:
+        # Skewed towards a hot set of customers, as real traffic is
+        return f"u{min(int(self.rng.expovariate(1 / (self.customers / 10))), self.customers - 1)}"
+
+    def session_id(self) -> str:
+        self.session += 1
+        return f"s{self.session % 5000}"
+
+    def stored_customer(self) -> Optional[str]:
+        return self.rng.choice(self.customer_ids) if self.customer_ids else None
+
+
+def new_customer(w: Workload) -> Request:
+    n = w.rng.randrange(10 ** 6)
+    return Request("POST", "/api/v1/customer/", body={
+        "first_name": "Jane", "last_name": f"Doe{n}", "email": f"jane{n}@example.com", "phone_number": "+1-555-0100",
+        "address": f"{n % 900 + 1} Main St", "city": "Springfield", "country": "US"})
+
+
+def read_customer(w: Workload) -> Request:
+    return Request("GET", f"/api/v1/customer/{w.stored_customer() or '0' * 24}")
+
+
+def update_customer(w: Workload) -> Request:
+    return Request("PUT", f"/api/v1/customer/{w.stored_customer() or '0' * 24}",
+                   body={"city": w.rng.choice(["Springfield", "Shelbyville", "Ogdenville"])})
+
+
+def store_cache_entry(w: Workload) -> Request:
+    key = f"k{w.rng.randrange(1000)}"
+    w.cache_keys.append(key)
+    return Request("POST", "/api/v1/cache/store", {"key": key, "value": "cached response " * 4, "ttl": 300})
+
+
+def interaction_context(w: Workload) -> dict:
+    return {"preferences": {"preferred_category": w.rng.choice(CATEGORIES)} if w.rng.random() < 0.2 else {},
+            "recent_interactions": [w.rng.choice(QUERIES)], "page": w.rng.choice(["home", "cart", "product"])}
+
+
+SCENARIOS = [
+    # Support and conversations: the bulk of the traffic
+    Scenario("POST /support/query", 22, lambda w: Request("POST", "/api/v1/support/query", body={
+        "query": w.rng.choice(QUERIES), "customer_id": w.customer(), "session_id": w.session_id()})),
+    Scenario("POST /orchestration/context-aware-response", 6, lambda w: Request(
+        "POST", "/api/v1/orchestration/context-aware-response",
+        {"session_id": w.session_id(), "customer_id": w.customer(), "input_text": w.rng.choice(QUERIES + ["cancel it"])},
+        {"previous_conversation": ["Where is my order?"], "current_task": "order_tracking",
+         "user_data": {"order_id": f"o{w.rng.randrange(10 ** 5)}"}})),
+    Scenario("POST /orchestration/task-oriented-dialog", 3, lambda w: Request(
+        "POST", "/api/v1/orchestration/task-oriented-dialog",
+        {"session_id": w.session_id(), "customer_id": w.customer(), "task": "password_reset", "current_step": 1,
+         "input_text": "reset my password"}, {"steps_completed": [], "email": "jane@example.com"})),
+    Scenario("POST /orchestration/update-conversation-state", 2, lambda w: Request(
+        "POST", "/api/v1/orchestration/update-conversation-state",
+        {"session_id": w.session_id(), "customer_id": w.customer()}, {"current_task": "order_tracking", "turn": 3})),
+    Scenario("GET /channels/available", 2, lambda w: Request("GET", "/api/v1/channels/available",
+                                                             {"customer_id": "user123"})),
+    Scenario("POST /channels/send", 2, lambda w: Request("POST", "/api/v1/channels/send", {
+        "customer_id": w.customer(), "channel": w.rng.choice(CHANNELS), "message": "Your order has shipped"})),
+    Scenario("POST /channels/receive", 2, lambda w: Request("POST", "/api/v1/channels/receive", {
+        "customer_id": w.customer(), "channel": w.rng.choice(CHANNELS), "message": w.rng.choice(QUERIES)})),
+    # Personalization
+    Scenario("POST /personalization/recommendations", 8, lambda w: Request(
+        "POST", "/api/v1/personalization/recommendations", {"customer_id": w.customer()}, interaction_context(w))),
+    Scenario("POST /personalization/dynamic-content", 5, lambda w: Request(
+        "POST", "/api/v1/personalization/dynamic-content", {"customer_id": w.customer()}, interaction_context(w))),
+    Scenario("GET /personalization/order-history", 3, lambda w: Request(
+        "GET", "/api/v1/personalization/order-history", {"customer_id": w.customer()})),
+    Scenario("POST /personalization/contextual-response", 3, lambda w: Request(
+        "POST", "/api/v1/personalization/contextual-response",
+        {"session_id": w.session_id(), "customer_id": w.customer(), "input_text": w.rng.choice(QUERIES)},
+        interaction_context(w))),
+    Scenario("POST /personalization/customer-profile", 2, lambda w: Request(
+        "POST", "/api/v1/personalization/customer-profile", {"customer_id": w.customer()})),
+    # Customers
+    Scenario("POST /customer/", 3, new_customer),
+    Scenario("GET /customer/{customer_id}", 6, read_customer),
+    Scenario("PUT /customer/{customer_id}", 2, update_customer),
+    Scenario("GET /customer/", 2, lambda w: Request("GET", "/api/v1/customer/",
+                                                    {"skip": w.rng.randrange(50), "limit": 10})),
+    # Auth
+    Scenario("POST /auth/login", 4, lambda w: Request("POST", "/api/v1/auth/login",
+                                                      body={"username": "admin", "password": "password"})),
+    # Cache
+    Scenario("POST /cache/store", 2, store_cache_entry),
+    # Stored keys only: the endpoint answers a miss with a 500
+    Scenario("GET /cache/retrieve", 3, lambda w: Request("GET", "/api/v1/cache/retrieve",
+                                                         {"key": w.rng.choice(w.cache_keys or ["k0"])})),
+    Scenario("GET /cache/metrics", 1, lambda w: Request("GET", "/api/v1/cache/metrics")),
+    # Active learning
+    Scenario("POST /active-learning/feedback", 4, lambda w: Request(
+        "POST", "/api/v1/active-learning/feedback", {"session_id": w.session_id(), "customer_id": w.customer()},
+        {"feedback": {"rating": w.rng.randint(1, 5), "comment": "Helpful answer"},
+         "ai_response": {"query": w.rng.choice(QUERIES), "intent": "help_request", "confidence": 0.9}})),
+    Scenario("GET /active-learning/feedback-collection", 1, lambda w: Request(
+        "GET", "/api/v1/active-learning/feedback-collection",
+        {"start_time": (datetime.utcnow() - timedelta(hours=1)).isoformat(),
+         "end_time": datetime.utcnow().isoformat(), "limit": 50})),
+    Scenario("GET /active-learning/annotation-queue", 1, lambda w: Request(
+        "GET", "/api/v1/active-learning/annotation-queue", {"limit": 20})),
+    # Model management (reads only: deploys would change what the rest of the run measures)
+    Scenario("GET /model/active", 1, lambda w: Request("GET", "/api/v1/model/active")),
+    Scenario("GET /model/drift-detection/status", 1, lambda w: Request(
+        "GET", "/api/v1/model/drift-detection/status", {"model_version": "v1.3"})),
+    # Monitoring
+    Scenario("POST /monitoring/error/report", 2, lambda w: Request("POST", "/api/v1/monitoring/error/report", {
+        "error_type": "Timeout", "session_id": w.session_id(), "component": w.rng.choice(["db", "cache", "tts"]),
+        "error_message": f"timeout after {w.rng.randrange(5000)}ms"})),
+    Scenario("GET /monitoring/error/logs", 1, lambda w: Request("GET", "/api/v1/monitoring/error/logs", {"limit": 20})),
+    Scenario("GET /monitoring/system-metrics", 1, lambda w: Request("GET", "/api/v1/monitoring/system-metrics")),
+    Scenario("GET /monitoring/ai-metrics", 1, lambda w: Request("GET", "/api/v1/monitoring/ai-metrics")),
+    # Security and compliance
+    Scenario("POST /security/encrypt-data", 1, lambda w: Request(
+        "POST", "/api/v1/security/encrypt-data", {"encryption_method": "AES-256"},
+        {"email": "jane@example.com", "phone": "+1-555-0100"})),
+    Scenario("GET /security/threat-detection", 1, lambda w: Request("GET", "/api/v1/security/threat-detection")),
+    # Text to speech
+    Scenario("POST /tts/", 1, lambda w: Request("POST", "/api/v1/tts/", {"text": w.rng.choice(QUERIES)})),
+]
+
+
+class LocalSpeech:
+    """
+    Stands in for gTTS: writes an MP3-sized file (about 1 KB per 10 characters) without the network.
+    """
+    def __init__(self, text: str, lang: str = "en", slow: bool = False):
+        self.text = text
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(b"\xff\xfb\x90\x00" + bytes(len(self.text) * 100))
+
+
+def configure_environment(directory: str):
+    # Settings are read at import time, so this runs before anything from `app` is imported
+    for name in ("MODEL_ARTIFACT_DIR", "EXPERIMENT_DIR", "DRIFT_DIR", "RETRAIN_DIR", "METRICS_DIR", "TIMESERIES_DIR",
+                 "ALERT_DIR", "RECOMMENDATION_INDEX_DIR"):
+        os.environ[name] = os.path.join(directory, name.lower())
+    os.environ["ENCRYPTION_KEYRING_PATH"] = os.path.join(directory, "keys", "keyring.json")
+    os.environ.setdefault("LOG_FILE", os.path.join(directory, "app.log"))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def forget_repo_root():
+    # Run from the repo root, its celery.py shadows the celery package that app/core/tasks.py imports;
+    # `app` is imported by now and keeps resolving its modules through its own package path
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path[:] = [entry for entry in sys.path if os.path.abspath(entry or os.curdir) != root]
+
+
+def install_stand_ins(db):
+    import fakeredis
+    import gtts
+    import redis.asyncio as aioredis
+
+    from app.core.resources import resources
+    from app.core.tasks import celery_app
+    from app.services.annotation_queue import annotation_queue
+    from app.services.cache_service import tiered_cache
+    from app.services.metrics_service import TimedRedis
+    from app.services.session_service import session_store
+
+    resources.db = db
+    server = fakeredis.FakeServer()
+    # The instrumented client class, talking to the in-memory server
+    async_redis = TimedRedis(connection_pool=aioredis.ConnectionPool(connection_class=fakeredis.aioredis.FakeConnection,
+                                                                     server=server))
+    resources.redis = tiered_cache.redis = session_store.redis = annotation_queue.redis = async_redis
+    resources.cache_client = fakeredis.FakeStrictRedis(server=server)
+    celery_app.conf.task_always_eager = True
+    gtts.gTTS = LocalSpeech
+
+
+def seed(db, rng: random.Random, customers: int, products: int):
+    from app.services.offer_service import offer_store
+    from app.services.recommendation_service import rebuild_from_db, recommendation_engine
+
+    now = datetime.utcnow()
+    db["products"].insert_many([{"product_id": f"p{i}", "product_name": f"Product {i}", "category": CATEGORIES[i % 8],
+                                 "price": f"${5 + i % 95}.99"} for i in range(products)])
+    db["customer_profiles"].insert_many([{"customer_id": f"u{i}", "preferences": {
+        "preferred_category": rng.choice(CATEGORIES), "language": "en"}, "updated_at": now} for i in range(customers)])
+    orders = []
+    for i in range(customers):
+        for j in range(rng.randint(1, 8)):
+            p = min(int(rng.expovariate(1 / (products / 8))), products - 1)
+            orders.append({"customer_id": f"u{i}", "order_id": f"o{i}-{j}", "product_id": f"p{p}",
+                           "product": f"Product {p}", "price": "$9.99", "order_date": now - timedelta(days=j * 7),
+                           "created_at": now - timedelta(days=j * 7)})
+    db["orders"].insert_many(orders)
+    db["customer_profiles"].create_index("customer_id")
+    db["orders"].create_index("customer_id")
+    rebuild_from_db(db)
+    recommendation_engine.reload()
+    offer_store.refresh_changed(db)
+
+
+def summarize(latencies: List[float], statuses: Dict[int, int], elapsed: float) -> dict:
+    values = np.asarray(latencies) * 1e3
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(float(values.mean()), 3) if len(values) else 0.0,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "status": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+async def run_load(app, workload: Workload, duration: float, concurrency: int, warmup: float,
+                   prepare: Callable[[], None]) -> dict:
+    import httpx
+
+    names = [scenario.name for scenario in SCENARIOS]
+    weights = [scenario.weight for scenario in SCENARIOS]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    recording = False
+
+    async def client_loop(client, deadline: float):
+        while time.perf_counter() < deadline:
+            scenario = SCENARIOS[names.index(workload.rng.choices(names, weights)[0])]
+            request = scenario.build(workload)
+            started = time.perf_counter()
+            response = await client.request(request.method, request.url, params=request.params,
+                                            json=request.body)
+            elapsed = time.perf_counter() - started
+            if scenario.name == "POST /customer/" and response.status_code == 200:
+                workload.customer_ids.append(response.json()["_id"])
+            if recording:
+                latencies[scenario.name].append(elapsed)
+                statuses[scenario.name][response.status_code] += 1
+
+    # Unhandled exceptions become 500s, as behind a real server
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async with app.router.lifespan_context(app):
+            # After startup, which opens the real clients
+            prepare()
+            # Warm caches, the model and the customer list before measuring
+            await asyncio.gather(*(client_loop(client, time.perf_counter() + warmup) for _ in range(concurrency)))
+            recording = True
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop(client, started + duration) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    all_statuses: Dict[int, int] = defaultdict(int)
+    for by_status in statuses.values():
+        for status, count in by_status.items():
+            all_statuses[status] += count
+    return {
+        "overall": summarize(all_latencies, all_statuses, elapsed),
+        "endpoints": {name: summarize(latencies[name], statuses[name], elapsed) for name in names if latencies[name]},
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    found = []
+    overall, before = report["overall"], baseline["overall"]
+    if overall["rps"] < before["rps"] * (1 - tolerance):
+        found.append(f"overall throughput {before['rps']} -> {overall['rps']} rps")
+    for name, stats in report["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if old is None or min(stats["requests"], old["requests"]) < MIN_SAMPLES_TO_COMPARE:
+            continue
+        if stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            found.append(f"{name}: p95 {old['p95_ms']} -> {stats['p95_ms']} ms")
+        if stats["errors"] > old["errors"] and stats["errors"] / stats["requests"] > 0.01:
+            found.append(f"{name}: {stats['errors']} errors (baseline {old['errors']})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_environment(directory)
+        import mongomock
+
+        from app.main import app
+
+        forget_repo_root()
+        rng = random.Random(args.seed)
+        db = mongomock.MongoClient()["customer_database"]
+
+        def prepare():
+            install_stand_ins(db)
+            seed(db, rng, args.customers, args.products)
+
+        workload = Workload(rng, args.customers)
+        results = asyncio.run(run_load(app, workload, args.duration, args.concurrency, args.warmup, prepare))
+
+    report = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "customers": args.customers,
+            "seed": args.seed,
+        },
+        **results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
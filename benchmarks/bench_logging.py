@@ -0,0 +1,92 @@
+"""
+Cost of a log call on the request path: the old synchronous RotatingFileHandler + StreamHandler
+pair against the queued JSON pipeline, plus sampled and disabled debug calls. "Caller" is the time
+spent inside the log calls; the writer thread's formatting and writes are timed separately.
+
+    python -m benchmarks.bench_logging --calls 100000
+"""
+import argparse
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+from app.utils.logging import (BatchWriter, BufferedQueueHandler, DebugSampler, JsonFormatter, RotatingFile,
+                               request_id_var)
+
+
+def fresh_logger(name: str, handlers) -> logging.Logger:
+    bench_logger = logging.getLogger(name)
+    bench_logger.handlers[:] = handlers
+    bench_logger.setLevel(logging.INFO)
+    bench_logger.propagate = False
+    return bench_logger
+
+
+def time_calls(call, calls: int) -> float:
+    started = time.perf_counter()
+    for i in range(calls):
+        call(i)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100_000)
+    args = parser.parse_args()
+    calls = args.calls
+    devnull = open(os.devnull, "w")
+    request_id_var.set("4f6c2a9e0d1b4e7a8c3f5b2d6e9a1c0f")
+
+    with tempfile.TemporaryDirectory() as directory:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        file_handler = RotatingFileHandler(os.path.join(directory, "sync.log"), maxBytes=5 * 1024 * 1024, backupCount=5)
+        stream_handler = logging.StreamHandler(devnull)
+        for handler in (file_handler, stream_handler):
+            handler.setFormatter(formatter)
+        sync_logger = fresh_logger("bench_sync", [file_handler, stream_handler])
+        sync = time_calls(lambda i: sync_logger.info("Served request %d for customer %s", i, "c42"), calls)
+
+        log_queue = queue.SimpleQueue()
+        handler = BufferedQueueHandler(log_queue, max_queued=10 ** 9)
+        log_file = RotatingFile(os.path.join(directory, "queued.log"), 5 * 1024 * 1024, 5)
+        writer = BatchWriter(log_queue, [devnull, log_file], JsonFormatter(), batch_size=512)
+        queued_logger = fresh_logger("bench_queued", [handler])
+        info = lambda i: queued_logger.info("Served request %d for customer %s", i, "c42", extra={"customer_id": "c42"})
+        # The caller's share alone (records pile up in the queue), then the writer draining them
+        caller = time_calls(info, calls)
+        started = time.perf_counter()
+        writer.start()
+        writer.stop()
+        writer_only = time.perf_counter() - started
+        # Both at once: on a single core the writer thread takes turns with the caller
+        writer.start()
+        started = time.perf_counter()
+        concurrent = time_calls(info, calls)
+        writer.stop()
+        drained = time.perf_counter() - started
+        log_file.close()
+
+        queued_logger.setLevel(logging.DEBUG)
+        sampler = DebugSampler(queued_logger, 0.01)
+        writer.start()
+        sampled = time_calls(lambda i: queued_logger.debug("Cache probe %d", i), calls)
+        writer.stop()
+        queued_logger.setLevel(logging.INFO)
+        disabled = time_calls(lambda i: queued_logger.debug("Cache probe %d", i), calls)
+
+    per_call = lambda seconds: seconds / calls * 1e6
+    print(f"calls:                      {calls:,}")
+    print(f"sync file + stream:         {per_call(sync):.2f} us per call (caller)")
+    print(f"queued JSON, caller only:   {per_call(caller):.2f} us per call")
+    print(f"queued JSON, writer only:   {per_call(writer_only):.2f} us per record, off the request path")
+    print(f"queued JSON, concurrent:    {per_call(concurrent):.2f} us per call, {per_call(drained):.2f} us drained "
+          f"(one core shared with the writer)")
+    print(f"debug, 1% sampled:          {per_call(sampled):.2f} us per call ({sampler.sampled_out:,} sampled out)")
+    print(f"debug, level INFO:          {per_call(disabled):.3f} us per call")
+
+
+if __name__ == "__main__":
+    main()
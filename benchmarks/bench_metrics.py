@@ -0,0 +1,91 @@
+"""
+Instrumentation overhead: cost of single metric updates, the per-request overhead the metrics
+middleware adds to an ASGI app, and the time to render /metrics with several worker files.
+
+    python -m benchmarks.bench_metrics
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from app.core import middleware
+from app.core.middleware import MetricsMiddleware
+from app.services.metrics_service import MetricsRegistry
+
+N = 200_000
+WORKERS = 8
+
+
+def per_call_us(fn, n: int = N) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+async def endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def routed(app):
+    # Stands in for the router, which records the matched endpoint in the scope
+    async def router(scope, receive, send):
+        scope["endpoint"] = endpoint
+        await app(scope, receive, send)
+    return router
+
+
+async def drive(app, n: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(n):
+        await app({"type": "http", "method": "GET", "path": "/items/1", "app": None}, receive, send)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        registry = MetricsRegistry(directory, max_slots=65536)
+        counter = registry.counter("c_total", "C.")
+        histogram = registry.histogram("h_seconds", "H.", ["route"])
+        series = counter.labels()
+        observed = histogram.labels("/items/{item_id}")
+        print(f"counter inc:               {per_call_us(lambda: series.inc()):.3f} us")
+        print(f"histogram observe:         {per_call_us(lambda: observed.observe(0.0123)):.3f} us")
+        print(f"labels() + observe:        {per_call_us(lambda: histogram.labels('/items/{item_id}').observe(0.0123)):.3f} us")
+
+        middleware.http_request_duration = registry.histogram("http_request_duration_seconds", "Latency.",
+                                                              ["method", "route", "status"])
+        middleware.http_requests_in_flight = registry.gauge("http_requests_in_flight", "In flight.")
+        plain, instrumented = routed(endpoint), MetricsMiddleware(routed(endpoint))
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(drive(instrumented, 1000))
+        plain_us = min(loop.run_until_complete(drive(plain, N)) for _ in range(3))
+        instrumented_us = min(loop.run_until_complete(drive(instrumented, N)) for _ in range(3))
+        loop.close()
+        print(f"request without metrics:   {plain_us:.3f} us")
+        print(f"request with metrics:      {instrumented_us:.3f} us")
+        print(f"middleware overhead:       {instrumented_us - plain_us:.3f} us per request")
+
+        # Scrape cost with a realistic number of series in every worker file
+        for i in range(300):
+            histogram.labels(f"/route/{i}").observe(0.01)
+        for worker in range(1, WORKERS):
+            for ext in (".npy", ".json"):
+                shutil.copy(os.path.join(directory, f"{os.getpid()}{ext}"), os.path.join(directory, f"{10_000_000 + worker}{ext}"))
+        start = time.perf_counter()
+        text = registry.exposition()
+        print(f"/metrics render:           {(time.perf_counter() - start) * 1e3:.1f} ms "
+              f"({WORKERS} workers, {len(text.splitlines()):,} lines)")
+
+
+if __name__ == "__main__":
+    main()
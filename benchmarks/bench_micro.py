@@ -0,0 +1,108 @@
+"""
+Micro-benchmarks of the per-request building blocks, with pytest-benchmark so runs can be saved
+and compared: intent classification, JWT creation and verification, the ASGI middleware stack
+around an empty endpoint, request schema validation, and TTS (speech with the local stand-in
+from bench_load; MP3 to WAV conversion only where ffmpeg is installed).
+
+    python -m pytest benchmarks/bench_micro.py --benchmark-autosave
+    python -m pytest benchmarks/bench_micro.py --benchmark-compare --benchmark-compare-fail=median:15%
+"""
+import asyncio
+import os
+import shutil
+
+import gtts
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from jose import jwt
+
+from app.core.config import settings
+from app.core.middleware import MetricsMiddleware, RequestIdMiddleware
+from app.schemas.auth import Login
+from app.schemas.customer import CustomerCreate
+from app.schemas.support import SupportQuery
+from app.services import tts_service
+from app.services.nlp_service import analyze_intent
+from app.utils.token import create_access_token
+from benchmarks.bench_load import LocalSpeech
+
+CUSTOMER = {"first_name": "Jane", "last_name": "Doe", "email": "jane@example.com", "phone_number": "+1-555-0100",
+            "address": "1 Main St", "city": "Springfield", "country": "US"}
+
+
+@pytest.mark.parametrize("query", ["I need help with my order", "refund for the broken headphones please",
+                                   "What are your opening hours?"])
+def test_analyze_intent(benchmark, query):
+    benchmark(analyze_intent, query)
+
+
+def test_create_token(benchmark):
+    benchmark(create_access_token, {"sub": "admin"})
+
+
+def test_verify_token(benchmark):
+    token = create_access_token({"sub": "admin"})
+    payload = benchmark(jwt.decode, token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    assert payload["sub"] == "admin"
+
+
+async def empty_endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+@pytest.mark.parametrize("stack", ["none", "request_id", "metrics+request_id"])
+def test_middleware_dispatch(benchmark, stack):
+    app = empty_endpoint
+    if "metrics" in stack:
+        app = MetricsMiddleware(app)
+    if "request_id" in stack:
+        app = RequestIdMiddleware(app)
+    scope = {"type": "http", "method": "POST", "path": "/api/v1/support/query", "headers": [], "app": None}
+    loop = asyncio.new_event_loop()
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    async def requests(n=100):
+        for _ in range(n):
+            await app(dict(scope), receive, send)
+
+    # 100 requests per round: one loop iteration would be mostly event loop overhead
+    benchmark(lambda: loop.run_until_complete(requests()))
+    loop.close()
+
+
+@pytest.mark.parametrize("schema,data", [
+    (SupportQuery, {"query": "Where is my package?", "customer_id": "u42", "session_id": "s1"}),
+    (Login, {"username": "admin", "password": "password"}),
+    (CustomerCreate, CUSTOMER),
+], ids=["SupportQuery", "Login", "CustomerCreate"])
+def test_schema_validation(benchmark, schema, data):
+    benchmark(schema.parse_obj, data)
+
+
+@pytest.fixture
+def speech(monkeypatch):
+    monkeypatch.setattr(gtts, "gTTS", LocalSpeech)
+    return tts_service.TTSService()
+
+
+def speak(speech, output_format: str) -> str:
+    path = speech.text_to_speech("Your order has shipped and will arrive on Tuesday.", output_format)
+    os.remove(path)  # Every round writes a temporary file
+    return path
+
+
+def test_text_to_speech(benchmark, speech):
+    benchmark(speak, speech, "mp3")
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="pydub needs ffmpeg to convert audio")
+def test_convert_audio_format(benchmark, speech):
+    assert benchmark(speak, speech, "wav").endswith(".wav")
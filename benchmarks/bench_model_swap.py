@@ -0,0 +1,103 @@
+"""
+Model hot swap under load: 8 threads classify queries through the registry while the main
+thread alternates deploys between two 64 MB intent model artifacts. The memory budget holds a
+single model, so every deploy evicts the previous version and reloads from disk.
+
+Reports load+warm and swap latency per deploy, request errors and request latency percentiles,
+compared with an unload-then-reload of an unmapped artifact.
+
+    python -m benchmarks.bench_model_swap
+"""
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from app.services.model_registry import ModelRegistry
+from app.services.nlp_service import LinearIntentModel
+
+N_FEATURES = 1 << 20
+LABELS = [f"intent_{i}" for i in range(16)]
+QUERIES = ["I need help with my order", "I want a refund", "where is my package", "cancel my subscription",
+           "the app keeps crashing when I log in", "change my delivery address please"]
+THREADS = 8
+DEPLOYS = 20
+DEPLOY_INTERVAL = 0.2
+
+
+def make_model(seed: int) -> LinearIntentModel:
+    rng = np.random.default_rng(seed)
+    weights = rng.standard_normal((N_FEATURES, len(LABELS)), dtype=np.float32)
+    return LinearIntentModel(weights, np.zeros(len(LABELS), dtype=np.float32), LABELS)
+
+
+def run_load(predict, stop: threading.Event, latencies: list, errors: list):
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            predict(QUERIES[i % len(QUERIES)])
+        except Exception as e:
+            errors.append(e)
+        latencies.append(time.perf_counter() - start)
+        i += 1
+
+
+def under_load(predict, deploy) -> dict:
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [threading.Thread(target=run_load, args=(predict, stop, latencies, errors)) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    deploys = []
+    try:
+        for i in range(DEPLOYS):
+            time.sleep(DEPLOY_INTERVAL)
+            deploys.append(deploy("v2" if i % 2 == 0 else "v3"))
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    latencies = np.array(latencies) * 1e3
+    return {"requests": len(latencies), "errors": len(errors), "deploys": deploys,
+            "p50": np.percentile(latencies, 50), "p99": np.percentile(latencies, 99), "max": latencies.max()}
+
+
+def main():
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        size = make_model(0).size_bytes
+        registry = ModelRegistry(artifact_dir, memory_budget_bytes=int(size * 1.5))
+        for seed, version in enumerate(("v2", "v3")):
+            registry.register(version, {}, artifact_path=registry.store_artifact(version, make_model(seed)))
+        registry.activate("v3")
+        print(f"artifacts: 2 x {size / 2**20:.0f} MB, {THREADS} request threads, {DEPLOYS} deploys")
+
+        hot = under_load(lambda text: registry.active().predict(text), registry.activate)
+        load = [d["load_seconds"] * 1e3 for d in hot["deploys"]]
+        swap = [d["swap_seconds"] * 1e3 for d in hot["deploys"]]
+
+        # Unload-then-load reload: the old model is dropped before the new one is read fully into memory
+        current = {"model": LinearIntentModel.load(registry.get("v3")["artifact_path"], mmap=False)}
+
+        def reload_predict(text):
+            model = current["model"]
+            if model is None:
+                raise RuntimeError("Model not loaded")
+            return model.predict(text)
+
+        def reload_deploy(version):
+            current["model"] = None
+            current["model"] = LinearIntentModel.load(registry.get(version)["artifact_path"], mmap=False)
+
+        naive = under_load(reload_predict, reload_deploy)
+
+    print(f"hot swap: load+warm {np.median(load):.1f} ms median, swap + registry write {np.median(swap):.1f} ms median")
+    print(f"{'mode':<16} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, result in (("hot swap", hot), ("unload+reload", naive)):
+        print(f"{name:<16} {result['requests']:>9} {result['errors']:>7} {result['p50']:>8.3f} "
+              f"{result['p99']:>8.3f} {result['max']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
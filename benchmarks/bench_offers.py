@@ -0,0 +1,94 @@
+"""
+Materialized offers vs request-time computation: per-request latency and refresh cost of an
+incremental run (1% of customers changed) vs a full recompute. Runs against mongomock, so
+absolute numbers are pessimistic; the ratios are what matter.
+
+    python -m benchmarks.bench_offers --customers 5000
+"""
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import mongomock
+import numpy as np
+
+from app.services.offer_service import OfferStore, load_customer_data, purchased_product_ids, RECOMMENDATIONS_LIMIT
+from app.services.recommendation_service import ItemSimilarityIndex, RecommendationEngine
+
+
+def seed(db, n_customers: int, n_items: int, rng):
+    created = datetime.utcnow() - timedelta(days=1)
+    db["customer_profiles"].insert_many([
+        {"customer_id": f"u{i}", "preferences": {"preferred_category": f"c{i % 20}"}, "updated_at": created}
+        for i in range(n_customers)
+    ])
+    counts = np.maximum(rng.poisson(5, n_customers), 1)
+    customers = np.repeat(np.arange(n_customers), counts)
+    items = (rng.zipf(1.3, len(customers)) - 1) % n_items
+    db["orders"].insert_many([
+        {"customer_id": f"u{c}", "product_id": f"p{p}", "order_date": created, "created_at": created}
+        for c, p in zip(customers.tolist(), items.tolist())
+    ])
+    db["customer_profiles"].create_index("customer_id")
+    db["orders"].create_index("customer_id")
+    catalog = {f"p{i}": {"product_name": f"Product {i}", "category": f"c{i % 20}", "price": "$9.99"} for i in range(n_items)}
+    return ItemSimilarityIndex.build(((f"u{c}", f"p{p}") for c, p in zip(customers, items)), catalog)
+
+
+def timed_per_call(fn, calls) -> float:
+    start = time.perf_counter()
+    for args in calls:
+        fn(*args)
+    return (time.perf_counter() - start) / len(calls) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=5_000)
+    parser.add_argument("--items", type=int, default=5_000)
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--changed", type=float, default=0.01)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(3)
+    db = mongomock.MongoClient()["bench"]
+    index = seed(db, args.customers, args.items, rng)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        index.save(index_dir)
+        engine = RecommendationEngine(index_dir)
+        store = OfferStore(engine=engine)
+
+        start = time.perf_counter()
+        full = store.refresh_changed(db)
+        full_s = time.perf_counter() - start
+
+        changed = rng.choice(args.customers, int(args.customers * args.changed), replace=False)
+        now = datetime.utcnow()
+        db["customer_profiles"].update_many(
+            {"customer_id": {"$in": [f"u{i}" for i in changed]}}, {"$set": {"updated_at": now}}
+        )
+        start = time.perf_counter()
+        incremental = store.refresh_changed(db)
+        incremental_s = time.perf_counter() - start
+
+        def live(customer_id):
+            data = load_customer_data(db, [customer_id])[customer_id]
+            engine.recommend(purchased_product_ids(data), k=RECOMMENDATIONS_LIMIT,
+                             preferred_category=data["preferences"].get("preferred_category"))
+
+        calls = [(f"u{i}",) for i in rng.integers(0, args.customers, args.requests)]
+        live_us = timed_per_call(live, calls)
+        materialized_us = timed_per_call(lambda customer_id: store.get(db, customer_id), calls)
+
+    print(f"{args.customers} customers, {args.items} items")
+    print(f"request latency   live compute: {live_us:9.1f} us   materialized lookup: {materialized_us:9.1f} us"
+          f"   ({live_us / materialized_us:.1f}x)")
+    print(f"refresh  full: {full['customers_refreshed']:6} customers {full_s:7.2f} s"
+          f"   incremental: {incremental['customers_refreshed']:6} customers {incremental_s:7.2f} s"
+          f"   ({full_s / incremental_s:.1f}x cheaper)")
+
+
+if __name__ == "__main__":
+    main()
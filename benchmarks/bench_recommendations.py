@@ -0,0 +1,76 @@
+"""
+Recommendation engine at production scale: offline build cost, index size, memory-mapped load
+time and recommendations/sec for random customers.
+
+    python -m benchmarks.bench_recommendations --items 100000 --customers 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.recommendation_service import ItemSimilarityIndex, RecommendationEngine
+
+
+def synthetic_orders(n_items: int, n_customers: int, orders_per_customer: float, seed: int = 7):
+    """
+    Zipf-distributed product popularity, Poisson number of orders per customer.
+    """
+    rng = np.random.default_rng(seed)
+    counts = np.maximum(rng.poisson(orders_per_customer, n_customers), 1)
+    customers = np.repeat(np.arange(n_customers), counts)
+    items = (rng.zipf(1.3, len(customers)) - 1) % n_items
+    return customers, items
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--customers", type=int, default=1_000_000)
+    parser.add_argument("--orders-per-customer", type=float, default=5.0)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    customers, items = synthetic_orders(args.items, args.customers, args.orders_per_customer)
+    item_ids = np.char.add("p", np.arange(args.items).astype(str))
+    catalog = {item_id: {"product_name": item_id, "category": f"c{i % 20}", "price": "$9.99"}
+               for i, item_id in enumerate(item_ids.tolist())}
+    orders = zip(np.char.add("u", customers.astype(str)).tolist(), item_ids[items].tolist())
+    print(f"{args.customers} customers, {args.items} items, {len(customers)} orders")
+
+    start = time.perf_counter()
+    index = ItemSimilarityIndex.build(orders, catalog)
+    print(f"build:        {time.perf_counter() - start:8.2f} s  ({len(index.data)} similarity entries)")
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        version = index.save(index_dir)
+        size = sum(os.path.getsize(os.path.join(index_dir, version, f)) for f in os.listdir(os.path.join(index_dir, version)))
+        print(f"index size:   {size / 1e6:8.1f} MB")
+
+        engine = RecommendationEngine(index_dir)
+        start = time.perf_counter()
+        engine.reload()
+        print(f"mmap load:    {(time.perf_counter() - start) * 1e3:8.1f} ms")
+
+        # Purchase histories of random customers
+        boundaries = np.flatnonzero(np.diff(customers)) + 1
+        histories = np.split(item_ids[items], boundaries)
+        rng = np.random.default_rng(11)
+        sample = [histories[i].tolist() for i in rng.integers(0, len(histories), args.queries)]
+
+        latencies = np.empty(len(sample))
+        start = time.perf_counter()
+        for i, purchased in enumerate(sample):
+            t0 = time.perf_counter()
+            engine.recommend(purchased, k=args.k)
+            latencies[i] = time.perf_counter() - t0
+        elapsed = time.perf_counter() - start
+        print(f"throughput:   {len(sample) / elapsed:8.0f} recommendations/s (single core)")
+        print(f"latency:      p50 {np.percentile(latencies, 50) * 1e6:.0f} us, p99 {np.percentile(latencies, 99) * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
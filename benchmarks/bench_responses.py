@@ -0,0 +1,101 @@
+"""
+Response serialization cost per router: before (response-model validation + jsonable_encoder +
+stdlib JSONResponse) vs after (FastJSONResponse, and no revalidation on `trusted_json` routes).
+
+    python -m benchmarks.bench_responses
+"""
+import asyncio
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.routing import APIRoute, serialize_response
+from starlette.responses import JSONResponse
+
+from app.main import app
+from app.core.responses import FastJSONResponse
+from app.api.v1.endpoints.customer import customer_to_response
+
+NOW = datetime(2023, 9, 21, 12, 0)
+
+CUSTOMERS = [
+    {
+        "_id": ObjectId(), "first_name": "Jane", "last_name": f"Doe{i}", "email": f"jane{i}@example.com",
+        "phone_number": "+1-555-0100", "address": "1 Main St", "city": "Springfield", "country": "US",
+        "created_at": NOW, "is_active": True,
+    }
+    for i in range(100)
+]
+
+FEEDBACK = {
+    "feedback_collected": [
+        {"session_id": f"s{i}", "customer_id": f"user{i}", "feedback": {"rating": i % 5, "comment": "Helpful answer"},
+         "ai_response": {"text": "Your order is being processed", "confidence": 0.87}}
+        for i in range(1000)
+    ]
+}
+
+# (method, path, payload, trusted) - one representative endpoint per router
+SAMPLES = [
+    ("POST", "/api/v1/auth/login", {"access_token": "x" * 160, "token_type": "bearer"}, False),
+    ("GET", "/api/v1/customer/", CUSTOMERS, True),
+    ("POST", "/api/v1/support/query", {"intent": "help_request", "confidence": 0.95}, False),
+    ("GET", "/api/v1/channels/available", {"channels": ["web", "mobile", "voice", "sms", "email"]}, False),
+    ("POST", "/api/v1/orchestration/context-aware-response",
+     {"response_text": "I'm not sure about that.", "confidence_score": 0.5, "context_update": {"current_task": None},
+      "requires_handoff": True}, False),
+    ("POST", "/api/v1/personalization/recommendations",
+     {"recommendations": [{"product_id": str(i), "product_name": f"Item {i}", "category": "accessories",
+                           "price": "$9.99"} for i in range(50)], "response_text": "Recommended for you"}, False),
+    ("GET", "/api/v1/model/ab-test/status",
+     {"experiment_name": "exp", "traffic_split": {"model_a": 50, "model_b": 50}, "status": "ongoing"}, False),
+    ("GET", "/api/v1/active-learning/feedback-collection", FEEDBACK, True),
+    ("GET", "/api/v1/cache/all-keys", {"cached_keys": [f"intent:{i}" for i in range(500)]}, False),
+    ("GET", "/api/v1/monitoring/error/logs",
+     {"error_logs": [{"error_id": f"error_{i}", "error_type": "timeout", "component": "nlp",
+                      "timestamp": NOW.isoformat()} for i in range(500)]}, False),
+    ("GET", "/api/v1/security/access-logs",
+     {"access_logs": [{"user_id": f"u{i}", "role": "agent", "permissions": ["read"]} for i in range(500)]}, False),
+]
+
+
+def find_route(method: str, path: str) -> APIRoute:
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path == path and method in route.methods:
+            return route
+    raise LookupError(f"{method} {path}")
+
+
+async def before(route: APIRoute, payload):
+    content = await serialize_response(field=route.secure_cloned_response_field, response_content=payload)
+    return JSONResponse(content).body
+
+
+async def after(route: APIRoute, payload, trusted: bool):
+    if trusted:
+        if route.path == "/api/v1/customer/":
+            payload = [customer_to_response(customer) for customer in payload]
+        return FastJSONResponse(payload).body
+    content = await serialize_response(field=route.secure_cloned_response_field, response_content=payload)
+    return FastJSONResponse(content).body
+
+
+async def timed(coro_factory, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await coro_factory()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+async def main():
+    print(f"{'endpoint':<52} {'before us':>10} {'after us':>10} {'speedup':>8}")
+    for method, path, payload, trusted in SAMPLES:
+        route = find_route(method, path)
+        rounds = 50 if isinstance(payload, list) or len(str(payload)) > 10000 else 2000
+        before_us = await timed(lambda: before(route, payload), rounds)
+        after_us = await timed(lambda: after(route, payload, trusted), rounds)
+        print(f"{method + ' ' + path:<52} {before_us:>10.1f} {after_us:>10.1f} {before_us / after_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
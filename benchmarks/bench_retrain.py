@@ -0,0 +1,97 @@
+"""
+Retraining wall-clock time against the number of worker processes, for the same data and epochs.
+
+Reads feedback from MongoDB when --mongodb-url points at a seeded database (see
+benchmarks/bench_feedback.py); by default a synthetic source generates the same kind of labelled
+queries in the worker processes, so the numbers cover tokenizing and training but not Mongo reads.
+
+    python -m benchmarks.bench_retrain --rows 200000 --processes 1 2 4 8
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app.services.model_registry import ModelRegistry
+from app.services.training_service import FeedbackTrainingSource, RetrainRunner
+
+END = datetime(2024, 6, 1)
+SPAN = timedelta(days=30)
+INTENTS = {
+    "help_request": "help assist stuck setup how use account login password".split(),
+    "refund_request": "refund money back charged twice return cash invoice".split(),
+    "unknown": "hello thanks weather today great fine okay".split(),
+}
+FILLER = "my the order please a for i can you it is".split()
+
+
+class SyntheticTrainingSource:
+    """
+    `rows` labelled queries spread evenly over SPAN, generated deterministically from their index.
+    """
+    def __init__(self, rows: int):
+        self.rows = rows
+        self.step = SPAN / rows
+
+    def _indices(self, start: datetime, end: datetime) -> range:
+        first = max(0, -(-(start - (END - SPAN)) // self.step))
+        last = min(self.rows, -(-(end - (END - SPAN)) // self.step))
+        return range(first, last)
+
+    def count(self, start: datetime, end: datetime) -> int:
+        return len(self._indices(start, end))
+
+    def labels(self, start: datetime, end: datetime):
+        return []
+
+    def chunks(self, start: datetime, end: datetime, labels, chunk_size: int):
+        label_index = {label: i for i, label in enumerate(labels)}
+        indices = self._indices(start, end)
+        for offset in range(0, len(indices), chunk_size):
+            texts, ys = [], []
+            for i in indices[offset:offset + chunk_size]:
+                rng = random.Random(i)
+                intent = rng.choice(("help_request", "refund_request", "unknown"))
+                words = rng.choices(INTENTS[intent], k=3) + rng.choices(FILLER, k=rng.randint(3, 9))
+                rng.shuffle(words)
+                texts.append(" ".join(words))
+                ys.append(label_index[intent])
+            yield texts, ys, len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--mongodb-url")
+    args = parser.parse_args()
+
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        source = FeedbackTrainingSource()
+    else:
+        source = SyntheticTrainingSource(args.rows)
+    print(f"{source.count(END - SPAN, END):,} rows, {args.epochs} epochs, {os.cpu_count()} CPUs")
+    print(f"{'processes':>9} {'seconds':>9} {'speedup':>8} {'accuracy':>9}")
+    baseline = None
+    for processes in args.processes:
+        with tempfile.TemporaryDirectory() as directory:
+            registry = ModelRegistry(f"{directory}/models", memory_budget_bytes=1 << 30)
+            runner = RetrainRunner(f"{directory}/jobs", registry, processes, args.epochs, chunk_size=1000,
+                                   learning_rate=0.1, n_features=1 << 18)
+            started = time.perf_counter()
+            job = runner.start("v1.3", END - SPAN, END, "benchmark", source=source)
+            runner.join(job["model_version"])
+            elapsed = time.perf_counter() - started
+            status = runner.status(job["model_version"])
+            if status["status"] != "completed":
+                raise SystemExit(f"Retraining failed: {status.get('error')}")
+            baseline = baseline or elapsed
+            print(f"{processes:>9} {elapsed:>9.2f} {baseline / elapsed:>7.2f}x {status['metrics']['accuracy']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Encode/decode throughput and stored size for the serializer configurations we can run with.
+
+Throughput is reported against the size of the stdlib-JSON encoding so all rows share one baseline.
+
+    python -m benchmarks.bench_serialization
+"""
+import json
+import time
+
+from app.utils.serialization import Serializer
+
+
+def conversation_context(turns: int = 400) -> dict:
+    return {
+        "session_id": "sess_8f2c1e",
+        "customer_id": "user123",
+        "current_task": "order_tracking",
+        "previous_conversation": [
+            {
+                "turn": i,
+                "speaker": "customer" if i % 2 else "assistant",
+                "text": f"Message number {i} about order 12345 and the smartphone accessories we discussed.",
+                "intent": "order_tracking",
+                "confidence": 0.87 + (i % 10) / 100,
+                "timestamp": f"2023-09-21T12:{i % 60:02d}:00Z",
+            }
+            for i in range(turns)
+        ],
+        "user_data": {"order_id": "12345", "email": "user@example.com"},
+    }
+
+
+def recommendation_list(items: int = 1000) -> list:
+    return [
+        {
+            "product_id": str(100000 + i),
+            "product_name": f"Product {i}",
+            "category": ["accessories", "electronics", "audio", "cases"][i % 4],
+            "price": f"${(i % 200) + 0.99:.2f}",
+            "score": 1.0 / (i + 1),
+        }
+        for i in range(items)
+    ]
+
+
+class StdlibJSON:
+    def dumps(self, obj):
+        return json.dumps(obj).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+CONFIGS = [
+    ("stdlib json", StdlibJSON()),
+    ("orjson", Serializer("json", "none")),
+    ("msgpack", Serializer("msgpack", "none")),
+    ("orjson + zstd", Serializer("json", "zstd")),
+    ("msgpack + zstd", Serializer("msgpack", "zstd")),
+    ("msgpack + lz4", Serializer("msgpack", "lz4")),
+]
+
+
+def measure(serializer, payload, reference_bytes: int, rounds: int = 200):
+    blob = serializer.dumps(payload)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        serializer.dumps(payload)
+    encode_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(rounds):
+        serializer.loads(blob)
+    decode_s = time.perf_counter() - start
+    mb = reference_bytes * rounds / 1e6
+    return mb / encode_s, mb / decode_s, len(blob)
+
+
+def main():
+    for name, payload in (("conversation context", conversation_context()), ("recommendation list", recommendation_list())):
+        reference = len(json.dumps(payload).encode())
+        print(f"\n{name} ({reference / 1024:.1f} KiB as JSON)")
+        print(f"{'config':<16} {'encode MB/s':>12} {'decode MB/s':>12} {'bytes':>9} {'ratio':>6}")
+        for label, serializer in CONFIGS:
+            encode, decode, size = measure(serializer, payload, reference)
+            print(f"{label:<16} {encode:>12.1f} {decode:>12.1f} {size:>9} {size / reference:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
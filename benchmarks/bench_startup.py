@@ -0,0 +1,137 @@
+"""
+Cold start of a worker: a fresh interpreter importing app.main, running the lifespan's startup and
+serving its first request, split into those phases (median of --runs fresh processes), followed by
+the `python -X importtime` profile of `import app.main`: the slowest top-level packages and app
+modules by cumulative import time. Meant for CI output; exits 1 when the median total exceeds --budget seconds.
+
+    python -m benchmarks.bench_startup --budget 1.0
+
+MongoDB and Redis need not be running: their clients connect lazily, the startup ping runs in the
+background, and the first request (a support query) uses neither.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the fresh process; prints wall-clock timestamps of each phase
+CHILD = """
+import time
+started = time.time()
+import asyncio, json
+import app.main
+imported = time.time()
+
+async def first_request(app):
+    lifespan = app.router.lifespan_context(app)
+    await lifespan.__aenter__()
+    ready = time.time()
+    body = json.dumps({"query": "I want a refund for my order"}).encode()
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+             "path": "/api/v1/support/query", "raw_path": b"/api/v1/support/query", "query_string": b"",
+             "root_path": "", "headers": [(b"content-type", b"application/json")], "server": ("bench", 80)}
+    await app(scope, receive, send)
+    served = time.time()
+    await lifespan.__aexit__(None, None, None)
+    return ready, served, messages[0]["status"]
+
+ready, served, status = asyncio.run(first_request(app.main.app))
+print(json.dumps({"started": started, "imported": imported, "ready": ready, "served": served, "status": status}))
+"""
+
+PHASES = ("interpreter", "import app.main", "lifespan startup", "first request")
+
+
+def child_env(directory: str) -> dict:
+    env = dict(os.environ, LOG_FILE="", LOG_LEVEL="WARNING")
+    for name in ("MODEL_ARTIFACT_DIR", "EXPERIMENT_DIR", "DRIFT_DIR", "RETRAIN_DIR", "METRICS_DIR", "TIMESERIES_DIR",
+                 "ALERT_DIR", "RECOMMENDATION_INDEX_DIR"):
+        env[name] = os.path.join(directory, name.lower())
+    env["ENCRYPTION_KEYRING_PATH"] = os.path.join(directory, "keys", "keyring.json")
+    return env
+
+
+def cold_start(env: dict) -> Dict[str, float]:
+    launched = time.time()
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True).stdout
+    marks = json.loads(output.strip().splitlines()[-1])
+    if marks["status"] != 200:
+        raise RuntimeError(f"First request answered {marks['status']}")
+    return {
+        "interpreter": marks["started"] - launched,
+        "import app.main": marks["imported"] - marks["started"],
+        "lifespan startup": marks["ready"] - marks["imported"],
+        "first request": marks["served"] - marks["ready"],
+        "total": marks["served"] - launched,
+    }
+
+
+def import_profile(env: dict) -> List[Tuple[int, int, int, str]]:
+    """
+    (self us, cumulative us, depth, module) rows of `python -X importtime -c "import app.main"`.
+    """
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            rows.append((int(match[1]), int(match[2]), len(match[3]) // 2, match[4]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Packages and app modules listed in the import profile")
+    parser.add_argument("--budget", type=float, help="Exit 1 when the median cold start takes longer (seconds)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = child_env(directory)
+        runs = [cold_start(env) for _ in range(args.runs)]
+        rows = import_profile(env)
+
+    median = {phase: statistics.median(run[phase] for run in runs) for phase in PHASES + ("total",)}
+    print(f"cold start, median of {args.runs} processes")
+    for phase in PHASES + ("total",):
+        print(f"  {phase:<18} {median[phase] * 1000:8.1f} ms")
+
+    # A package's cost is its largest cumulative time, wherever it was first imported from
+    packages: Dict[str, int] = {}
+    for _, cumulative, _, module in rows:
+        if "." not in module and module != "app":
+            packages[module] = max(packages.get(module, 0), cumulative)
+    print(f"\nimport app.main: {max(c for _, c, _, m in rows if m == 'app.main') / 1000:.1f} ms, "
+          f"slowest packages (cumulative)")
+    for module, cumulative in sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+    print("\nslowest app modules (cumulative, self)")
+    app_rows = sorted((row for row in rows if row[3].startswith("app.")), key=lambda row: -row[1])
+    for own, cumulative, _, module in app_rows[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms {own / 1000:7.1f} ms  {module}")
+
+    if args.budget is not None and median["total"] > args.budget:
+        print(f"\nCold start {median['total']:.3f}s is over the {args.budget:g}s budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Targeting rule evaluation at 10, 1k and 100k rules: compile time and per-request evaluation
+cost of the compiled bitset index vs a linear scan over all rules.
+
+    python -m benchmarks.bench_targeting
+"""
+import random
+import time
+
+from app.services.targeting_service import CompiledRules
+
+ATTRIBUTES = [f"preferences.attr{i}" for i in range(6)] + ["orders.product_id", "interaction.last_clicked_item",
+                                                           "interaction.page", "interaction.channel"]
+VALUES = [f"v{i}" for i in range(200)]
+
+
+def random_rules(count: int, rng: random.Random) -> list:
+    rules = []
+    for i in range(count):
+        conditions = {}
+        for attribute in rng.sample(ATTRIBUTES, rng.randint(1, 3)):
+            conditions[attribute] = rng.sample(VALUES, rng.randint(1, 3))
+        rules.append({"rule_id": f"r{i}", "priority": rng.randint(0, 1000), "conditions": conditions,
+                      "content": {"banner": f"Banner {i}", "offers": []}})
+    return rules
+
+
+def random_facts(rng: random.Random) -> dict:
+    facts = {attribute: [rng.choice(VALUES)] for attribute in ATTRIBUTES}
+    facts["orders.product_id"] = rng.sample(VALUES, 10)
+    return facts
+
+
+def linear_scan(rules: list, facts: dict):
+    best = None
+    for rule in rules:
+        if all(set(map(str, expected)) & set(facts.get(attribute, ()))
+               for attribute, expected in rule["conditions"].items()):
+            if best is None or rule["priority"] > best["priority"]:
+                best = rule
+    return best
+
+
+def main():
+    rng = random.Random(5)
+    samples = [random_facts(rng) for _ in range(2000)]
+    print(f"{'rules':>7} {'compile ms':>11} {'compiled us':>12} {'linear us':>11}")
+    for count in (10, 1_000, 100_000):
+        rules = random_rules(count, rng)
+        start = time.perf_counter()
+        compiled = CompiledRules(rules)
+        compile_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        for facts in samples:
+            compiled.evaluate(facts)
+        compiled_us = (time.perf_counter() - start) / len(samples) * 1e6
+
+        linear_samples = samples if count < 100_000 else samples[:50]
+        start = time.perf_counter()
+        for facts in linear_samples:
+            linear_scan(rules, facts)
+        linear_us = (time.perf_counter() - start) / len(linear_samples) * 1e6
+        print(f"{count:>7} {compile_ms:>11.1f} {compiled_us:>12.1f} {linear_us:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
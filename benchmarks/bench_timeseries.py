@@ -0,0 +1,71 @@
+"""
+Metrics history at scale: write cost per sample, on-disk size per series, and range query latency
+over 90 days of history for a gauge and a latency histogram series.
+
+    python -m benchmarks.bench_timeseries --days 90 --step 60
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from app.services import metrics_service as m
+from app.services.timeseries_service import TIERS, SeriesSpec, TimeSeriesStore, log_bounds
+
+NOW = 1_700_000_000
+
+
+def disk_bytes(directory: str) -> int:
+    # Allocated blocks: ring files are sparse until their slots are written
+    return sum(os.stat(os.path.join(root, name)).st_blocks * 512
+               for root, _, names in os.walk(directory) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--step", type=int, default=60, help="Seconds between samples")
+    args = parser.parse_args()
+
+    cpu = SeriesSpec("system.cpu_percent", "gauge", log_bounds(0.1, 10_000), lambda collected: None)
+    latency = SeriesSpec("http.latency_seconds", "histogram", m.LATENCY_BUCKETS, lambda collected: None)
+    rng = random.Random(7)
+    start = NOW - args.days * 86400
+    samples = args.days * 86400 // args.step
+    with tempfile.TemporaryDirectory() as directory:
+        store = TimeSeriesStore(directory, TIERS)
+        buckets = np.zeros(len(m.LATENCY_BUCKETS) + 1)
+        began = time.perf_counter()
+        for i in range(samples):
+            timestamp = start + i * args.step
+            store.record_value(cpu, timestamp, rng.uniform(5, 95))
+            buckets[:] = 0
+            buckets[4:9] = [rng.randint(0, 50) for _ in range(5)]
+            store.record_histogram(latency, timestamp, buckets, float(buckets.sum()) * 0.01)
+        write_us = (time.perf_counter() - began) / (2 * samples) * 1e6
+
+        print(f"{samples:,} samples per series over {args.days} days; tiers "
+              + ", ".join(f"{tier.name}={tier.resolution}s x {tier.slots:,}" for tier in TIERS))
+        print(f"write per sample (all tiers): {write_us:.1f} us")
+        print(f"disk for both series:         {disk_bytes(directory) / 2**20:.1f} MB")
+
+        print(f"\n{'window':<8} {'series':<22} {'tier':<5} {'points':>7} {'cold ms':>8} {'warm ms':>8}")
+        for label, seconds in (("1h", 3600), ("24h", 86400), ("7d", 7 * 86400), ("90d", args.days * 86400)):
+            for spec in (cpu, latency):
+                reader = TimeSeriesStore(directory, TIERS, writable=False)
+                began = time.perf_counter()
+                result = reader.query(spec, NOW - seconds, NOW, now=NOW)
+                cold_ms = (time.perf_counter() - began) * 1e3
+                began = time.perf_counter()
+                for _ in range(20):
+                    reader.query(spec, NOW - seconds, NOW, now=NOW)
+                warm_ms = (time.perf_counter() - began) / 20 * 1e3
+                print(f"{label:<8} {spec.name:<22} {result['tier']:<5} {len(result['points']):>7} "
+                      f"{cold_ms:>8.2f} {warm_ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
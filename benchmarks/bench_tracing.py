@@ -0,0 +1,131 @@
+"""
+Tracing and profiling overhead. With tracing disabled (the default) the middleware is not installed
+and instrumented calls only check a flag, so this compares an instrumented hot path (analyze_intent,
+a MongoDB command listener, a Redis-style client span) and a whole ASGI request without any
+instrumentation, with tracing off, with tracing on for requests that are not sampled, and with
+every request traced. Also measures
+the cost of one profiler sample, which is what the opt-in profiler steals per interval.
+
+    python -m benchmarks.bench_tracing
+"""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from opentelemetry import context, trace
+
+from app.core.middleware import TracingMiddleware
+from app.services.nlp_service import analyze_intent
+from app.services.profiling_service import ProfileSession
+from app.services.tracing_service import SpanKind, Tracing, mongo_command_tracing, tracing
+
+N = 200_000
+QUERY = "I want a refund for my order"
+MONGO_EVENT = SimpleNamespace(request_id=1, command_name="find", database_name="customer_database",
+                              command={"find": "customers"}, failure=None)
+
+
+def per_call_us(fn, n: int = N) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def plain_path():
+    analyze_intent.__wrapped__(QUERY)
+
+
+def hot_path():
+    # What one request does in instrumented code: classify, one MongoDB command, one Redis command
+    analyze_intent(QUERY)
+    # app/db.py only registers the MongoDB listener when tracing is enabled
+    if tracing.enabled:
+        mongo_command_tracing.started(MONGO_EVENT)
+        mongo_command_tracing.succeeded(MONGO_EVENT)
+    with tracing.span("redis GET", SpanKind.CLIENT, {"db.system": "redis"}):
+        pass
+
+
+def asgi_endpoint(path):
+    async def endpoint(scope, receive, send):
+        path()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+    return endpoint
+
+
+async def drive(app, n: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(n):
+        await app({"type": "http", "method": "POST", "path": "/api/v1/support/query", "headers": [], "app": None},
+                  receive, send)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def enable(sample_rate: float):
+    fresh = Tracing()
+    fresh.setup(enabled=True, sample_rate=sample_rate, file_path="", memory_spans=10000)
+    tracing.enabled, tracing.tracer, tracing.recent = True, fresh.tracer, fresh.recent
+
+
+def busy(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    print(f"{'':<34} {'analyze_intent':>15} {'hot path':>10} {'request':>10}   (us per call)")
+    plain = asgi_endpoint(plain_path)
+    loop.run_until_complete(drive(plain, 500))
+    plain_request_us = min(loop.run_until_complete(drive(plain, N // 20)) for _ in range(3))
+    print(f"{'no instrumentation':<34} {per_call_us(plain_path):>15.3f} {per_call_us(plain_path):>10.3f} "
+          f"{plain_request_us:>10.3f}")
+
+    endpoint = asgi_endpoint(hot_path)
+    rows = [("tracing disabled", None, endpoint), ("enabled, request not sampled", 0.0, TracingMiddleware(endpoint)),
+            ("enabled, every request traced", 1.0, TracingMiddleware(endpoint))]
+    for label, sample_rate, app in rows:
+        if sample_rate is not None:
+            enable(sample_rate)
+        # Inside a request span, as in production
+        root = tracing.tracer.start_span("request")
+        attached = context.attach(trace.set_span_in_context(root))
+        intent_us = per_call_us(lambda: analyze_intent(QUERY), N // 4)
+        hot_us = per_call_us(hot_path, N // 4)
+        context.detach(attached)
+        root.end()
+        loop.run_until_complete(drive(app, 500))
+        request_us = min(loop.run_until_complete(drive(app, N // 20)) for _ in range(3))
+        print(f"{label:<34} {intent_us:>15.3f} {hot_us:>10.3f} {request_us:>10.3f}")
+    loop.close()
+    tracing.enabled = False
+
+    # One profiler sample with a handful of busy threads (the worker's threadpool under load)
+    stop = threading.Event()
+    threads = [threading.Thread(target=busy, args=(stop,), daemon=True) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    session = ProfileSession(interval=0.005, max_seconds=60)
+    # CPU time of the sampling thread only: wall time would include waiting for the busy threads' GIL
+    started = time.thread_time()
+    for _ in range(2000):
+        session.sample()
+    sample_us = (time.thread_time() - started) / 2000 * 1e6
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(f"\nprofiler sample ({len(threads) + 1} threads): {sample_us:.1f} us, "
+          f"{sample_us / (session.interval * 1e6):.2%} of one core at a {session.interval * 1000:g} ms interval")
+
+
+if __name__ == "__main__":
+    main()
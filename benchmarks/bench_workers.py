@@ -0,0 +1,199 @@
+"""
+Throughput of the production server (gunicorn.conf.py) from 1 to N workers, and the memory the
+workers take with and without the preloaded, copy-on-write shared data.
+
+Each row starts gunicorn with that many workers on a local port, then drives it for --duration
+seconds from --clients load-generator processes, each holding --connections keep-alive
+connections that send a support query (intent classification) or a health check back to back.
+MongoDB and Redis are not needed by these two routes.
+Memory is the proportional set size (PSS) of the workers, which counts shared pages once.
+
+    python -m benchmarks.bench_workers --max-workers 8 --duration 10
+
+The load generators run on the same machine and take cores too, so throughput stops scaling
+before --max-workers reaches the core count.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERY_BODY = json.dumps({"query": "I want a refund for my order"}).encode()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def raw_request(host: str, index: int) -> bytes:
+    if index % 4 == 0:
+        return f"GET / HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+    return (f"POST /api/v1/support/query HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(QUERY_BODY)}\r\n\r\n").encode() + QUERY_BODY
+
+
+async def connection_loop(host: str, port: int, deadline: float, latencies: List[float], errors: List[int]):
+    reader, writer = await asyncio.open_connection(host, port)
+    index = 0
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            writer.write(raw_request(host, index))
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            if not head.startswith(b"HTTP/1.1 200"):
+                errors[0] += 1
+            index += 1
+    finally:
+        writer.close()
+
+
+def load_generator(url: str, connections: int, duration: float, results):
+    """
+    One client process: `connections` keep-alive connections, each sending requests back to back.
+    """
+    parts = urlsplit(url)
+    latencies: List[float] = []
+    errors = [0]
+
+    async def run():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(connection_loop(parts.hostname, parts.port, deadline, latencies, errors)
+                               for _ in range(connections)))
+
+    asyncio.run(run())
+    results.put((latencies, errors[0]))
+
+
+def drive(url: str, clients: int, connections: int, duration: float) -> dict:
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=load_generator, args=(url, connections, duration, results))
+                 for _ in range(clients)]
+    for process in processes:
+        process.start()
+    latencies: List[float] = []
+    errors = 0
+    for _ in processes:
+        values, failed = results.get()
+        latencies.extend(values)
+        errors += failed
+    for process in processes:
+        process.join()
+    values = np.asarray(latencies) * 1e3
+    return {
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "errors": errors,
+    }
+
+
+def pss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def worker_pids(master: int) -> List[int]:
+    try:
+        with open(f"/proc/{master}/task/{master}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def start_server(workers: int, port: int, data_dir: str, preload: bool) -> subprocess.Popen:
+    # No worker recycling in the middle of a measurement
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), SERVER_BIND=f"127.0.0.1:{port}", LOG_FILE="",
+               LOG_LEVEL="CRITICAL", SERVER_MAX_REQUESTS="0", SERVER_PRELOAD=str(preload).lower())
+    for name in ("MODEL_ARTIFACT_DIR", "EXPERIMENT_DIR", "DRIFT_DIR", "RETRAIN_DIR", "METRICS_DIR", "TIMESERIES_DIR",
+                 "ALERT_DIR"):
+        env[name] = os.path.join(data_dir, name.lower())
+    command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(port: int, workers: int, server: subprocess.Popen, timeout: float = 60) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            return False
+        if len(worker_pids(server.pid)) >= workers:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1) as s:
+                    s.sendall(b"GET / HTTP/1.1\r\nHost: bench\r\n\r\n")
+                    if s.recv(12).startswith(b"HTTP/1.1 200"):
+                        return True
+            except OSError:
+                pass
+        time.sleep(0.2)
+    return False
+
+
+def run_row(workers: int, preload: bool, args, data_dir: str) -> Tuple[Optional[dict], Optional[float]]:
+    port = free_port()
+    server = start_server(workers, port, data_dir, preload)
+    try:
+        if not wait_ready(port, workers, server):
+            return None, None
+        drive(f"http://127.0.0.1:{port}", args.clients, args.connections, 1.0)  # Warm up
+        result = drive(f"http://127.0.0.1:{port}", args.clients, args.connections, args.duration)
+        memory = [pss_mb(pid) for pid in worker_pids(server.pid)]
+        return result, sum(m for m in memory if m is not None) if memory else None
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-workers", type=int, default=len(os.sched_getaffinity(0)) if hasattr(
+        os, "sched_getaffinity") else os.cpu_count())
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=2, help="Load generator processes")
+    parser.add_argument("--connections", type=int, default=32, help="Keep-alive connections per load generator")
+    args = parser.parse_args()
+
+    counts = sorted({1, 2, 4, 8, 16, 32, args.max_workers} & set(range(1, args.max_workers + 1)))
+    print(f"{'workers':>8} {'preload':>8} {'rps':>10} {'x 1 worker':>11} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'workers PSS MB':>15}")
+    with tempfile.TemporaryDirectory() as data_dir:
+        single = None
+        for workers in counts:
+            for preload in (True, False) if workers == args.max_workers else (True,):
+                result, memory = run_row(workers, preload, args, data_dir)
+                if result is None:
+                    print(f"{workers:>8} {str(preload):>8}  server did not start")
+                    continue
+                single = single or result["rps"]
+                print(f"{workers:>8} {str(preload):>8} {result['rps']:>10.1f} {result['rps'] / single:>11.2f} "
+                      f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>7} "
+                      f"{memory if memory is not None else float('nan'):>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
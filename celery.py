@@ -1,4 +1,8 @@
 from celery import Celery
+from app.utils.serialization import register_celery_serializer
+
+# Compact binary (msgpack + compression) payloads for tasks and results
+register_celery_serializer("acx")
 
 # Celery instance
 celery_app = Celery('app', broker='redis://localhost:6379/0')
@@ -6,9 +10,9 @@ celery_app = Celery('app', broker='redis://localhost:6379/0')
 # Load custom configurations if needed
 celery_app.conf.update(
     result_backend='redis://localhost:6379/0',
-    task_serializer='json',
-    result_serializer='json',
-    accept_content=['json'],
+    task_serializer='acx',
+    result_serializer='acx',
+    accept_content=['acx', 'json'],  # 'json' keeps tasks queued before the switch decodable
     enable_utc=True,
     timezone='UTC',
 )
@@ -0,0 +1,54 @@
+"""
+Production server: gunicorn managing uvicorn workers (uvloop + httptools).
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The app is imported once in the master (preload_app, SERVER_PRELOAD) and the read-only data it serves from is
+loaded there too, so workers start fast and share it copy-on-write. Each worker opens its own
+MongoDB and Redis clients in the app's lifespan (app/core/resources.py). Workers are recycled after
+SERVER_MAX_REQUESTS requests (plus jitter, so they don't all restart at once) and given
+SERVER_GRACEFUL_TIMEOUT seconds to stop: on SIGTERM a worker reports not ready but keeps serving for
+SHUTDOWN_GRACE_SECONDS, then stops accepting and drains in-flight requests for up to
+SHUTDOWN_DRAIN_TIMEOUT (the two must add up to less). Settings are in app/core/config.py.
+"""
+import os
+
+from app.core.config import settings
+
+
+def available_cores() -> int:
+    # The cores this process may run on (a container's CPU set), not all of the host's
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+bind = settings.SERVER_BIND
+# Async workers: one per core keeps every core busy without contending for it
+workers = settings.WEB_CONCURRENCY or available_cores()
+worker_class = "app.core.server.UvloopWorker"
+preload_app = settings.SERVER_PRELOAD
+max_requests = settings.SERVER_MAX_REQUESTS
+max_requests_jitter = settings.SERVER_MAX_REQUESTS_JITTER
+timeout = settings.SERVER_TIMEOUT
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT
+# Longer than a load balancer's idle timeout (60s on most), so it never reuses a connection we closed
+keepalive = settings.SERVER_KEEPALIVE
+backlog = settings.SERVER_BACKLOG
+# The app writes its own JSON logs; gunicorn's access log would double every line
+accesslog = None
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from app.core.server import warm_shared_data
+
+    warm_shared_data()
+
+
+def child_exit(server, worker):
+    # The worker's metric files go into the retired totals, so they don't pile up as workers are recycled
+    from app.services.metrics_service import metrics
+
+    metrics.store.retire(worker.pid)
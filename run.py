@@ -1,4 +1,11 @@
+import os
+import sys
+
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    if "--dev" in sys.argv:
+        # Single process that restarts on code changes; not for production
+        uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn.conf.py", "app.main:app"])